@@ -19,10 +19,38 @@ import os
 import rasterio
 from rasterio.transform import from_origin
 import datetime
+import functools
 import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_metadata
+import pixel_area
+import missing_tile
+import window_pipeline
+
+
+# Per pixel and forest extent versions of one window of a per hectare model output
+def supplementary_outputs_window(tile_id, windows, window):
+
+    in_window = windows['focal']
+    pixel_area_window = pixel_area.read_window(tile_id, window)
+
+    # Output window for per pixel full extent raster
+    dst_window_per_pixel_full_extent = in_window * pixel_area_window / cn.m2_per_ha
+
+    # Output window for per hectare forest extent raster
+    # QCed this line before publication and then again afterwards in response to question from Lena Schulte-Uebbing at Wageningen Uni.
+    dst_window_per_hectare_forest_extent = np.where((windows['tcd'] > cn.canopy_threshold) | (windows['gain'] == 1) | (windows['mangrove'] != 0), in_window, 0)
+
+    # Output window for per pixel forest extent raster
+    dst_window_per_pixel_forest_extent = dst_window_per_hectare_forest_extent * pixel_area_window / cn.m2_per_ha
+
+    return {'per_pixel_full_extent': dst_window_per_pixel_full_extent,
+            'per_hectare_forest_extent': dst_window_per_hectare_forest_extent,
+            'per_pixel_forest_extent': dst_window_per_pixel_forest_extent}
+
 
 def create_supplementary_outputs(tile_id, input_pattern, output_patterns, sensit_type):
 
@@ -34,7 +62,6 @@ def create_supplementary_outputs(tile_id, input_pattern, output_patterns, sensit
 
     # Names of inputs
     focal_tile = '{0}_{1}.tif'.format(tile_id, input_pattern)
-    pixel_area = '{0}_{1}.tif'.format(cn.pattern_pixel_area, tile_id)
     tcd = '{0}_{1}.tif'.format(cn.pattern_tcd, tile_id)
     gain = '{0}_{1}.tif'.format(cn.pattern_gain, tile_id)
     mangrove = '{0}_{1}.tif'.format(tile_id, cn.pattern_mangrove_biomass_2000)
@@ -50,97 +77,47 @@ def create_supplementary_outputs(tile_id, input_pattern, output_patterns, sensit
     in_src = rasterio.open(focal_tile)
     # Grabs metadata about the tif, like its location/projection/cellsize
     kwargs = in_src.meta
-    # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-    windows = in_src.block_windows(1)
 
-    pixel_area_src = rasterio.open(pixel_area)
     tcd_src = rasterio.open(tcd)
     gain_src = rasterio.open(gain)
 
-    try:
-        mangrove_src = rasterio.open(mangrove)
+    if os.path.exists(mangrove):
         uu.print_log("    Mangrove tile found for {}".format(tile_id))
-    except:
+    else:
         uu.print_log("    No mangrove tile found for {}".format(tile_id))
+    mangrove_src = missing_tile.open_tile(mangrove, tile_id)
 
     uu.print_log("  Creating outputs for {}...".format(focal_tile))
 
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0,
         dtype='float32'
     )
+    raster_profile.update(kwargs)
 
     # Opens output tiles, giving them the arguments of the input tiles
     per_pixel_full_extent_dst = rasterio.open(per_pixel_full_extent, 'w', **kwargs)
     per_hectare_forest_extent_dst = rasterio.open(per_hectare_forest_extent, 'w', **kwargs)
     per_pixel_forest_extent_dst = rasterio.open(per_pixel_forest_extent, 'w', **kwargs)
 
-    # Adds metadata tags to the output rasters
-
-    uu.add_rasterio_tags(per_pixel_full_extent_dst, sensit_type)
-    per_pixel_full_extent_dst.update_tags(
-        units='Mg CO2e/pixel over model duration (2001-20{})'.format(cn.loss_years))
-    per_pixel_full_extent_dst.update_tags(
-        source='per hectare full model extent tile')
-    per_pixel_full_extent_dst.update_tags(
-        extent='Full model extent: ((TCD2000>0 AND WHRC AGB2000>0) OR Hansen gain=1 OR mangrove AGB2000>0) NOT IN pre-2000 plantations')
-
-    uu.add_rasterio_tags(per_hectare_forest_extent_dst, sensit_type)
-    per_hectare_forest_extent_dst.update_tags(
-        units='Mg CO2e/hectare over model duration (2001-20{})'.format(cn.loss_years))
-    per_hectare_forest_extent_dst.update_tags(
-        source='per hectare full model extent tile')
-    per_hectare_forest_extent_dst.update_tags(
-        extent='Forest extent: ((TCD2000>30 AND WHRC AGB2000>0) OR Hansen gain=1 OR mangrove AGB2000>0) NOT IN pre-2000 plantations')
-
-    uu.add_rasterio_tags(per_pixel_forest_extent_dst, sensit_type)
-    per_pixel_forest_extent_dst.update_tags(
-        units='Mg CO2e/pixel over model duration (2001-20{})'.format(cn.loss_years))
-    per_pixel_forest_extent_dst.update_tags(
-        source='per hectare forest model extent tile')
-    per_pixel_forest_extent_dst.update_tags(
-        extent='Forest extent: ((TCD2000>30 AND WHRC AGB2000>0) OR Hansen gain=1 OR mangrove AGB2000>0) NOT IN pre-2000 plantations')
-
-    if "net_flux" in focal_tile:
-        per_pixel_full_extent_dst.update_tags(
-            scale='Negative values are net sinks. Positive values are net sources.')
-        per_hectare_forest_extent_dst.update_tags(
-            scale='Negative values are net sinks. Positive values are net sources.')
-        per_pixel_forest_extent_dst.update_tags(
-            scale='Negative values are net sinks. Positive values are net sources.')
-
-
-    # Iterates across the windows of the input tiles
-    for idx, window in windows:
-
-        # Creates windows for each input tile
-        in_window = in_src.read(1, window=window)
-        pixel_area_window = pixel_area_src.read(1, window=window)
-        tcd_window = tcd_src.read(1, window=window)
-        gain_window = gain_src.read(1, window=window)
-
-        try:
-            mangrove_window = mangrove_src.read(1, window=window)
-        except:
-            mangrove_window = np.zeros((window.height, window.width), dtype='uint8')
-
-        # Output window for per pixel full extent raster
-        dst_window_per_pixel_full_extent = in_window * pixel_area_window / cn.m2_per_ha
-
-        # Output window for per hectare forest extent raster
-        # QCed this line before publication and then again afterwards in response to question from Lena Schulte-Uebbing at Wageningen Uni.
-        dst_window_per_hectare_forest_extent = np.where((tcd_window > cn.canopy_threshold) | (gain_window == 1) | (mangrove_window != 0), in_window, 0)
-
-        # Output window for per pixel forest extent raster
-        dst_window_per_pixel_forest_extent = dst_window_per_hectare_forest_extent * pixel_area_window / cn.m2_per_ha
-
-        # Writes arrays to output raster
-        per_pixel_full_extent_dst.write_band(1, dst_window_per_pixel_full_extent, window=window)
-        per_hectare_forest_extent_dst.write_band(1, dst_window_per_hectare_forest_extent, window=window)
-        per_pixel_forest_extent_dst.write_band(1, dst_window_per_pixel_forest_extent, window=window)
+    # Adds metadata tags to the output rasters (net flux outputs also get a scale tag)
+    tile_metadata.update_tags(per_pixel_full_extent_dst, output_patterns[0], sensit_type)
+    tile_metadata.update_tags(per_hectare_forest_extent_dst, output_patterns[1], sensit_type)
+    tile_metadata.update_tags(per_pixel_forest_extent_dst, output_patterns[2], sensit_type)
+
+    # Reads, calculates and writes the windows of the tiles at the same time
+    srcs = {'focal': in_src, 'tcd': tcd_src, 'gain': gain_src, 'mangrove': mangrove_src}
+    dsts = {'per_pixel_full_extent': per_pixel_full_extent_dst,
+            'per_hectare_forest_extent': per_hectare_forest_extent_dst,
+            'per_pixel_forest_extent': per_pixel_forest_extent_dst}
+    window_pipeline.run(functools.partial(supplementary_outputs_window, tile_id), srcs, dsts)
+
+    for src in srcs.values():
+        src.close()
+    for dst in dsts.values():
+        dst.close()
 
     uu.print_log("  Output tiles created for {}...".format(tile_id))
 
@@ -5,6 +5,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 # Calculates a range of tile statistics
 def loss_in_raster(tile_id, raster_type, output_name, lat, mask):
@@ -46,12 +47,9 @@ def loss_in_raster(tile_id, raster_type, output_name, lat, mask):
         out = '--outfile={}'.format(outname)
 
         uu.print_log("Masking loss in {} by raster of interest...".format(tile_id))
-        cmd = ['gdal_calc.py', '-A', loss_tile, '-B', raster_of_interest, calc, out, '--NoDataValue=0', '--co', 'COMPRESS=LZW',
+        cmd = ['gdal_calc.py', '-A', loss_tile, '-B', raster_of_interest, calc, out, '--NoDataValue=0', *raster_profile.gdal_options('archive', 'Byte', '--co'),
                '--overwrite', '--quiet']
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.log_subprocess_output_full(cmd)
 
         uu.print_log("{} masked".format(tile_id))
 
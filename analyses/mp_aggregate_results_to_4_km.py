@@ -2,10 +2,11 @@
 This script creates maps of model outputs at roughly 10km resolution (0.1x0.1 degrees), where each output pixel
 represents the total value in the pixel (not the density) (hence, the aggregated results).
 This is currently only set up for gross emissions from biomass+soil and net flux from biomass+soil.
-It iterates through all the model outputs that are supplied.
-First, it rewindows the model output, pixel area tile, and tcd tile into 400x400 (0.1x0.1 degree) windows, instead of the native
-40000x1 pixel windows.
-Then it calculates the per pixel value for each model output pixel and sums those values within each 0.1x0.1 degree
+It downloads all the model outputs that are supplied and aggregates all of them for a tile at once.
+Tiles are read in their native layout 160 rows (0.04 degrees) at a time, so the tcd, gain and mangrove tiles are read
+once per tile. Pixel areas for each band of rows come from pixel_area.py (the pixel area tile, or calculated from the
+tile's coordinates if cn.pixel_area_calculated is on).
+It calculates the per pixel value for each model output pixel and sums those values within each 0.04x0.04 degree
 aggregated pixel.
 It converts cumulative carbon gain to CO2 gain per year, converts cumulative CO2 flux to CO2 flux per year, and
 converts cumulative gross CO2 emissions to gross CO2 emissions per year.
@@ -26,6 +27,9 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_metadata
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'analyses'))
 import aggregate_results_to_4_km
 
@@ -55,8 +59,9 @@ def mp_aggregate_results_to_4_km(sensit_type, thresh, tile_id_list, std_net_flux
         uu.exception_log('Invalid tcd. Please provide an integer between 0 and 99.')
 
 
-    # Pixel area tiles-- necessary for calculating sum of pixels for any set of tiles
-    uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, sensit_type, tile_id_list)
+    # Pixel area tiles-- necessary for calculating sum of pixels for any set of tiles (unless areas are calculated)
+    if not cn.pixel_area_calculated:
+        uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, sensit_type, tile_id_list)
     # Tree cover density, Hansen gain, and mangrove biomass tiles-- necessary for filtering sums to model extent
     uu.s3_flexible_download(cn.tcd_dir, cn.pattern_tcd, cn.docker_base_dir, sensit_type, tile_id_list)
     uu.s3_flexible_download(cn.gain_dir, cn.pattern_gain, cn.docker_base_dir, sensit_type, tile_id_list)
@@ -79,6 +84,10 @@ def mp_aggregate_results_to_4_km(sensit_type, thresh, tile_id_list, std_net_flux
         output_dir_list = uu.replace_output_dir_date(output_dir_list, run_date)
 
 
+    # Patterns of the model outputs to aggregate and the tiles of each
+    patterns = []
+    tile_lists = {}
+
     # Iterates through the types of tiles to be processed
     for dir, download_pattern in list(download_dict.items()):
 
@@ -110,103 +119,63 @@ def mp_aggregate_results_to_4_km(sensit_type, thresh, tile_id_list, std_net_flux
         tile_list = uu.tile_list_spot_machine(".", "{}.tif".format(pattern))
         # from https://stackoverflow.com/questions/12666897/removing-an-item-from-list-matching-a-substring
         tile_list = [i for i in tile_list if not ('hanson_2013' in i)]
-        tile_list = [i for i in tile_list if not ('rewindow' in i)]
         tile_list = [i for i in tile_list if not ('0_4deg' in i)]
         tile_list = [i for i in tile_list if not ('.ovr' in i)]
 
         # tile_list = ['00N_070W_cumul_gain_AGCO2_BGCO2_t_ha_all_forest_types_2001_15_biomass_swap.tif']  # test tiles
 
         uu.print_log("There are {0} tiles to process for pattern {1}".format(str(len(tile_list)), download_pattern) + "\n")
-        uu.print_log("Processing:", dir, "; ", pattern)
-
-        # Converts the 10x10 degree Hansen tiles that are in windows of 40000x1 pixels to windows of 400x400 pixels,
-        # which is the resolution of the output tiles. This will allow the 30x30 m pixels in each window to be summed.
-        # For multiprocessor use. count/2 used about 400 GB of memory on an r4.16xlarge machine, so that was okay.
-        if cn.count == 96:
-            if sensit_type == 'biomass_swap':
-                processes = 12  # 12 processors = XXX GB peak
-            else:
-                processes = 16  # 12 processors = 140 GB peak; 16 = XXX GB peak; 20 = >750 GB (maxed out)
-        else:
-            processes = 8
-        uu.print_log('Rewindow max processors=', processes)
-        pool = multiprocessing.Pool(processes)
-        pool.map(aggregate_results_to_4_km.rewindow, tile_list)
-        # Added these in response to error12: Cannot allocate memory error.
-        # This fix was mentioned here: of https://stackoverflow.com/questions/26717120/python-cannot-allocate-memory-using-multiprocessing-pool
-        # Could also try this: https://stackoverflow.com/questions/42584525/python-multiprocessing-debugging-oserror-errno-12-cannot-allocate-memory
-        pool.close()
-        pool.join()
-
-        # # For single processor use
-        # for tile in tile_list:
-        #
-        #     aggregate_results_to_4_km.rewindow(tile)
-
-        # Converts the existing (per ha) values to per pixel values (e.g., emissions/ha to emissions/pixel)
-        # and sums those values in each 400x400 pixel window.
-        # The sum for each 400x400 pixel window is stored in a 2D array, which is then converted back into a raster at
-        # 0.1x0.1 degree resolution (approximately 10m in the tropics).
-        # Each pixel in that raster is the sum of the 30m pixels converted to value/pixel (instead of value/ha).
-        # The 0.1x0.1 degree tile is output.
-        # For multiprocessor use. This used about 450 GB of memory with count/2, it's okay on an r4.16xlarge
-        if cn.count == 96:
-            if sensit_type == 'biomass_swap':
-                processes = 10  # 10 processors = XXX GB peak
-            else:
-                processes = 12  # 16 processors = 180 GB peak; 16 = XXX GB peak; 20 = >750 GB (maxed out)
-        else:
-            processes = 8
-        uu.print_log('Conversion to per pixel and aggregate max processors=', processes)
-        pool = multiprocessing.Pool(processes)
-        pool.map(partial(aggregate_results_to_4_km.aggregate, thresh=thresh, sensit_type=sensit_type), tile_list)
-        pool.close()
-        pool.join()
-
-        # # For single processor use
-        # for tile in tile_list:
-        #
-        #     aggregate_results_to_4_km.aggregate(tile, thresh, sensit_type)
+
+        patterns.append((download_pattern_name, pattern))
+        tile_lists[pattern] = tile_list
+
+    # Tiles that have at least one of the model outputs
+    aggregate_tile_id_list = sorted(set(uu.get_tile_id(tile_name) for tile_list in tile_lists.values() for tile_name in tile_list))
+
+    uu.print_log("Aggregating {0} for {1} tiles".format(', '.join(tile_lists), len(aggregate_tile_id_list)))
+
+    # Converts the existing (per ha) values to per pixel values (e.g., emissions/ha to emissions/pixel)
+    # and sums those values in each 160x160 pixel window, for all the model outputs of a tile at once.
+    # The sums are converted into a raster at 0.04x0.04 degree resolution (approximately 4 km in the tropics).
+    # Each pixel in that raster is the sum of the 30m pixels converted to value/pixel (instead of value/ha).
+    # The 0.04x0.04 degree tile of each model output is output.
+    # Tiles are read 160 rows at a time, so each tile needs about 1 GB of memory for four model outputs.
+    tile_scheduler.run(partial(aggregate_results_to_4_km.aggregate, tile_types=list(tile_lists), thresh=thresh, sensit_type=sensit_type),
+                       aggregate_tile_id_list, 'aggregate_{}'.format(sensit_type), memory_gb=2, disk_gb=0)
+
+    # # For single processor use
+    # for tile_id in aggregate_tile_id_list:
+    #
+    #     aggregate_results_to_4_km.aggregate(tile_id, list(tile_lists), thresh, sensit_type)
+
+    # Iterates through the types of tiles that were aggregated
+    for download_pattern_name, pattern in patterns:
+
+        uu.print_log("Mosaicking:", pattern)
 
         # Makes a vrt of all the output 10x10 tiles (10 km resolution)
         out_vrt = "{}_0_4deg.vrt".format(pattern)
-        os.system('gdalbuildvrt -tr 0.04 0.04 {0} *{1}_0_4deg*.tif'.format(out_vrt, pattern))
+        uu.log_subprocess_output_full('gdalbuildvrt -tr 0.04 0.04 {0} *{1}_0_4deg*.tif'.format(out_vrt, pattern), shell=True)
 
         # Creates the output name for the 10km map
         out_pattern = uu.name_aggregated_output(download_pattern_name, thresh, sensit_type)
         uu.print_log(out_pattern)
 
-        # Produces a single raster of all the 10x10 tiles (0.4 degree resolution)
-        cmd = ['gdalwarp', '-t_srs', "EPSG:4326", '-overwrite', '-dstnodata', '0', '-co', 'COMPRESS=LZW',
-               '-tr', '0.04', '0.04',
+        # Metadata tags of the output. Units are different for annual removal factor, so metadata has to reflect that.
+        extra_tags = {'treecover_density_threshold': '{0} (only model pixels with canopy cover > {0} are included in aggregation'.format(thresh)}
+        if 'annual_removal_factor' in out_pattern:
+            extra_tags.update(units='Mg aboveground carbon/yr/pixel, where pixels are 0.04x0.04 degrees',
+                              scale='negative values are removals')
+
+        # Produces a single raster of all the 10x10 tiles (0.4 degree resolution), with its metadata tags.
+        # The vrt is already at the output resolution and projection, so it is translated rather than warped.
+        cmd = ['gdal_translate', '-a_nodata', '0',
+               *raster_profile.gdal_options('archive', 'Float32', block_size=False),
+               *tile_metadata.gdal_options(out_pattern, sensit_type, **extra_tags),
                out_vrt, '{}.tif'.format(out_pattern)]
         uu.log_subprocess_output_full(cmd)
 
 
-        # Adds metadata tags to output rasters
-        uu.add_universal_metadata_tags('{0}.tif'.format(out_pattern), sensit_type)
-
-        # Units are different for annual removal factor, so metadata has to reflect that
-        if 'annual_removal_factor' in out_pattern:
-            cmd = ['gdal_edit.py',
-                   '-mo', 'units=Mg aboveground carbon/yr/pixel, where pixels are 0.04x0.04 degrees',
-                   '-mo', 'source=per hectare version of the same model output, aggregated from 0.00025x0.00025 degree pixels',
-                   '-mo', 'extent=Global',
-                   '-mo', 'scale=negative values are removals',
-                   '-mo', 'treecover_density_threshold={0} (only model pixels with canopy cover > {0} are included in aggregation'.format(thresh),
-                   '{0}.tif'.format(out_pattern)]
-            uu.log_subprocess_output_full(cmd)
-
-        else:
-            cmd = ['gdal_edit.py',
-                   '-mo', 'units=Mg CO2e/yr/pixel, where pixels are 0.04x0.04 degrees',
-                   '-mo', 'source=per hectare version of the same model output, aggregated from 0.00025x0.00025 degree pixels',
-                   '-mo', 'extent=Global',
-                   '-mo', 'treecover_density_threshold={0} (only model pixels with canopy cover > {0} are included in aggregation'.format(thresh),
-                   '{0}.tif'.format(out_pattern)]
-            uu.log_subprocess_output_full(cmd)
-
-
         uu.print_log("Tiles processed. Uploading to s3 now...")
 
         # Uploads all output tiles to s3
@@ -217,10 +186,9 @@ def mp_aggregate_results_to_4_km(sensit_type, thresh, tile_id_list, std_net_flux
         for vrt in vrtList:
             os.remove(vrt)
 
-        for tile_name in tile_list:
+        for tile_name in tile_lists[pattern]:
             tile_id = uu.get_tile_id(tile_name)
             os.remove('{0}_{1}.tif'.format(tile_id, pattern))
-            os.remove('{0}_{1}_rewindow.tif'.format(tile_id, pattern))
             os.remove('{0}_{1}_0_4deg.tif'.format(tile_id, pattern))
 
 
@@ -25,6 +25,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'analyses'))
 import create_supplementary_outputs
 
@@ -36,6 +37,8 @@ def mp_create_supplementary_outputs(sensit_type, tile_id_list, run_date = None):
     if tile_id_list == 'all':
         # List of tiles to run in the model
         tile_id_list_outer = uu.tile_list_s3(cn.net_flux_dir, sensit_type)
+    else:
+        tile_id_list_outer = tile_id_list
 
     uu.print_log(tile_id_list_outer)
     uu.print_log("There are {} tiles to process".format(str(len(tile_id_list_outer))) + "\n")
@@ -74,8 +77,9 @@ def mp_create_supplementary_outputs(sensit_type, tile_id_list, run_date = None):
     ]
 
 
-    # Pixel area tiles-- necessary for calculating per pixel values
-    uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, sensit_type, tile_id_list_outer)
+    # Pixel area tiles-- necessary for calculating per pixel values (unless areas are calculated)
+    if not cn.pixel_area_calculated:
+        uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, sensit_type, tile_id_list_outer)
     # Tree cover density, Hansen gain, and mangrove biomass tiles-- necessary for masking to forest extent
     uu.s3_flexible_download(cn.tcd_dir, cn.pattern_tcd, cn.docker_base_dir, sensit_type, tile_id_list_outer)
     uu.s3_flexible_download(cn.gain_dir, cn.pattern_gain, cn.docker_base_dir, sensit_type, tile_id_list_outer)
@@ -133,18 +137,14 @@ def mp_create_supplementary_outputs(sensit_type, tile_id_list, run_date = None):
         uu.print_log("Input pattern:", input_pattern)
         uu.print_log("Output patterns:", output_patterns)
 
+        # Per-tile memory for the first run of the stage on a machine:
         # Gross removals: 20 processors = >740 GB peak; 15 = 570 GB peak; 17 = 660 GB peak; 18 = 670 GB peak
-        # Gross emissions: 17 processors = 660 GB peak; 18 = 710 GB peak
-        if cn.count == 96:
-            processes = 18
-        else:
-            processes = 2
-        uu.print_log("Creating derivative outputs for {0} with {1} processors...".format(input_pattern, processes))
-        pool = multiprocessing.Pool(processes)
-        pool.map(partial(create_supplementary_outputs.create_supplementary_outputs, input_pattern=input_pattern,
-                         output_patterns=output_patterns, sensit_type=sensit_type), tile_id_list_input)
-        pool.close()
-        pool.join()
+        # Gross emissions: 17 processors = 660 GB peak; 18 = 710 GB peak (about 40 GB per tile)
+        uu.print_log("Creating derivative outputs for {}...".format(input_pattern))
+        tile_scheduler.run(partial(create_supplementary_outputs.create_supplementary_outputs, input_pattern=input_pattern,
+                                   output_patterns=output_patterns, sensit_type=sensit_type),
+                           tile_id_list_input, 'supplementary_outputs_{0}_{1}'.format(input_pattern, sensit_type),
+                           memory_gb=40)
 
         # # For single processor use
         # for tile_id in tile_id_list_input:
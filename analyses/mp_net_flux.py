@@ -10,6 +10,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'analyses'))
 import net_flux
 
@@ -61,18 +62,14 @@ def mp_net_flux(sensit_type, tile_id_list, run_date = None):
 
     # Creates a single filename pattern to pass to the multiprocessor call
     pattern = output_pattern_list[0]
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 32 # 32 processors = XXX GB peak
-        else:
-            processes = 40   # 38 = 690 GB peak; 40 = 715 GB peak
+    # Per-tile memory for the first run of the stage on a machine: 38 processors = 690 GB peak; 40 = 715 GB peak
+    # (about 18 GB per tile)
+    if sensit_type == 'biomass_swap':
+        memory_gb = 23
     else:
-        processes = 9
-    uu.print_log('Net flux max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(net_flux.net_calc, pattern=pattern, sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 18
+    tile_scheduler.run(partial(net_flux.net_calc, pattern=pattern, sensit_type=sensit_type),
+                       tile_id_list, 'net_flux_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
@@ -1,9 +1,10 @@
-### This script calculates various statistics on all tiles in input folders and saves them to a txt.
-### Users can input as many folders as they want for calculating statistics on each tile
+### This script calculates various statistics on all tiles in input folders and saves them to a csv and a Parquet table.
+### Users can input as many folders as they want for calculating statistics on each tile.
+### Along with a row for each tile, each folder gets a row of statistics of all its tiles (tile_id "all").
 
 import multiprocessing
 import tile_statistics
-from subprocess import Popen, PIPE, STDOUT, check_call
+import csv
 import datetime
 from functools import partial
 import argparse
@@ -14,27 +15,41 @@ sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
 
+
+# Writes the statistics rows to a csv and, if pyarrow is installed, to a Parquet table with the same columns
+def write_tile_statistics(rows, tile_stats_csv, tile_stats_parquet):
+
+    with open(tile_stats_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(tile_statistics.headers)
+        writer.writerows(rows)
+
+    try:
+        import pandas as pd
+        pd.DataFrame(rows, columns=tile_statistics.headers).to_parquet(tile_stats_parquet, index=False)
+    except ImportError:
+        uu.print_log("pyarrow not installed. Not writing {}".format(tile_stats_parquet))
+        return [tile_stats_csv]
+
+    return [tile_stats_csv, tile_stats_parquet]
+
+
 def mp_tile_statistics(sensit_type, tile_id_list):
 
     os.chdir(cn.docker_base_dir)
 
-    # The column names for the tile summary statistics.
-    # If the statistics calculations are changed in tile_statistics.py, the list here needs to be changed, too.
-    headers = ['tile_id', 'tile_type', 'tile_name', 'pixel_count', 'mean', 'median', 'percentile10', 'percentile25',
-               'percentile75', 'percentile90', 'min', 'max', 'sum']
-    header_no_brackets = ', '.join(headers)
+    tile_stats_name = '{0}_v{1}_{2}_{3}'.format(cn.tile_stats_pattern, cn.version, sensit_type, uu.date_time_today)
+    tile_stats_csv = '{}.csv'.format(tile_stats_name)
+    tile_stats_parquet = '{}.parquet'.format(tile_stats_name)
 
-    tile_stats_txt = '{0}_v{1}_{2}_{3}.csv'.format(cn.tile_stats_pattern, cn.version, sensit_type, uu.date_time_today)
-
-    # Creates the output text file with the column names
-    with open(tile_stats_txt, 'w+') as f:
-        f.write(header_no_brackets  +'\r\n')
-    f.close()
+    # Statistics of each tile and of all tiles of each folder
+    rows = []
 
     uu.print_log(tile_id_list)
 
-    # Pixel area tiles-- necessary for calculating sum of pixels for any set of tiles
-    uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, 'std', tile_id_list)
+    # Pixel area tiles-- necessary for calculating sum of pixels for any set of tiles (unless areas are calculated)
+    if not cn.pixel_area_calculated:
+        uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, 'std', tile_id_list)
 
     # For downloading all tiles in selected folders
     download_dict = {
@@ -161,31 +176,37 @@ def mp_tile_statistics(sensit_type, tile_id_list):
         uu.print_log("There are {} tiles to process".format(str(len(tile_list))) + "\n")
 
         # For multiprocessor use.
-        processes=14
+        # Tiles are read a window at a time, so each process only needs memory for a window and its statistics.
+        processes=cn.count
         uu.print_log('Tile statistics max processors=', processes)
         pool = multiprocessing.Pool(processes)
-        pool.map(partial(tile_statistics.create_tile_statistics, sensit_type=sensit_type, tile_stats_txt=tile_stats_txt), tile_list)
-        # Added these in response to error12: Cannot allocate memory error.
-        # This fix was mentioned here: of https://stackoverflow.com/questions/26717120/python-cannot-allocate-memory-using-multiprocessing-pool
-        # Could also try this: https://stackoverflow.com/questions/42584525/python-multiprocessing-debugging-oserror-errno-12-cannot-allocate-memory
+        tile_stats = pool.map(partial(tile_statistics.create_tile_statistics, sensit_type=sensit_type), tile_list)
         pool.close()
         pool.join()
 
         # # For single processor use
+        # tile_stats = []
         # for tile in tile_list:
-        #     tile_statistics.create_tile_statistics(tile, sensit_type)
-
-        # Copies the text file to the tile statistics folder on s3
-        cmd = ['aws', 's3', 'cp', tile_stats_txt, cn.tile_stats_dir]
-        uu.log_subprocess_output_full(cmd)
+        #     tile_stats.append(tile_statistics.create_tile_statistics(tile, sensit_type))
+
+        # Merges the statistics of the tiles into statistics of all the tiles.
+        # Quantiles of all the tiles are exact if every tile has exact quantiles of the same data type.
+        dtype = tile_stats[0].dtype if len(tile_stats) > 0 else 'float64'
+        all_tiles = tile_statistics.TileStatistics('all', pattern, pattern, dtype)
+        for stats in tile_stats:
+            rows.append(stats.row())
+            all_tiles.merge(stats)
+        rows.append(all_tiles.row())
+        uu.print_log(', '.join(map(str, all_tiles.row())))
+
+        # Copies the statistics to the tile statistics folder on s3
+        for output in write_tile_statistics(rows, tile_stats_csv, tile_stats_parquet):
+            uu.s3_copy(output, cn.tile_stats_dir)
 
         # Spot machine can't store all the tiles, so this cleans it up
         uu.print_log("Deleting tiles...")
         for tile in tile_list:
             os.remove(tile)
-            tile_short = tile[:-4]
-            outname = '{0}_value_per_pixel.tif'.format(tile_short)
-            os.remove(outname)
             uu.print_log("  {} deleted".format(tile))
 
     uu.print_log("Script complete. All tiles analyzed!")
@@ -2,12 +2,23 @@
 
 import os
 import datetime
-import numpy as np
 import rasterio
 import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_metadata
+import missing_tile
+import window_pipeline
+
+
+# Net flux of one window: gross emissions minus gross removals
+def net_flux_window(windows, window):
+
+    # Subtracts gain that from loss
+    return {'net_flux': windows['emissions'].astype('float32') - windows['removals'].astype('float32')}
+
 
 def net_calc(tile_id, pattern, sensit_type):
 
@@ -23,73 +34,45 @@ def net_calc(tile_id, pattern, sensit_type):
     # Output net emissions file
     net_flux = '{0}_{1}.tif'.format(tile_id, pattern)
 
-    try:
-        removals_src = rasterio.open(removals_in)
-        # Grabs metadata about the tif, like its location/projection/cellsize
-        kwargs = removals_src.meta
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = removals_src.block_windows(1)
-        uu.print_log("   Gross removals tile {} found".format(removals_in))
-    except:
-        uu.print_log("   No gross removals tile {} found".format(removals_in))
-
-    try:
-        emissions_src = rasterio.open(emissions_in)
-        # Grabs metadata about the tif, like its location/projection/cellsize
-        kwargs = emissions_src.meta
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = emissions_src.block_windows(1)
-        uu.print_log("   Gross emissions tile {} found".format(emissions_in))
-    except:
-        uu.print_log("   No gross emissions tile {} found".format(emissions_in))
-
     # Skips the tile if there is neither a gross emissions nor a gross removals tile.
     # This should only occur for biomass_swap sensitivity analysis, which gets its net flux tile list from
     # the JPL tile list (some tiles of which have neither emissions nor removals), rather than the union of
     # emissions and removals tiles.
-    try:
-        kwargs.update(
-            driver='GTiff',
-            count=1,
-            compress='lzw',
-            nodata=0,
-            dtype='float32'
-        )
-    except:
+    if not os.path.exists(removals_in) and not os.path.exists(emissions_in):
         uu.print_log("No gross emissions or gross removals for {}. Skipping tile.".format(tile_id))
         return
 
+    # Opens the input tiles. A tile that doesn't exist is read as 0s.
+    srcs = {}
+    for name, tile, description in [('removals', removals_in, 'Gross removals'), ('emissions', emissions_in, 'Gross emissions')]:
+        srcs[name] = missing_tile.open_tile(tile, tile_id, 'float32')
+        if os.path.exists(tile):
+            # Grabs metadata about the tif, like its location/projection/cellsize
+            kwargs = srcs[name].meta
+            uu.print_log("   {0} tile {1} found".format(description, tile))
+        else:
+            uu.print_log("   No {0} tile {1} found".format(description.lower(), tile))
+
+    kwargs.update(
+        driver='GTiff',
+        count=1,
+        nodata=0,
+        dtype='float32'
+    )
+    raster_profile.update(kwargs)
+
     # Opens the output tile, giving it the arguments of the input tiles
     net_flux_dst = rasterio.open(net_flux, 'w', **kwargs)
 
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(net_flux_dst, sensit_type)
-    net_flux_dst.update_tags(
-        units='Mg CO2e/ha over model duration (2001-20{})'.format(cn.loss_years))
-    net_flux_dst.update_tags(
-        source='Gross emissions - gross removals')
-    net_flux_dst.update_tags(
-        extent='Model extent')
-    net_flux_dst.update_tags(
-        scale='Negative values are net sinks. Positive values are net sources.')
-
-    # Iterates across the windows (1 pixel strips) of the input tile
-    for idx, window in windows:
-
-        # Creates windows for each input tile
-        try:
-            removals_window = removals_src.read(1, window=window).astype('float32')
-        except:
-            removals_window = np.zeros((window.height, window.width)).astype('float32')
-        try:
-            emissions_window = emissions_src.read(1, window=window).astype('float32')
-        except:
-            emissions_window = np.zeros((window.height, window.width)).astype('float32')
-
-        # Subtracts gain that from loss
-        dst_data = emissions_window - removals_window
-
-        net_flux_dst.write_band(1, dst_data, window=window)
+    tile_metadata.update_tags(net_flux_dst, cn.pattern_net_flux, sensit_type)
+
+    # Reads, calculates and writes the windows of the tile at the same time
+    window_pipeline.run(net_flux_window, srcs, {'net_flux': net_flux_dst})
+
+    for src in srcs.values():
+        src.close()
+    net_flux_dst.close()
 
     # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, pattern)
\ No newline at end of file
+    uu.end_of_fx_summary(start, tile_id, pattern)
@@ -1,117 +1,230 @@
-from osgeo import gdal
-import numpy as np
-from subprocess import Popen, PIPE, STDOUT, check_call
+'''
+Calculates statistics of a tile (count, mean, median, percentiles, min, max, sum of per pixel values) in one pass over
+its blocks, so a tile never has to be in memory at once.
+Count, sum, min, max and mean are exact. Quantiles are exact for 8 and 16 bit integer tiles (from a histogram of
+every possible value) and come from a sketch for other tiles. The sketch puts each value in a bucket whose width is a
+fixed fraction of the value, so each quantile is within cn.tile_stats_relative_accuracy of the true quantile.
+The sum is of the per pixel values (value/ha * pixel area in ha), using pixel areas from pixel_area.read_window().
+Statistics of several tiles can be merged, e.g., into statistics of all tiles of one model output.
+'''
+
 import datetime
+import numpy as np
+import rasterio
 import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import pixel_area
 
-# Calculates a range of tile statistics
-def create_tile_statistics(tile, sensit_type, tile_stats_txt):
+# Column names of the statistics, in the order row() returns them
+headers = ['tile_id', 'tile_type', 'tile_name', 'pixel_count', 'mean', 'median', 'percentile10', 'percentile25',
+           'percentile75', 'percentile90', 'min', 'max', 'sum', 'value_sum', 'quantile_method']
 
-    # Extracts the tile id from the full tile name
-    tile_id = uu.get_tile_id(tile)
 
-    uu.print_log("Calculating tile statistics for {0}, tile id {1}...".format(tile, tile_id))
+# Bucket index of each value in the sketch. Values at or below the smallest value are counted as 0.
+def _sketch_index(values, log_gamma):
 
-    # start time
-    start = datetime.datetime.now()
+    return np.ceil(np.log(values) / log_gamma).astype('int64')
+
+
+# Statistics of the pixels of one or more tiles, accumulated one block at a time
+class TileStatistics(object):
+
+    def __init__(self, tile_id, tile_type, tile_name, dtype):
+
+        self.tile_id = tile_id
+        self.tile_type = tile_type
+        self.tile_name = tile_name
+
+        self.count = 0
+        self.value_sum = 0.0
+        self.per_pixel_sum = 0.0
+        self.min = None
+        self.max = None
+
+        # 8 and 16 bit integer tiles get a histogram with a bin for every possible value
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind in 'iu' and self.dtype.itemsize <= 2:
+            self.histogram_min = int(np.iinfo(self.dtype).min)
+            self.histogram = np.zeros(int(np.iinfo(self.dtype).max) - self.histogram_min + 1, dtype='int64')
+            self.sketch = None
+        else:
+            self.histogram = None
+            self._new_sketch()
+
+    # Empty sketch: counts of positive values, negative values (by bucket) and values near 0
+    def _new_sketch(self):
+
+        alpha = cn.tile_stats_relative_accuracy
+        self.log_gamma = np.log((1 + alpha) / (1 - alpha))
+        self.sketch_min_index = int(_sketch_index(np.array([cn.tile_stats_smallest_value]), self.log_gamma)[0])
+        size = int(_sketch_index(np.array([np.finfo('float64').max]), self.log_gamma)[0]) - self.sketch_min_index + 1
+        self.sketch = {'positive': np.zeros(size, dtype='int64'), 'negative': np.zeros(size, dtype='int64'), 'zero': 0}
+
+    # Adds values (with how many pixels have each value) to the sketch
+    def _add_to_sketch(self, values, counts=None):
+
+        values = values.astype('float64')
+        if counts is None:
+            counts = np.ones(values.shape, dtype='int64')
+
+        near_zero = np.abs(values) <= cn.tile_stats_smallest_value
+        self.sketch['zero'] += int(counts[near_zero].sum())
+
+        for sign, side in [(1, 'positive'), (-1, 'negative')]:
+            in_side = (values * sign) > cn.tile_stats_smallest_value
+            if in_side.any():
+                index = _sketch_index(values[in_side] * sign, self.log_gamma) - self.sketch_min_index
+                self.sketch[side] += np.bincount(index, weights=counts[in_side],
+                                                 minlength=len(self.sketch[side])).astype('int64')
+
+    # Adds the values of a block. areas are the pixel areas (m2) of the block, with the same shape.
+    def add(self, values, areas):
+
+        if values.size == 0:
+            return
 
-    # Source: http://gis.stackexchange.com/questions/90726
-    # Opens raster we're getting statistics on
-    focus_tile = gdal.Open(tile)
+        self.count += int(values.size)
+        self.value_sum += float(np.sum(values, dtype='float64'))
+        self.per_pixel_sum += float(np.sum(values.astype('float64') * areas / cn.m2_per_ha))
 
-    nodata = uu.get_raster_nodata_value(tile)
-    uu.print_log("NoData value =", nodata)
+        block_min = values.min()
+        block_max = values.max()
+        self.min = block_min if self.min is None else min(self.min, block_min)
+        self.max = block_max if self.max is None else max(self.max, block_max)
 
-    # Turns the raster into a numpy array
-    tile_array = np.array(focus_tile.GetRasterBand(1).ReadAsArray())
+        if self.histogram is not None:
+            self.histogram += np.bincount(values.astype('int64') - self.histogram_min, minlength=len(self.histogram))
+        else:
+            self._add_to_sketch(values)
 
-    # Flattens the numpy array to a single dimension
-    tile_array_flat = tile_array.flatten()
+    # Adds the statistics of other tiles to these statistics
+    def merge(self, other):
 
-    # Removes NoData values from the array. NoData are generally either 0 or -9999.
-    tile_array_flat_mask = tile_array_flat[tile_array_flat != nodata]
+        if other.count == 0:
+            return
 
-    ### For converting value/hectare to value/pixel
-    # Tile with the area of each pixel in m2
-    area_tile = '{0}_{1}.tif'.format(cn.pattern_pixel_area, tile_id)
+        self.count += other.count
+        self.value_sum += other.value_sum
+        self.per_pixel_sum += other.per_pixel_sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
 
-    # Output file name
-    tile_short = tile[:-4]
-    outname = '{0}_value_per_pixel.tif'.format(tile_short)
+        # Histograms can only be added to histograms of the same data type. Otherwise, both go in a sketch.
+        if self.histogram is not None and other.histogram is not None and self.dtype == other.dtype:
+            self.histogram += other.histogram
+            return
 
-    # Equation argument for converting emissions from per hectare to per pixel.
-    # First, multiplies the per hectare emissions by the area of the pixel in m2, then divides by the number of m2 in a hectare.
-    calc = '--calc=A*B/{}'.format(cn.m2_per_ha)
+        if self.histogram is not None:
+            histogram, histogram_min = self.histogram, self.histogram_min
+            self.histogram = None
+            self._new_sketch()
+            self._add_histogram_to_sketch(histogram, histogram_min)
 
-    # Argument for outputting file
-    out = '--outfile={}'.format(outname)
+        if other.histogram is not None:
+            self._add_histogram_to_sketch(other.histogram, other.histogram_min)
+        else:
+            self.sketch['positive'] += other.sketch['positive']
+            self.sketch['negative'] += other.sketch['negative']
+            self.sketch['zero'] += other.sketch['zero']
 
-    uu.print_log("Converting {} from /ha to /pixel...".format(tile))
-    cmd = ['gdal_calc.py', '-A', tile, '-B', area_tile, calc, out, '--NoDataValue=0', '--co', 'COMPRESS=LZW',
-           '--overwrite', '--quiet']
-    uu.log_subprocess_output_full(cmd)
+    def _add_histogram_to_sketch(self, histogram, histogram_min):
 
-    uu.print_log("{} converted to /pixel".format(tile))
+        values = np.nonzero(histogram)[0]
+        self._add_to_sketch(values + histogram_min, histogram[values])
+
+    # The value of rank k (0 = smallest) of the accumulated values
+    def _ranked_value(self, k):
 
-    uu.print_log("Converting value/pixel tile {} to numpy array...".format(tile))
-    # Opens raster with value per pixel
-    value_per_pixel = gdal.Open(outname)
+        if self.histogram is not None:
+            return np.searchsorted(np.cumsum(self.histogram), k, side='right') + self.histogram_min
 
-    # Turns the pixel area raster into a numpy array
-    value_per_pixel_array = np.array(value_per_pixel.GetRasterBand(1).ReadAsArray())
+        # Sketch buckets from the most negative to the most positive value
+        negative = self.sketch['negative'][::-1]
+        counts = np.concatenate([negative, [self.sketch['zero']], self.sketch['positive']])
+        bucket = int(np.searchsorted(np.cumsum(counts), k, side='right'))
 
-    # Flattens the pixel area numpy array to a single dimension
-    value_per_pixel_array_flat = value_per_pixel_array.flatten()
+        if bucket == len(negative):
+            return 0.0
 
-    uu.print_log("Converted {} to numpy array".format(tile))
+        if bucket < len(negative):
+            index = len(negative) - 1 - bucket + self.sketch_min_index
+            sign = -1
+        else:
+            index = bucket - len(negative) - 1 + self.sketch_min_index
+            sign = 1
 
-    # Empty statistics list
-    stats = [None] * 13
+        # Middle of the bucket, relative to its width
+        gamma = np.exp(self.log_gamma)
+        value = 2 * gamma ** index / (gamma + 1)
 
-    # Calculates basic tile info
-    stats[0] = tile_id
-    stats[1] = tile[9:-4]
-    stats[2] = tile
-    stats[3] = tile_array_flat_mask.size
+        # Keeps the value within the exact minimum and maximum
+        return float(min(max(sign * value, self.min), self.max))
 
-    # If there are no pixels with values in the tile (as determined by the length of the array when NoData values are removed),
-    # the statistics are all N/A.
-    if stats[3] == 0:
+    # Percentile (0-100) of the accumulated values, interpolated between ranks like np.percentile
+    def percentile(self, q):
 
-        stats[4] = "N/A"
-        stats[5] = "N/A"
-        stats[6] = "N/A"
-        stats[7] = "N/A"
-        stats[8] = "N/A"
-        stats[9] = "N/A"
-        stats[10] = "N/A"
-        stats[11] = "N/A"
-        stats[12] = "N/A"
+        position = q / 100.0 * (self.count - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, self.count - 1)
+        lower_value = self._ranked_value(lower)
+        upper_value = self._ranked_value(upper)
 
-    # If there are pixels with values in the tile, the following statistics are calculated
-    else:
+        return lower_value + (position - lower) * (upper_value - lower_value)
 
-        stats[4] = np.mean(tile_array_flat_mask, dtype=np.float64)
-        stats[5] = np.median(tile_array_flat_mask)
-        stats[6] = np.percentile(tile_array_flat_mask, 10)
-        stats[7] = np.percentile(tile_array_flat_mask, 25)
-        stats[8] = np.percentile(tile_array_flat_mask, 75)
-        stats[9] = np.percentile(tile_array_flat_mask, 90)
-        stats[10] = np.amin(tile_array_flat_mask)
-        stats[11] = np.amax(tile_array_flat_mask)
-        stats[12] = np.sum(value_per_pixel_array_flat)
+    # The statistics as a row with the columns in headers.
+    # Statistics of tiles without any pixels with values are empty.
+    def row(self):
 
-    stats_no_brackets = ', '.join(map(str, stats))
+        row = [self.tile_id, self.tile_type, self.tile_name, self.count]
 
-    uu.print_log(stats_no_brackets)
+        if self.count == 0:
+            return row + [None] * 9 + ['exact' if self.histogram is not None else 'sketch']
 
-    # Adds the tile's statistics to the txt file
-    with open(tile_stats_txt, 'a+') as f:
-        f.write(stats_no_brackets + '\r\n')
-    f.close()
+        row += [self.value_sum / self.count, self.percentile(50), self.percentile(10), self.percentile(25),
+                self.percentile(75), self.percentile(90), self.min, self.max, self.per_pixel_sum, self.value_sum,
+                'exact' if self.histogram is not None else 'sketch']
+
+        return [value.item() if isinstance(value, np.generic) else value for value in row]
+
+
+# Calculates a range of tile statistics, reading the tile a window at a time.
+# Pixels that are NoData aren't included.
+def create_tile_statistics(tile, sensit_type):
+
+    # Extracts the tile id from the full tile name
+    tile_id = uu.get_tile_id(tile)
+
+    uu.print_log("Calculating tile statistics for {0}, tile id {1}...".format(tile, tile_id))
+
+    # start time
+    start = datetime.datetime.now()
+
+    with rasterio.open(tile) as src:
+
+        nodata = src.nodata
+        uu.print_log("NoData value =", nodata)
+
+        stats = TileStatistics(tile_id, tile[9:-4], tile, src.dtypes[0])
+
+        for idx, window in tile_layout.windows(src):
+
+            values = src.read(1, window=window)
+            areas = pixel_area.read_window(tile_id, window)
+
+            # Removes NoData values. NoData are generally either 0 or -9999.
+            if nodata is not None:
+                has_data = values != nodata
+                values = values[has_data]
+                areas = areas[has_data]
+
+            stats.add(values.ravel(), areas.ravel())
+
+    uu.print_log(', '.join(map(str, stats.row())))
 
     # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'value_per_pixel.tif')
\ No newline at end of file
+    uu.end_of_fx_summary(start, tile_id, tile[9:-4])
+
+    return stats
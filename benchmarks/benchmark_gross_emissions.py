@@ -0,0 +1,167 @@
+'''
+Times the numpy gross emissions engine (emissions/gross_emissions_engine.py) on a synthetic tile with different
+numbers of threads and, if the C++ script for the model type has been compiled, times it on the same tile and checks
+that both give the same outputs pixel for pixel.
+The synthetic inputs have every combination of driver, peat, burning, ecozone, climate, IFL and plantation codes,
+so every node of the decision tree is used.
+Run from carbon-budget/ with, e.g.:
+python benchmarks/benchmark_gross_emissions.py -s 10000 -n 1,2,4,8 -t std -p biomass_soil
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'emissions'))
+import constants_and_names as cn
+import gross_emissions_engine
+
+tile_id = '00N_110E'
+
+
+# Writes one synthetic input tile
+def write_tile(path, array, dtype):
+
+    kwargs = {'driver': 'GTiff', 'height': array.shape[0], 'width': array.shape[1], 'count': 1, 'dtype': dtype,
+              'crs': 'EPSG:4326', 'transform': from_origin(110, 0, 0.00025, 0.00025), 'compress': 'lzw', 'nodata': 0}
+
+    with rasterio.open(path, 'w', **kwargs) as dst:
+        dst.write(array.astype(dtype), 1)
+
+
+# Writes synthetic versions of all gross emissions inputs, named as the numpy engine and the C++ read them
+def make_inputs(folder, size, sensit_type, seed, loss_fraction):
+
+    rng = np.random.RandomState(seed)
+
+    def codes(values):
+        return rng.choice(np.array(values), size=(size, size))
+
+    def carbon(maximum):
+        values = rng.random_sample((size, size)) * maximum
+        values[rng.random_sample((size, size)) < 0.1] = 0
+        return values
+
+    inputs = {
+        'agc': (carbon(200), 'float32'),
+        'bgc': (carbon(60), 'float32'),
+        'deadwood': (carbon(30), 'float32'),
+        'litter': (carbon(10), 'float32'),
+        'soil': (carbon(150), 'float32'),
+        'driver': (codes([0, 1, 2, 3, 4, 5]), 'uint8'),
+        'loss': (np.where(rng.random_sample((size, size)) < loss_fraction, codes(range(1, cn.loss_years + 1)), 0), 'uint8'),
+        'peat': (codes([0, 1]), 'uint8'),
+        'burn': (codes([0] * cn.loss_years + list(range(1, cn.loss_years + 1))), 'uint8'),
+        'ifl_primary': (codes([0, 1]), 'uint8'),
+        'ecozone': (codes([1, 1, 2, 3]), 'uint8'),
+        'climate': (codes(range(0, 13)), 'uint8'),
+        'plantation': (codes([0, 0, 0, 1, 2, 3]), 'uint8')
+    }
+
+    # Writes the tiles with the names the numpy engine reads
+    paths = gross_emissions_engine.tile_names(tile_id, sensit_type, folder)
+    for name, path in zip(gross_emissions_engine.input_names, paths):
+        array, dtype = inputs[name]
+        write_tile(path, array, dtype)
+
+    # The generic C++ script reads carbon pool tiles with the model type in their names
+    if sensit_type != 'std':
+        for name, pattern in [('agc', cn.pattern_AGC_emis_year), ('bgc', cn.pattern_BGC_emis_year),
+                              ('deadwood', cn.pattern_deadwood_emis_year_2000),
+                              ('litter', cn.pattern_litter_emis_year_2000), ('soil', cn.pattern_soil_C_emis_year_2000)]:
+            array, dtype = inputs[name]
+            write_tile(os.path.join(folder, '{0}_{1}_{2}.tif'.format(tile_id, pattern, sensit_type)), array, dtype)
+
+    # The C++ scripts read these loss tile names
+    loss_array, loss_dtype = inputs['loss']
+    for loss_name in ['{0}_{1}.tif'.format(cn.pattern_loss, tile_id),
+                      '{0}_{1}.tif'.format(tile_id, cn.pattern_Brazil_annual_loss_processed)]:
+        if os.path.join(folder, loss_name) not in paths:
+            write_tile(os.path.join(folder, loss_name), loss_array, loss_dtype)
+
+
+# Reads the outputs of a run
+def read_outputs(folder, emitted_pools, sensit_type):
+
+    outputs = []
+    for name in gross_emissions_engine.output_names(tile_id, emitted_pools, sensit_type):
+        with rasterio.open(os.path.join(folder, name)) as src:
+            outputs.append(src.read(1))
+
+    return outputs
+
+
+# Name of the compiled C++ script for the pool and model type options
+def cpp_exe(emitted_pools, sensit_type):
+
+    if emitted_pools == 'soil_only':
+        return '{0}/calc_gross_emissions_soil_only.exe'.format(cn.c_emis_compile_dst)
+    if sensit_type in ['no_shifting_ag', 'convert_to_grassland']:
+        return '{0}/calc_gross_emissions_{1}.exe'.format(cn.c_emis_compile_dst, sensit_type)
+
+    return '{0}/calc_gross_emissions_generic.exe'.format(cn.c_emis_compile_dst)
+
+
+def benchmark_gross_emissions(size, thread_counts, sensit_type, emitted_pools, folder, seed, loss_fraction):
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    folder = os.path.join(os.path.abspath(folder), '')
+    os.chdir(folder)
+
+    print("Making synthetic {0}x{0} inputs in {1}".format(size, folder))
+    make_inputs(folder, size, sensit_type, seed, loss_fraction)
+
+    numpy_outputs = None
+    for threads in thread_counts:
+        cn.gross_emissions_threads = threads
+        start = time.time()
+        gross_emissions_engine.create_gross_emissions(tile_id, emitted_pools, sensit_type, folder)
+        seconds = time.time() - start
+        print("numpy, {0} threads: {1:.1f} s ({2:.1f} million pixels/s)".format(
+            threads, seconds, size * size / seconds / 1e6))
+        numpy_outputs = read_outputs(folder, emitted_pools, sensit_type)
+
+    exe = cpp_exe(emitted_pools, sensit_type)
+    if not os.path.exists(exe):
+        print("{} not compiled; skipping the C++ comparison".format(exe))
+        return
+
+    start = time.time()
+    subprocess.check_call([exe, tile_id, sensit_type, folder], stdout=subprocess.DEVNULL)
+    seconds = time.time() - start
+    print("C++: {0:.1f} s ({1:.1f} million pixels/s)".format(seconds, size * size / seconds / 1e6))
+
+    cpp_outputs = read_outputs(folder, emitted_pools, sensit_type)
+    for name, numpy_output, cpp_output in zip(gross_emissions_engine.output_names(tile_id, emitted_pools, sensit_type),
+                                              numpy_outputs, cpp_outputs):
+        different = np.count_nonzero(numpy_output.view('uint32') != cpp_output.view('uint32'))
+        print("{0}: {1}".format(name, 'same' if different == 0 else '{} pixels differ'.format(different)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the numpy gross emissions engine against the C++')
+    parser.add_argument('--size', '-s', type=int, default=4000,
+                        help='Width and height of the synthetic tile in pixels. Full tiles are 40000.')
+    parser.add_argument('--threads', '-n', default='1,2,4,8',
+                        help='Comma-separated numbers of threads to time the numpy engine with')
+    parser.add_argument('--model-type', '-t', default='std',
+                        help='{}'.format(cn.model_type_arg_help))
+    parser.add_argument('--emitted-pools-to-use', '-p', default='biomass_soil',
+                        help='Options are soil_only or biomass_soil.')
+    parser.add_argument('--folder', '-f', default=os.path.join(cn.docker_tmp, 'gross_emissions_benchmark'),
+                        help='Folder for the synthetic inputs and the outputs')
+    parser.add_argument('--loss-fraction', type=float, default=0.1,
+                        help='Fraction of pixels with tree cover loss (only loss pixels have emissions)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic inputs')
+    args = parser.parse_args()
+
+    benchmark_gross_emissions(args.size, [int(threads) for threads in args.threads.split(',')],
+                              args.model_type, args.emitted_pools_to_use, args.folder, args.seed, args.loss_fraction)
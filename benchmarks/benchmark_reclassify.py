@@ -0,0 +1,103 @@
+'''
+Times the reclassification of code rasters into values with reclassify.py lookup tables, compared with the two ways
+the model used to do it: np.vectorize(dict.get) and loops of arr[arr == key] = value.
+Each approach is timed on a 40000-pixel row (one block of a striped tile) and on a 1024x1024 block, with synthetic
+dictionaries shaped like the model's: continent-ecozone codes (forest age category), continent-ecozone-age codes
+(IPCC default removal rates) and US age-group-region codes (US removal rates). Each result is checked against the
+dictionary loop.
+Run from carbon-budget/ with, e.g.:
+python benchmarks/benchmark_reclassify.py -r 20
+'''
+
+import argparse
+import os
+import sys
+import timeit
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import reclassify
+
+
+# Synthetic dictionaries with the kinds of codes and numbers of keys the model uses
+def make_dicts(rng):
+
+    cont_eco_codes = sorted(set(int(code) for code in rng.randint(1000, 9000, 120)))
+    cont_eco = dict((float(code), float(rate)) for code, rate in zip(cont_eco_codes, rng.random_sample(len(cont_eco_codes)) * 10))
+    cont_eco[0.0] = 0
+
+    cont_eco_age = {}
+    for age_code in [10000, 20000, 30000]:
+        for code in cont_eco_codes:
+            cont_eco_age[float(code + age_code)] = float(rng.random_sample() * 10)
+    for code in cont_eco_codes:
+        cont_eco_age[float(code)] = 0
+    cont_eco_age[0.0] = 0
+
+    US = {}
+    for age in [1, 2, 3]:
+        for group in range(1, 30):
+            for region in range(1, 10):
+                US[age * 10000 + group * 100 + region] = float(rng.random_sample() * 5)
+
+    return [('continent-ecozone', cont_eco, cont_eco_codes, 'uint16'),
+            ('continent-ecozone-age', cont_eco_age, sorted(int(key) for key in cont_eco_age), 'int32'),
+            ('US age-group-region', US, sorted(US), 'uint16')]
+
+
+# The ways codes were reclassified before reclassify.py
+def vectorize_get(mapping, codes):
+
+    return np.vectorize(mapping.get, otypes=['float32'])(codes)
+
+
+def dict_loop(mapping, codes):
+
+    values = codes.astype('float32')
+    for key, value in mapping.items():
+        values[values == key] = value
+
+    return values
+
+
+def benchmark_reclassify(repeats, seed):
+
+    rng = np.random.RandomState(seed)
+
+    for name, mapping, codes_in_table, dtype in make_dicts(rng):
+
+        lut = reclassify.compile_lut(mapping)
+
+        for shape_name, shape in [('40000-pixel row', (1, 40000)), ('1024x1024 block', (1024, 1024))]:
+
+            # Mostly codes in the dictionary, with some that aren't
+            codes = rng.choice(np.array(codes_in_table), size=shape).astype(dtype)
+            codes[rng.random_sample(shape) < 0.05] = 1
+
+            expected = dict_loop(mapping, codes)
+            result = lut.apply(codes, default=codes.astype('float32'))
+            assert np.array_equal(expected, result), '{0}, {1}: lookup table differs from the dictionary loop'.format(name, shape_name)
+
+            timings = [('lookup table', lambda: lut.apply(codes, default=codes.astype('float32'))),
+                       ('lookup table, default 0', lambda: lut.apply(codes)),
+                       ('dictionary loop', lambda: dict_loop(mapping, codes))]
+
+            # np.vectorize is too slow to time on many blocks
+            if shape[0] == 1:
+                timings.append(('np.vectorize(dict.get)', lambda: vectorize_get(mapping, codes)))
+
+            print("{0} codes ({1} keys), {2}:".format(name, len(mapping), shape_name))
+            for approach, function in timings:
+                seconds = min(timeit.repeat(function, number=1, repeat=repeats))
+                print("    {0:<25} {1:10.3f} ms".format(approach, seconds * 1000))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark lookup table reclassification against the earlier approaches')
+    parser.add_argument('--repeats', '-r', type=int, default=10,
+                        help='Number of times each approach is timed; the fastest time is reported')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic codes')
+    args = parser.parse_args()
+
+    benchmark_reclassify(args.repeats, args.seed)
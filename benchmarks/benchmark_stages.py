@@ -0,0 +1,626 @@
+'''
+Benchmarks the per-tile function of each stage of the model on synthetic tiles (synthetic_tiles.py), offline.
+The stages run in model order on one synthetic tile, like the mp_ scripts run them: each stage downloads its inputs
+from s3 into an empty working folder, calculates its outputs and uploads them, and the next stage downloads what it
+needs. s3 is moto's in-memory fake of s3, so nothing leaves the machine; the synthetic inputs are uploaded to their
+folders in cn first.
+Each stage's function runs in a forked process, like tile_scheduler.run runs it, and for each stage this records:
+wall and CPU seconds (including programs the stage runs, e.g., the C++ gross emissions); peak memory the stage adds
+to the process, in bytes (or the peak of programs it runs, if that's more); bytes read and written by the stage's
+process (read and write calls, so including reads from the page cache, but not by the programs it runs);
+bytes of inputs and outputs; peak scratch disk (bytes of files in the working folder besides the inputs, sampled
+while the stage runs); and seconds of downloads and uploads.
+Results are kept in a SQLite history. Each stage is compared with the median of its last few runs with the same
+tile size and seed, and increases of more than the threshold are flagged as regressions (the script exits with 1).
+Needs moto (pip install moto), which isn't in requirements.txt because the model doesn't use it.
+Run from carbon-budget/ with, e.g.:
+python benchmarks/benchmark_stages.py -s 4000 --stages gross_removals,carbon_pools,gross_emissions -t 0.2
+'''
+
+import argparse
+import datetime
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from functools import partial
+import boto3
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws    # moto < 5
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+for subfolder in ['data_prep', 'gain', 'carbon_pools', 'burn_date', 'emissions', 'analyses']:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', subfolder))
+import constants_and_names as cn
+import universal_util as uu
+import s3_transfer
+import synthetic_tiles
+import model_extent
+import forest_age_category_IPCC
+import annual_gain_rate_IPCC_defaults
+import annual_gain_rate_mangrove
+import US_removal_rates
+import annual_gain_rate_AGC_BGC_all_forest_types
+import gain_year_count_all_forest_types
+import gross_removals_all_forest_types
+import carbon_pools_engine
+import hansen_burnyear_final
+import calculate_gross_emissions
+import gross_emissions_engine
+import net_flux
+import create_supplementary_outputs
+import aggregate_results_to_4_km
+
+tile_id = synthetic_tiles.tile_id
+
+# Metrics compared with earlier runs, and the smallest increase of each that is flagged, so that timer and
+# allocator noise on fast stages isn't flagged
+compared_metrics = {'wall_seconds': 1, 'cpu_seconds': 1, 'peak_rss_bytes': 64 * 1024 ** 2,
+                    'read_bytes': 1024 ** 2, 'written_bytes': 1024 ** 2, 'scratch_bytes': 1024 ** 2}
+
+# All metrics recorded for each stage, in the order of the history's columns
+metrics = ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'read_bytes', 'written_bytes', 'input_bytes',
+           'output_bytes', 'scratch_bytes', 'download_seconds', 'upload_seconds']
+
+# How often the working folder's size is checked while a stage runs, in seconds
+scratch_poll_seconds = 0.1
+
+# Supplementary outputs of each model output, like mp_create_supplementary_outputs
+supplementary_patterns = [
+    (cn.pattern_cumul_gain_AGCO2_BGCO2_all_types,
+     {cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent],
+      cn.cumul_gain_AGCO2_BGCO2_all_types_forest_extent_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_forest_extent],
+      cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent]}),
+    (cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil,
+     {cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent],
+      cn.gross_emis_all_gases_all_drivers_biomass_soil_forest_extent_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_forest_extent],
+      cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent]}),
+    (cn.pattern_net_flux,
+     {cn.net_flux_per_pixel_full_extent_dir: [cn.pattern_net_flux_per_pixel_full_extent],
+      cn.net_flux_forest_extent_dir: [cn.pattern_net_flux_forest_extent],
+      cn.net_flux_per_pixel_forest_extent_dir: [cn.pattern_net_flux_per_pixel_forest_extent]})
+]
+
+# Output folders of the gross emissions, in the order of gross_emissions_engine.output_patterns
+gross_emissions_dirs = [cn.gross_emis_commod_biomass_soil_dir, cn.gross_emis_shifting_ag_biomass_soil_dir,
+                        cn.gross_emis_forestry_biomass_soil_dir, cn.gross_emis_wildfire_biomass_soil_dir,
+                        cn.gross_emis_urban_biomass_soil_dir, cn.gross_emis_no_driver_biomass_soil_dir,
+                        cn.gross_emis_all_gases_all_drivers_biomass_soil_dir,
+                        cn.gross_emis_co2_only_all_drivers_biomass_soil_dir,
+                        cn.gross_emis_non_co2_all_drivers_biomass_soil_dir, cn.gross_emis_nodes_biomass_soil_dir]
+
+
+# Supplementary outputs (per pixel and forest extent) of all three model outputs of a tile
+def supplementary_outputs(tile_id, sensit_type):
+
+    for input_pattern, outputs in supplementary_patterns:
+        create_supplementary_outputs.create_supplementary_outputs(
+            tile_id, input_pattern, [patterns[0] for patterns in outputs.values()], sensit_type)
+
+
+# The stages in model order, as (name, inputs, per-tile function, outputs).
+# Inputs and outputs are {s3 folder: [pattern]}, like the download_dict of the mp_ scripts.
+# Functions take the tile id, like the functions the mp_ scripts give tile_scheduler.run.
+def stages(tables, folder):
+
+    sensit_type = 'std'
+
+    return [
+        ('model_extent',
+         {cn.mangrove_biomass_2000_dir: [cn.pattern_mangrove_biomass_2000],
+          cn.gain_dir: [cn.pattern_gain],
+          cn.plant_pre_2000_processed_dir: [cn.pattern_plant_pre_2000],
+          cn.tcd_dir: [cn.pattern_tcd],
+          cn.WHRC_biomass_2000_unmasked_dir: [cn.pattern_WHRC_biomass_2000_unmasked]},
+         partial(model_extent.model_extent, pattern=cn.pattern_model_extent, sensit_type=sensit_type),
+         {cn.model_extent_dir: [cn.pattern_model_extent]}),
+
+        ('forest_age_category_IPCC',
+         {cn.gain_dir: [cn.pattern_gain],
+          cn.model_extent_dir: [cn.pattern_model_extent],
+          cn.ifl_primary_processed_dir: [cn.pattern_ifl_primary],
+          cn.cont_eco_dir: [cn.pattern_cont_eco_processed],
+          cn.WHRC_biomass_2000_unmasked_dir: [cn.pattern_WHRC_biomass_2000_unmasked],
+          cn.loss_dir: [cn.pattern_loss]},
+         partial(forest_age_category_IPCC.forest_age_category, gain_table_dict=tables['age_category'],
+                 pattern=cn.pattern_age_cat_IPCC, sensit_type=sensit_type),
+         {cn.age_cat_IPCC_dir: [cn.pattern_age_cat_IPCC]}),
+
+        ('annual_removals_IPCC',
+         {cn.age_cat_IPCC_dir: [cn.pattern_age_cat_IPCC],
+          cn.cont_eco_dir: [cn.pattern_cont_eco_processed]},
+         partial(annual_gain_rate_IPCC_defaults.annual_gain_rate, sensit_type=sensit_type,
+                 gain_table_dict=tables['IPCC_gain'], stdev_table_dict=tables['IPCC_stdev'],
+                 output_pattern_list=[cn.pattern_annual_gain_AGB_IPCC_defaults,
+                                      cn.pattern_annual_gain_BGB_IPCC_defaults,
+                                      cn.pattern_stdev_annual_gain_AGB_IPCC_defaults]),
+         {cn.annual_gain_AGB_IPCC_defaults_dir: [cn.pattern_annual_gain_AGB_IPCC_defaults],
+          cn.annual_gain_BGB_IPCC_defaults_dir: [cn.pattern_annual_gain_BGB_IPCC_defaults],
+          cn.stdev_annual_gain_AGB_IPCC_defaults_dir: [cn.pattern_stdev_annual_gain_AGB_IPCC_defaults]}),
+
+        ('annual_removals_mangrove',
+         {cn.mangrove_biomass_2000_dir: [cn.pattern_mangrove_biomass_2000],
+          cn.cont_eco_dir: [cn.pattern_cont_eco_processed]},
+         partial(annual_gain_rate_mangrove.annual_gain_rate, sensit_type=sensit_type,
+                 output_pattern_list=[cn.pattern_annual_gain_AGB_mangrove, cn.pattern_annual_gain_BGB_mangrove,
+                                      cn.pattern_stdev_annual_gain_AGB_mangrove],
+                 gain_above_dict=tables['mangrove_gain_above'], gain_below_dict=tables['mangrove_gain_below'],
+                 stdev_dict=tables['mangrove_stdev']),
+         {cn.annual_gain_AGB_mangrove_dir: [cn.pattern_annual_gain_AGB_mangrove],
+          cn.annual_gain_BGB_mangrove_dir: [cn.pattern_annual_gain_BGB_mangrove],
+          cn.stdev_annual_gain_AGB_mangrove_dir: [cn.pattern_stdev_annual_gain_AGB_mangrove]}),
+
+        ('annual_removals_US',
+         {cn.gain_dir: [cn.pattern_gain],
+          cn.age_cat_natrl_forest_US_dir: [cn.pattern_age_cat_natrl_forest_US],
+          cn.FIA_forest_group_processed_dir: [cn.pattern_FIA_forest_group_processed],
+          cn.FIA_regions_processed_dir: [cn.pattern_FIA_regions_processed]},
+         partial(US_removal_rates.US_removal_rate_calc,
+                 gain_table_group_region_age_dict=tables['US_gain_group_region_age'],
+                 gain_table_group_region_dict=tables['US_gain_group_region'],
+                 stdev_table_group_region_age_dict=tables['US_stdev_group_region_age'],
+                 stdev_table_group_region_dict=tables['US_stdev_group_region'],
+                 output_pattern_list=[cn.pattern_annual_gain_AGC_BGC_natrl_forest_US,
+                                      cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US]),
+         {cn.annual_gain_AGC_BGC_natrl_forest_US_dir: [cn.pattern_annual_gain_AGC_BGC_natrl_forest_US],
+          cn.stdev_annual_gain_AGC_BGC_natrl_forest_US_dir: [cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US]}),
+
+        ('annual_removals_all_forest_types',
+         {cn.model_extent_dir: [cn.pattern_model_extent],
+          cn.annual_gain_AGB_mangrove_dir: [cn.pattern_annual_gain_AGB_mangrove],
+          cn.annual_gain_BGB_mangrove_dir: [cn.pattern_annual_gain_BGB_mangrove],
+          cn.annual_gain_AGC_BGC_natrl_forest_Europe_dir: [cn.pattern_annual_gain_AGC_BGC_natrl_forest_Europe],
+          cn.annual_gain_AGC_BGC_planted_forest_unmasked_dir: [cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked],
+          cn.annual_gain_AGC_BGC_natrl_forest_US_dir: [cn.pattern_annual_gain_AGC_BGC_natrl_forest_US],
+          cn.annual_gain_AGC_natrl_forest_young_dir: [cn.pattern_annual_gain_AGC_natrl_forest_young],
+          cn.age_cat_IPCC_dir: [cn.pattern_age_cat_IPCC],
+          cn.annual_gain_AGB_IPCC_defaults_dir: [cn.pattern_annual_gain_AGB_IPCC_defaults],
+          cn.stdev_annual_gain_AGB_mangrove_dir: [cn.pattern_stdev_annual_gain_AGB_mangrove],
+          cn.stdev_annual_gain_AGC_BGC_natrl_forest_Europe_dir: [cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_Europe],
+          cn.stdev_annual_gain_AGC_BGC_planted_forest_unmasked_dir: [cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked],
+          cn.stdev_annual_gain_AGC_BGC_natrl_forest_US_dir: [cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US],
+          cn.stdev_annual_gain_AGC_natrl_forest_young_dir: [cn.pattern_stdev_annual_gain_AGC_natrl_forest_young],
+          cn.stdev_annual_gain_AGB_IPCC_defaults_dir: [cn.pattern_stdev_annual_gain_AGB_IPCC_defaults]},
+         partial(annual_gain_rate_AGC_BGC_all_forest_types.annual_gain_rate_AGC_BGC_all_forest_types,
+                 output_pattern_list=[cn.pattern_removal_forest_type, cn.pattern_annual_gain_AGC_all_types,
+                                      cn.pattern_annual_gain_BGC_all_types, cn.pattern_annual_gain_AGC_BGC_all_types,
+                                      cn.pattern_stdev_annual_gain_AGC_all_types],
+                 sensit_type=sensit_type),
+         {cn.removal_forest_type_dir: [cn.pattern_removal_forest_type],
+          cn.annual_gain_AGC_all_types_dir: [cn.pattern_annual_gain_AGC_all_types],
+          cn.annual_gain_BGC_all_types_dir: [cn.pattern_annual_gain_BGC_all_types],
+          cn.annual_gain_AGC_BGC_all_types_dir: [cn.pattern_annual_gain_AGC_BGC_all_types],
+          cn.stdev_annual_gain_AGC_all_types_dir: [cn.pattern_stdev_annual_gain_AGC_all_types]}),
+
+        ('gain_year_count',
+         {cn.loss_dir: [cn.pattern_loss],
+          cn.gain_dir: [cn.pattern_gain],
+          cn.model_extent_dir: [cn.pattern_model_extent]},
+         partial(gain_year_count_all_forest_types.create_gain_year_count, pattern=cn.pattern_gain_year_count,
+                 sensit_type=sensit_type),
+         {cn.gain_year_count_dir: [cn.pattern_gain_year_count]}),
+
+        ('gross_removals',
+         {cn.annual_gain_AGC_all_types_dir: [cn.pattern_annual_gain_AGC_all_types],
+          cn.annual_gain_BGC_all_types_dir: [cn.pattern_annual_gain_BGC_all_types],
+          cn.gain_year_count_dir: [cn.pattern_gain_year_count]},
+         partial(gross_removals_all_forest_types.gross_removals_all_forest_types,
+                 output_pattern_list=[cn.pattern_cumul_gain_AGCO2_all_types, cn.pattern_cumul_gain_BGCO2_all_types,
+                                      cn.pattern_cumul_gain_AGCO2_BGCO2_all_types],
+                 sensit_type=sensit_type),
+         {cn.cumul_gain_AGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_all_types],
+          cn.cumul_gain_BGCO2_all_types_dir: [cn.pattern_cumul_gain_BGCO2_all_types],
+          cn.cumul_gain_AGCO2_BGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types]}),
+
+        ('carbon_pools',
+         {cn.removal_forest_type_dir: [cn.pattern_removal_forest_type],
+          cn.mangrove_biomass_2000_dir: [cn.pattern_mangrove_biomass_2000],
+          cn.gain_dir: [cn.pattern_gain],
+          cn.annual_gain_AGC_all_types_dir: [cn.pattern_annual_gain_AGC_all_types],
+          cn.cumul_gain_AGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_all_types],
+          cn.cont_eco_dir: [cn.pattern_cont_eco_processed],
+          cn.bor_tem_trop_processed_dir: [cn.pattern_bor_tem_trop_processed],
+          cn.precip_processed_dir: [cn.pattern_precip],
+          cn.elevation_processed_dir: [cn.pattern_elevation],
+          cn.soil_C_full_extent_2000_dir: [cn.pattern_soil_C_full_extent_2000],
+          cn.WHRC_biomass_2000_unmasked_dir: [cn.pattern_WHRC_biomass_2000_unmasked],
+          cn.loss_dir: [cn.pattern_loss]},
+         partial(carbon_pools_engine.create_carbon_pools, mang_BGB_AGB_ratio=tables['mangrove_BGB_AGB_ratio'],
+                 mang_deadwood_AGB_ratio=tables['mangrove_deadwood_AGB_ratio'],
+                 mang_litter_AGB_ratio=tables['mangrove_litter_AGB_ratio'], carbon_pool_extent='loss',
+                 sensit_type=sensit_type),
+         {cn.AGC_emis_year_dir: [cn.pattern_AGC_emis_year],
+          cn.BGC_emis_year_dir: [cn.pattern_BGC_emis_year],
+          cn.deadwood_emis_year_2000_dir: [cn.pattern_deadwood_emis_year_2000],
+          cn.litter_emis_year_2000_dir: [cn.pattern_litter_emis_year_2000],
+          cn.soil_C_emis_year_2000_dir: [cn.pattern_soil_C_emis_year_2000],
+          cn.total_C_emis_year_dir: [cn.pattern_total_C_emis_year]}),
+
+        # Also downloads the burned area tiles of each year from s3
+        ('burn_year',
+         {cn.loss_dir: [cn.pattern_loss]},
+         hansen_burnyear_final.hansen_burnyear,
+         {cn.burn_year_dir: [cn.pattern_burn_year]}),
+
+        ('gross_emissions',
+         {cn.AGC_emis_year_dir: [cn.pattern_AGC_emis_year],
+          cn.BGC_emis_year_dir: [cn.pattern_BGC_emis_year],
+          cn.deadwood_emis_year_2000_dir: [cn.pattern_deadwood_emis_year_2000],
+          cn.litter_emis_year_2000_dir: [cn.pattern_litter_emis_year_2000],
+          cn.soil_C_emis_year_2000_dir: [cn.pattern_soil_C_emis_year_2000],
+          cn.peat_mask_dir: [cn.pattern_peat_mask],
+          cn.ifl_primary_processed_dir: [cn.pattern_ifl_primary],
+          cn.planted_forest_type_unmasked_dir: [cn.pattern_planted_forest_type_unmasked],
+          cn.drivers_processed_dir: [cn.pattern_drivers],
+          cn.climate_zone_processed_dir: [cn.pattern_climate_zone],
+          cn.bor_tem_trop_processed_dir: [cn.pattern_bor_tem_trop_processed],
+          cn.burn_year_dir: [cn.pattern_burn_year],
+          cn.loss_dir: [cn.pattern_loss]},
+         partial(calculate_gross_emissions.calc_emissions, emitted_pools='biomass_soil', sensit_type=sensit_type,
+                 folder=folder),
+         dict((dir, [pattern]) for dir, pattern in
+              zip(gross_emissions_dirs, gross_emissions_engine.output_patterns('biomass_soil', sensit_type)))),
+
+        ('net_flux',
+         {cn.cumul_gain_AGCO2_BGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types],
+          cn.gross_emis_all_gases_all_drivers_biomass_soil_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil]},
+         partial(net_flux.net_calc, pattern=cn.pattern_net_flux, sensit_type=sensit_type),
+         {cn.net_flux_dir: [cn.pattern_net_flux]}),
+
+        ('supplementary_outputs',
+         {cn.tcd_dir: [cn.pattern_tcd],
+          cn.gain_dir: [cn.pattern_gain],
+          cn.mangrove_biomass_2000_dir: [cn.pattern_mangrove_biomass_2000],
+          cn.cumul_gain_AGCO2_BGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types],
+          cn.gross_emis_all_gases_all_drivers_biomass_soil_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil],
+          cn.net_flux_dir: [cn.pattern_net_flux]},
+         partial(supplementary_outputs, sensit_type=sensit_type),
+         dict(output for input_pattern, outputs in supplementary_patterns for output in outputs.items())),
+
+        # The aggregated tiles are mosaicked by mp_aggregate_results_to_4_km, not uploaded, so there are no outputs
+        ('aggregate',
+         {cn.tcd_dir: [cn.pattern_tcd],
+          cn.gain_dir: [cn.pattern_gain],
+          cn.mangrove_biomass_2000_dir: [cn.pattern_mangrove_biomass_2000],
+          cn.annual_gain_AGC_all_types_dir: [cn.pattern_annual_gain_AGC_all_types],
+          cn.cumul_gain_AGCO2_BGCO2_all_types_dir: [cn.pattern_cumul_gain_AGCO2_BGCO2_all_types],
+          cn.gross_emis_all_gases_all_drivers_biomass_soil_dir: [cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil],
+          cn.net_flux_dir: [cn.pattern_net_flux]},
+         partial(aggregate_results_to_4_km.aggregate,
+                 tile_types=[cn.pattern_annual_gain_AGC_all_types, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types,
+                             cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil, cn.pattern_net_flux],
+                 thresh=30, sensit_type=sensit_type),
+         {})
+    ]
+
+
+# Bytes of all files in a folder and its subfolders
+def folder_bytes(folder):
+
+    total = 0
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass    # Deleted while the folder was being walked
+
+    return total
+
+
+# Fields of /proc/self/status (e.g., VmRSS), in bytes
+def _proc_status(field):
+
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+
+    return 0
+
+
+# I/O counters of this process from /proc/self/io
+def _proc_io():
+
+    with open('/proc/self/io') as io:
+        return dict((line.split(':')[0], int(line.split(':')[1])) for line in io)
+
+
+# Runs a stage's function on the tile in a forked process in the folder and measures it.
+# The peak memory the stage adds is the process's peak RSS (reset when the stage starts) minus its RSS when it started,
+# since the forked process starts with the memory of this one (including the fake s3).
+def measure(function, folder, input_bytes):
+
+    read_fd, write_fd = os.pipe()
+    start = time.time()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        os.chdir(folder)
+        status = 1
+        try:
+            try:
+                with open('/proc/self/clear_refs', 'w') as clear_refs:
+                    clear_refs.write('5')
+            except OSError:
+                pass    # Older kernels can't reset the peak, so the peak may be from before the stage
+            start_rss = _proc_status('VmRSS')
+            function(tile_id)
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            io = _proc_io()
+            peak_rss = max(_proc_status('VmHWM') - start_rss,
+                           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+            os.write(write_fd, json.dumps({'peak_rss_bytes': peak_rss, 'read_bytes': io['rchar'],
+                                           'written_bytes': io['wchar']}).encode())
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    os.close(write_fd)
+
+    # Samples the size of the working folder until the stage finishes
+    scratch_bytes = 0
+    while True:
+        done_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+        if done_pid:
+            break
+        scratch_bytes = max(scratch_bytes, folder_bytes(folder) - input_bytes)
+        time.sleep(scratch_poll_seconds)
+
+    wall_seconds = time.time() - start
+
+    with os.fdopen(read_fd) as reader:
+        report = reader.read()
+
+    result = json.loads(report) if report else {}
+    result.update(wall_seconds=wall_seconds, cpu_seconds=rusage.ru_utime + rusage.ru_stime,
+                  scratch_bytes=max(scratch_bytes, folder_bytes(folder) - input_bytes))
+    ok = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+    return ok, result
+
+
+# Runs one stage like its mp_ script: downloads the inputs into an empty working folder, runs the function on the
+# tile and uploads the outputs
+def run_stage(name, inputs, function, outputs, folder):
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    os.chdir(folder)
+
+    print("Running {}".format(name))
+
+    start = time.time()
+    for dir, patterns in inputs.items():
+        uu.s3_flexible_download(dir, patterns[0], folder, 'std', [tile_id])
+    download_seconds = time.time() - start
+    input_bytes = folder_bytes(folder)
+
+    ok, result = measure(function, folder, input_bytes)
+    result['input_bytes'] = input_bytes
+    result['output_bytes'] = max(folder_bytes(folder) - input_bytes, 0)
+
+    start = time.time()
+    for dir, patterns in outputs.items():
+        uu.upload_final_set(dir, patterns[0])
+    result['upload_seconds'] = time.time() - start
+    result['download_seconds'] = download_seconds
+
+    return ok, result
+
+
+# Makes the buckets of the s3 folders in the fake s3 and uploads the synthetic inputs to the folders the stages
+# download them from
+def seed_fake_s3(stage_list, folder, size, seed):
+
+    s3_dirs = set([cn.burn_year_warped_to_Hansen_dir])
+    for name, inputs, function, outputs in stage_list:
+        s3_dirs.update(inputs)
+        s3_dirs.update(outputs)
+
+    client = boto3.client('s3', region_name='us-east-1')
+    for bucket in sorted(set(s3_transfer.split_s3_path(dir)[0] for dir in s3_dirs)):
+        client.create_bucket(Bucket=bucket)
+
+    input_folder = os.path.join(folder, 'inputs')
+    print("Making synthetic {0}x{0} inputs in {1}".format(size, input_folder))
+
+    uploads = {}
+    for name, inputs, function, outputs in stage_list:
+        for dir, patterns in inputs.items():
+            if patterns[0] in synthetic_tiles.layers:
+                uploads[patterns[0]] = dir
+
+    for pattern, dir in sorted(uploads.items()):
+        path = synthetic_tiles.write_inputs(input_folder, size, seed, [pattern])[0]
+        s3_transfer.upload_file(path, dir)
+
+    for path in synthetic_tiles.write_burned_area(input_folder, size, seed):
+        s3_transfer.upload_file(path, cn.burn_year_warped_to_Hansen_dir)
+
+    shutil.rmtree(input_folder)
+
+
+# Commit of the code being benchmarked, if this is a git checkout
+def git_commit():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except:
+        return ''
+
+
+# Opens the history of benchmark results, creating its tables if needed
+def open_history(path):
+
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, started TEXT, git_commit TEXT, '
+                       'size INTEGER, seed INTEGER)')
+    connection.execute('CREATE TABLE IF NOT EXISTS stage_results (run_id INTEGER, stage TEXT, ok INTEGER, {})'.format(
+        ', '.join('{} REAL'.format(metric) for metric in metrics)))
+    connection.commit()
+
+    return connection
+
+
+# Median of each compared metric of the last successful runs of a stage with the same tile size and seed
+def baseline(connection, stage, size, seed, baseline_runs):
+
+    rows = connection.execute(
+        'SELECT {} FROM stage_results JOIN runs USING (run_id) WHERE stage = ? AND size = ? AND seed = ? AND ok = 1 '
+        'ORDER BY run_id DESC LIMIT ?'.format(', '.join(compared_metrics)),
+        (stage, size, seed, baseline_runs)).fetchall()
+
+    if not rows:
+        return None
+
+    return dict((metric, statistics.median(row[i] for row in rows)) for i, metric in enumerate(compared_metrics))
+
+
+# Metrics of a stage's result that are more than the threshold (fraction) above the baseline, as
+# (metric, value, baseline) tuples
+def regressions(result, stage_baseline, threshold):
+
+    if stage_baseline is None:
+        return []
+
+    flagged = []
+    for metric, noise in compared_metrics.items():
+        value = result.get(metric, 0)
+        previous = stage_baseline[metric]
+        if value > previous * (1 + threshold) and value - previous > noise:
+            flagged.append((metric, value, previous))
+
+    return flagged
+
+
+def benchmark_stages(size, seed, stage_names, folder, history, threshold, baseline_runs):
+
+    folder = os.path.abspath(folder)
+    cwd = os.getcwd()
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    # Everything the model writes outside the working folder (tile scheduler costs, tile manifest, fake s3 objects
+    # too big to keep in memory) goes in the benchmark folder. s3 transfers don't use the local tile cache, so every
+    # stage downloads its inputs.
+    cn.docker_tmp = os.path.join(folder, 'tmp')
+    os.makedirs(cn.docker_tmp)
+    tempfile.tempdir = cn.docker_tmp
+    cn.tile_cache_dir = os.path.join(folder, 'tile_cache')
+    cn.tile_cache_max_bytes = 0
+    cn.s3_endpoint_url = None
+    working_folder = os.path.join(folder, 'tiles', '')
+    cn.docker_base_dir = working_folder
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    # Tiles are aggregated in windows of 160x160 pixels
+    if size % aggregate_results_to_4_km.aggregated_pixel_size != 0:
+        uu.exception_log("Tile size must be a multiple of {} pixels".format(aggregate_results_to_4_km.aggregated_pixel_size))
+
+    stage_list = stages(synthetic_tiles.lookup_tables(seed), working_folder)
+    if stage_names is None:
+        stage_names = [name for name, inputs, function, outputs in stage_list]
+    for stage_name in stage_names:
+        if stage_name not in [name for name, inputs, function, outputs in stage_list]:
+            uu.exception_log("Invalid stage {0}. Please choose from {1}.".format(
+                stage_name, ', '.join(name for name, inputs, function, outputs in stage_list)))
+
+    # Stages before the last requested one are run for their outputs even if they aren't requested
+    last = max([name for name, inputs, function, outputs in stage_list].index(stage_name) for stage_name in stage_names)
+    stage_list = stage_list[:last + 1]
+
+    connection = open_history(history)
+    started = datetime.datetime.now().isoformat(timespec='seconds')
+    results = []
+
+    with mock_aws():
+
+        seed_fake_s3(stage_list, folder, size, seed)
+
+        for name, inputs, function, outputs in stage_list:
+            ok, result = run_stage(name, inputs, function, outputs, working_folder)
+            if name in stage_names:
+                results.append((name, ok, result))
+            if not ok:
+                print("{} failed; later stages would be missing its outputs, so stopping".format(name))
+                break
+
+    # Compares the results with the earlier runs before they are added to the history
+    flagged = {}
+    for name, ok, result in results:
+        if ok:
+            flagged[name] = regressions(result, baseline(connection, name, size, seed, baseline_runs), threshold)
+
+    run_id = connection.execute('INSERT INTO runs (started, git_commit, size, seed) VALUES (?, ?, ?, ?)',
+                                (started, git_commit(), size, seed)).lastrowid
+    for name, ok, result in results:
+        connection.execute('INSERT INTO stage_results VALUES (?, ?, ?, {})'.format(', '.join('?' * len(metrics))),
+                           [run_id, name, int(ok)] + [result.get(metric) for metric in metrics])
+    connection.commit()
+    connection.close()
+
+    megabytes = 1024 ** 2
+    print("")
+    print("{0:<34}{1:>8}{2:>8}{3:>10}{4:>10}{5:>10}{6:>10}  {7}".format(
+        'Stage', 'Wall s', 'CPU s', 'Peak MB', 'Read MB', 'Write MB', 'Disk MB', 'Regressions'))
+    for name, ok, result in results:
+        if not ok:
+            print("{0:<34}failed".format(name))
+            continue
+        print("{0:<34}{1:>8.1f}{2:>8.1f}{3:>10.0f}{4:>10.0f}{5:>10.0f}{6:>10.0f}  {7}".format(
+            name, result['wall_seconds'], result['cpu_seconds'], result['peak_rss_bytes'] / megabytes,
+            result['read_bytes'] / megabytes, result['written_bytes'] / megabytes,
+            result['scratch_bytes'] / megabytes,
+            ', '.join('{0} {1:.3g} (was {2:.3g})'.format(metric, value, previous)
+                      for metric, value, previous in flagged[name])))
+    print("Results saved as run {0} in {1}".format(run_id, history))
+
+    os.chdir(cwd)
+    shutil.rmtree(folder)
+
+    return results, flagged
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the model on synthetic tiles')
+    parser.add_argument('--size', '-s', type=int, default=4000,
+                        help='Width and height of the synthetic tiles in pixels, a multiple of 160. Full tiles are 40000.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic inputs')
+    parser.add_argument('--stages', default=None,
+                        help='Comma-separated stages to benchmark (all if not given). Earlier stages also run for their outputs.')
+    parser.add_argument('--folder', '-f', default=os.path.join(cn.docker_tmp, 'stage_benchmark'),
+                        help='Folder for the synthetic inputs and outputs. Deleted afterwards.')
+    parser.add_argument('--history', default=os.path.join(cn.docker_tmp, 'stage_benchmarks.sqlite'),
+                        help='SQLite file the results of every run are kept in')
+    parser.add_argument('--threshold', '-t', type=float, default=0.2,
+                        help='Fraction above the median of earlier runs at which a metric is flagged as a regression')
+    parser.add_argument('--baseline-runs', type=int, default=5,
+                        help='Number of earlier runs whose median each stage is compared with')
+    args = parser.parse_args()
+
+    results, flagged = benchmark_stages(args.size, args.seed, args.stages.split(',') if args.stages else None,
+                                        args.folder, args.history, args.threshold, args.baseline_runs)
+
+    if any(flagged.values()) or not all(ok for name, ok, result in results):
+        sys.exit(1)
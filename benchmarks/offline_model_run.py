@@ -0,0 +1,647 @@
+'''
+Runs run_full_model.py end to end offline, on a few small synthetic tiles (synthetic_tiles.py) and against a local
+s3-compatible server (moto's server) instead of s3, for the standard model and the sensitivity analyses.
+The server is seeded with synthetic tiles for every s3 folder the model reads: the inputs of the stages in
+run_full_model's stage graph that no stage writes (including the inputs that sensitivity analyses swap in), the
+pixel area tiles that valid tile ids are checked against, and the removal rate spreadsheets.
+The model runs in its own process with AWS_ENDPOINT_URL pointing at the server and the local folders in cn (tiles,
+tmp, tile cache, the app folder and the log) in the harness's folder, so it doesn't touch s3 or the machine's model folders.
+The standard model runs first, because the sensitivity analyses read some of its outputs (e.g., mangrove removals),
+and sensitivity analyses that compare their aggregated net flux with the standard model's get its map.
+The same tile size and seed always give the same outputs. After each run, a checksum of the pixels of each tile it
+wrote to s3 is taken (of the pixels rather than the files, because files have the date they were made in their
+metadata tags). The checksums are compared with the ones in the checksum file and the script exits with 1 if any
+differ or a run fails. If there is no checksum file yet, or with --update-checksums, the checksums are saved in it.
+--stages runs the named stages one at a time instead of all of them (e.g., to leave out aggregate on a machine without
+the GDAL command line programs).
+--loss-year-update checks the incremental update for new loss (loss_year_update.py) instead: the standard model is run
+with the synthetic loss, then with a previous version of that loss (without the last year in some tiles), and then
+updated from the previous version to the synthetic loss with -lu true. Every tile the update leaves or writes must be
+the same as the tile from the first run. The number of loss years is the same in all three runs; the stages that use it
+are run on all tiles in the update anyway, so the check is of the stages whose tiles the update doesn't run again.
+With --new-loss-year, the previous version is instead run with one loss year fewer (cn.loss_years - 1, as if cn had
+been edited, so the patterns made from it change too) and without the last year of loss in any tile, and the update
+adds that year. This checks that the tiles the update copies forward or leaves in place line up with the outputs of
+the new number of loss years. The last tile has no loss in the last year, so its loss doesn't change.
+--fan-out checks running several model types in one model run (sensitivity_fanout.py) instead: the model types are
+run separately, their outputs are deleted, and they are run again together. Each tile of a separate run must be the
+same as the tile the run of all of them writes or, for the stages a sensitivity analysis shares with the standard
+model, as the standard model's tile.
+Needs moto's server and openpyxl (pip install "moto[server]" openpyxl), which aren't in requirements.txt because the
+model doesn't use them.
+Run from carbon-budget/ with, e.g.:
+python benchmarks/offline_model_run.py -s 320 --model-types std,biomass_swap,legal_Amazon_loss
+python benchmarks/offline_model_run.py -s 320 --loss-year-update
+python benchmarks/offline_model_run.py -s 320 --loss-year-update --new-loss-year
+python benchmarks/offline_model_run.py -s 320 --fan-out --model-types std,maxgain,no_shifting_ag,biomass_swap
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import rasterio
+from moto.server import ThreadedMotoServer
+app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(app_dir)
+import constants_and_names as cn
+
+# A tile in the legal Amazon, one in the US and one in the Mekong, so that the sensitivity analyses that use
+# regional inputs have tiles in their regions
+tile_ids = ['00N_050W', '40N_090W', '20N_100E']
+
+# Arguments of the model runs besides the model type and stages
+carbon_pool_extent = {'std': 'loss,2000'}
+emitted_pools = 'biomass_soil'
+tcd_threshold = '30'
+
+# s3 folder of the previous version's loss tiles for the loss year update check
+previous_loss_dir = 's3://gfw2-data/forest_change/offline_model_run_previous_loss/'
+
+
+# Points the local folders in cn at the harness's folder. Must be done before any mp_ script is imported, since they
+# change to cn.docker_base_dir when they are imported.
+def use_folder(folder):
+
+    cn.docker_base_dir = os.path.join(folder, 'tiles', '')
+    cn.docker_tmp = os.path.join(folder, 'tmp')
+    cn.tile_cache_dir = os.path.join(folder, 'tile_cache')
+    cn.docker_app = os.path.abspath(app_dir)
+    cn.c_emis_compile_dst = os.path.join(cn.docker_app, 'emissions', 'cpp_util')
+    cn.model_log = os.path.join(folder, 'logs', cn.model_log)
+
+    for local_dir in [cn.docker_base_dir, cn.docker_tmp, cn.tile_cache_dir, os.path.dirname(cn.model_log)]:
+        if not os.path.exists(local_dir):
+            os.makedirs(local_dir)
+
+    tempfile.tempdir = cn.docker_tmp
+
+
+# Makes cn again with another number of loss years, as if constants_and_names.py had been edited, so the patterns
+# made from it (e.g., ..._2001_{loss_years}) change too
+def set_loss_years(loss_years):
+
+    with open(cn.__file__) as cn_file:
+        source = cn_file.read()
+
+    source = re.sub(r'^loss_years = \d+$', 'loss_years = {}'.format(loss_years), source, count=1, flags=re.MULTILINE)
+    exec(compile(source, cn.__file__, 'exec'), vars(cn))
+
+
+# Runs run_full_model.py with the model arguments in this process, with the local folders in the harness's folder
+# and the cn values the harness overrides (OFFLINE_MODEL_RUN_CN, as JSON). This is what the harness runs in the model's process.
+def run_model_here(folder, model_args):
+
+    overrides = json.loads(os.environ.get('OFFLINE_MODEL_RUN_CN', '{}'))
+    if 'loss_years' in overrides:
+        set_loss_years(overrides.pop('loss_years'))
+
+    use_folder(folder)
+    for name, value in overrides.items():
+        setattr(cn, name, value)
+    sys.path.insert(0, cn.docker_app)
+    sys.argv = ['run_full_model.py'] + model_args
+
+    import run_full_model
+    run_full_model.main()
+
+
+# A free local port for the s3 server
+def free_port():
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Starts the local s3 server and points this process at it.
+# Returns the server and the environment for the model's processes.
+def start_s3_server():
+
+    # Credentials don't matter to the server, but fake ones make sure no real ones are used
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint = 'http://127.0.0.1:{}'.format(port)
+    env = dict(os.environ, AWS_ENDPOINT_URL=endpoint, AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+               AWS_SESSION_TOKEN='testing', AWS_DEFAULT_REGION='us-east-1')
+    os.environ.update(env)
+    cn.s3_endpoint_url = endpoint
+
+    return server, env
+
+
+# Runs run_full_model.py with the model arguments in a new process of this script.
+# overrides are cn values to use in that process (e.g., another loss folder). Returns whether the run succeeded.
+def run_model(folder, model_args, env, overrides=None):
+
+    print("Running run_full_model.py {}".format(' '.join(model_args)))
+    run_env = dict(env, OFFLINE_MODEL_RUN_CN=json.dumps(overrides or {}))
+
+    return subprocess.call([sys.executable, os.path.abspath(__file__), '--run-model', folder] + model_args, env=run_env) == 0
+
+
+# (s3 folder, pattern) of every tile the model reads but doesn't write, for the model types.
+# These are the inputs of the stages in the stage graph that no stage outputs, with sensitivity analysis inputs
+# swapped in, plus the pixel area tiles that tile ids are checked against.
+def model_inputs(model_types):
+
+    import run_full_model
+
+    outputs = set()
+    for stage in run_full_model.model_graph:
+        for s3_dir, pattern in stage.output_list(run_args('std', None)):
+            outputs.add(pattern)
+
+    inputs = [(cn.pixel_area_dir, cn.pattern_pixel_area)]
+    for model_type in model_types:
+        for stage in run_full_model.model_graph:
+            if not stage.runs_for(model_type):
+                continue
+            for s3_dir, pattern in stage.input_list(run_args(model_type, None)):
+                if pattern not in outputs and (s3_dir, pattern) not in inputs:
+                    inputs.append((s3_dir, pattern))
+
+    return inputs
+
+
+# Arguments of a model run like run_full_model passes them to the stages, for listing stage inputs and outputs
+def run_args(model_type, std_net_flux):
+
+    return {'sensit_type': model_type, 'tile_id_list': tile_ids,
+            'carbon_pool_extent': carbon_pool_extent.get(model_type, 'loss'), 'emitted_pools': emitted_pools,
+            'thresh': int(tcd_threshold), 'std_net_flux': std_net_flux, 'run_date': None}
+
+
+# Makes the buckets of every s3 folder in cn and uploads the synthetic inputs, pixel area tiles and spreadsheets.
+# Returns the s3 paths of everything uploaded.
+def seed_s3(folder, size, seed, model_types):
+
+    import s3_transfer
+    import tile_manifest
+    import synthetic_tiles
+
+    client = s3_transfer._resources()[0]
+    buckets = set(s3_transfer.split_s3_path(s3_dir)[0] for s3_dir in tile_manifest.model_dirs() + [cn.model_log_dir])
+    for bucket in sorted(buckets):
+        client.create_bucket(Bucket=bucket)
+
+    input_folder = os.path.join(folder, 'inputs')
+    os.makedirs(input_folder)
+    print("Making synthetic {0}x{0} inputs for tiles {1} in {2}".format(size, ', '.join(tile_ids), input_folder))
+
+    uploads = []
+    for s3_dir, pattern in model_inputs(model_types):
+        for tile_id in tile_ids:
+            if pattern == cn.pattern_pixel_area:
+                path = synthetic_tiles.write_pixel_area(input_folder, size, tile_id)
+            else:
+                path = synthetic_tiles.write_inputs(input_folder, size, seed, [pattern], tile_id)[0]
+            uploads.append((path, os.path.join(s3_dir, os.path.basename(path))))
+
+    for path in synthetic_tiles.write_spreadsheets(input_folder, seed):
+        uploads.append((path, os.path.join(cn.gain_spreadsheet_dir, os.path.basename(path))))
+
+    s3_transfer.upload_files(uploads)
+    shutil.rmtree(input_folder)
+
+    return set(s3_path for path, s3_path in uploads)
+
+
+# s3 paths of all objects in the buckets of the model's s3 folders
+def s3_objects():
+
+    import s3_transfer
+    import tile_manifest
+
+    paths = set()
+    for bucket in sorted(set(s3_transfer.split_s3_path(s3_dir)[0] for s3_dir in tile_manifest.model_dirs())):
+        for obj in s3_transfer.list_objects('s3://{}'.format(bucket)):
+            paths.add('s3://{0}/{1}'.format(obj['bucket'], obj['key']))
+
+    return paths
+
+
+# Checksum of a raster's pixels: data type, shape and values of every band
+def pixel_checksum(path):
+
+    checksum = hashlib.sha256()
+    with rasterio.open(path) as src:
+        for band in range(1, src.count + 1):
+            data = src.read(band)
+            checksum.update('{0} {1}'.format(data.dtype, data.shape).encode())
+            checksum.update(np.ascontiguousarray(data).tobytes())
+
+    return checksum.hexdigest()
+
+
+# Deletes the objects from s3
+def delete_objects(s3_paths):
+
+    import boto3
+    import s3_transfer
+
+    client = boto3.client('s3', endpoint_url=cn.s3_endpoint_url)
+    for path in s3_paths:
+        bucket, key = s3_transfer.split_s3_path(path)
+        client.delete_object(Bucket=bucket, Key=key)
+
+
+# Empties the model's working folder
+def clear_working_folder():
+
+    for name in os.listdir(cn.docker_base_dir):
+        path = os.path.join(cn.docker_base_dir, name)
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+# Checksums of the tiles in s3 (tifs that aren't logs), by s3 path
+def checksums(s3_paths, folder):
+
+    import s3_transfer
+
+    download_folder = os.path.join(folder, 'checksums')
+    os.makedirs(download_folder)
+
+    tifs = sorted(path for path in s3_paths if path.endswith('.tif') and not path.startswith(cn.model_log_dir))
+    s3_transfer.download_files([(path, os.path.join(download_folder, str(index))) for index, path in enumerate(tifs)])
+
+    tile_checksums = dict((path, pixel_checksum(os.path.join(download_folder, str(index))))
+                          for index, path in enumerate(tifs))
+    shutil.rmtree(download_folder)
+
+    return tile_checksums
+
+
+# The standard model's aggregated net flux map in the s3 paths, for the sensitivity analysis comparison
+def std_net_flux_map(s3_paths):
+
+    maps = sorted(path for path in s3_paths
+                  if path.startswith(cn.output_aggreg_dir) and os.path.basename(path).startswith('net_flux_Mt_CO2e'))
+
+    return maps[0] if maps else None
+
+
+# Model arguments for each run of run_full_model.py for a model type: one run of all stages, or one run per stage
+def model_runs(model_type, stages, std_net_flux):
+
+    args = ['-t', model_type, '-l', ','.join(tile_ids), '-ce', carbon_pool_extent.get(model_type, 'loss'),
+            '-p', emitted_pools, '-tcd', tcd_threshold, '-ln', 'Offline model run with synthetic tiles']
+    if std_net_flux:
+        args = args + ['-sagg', std_net_flux]
+
+    # Mangrove and US removal factors are only made by the standard model
+    removal_args = ['-ma', 'true', '-us', 'true'] if model_type == 'std' else []
+
+    if stages is None:
+        return [args + ['-s', 'all', '-r', 'true'] + removal_args]
+
+    return [args + ['-s', stage, '-r', 'false'] + (removal_args if index == 0 else [])
+            for index, stage in enumerate(stages)]
+
+
+# Compares checksums with the expected ones and prints the differences. Returns the number of differences.
+def compare(expected, actual):
+
+    differences = 0
+    for model_type in sorted(set(expected) | set(actual)):
+        expected_tiles = expected.get(model_type, {})
+        actual_tiles = actual.get(model_type, {})
+        for path in sorted(set(expected_tiles) | set(actual_tiles)):
+            if path not in actual_tiles:
+                print("{0}: {1} wasn't written".format(model_type, path))
+            elif path not in expected_tiles:
+                print("{0}: {1} is new".format(model_type, path))
+            elif expected_tiles[path] != actual_tiles[path]:
+                print("{0}: {1} changed".format(model_type, path))
+            else:
+                continue
+            differences += 1
+
+    return differences
+
+
+def offline_model_run(size, seed, model_types, stages, folder, checksum_file, update_checksums, keep):
+
+    folder = os.path.abspath(folder)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    if 'std' not in model_types:
+        model_types = ['std'] + model_types
+    for model_type in model_types:
+        if model_type not in cn.sensitivity_list:
+            print("Invalid model type {0}. Please choose from {1}.".format(model_type, ', '.join(cn.sensitivity_list)))
+            return False
+    model_types = sorted(model_types, key=cn.sensitivity_list.index)
+
+    server, env = start_s3_server()
+
+    use_folder(folder)
+    seen = seed_s3(folder, size, seed, model_types)
+
+    results = {}
+    failed = []
+    std_net_flux = None
+
+    for model_type in model_types:
+
+        for model_args in model_runs(model_type, stages, std_net_flux):
+            if not run_model(folder, model_args, env):
+                failed.append(model_type)
+                break
+
+        # Tiles written by this model run
+        s3_paths = s3_objects()
+        written = s3_paths - seen
+        seen = s3_paths
+        results[model_type] = checksums(written, folder)
+        print("{0}: {1} tiles written".format(model_type, len(results[model_type])))
+
+        if model_type == 'std':
+            std_net_flux = std_net_flux_map(written)
+
+    server.stop()
+    if not keep:
+        shutil.rmtree(folder)
+
+    if failed:
+        print("Model runs failed for: {}".format(', '.join(failed)))
+        return False
+
+    # The checksums of each model type are compared separately, so runs of some model types can be checked against
+    # a checksum file of all of them
+    expected = {}
+    if os.path.exists(checksum_file):
+        with open(checksum_file) as checksum_json:
+            expected = json.load(checksum_json)
+
+    if not expected or update_checksums:
+        expected.update(results)
+        with open(checksum_file, 'w') as checksum_json:
+            json.dump(expected, checksum_json, indent=1, sort_keys=True)
+        print("Checksums saved in {}".format(checksum_file))
+        return True
+
+    differences = compare(dict((model_type, expected.get(model_type, {})) for model_type in results), results)
+    print("{0} differences from the checksums in {1}".format(differences, checksum_file))
+
+    return differences == 0
+
+
+# Uploads the previous version's loss tiles to previous_loss_dir: the current loss tiles without the last year of loss
+# in the first tile, without it in the top half of the second tile, and unchanged in the other tiles.
+# For a new loss year, the previous loss tiles don't have the last year in any tile, and the last tile's current loss
+# tile is replaced with its previous one, so that one tile's loss doesn't change.
+def seed_previous_loss(folder, new_year=False):
+
+    import s3_transfer
+
+    loss_folder = os.path.join(folder, 'previous_loss')
+    os.makedirs(loss_folder)
+
+    uploads = []
+    for index, tile_id in enumerate(tile_ids):
+
+        name = '{0}_{1}.tif'.format(cn.pattern_loss, tile_id)
+        path = os.path.join(loss_folder, name)
+        s3_transfer.download_file(os.path.join(cn.loss_dir, name), path)
+
+        with rasterio.open(path, 'r+') as src:
+            loss = src.read(1)
+            if new_year:
+                rows = loss.shape[0]
+            else:
+                rows = loss.shape[0] if index == 0 else loss.shape[0] // 2 if index == 1 else 0
+            loss[:rows][loss[:rows] == cn.loss_years] = 0
+            src.write(loss, 1)
+
+        uploads.append((path, os.path.join(previous_loss_dir, name)))
+        if new_year and index == len(tile_ids) - 1:
+            uploads.append((path, os.path.join(cn.loss_dir, name)))
+
+    s3_transfer.upload_files(uploads)
+    shutil.rmtree(loss_folder)
+
+
+# Checks that updating the standard model from a previous version's loss to the current loss with
+# run_full_model.py -lu true gives the same tiles as running the model with the current loss from the start.
+# With new_year, the previous version has one loss year fewer and the update adds the last year.
+def loss_year_update_check(size, seed, stages, folder, keep, new_year=False):
+
+    folder = os.path.abspath(folder)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    server, env = start_s3_server()
+
+    use_folder(folder)
+    seeded = seed_s3(folder, size, seed, ['std'])
+    seed_previous_loss(folder, new_year)
+    seeded = s3_objects()
+
+    previous_overrides = {'loss_dir': previous_loss_dir}
+    if new_year:
+        previous_overrides['loss_years'] = cn.loss_years - 1
+
+    # The working folder is emptied between runs, so each run only uses tiles from s3, like a new machine would
+    runs = [('full run with the current loss', [], {}),
+            ('full run with the previous loss', [], previous_overrides),
+            ('update from the previous loss to the current loss', ['-lu', 'true'], {'previous_loss_dir': previous_loss_dir})]
+
+    results = []
+    ok = True
+
+    for description, update_args, overrides in runs:
+
+        print("Loss year update check: {}".format(description))
+        clear_working_folder()
+
+        for model_args in model_runs('std', stages, None):
+            if not run_model(folder, model_args + ['-re', 'false'] + update_args, env, overrides):
+                ok = False
+                break
+
+        if not ok:
+            print("Run failed: {}".format(description))
+            break
+
+        results.append(checksums(s3_objects() - seeded, folder))
+
+        # The previous version starts from an empty s3 folder, so tiles the update doesn't write can't come from the
+        # full run
+        if len(results) == 1:
+            delete_objects(s3_objects() - seeded)
+
+    server.stop()
+    if not keep:
+        shutil.rmtree(folder)
+
+    if not ok:
+        return False
+
+    # Previous version tiles with names the current version doesn't use (e.g., the last loss year in their name) are
+    # left on s3 by the update
+    updated = dict((path, checksum) for path, checksum in results[2].items() if path in results[0] or path not in results[1])
+
+    differences = compare({'std': results[0]}, {'std': updated})
+    print("{0} differences between the update and the full run with the current loss ({1} tiles)".format(differences, len(results[0])))
+
+    # If the previous version's tiles were the same, the check wouldn't show that the update replaced any of them
+    replaced = sum(1 for path in results[0] if results[1].get(path) != results[0][path])
+    print("{} tiles of the previous version were different".format(replaced))
+
+    return differences == 0
+
+
+# The s3 path of the standard model's version of a sensitivity analysis tile (renamed like stage_graph.Stage.output_list)
+def std_path(s3_path, model_type):
+
+    s3_dir, name = s3_path.rsplit('/', 1)
+
+    return '{0}/{1}'.format(s3_dir.replace('/{}/'.format(model_type), '/standard/'),
+                            name.replace('_{}.tif'.format(model_type), '.tif'))
+
+
+# Checks that running the model types together with run_full_model.py -t std,... gives the same tiles as running
+# them separately
+def fan_out_check(size, seed, model_types, stages, folder, keep):
+
+    folder = os.path.abspath(folder)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    model_types = sorted(set(['std'] + model_types), key=cn.sensitivity_list.index)
+
+    server, env = start_s3_server()
+
+    use_folder(folder)
+    seeded = seed_s3(folder, size, seed, model_types)
+
+    separate = {}
+    ok = True
+
+    for model_type in model_types:
+
+        print("Fan-out check: {} by itself".format(model_type))
+        clear_working_folder()
+        before = s3_objects()
+
+        for model_args in model_runs(model_type, stages, None):
+            if not run_model(folder, model_args + ['-re', 'false'], env):
+                ok = False
+                break
+        if not ok:
+            print("Run failed: {}".format(model_type))
+            break
+
+        separate[model_type] = checksums(s3_objects() - before, folder)
+
+    if ok:
+
+        # Without the separate runs' outputs, the run of all model types can only use its own tiles
+        delete_objects(s3_objects() - seeded)
+
+        print("Fan-out check: {} together".format(', '.join(model_types)))
+        clear_working_folder()
+
+        # The mangrove and US removal stages and the carbon pools in 2000 are the standard model's
+        for model_args in model_runs('std', stages, None):
+            model_args[model_args.index('-t') + 1] = ','.join(model_types)
+            if not run_model(folder, model_args + ['-re', 'false'], env):
+                ok = False
+                print("Run failed: {}".format(', '.join(model_types)))
+                break
+
+    together = checksums(s3_objects() - seeded, folder) if ok else {}
+
+    server.stop()
+    if not keep:
+        shutil.rmtree(folder)
+
+    if not ok:
+        return False
+
+    differences = 0
+    shared = 0
+    for model_type in model_types:
+        for path, checksum in sorted(separate[model_type].items()):
+            if path in together:
+                same = together[path] == checksum
+            else:
+                shared += 1
+                same = together.get(std_path(path, model_type)) == checksum
+            if not same:
+                differences += 1
+                print("  {0}: {1} is different".format(model_type, path))
+
+    written = set(path for tile_checksums in separate.values() for path in tile_checksums)
+    for path in sorted(set(together) - written):
+        differences += 1
+        print("  {} isn't written by the separate runs".format(path))
+
+    print("{0} differences between running {1} together and separately ({2} tiles, {3} shared with the standard model)".format(
+        differences, ', '.join(model_types), len(together), shared))
+
+    return differences == 0
+
+
+if __name__ == '__main__':
+
+    # The harness runs run_full_model.py in a new process of this script
+    if len(sys.argv) > 2 and sys.argv[1] == '--run-model':
+        run_model_here(sys.argv[2], sys.argv[3:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Run the full model offline on synthetic tiles and check its outputs')
+    parser.add_argument('--size', '-s', type=int, default=320,
+                        help='Width and height of the synthetic tiles in pixels, a multiple of 160. Full tiles are 40000.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic inputs')
+    parser.add_argument('--model-types', '-t', default=','.join(cn.sensitivity_list),
+                        help='Comma-separated model types to run (std and all sensitivity analyses if not given). std always runs.')
+    parser.add_argument('--stages', default=None,
+                        help='Comma-separated stages of run_full_model.py to run one at a time (all stages at once if not given)')
+    parser.add_argument('--folder', '-f', default=os.path.join(cn.docker_tmp, 'offline_model_run'),
+                        help='Folder for the synthetic inputs, the model\'s working folders and the log. Deleted afterwards.')
+    parser.add_argument('--checksums', default=os.path.join(cn.docker_tmp, 'offline_model_run_checksums.json'),
+                        help='JSON file of the expected checksums of the tiles each model type writes')
+    parser.add_argument('--update-checksums', action='store_true',
+                        help='Save the checksums of this run in the checksum file instead of comparing them')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the folder afterwards, e.g., to look at the log')
+    parser.add_argument('--loss-year-update', action='store_true',
+                        help='Check that the incremental update for new loss gives the same tiles as a full run (standard model only)')
+    parser.add_argument('--new-loss-year', action='store_true',
+                        help='With --loss-year-update, run the previous version with one loss year fewer and add the last year in the update')
+    parser.add_argument('--fan-out', action='store_true',
+                        help='Check that running the model types together gives the same tiles as running them separately')
+    args = parser.parse_args()
+
+    # Tiles are aggregated in windows of 160x160 pixels
+    if args.size % 160 != 0:
+        parser.error('Tile size must be a multiple of 160 pixels')
+
+    if args.fan_out:
+        ok = fan_out_check(args.size, args.seed, args.model_types.split(','), args.stages.split(',') if args.stages else None,
+                           args.folder, args.keep)
+    elif args.loss_year_update:
+        ok = loss_year_update_check(args.size, args.seed, args.stages.split(',') if args.stages else None,
+                                    args.folder, args.keep, args.new_loss_year)
+    else:
+        ok = offline_model_run(args.size, args.seed, args.model_types.split(','),
+                               args.stages.split(',') if args.stages else None, args.folder, args.checksums,
+                               args.update_checksums, args.keep)
+
+    if not ok:
+        sys.exit(1)
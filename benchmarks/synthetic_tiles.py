@@ -0,0 +1,291 @@
+'''
+Deterministic synthetic versions of the model's input tiles and lookup tables, for benchmarks and tests that can't
+download the real inputs: tree cover loss years, gain, tree cover density, biomass, continent-ecozones, drivers, peat,
+soil, plantations, removal rates and so on, named as the model names them, as well as pixel area tiles and the
+removal rate spreadsheets.
+Tiles are the top left size x size pixels of a real tile (same origin and resolution), so functions that calculate
+pixel areas or coordinates from the tile id work on them. Values come in patches of about 100 pixels with scattered
+single pixels, so the tiles compress and branch about like real ones. The same seed and size always give the same
+tiles and tables, and each layer has its own random stream, so adding a layer doesn't change the others.
+Tiles are written a band of rows at a time, so full size (40000x40000) tiles don't have to fit in memory.
+Run from carbon-budget/ with, e.g.:
+python benchmarks/synthetic_tiles.py -s 4000 -f /usr/local/tmp/synthetic_tiles
+'''
+
+import argparse
+import os
+import sys
+import zlib
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import constants_and_names as cn
+import missing_tile
+import pixel_area
+import raster_profile
+
+tile_id = '00N_110E'
+
+# Width of the patches values come in, in pixels (about 3 km)
+patch_size = 100
+
+# Continent-ecozone codes in the synthetic continent-ecozone tiles and lookup tables
+cont_eco_codes = [continent * 1000 + ecozone for continent in range(1, 7)
+                  for ecozone in [11, 12, 13, 21, 22, 23, 24, 25, 31, 32, 33, 34, 41, 42, 43, 50]]
+
+# Synthetic input layers: pattern: (data type, kind, values, fraction).
+# 'codes' are categories in patches (values are the categories, fraction is the fraction of scattered pixels);
+# 'sparse' are 0 with a fraction of pixels that have one of the values, denser in some patches than others;
+# 'amount' are smooth values in patches up to a maximum (values), with a fraction of patches that are 0.
+layers = {
+    cn.pattern_loss: ('uint8', 'sparse', list(range(1, cn.loss_years + 1)), 0.1),
+    cn.pattern_Brazil_annual_loss_processed: ('uint8', 'sparse', list(range(1, cn.loss_years + 1)), 0.1),
+    cn.pattern_Mekong_loss_processed: ('uint8', 'sparse', list(range(1, cn.loss_years + 1)), 0.1),
+    cn.pattern_gain: ('uint8', 'sparse', [1], 0.03),
+    cn.pattern_tcd: ('uint8', 'amount', 100, 0.2),
+    cn.pattern_Brazil_forest_extent_2000_processed: ('uint8', 'codes', [0, 1, 1], 0.02),
+    cn.pattern_WHRC_biomass_2000_unmasked: ('float32', 'amount', 400, 0.3),
+    cn.pattern_JPL_unmasked_processed: ('float32', 'amount', 400, 0.3),
+    cn.pattern_mangrove_biomass_2000: ('float32', 'amount', 300, 0.9),
+    cn.pattern_plant_pre_2000: ('uint8', 'codes', [0] * 9 + [1], 0.01),
+    cn.pattern_ifl_primary: ('uint8', 'codes', [0, 0, 1], 0.02),
+    cn.pattern_cont_eco_processed: ('uint16', 'codes', cont_eco_codes, 0),
+    cn.pattern_bor_tem_trop_processed: ('uint8', 'codes', [1, 2, 3], 0),
+    cn.pattern_precip: ('float32', 'amount', 4000, 0),
+    cn.pattern_elevation: ('float32', 'amount', 3000, 0),
+    cn.pattern_soil_C_full_extent_2000: ('int16', 'amount', 200, 0.1),
+    cn.pattern_drivers: ('uint8', 'codes', [0, 1, 2, 3, 4, 5], 0.02),
+    cn.pattern_peat_mask: ('uint8', 'codes', [0, 0, 0, 1], 0.02),
+    cn.pattern_climate_zone: ('uint8', 'codes', list(range(0, 13)), 0.02),
+    cn.pattern_planted_forest_type_unmasked: ('uint8', 'codes', [0, 0, 0, 1, 2, 3], 0.02),
+    cn.pattern_age_cat_natrl_forest_US: ('uint8', 'codes', [0, 1, 2, 3], 0.02),
+    cn.pattern_FIA_forest_group_processed: ('uint8', 'codes', list(range(0, 11)), 0.02),
+    cn.pattern_FIA_regions_processed: ('uint8', 'codes', list(range(0, 9)), 0),
+    cn.pattern_annual_gain_AGC_BGC_natrl_forest_Europe: ('float32', 'amount', 5, 0.9),
+    cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_Europe: ('float32', 'amount', 2, 0.9),
+    cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked: ('float32', 'amount', 10, 0.8),
+    cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked: ('float32', 'amount', 4, 0.8),
+    cn.pattern_annual_gain_AGC_natrl_forest_young: ('float32', 'amount', 6, 0.5),
+    cn.pattern_stdev_annual_gain_AGC_natrl_forest_young: ('float32', 'amount', 2, 0.5),
+    cn.pattern_burn_year: ('uint8', 'sparse', list(range(1, cn.loss_years + 1)), 0.02)
+}
+
+
+# Random generator for a layer, or for one band of rows of a layer.
+# Seeded by the layer's name, so each layer gets the same values no matter which other layers are made.
+def _rng(seed, name, *keys):
+
+    return np.random.RandomState([seed, zlib.crc32(name.encode())] + list(keys))
+
+
+# Values of one band of rows of a layer
+def layer_band(name, kind, values, fraction, size, seed, row, height):
+
+    # Value between 0 and 1 for each patch of the whole tile, which sets the patch's category or amount
+    patches = _rng(seed, name).random((size // patch_size + 1, size // patch_size + 1))
+    band_patches = patches[np.arange(row, row + height) // patch_size][:, np.arange(size) // patch_size]
+
+    rng = _rng(seed, name, row)
+
+    if kind == 'codes':
+        values = np.asarray(values)
+        band = values[(band_patches * len(values)).astype('int64')]
+        scattered = rng.random_sample((height, size)) < fraction
+        band[scattered] = rng.choice(values, int(scattered.sum()))
+
+    elif kind == 'sparse':
+        band = np.zeros((height, size), dtype='int64')
+        scattered = rng.random_sample((height, size)) < fraction * 2 * band_patches
+        band[scattered] = rng.choice(np.asarray(values), int(scattered.sum()))
+
+    elif kind == 'amount':
+        band = band_patches * values * 0.95 + rng.random_sample((height, size)) * values * 0.05
+        band[band_patches < fraction] = 0
+
+    else:
+        raise ValueError('Unknown kind of synthetic layer: {}'.format(kind))
+
+    return band
+
+
+# Name of a tile, with the tile id first or last like uu.s3_flexible_download expects
+def tile_name(tile_id, pattern):
+
+    if pattern in [cn.pattern_gain, cn.pattern_tcd, cn.pattern_pixel_area, cn.pattern_loss]:
+        return '{0}_{1}.tif'.format(pattern, tile_id)
+
+    return '{0}_{1}.tif'.format(tile_id, pattern)
+
+
+# Writes one synthetic tile, a band of rows at a time
+def write_tile(path, name, dtype, kind, values, fraction, size, seed, tile_id=tile_id):
+
+    xmin, ymax = missing_tile.tile_origin(tile_id)
+    kwargs = dict(driver='GTiff', width=size, height=size, count=1, dtype=dtype, crs='EPSG:4326',
+                  transform=from_origin(xmin, ymax, cn.Hansen_res, cn.Hansen_res), nodata=0)
+    raster_profile.update(kwargs)
+
+    with rasterio.open(path, 'w', **kwargs) as dst:
+        for row in range(0, size, cn.tile_window_rows):
+            height = min(cn.tile_window_rows, size - row)
+            band = layer_band(name, kind, values, fraction, size, seed, row, height)
+            dst.write(band.astype(dtype), 1, window=Window(0, row, size, height))
+
+    return path
+
+
+# Burned area tiles for each loss year, named like the tiles in cn.burn_year_warped_to_Hansen_dir.
+# Each has the year of burning (e.g., 17) where there was burning that year.
+def write_burned_area(folder, size, seed, tile_id=tile_id):
+
+    paths = []
+    for year in range(1, cn.loss_years + 1):
+        path = os.path.join(folder, 'ba_{0}_{1}.tif'.format(2000 + year, tile_id))
+        paths.append(write_tile(path, 'ba_{}'.format(year), 'uint8', 'sparse', [year], 0.02, size, seed, tile_id))
+
+    return paths
+
+
+# Pixel area tile (m2), like the tiles in cn.pixel_area_dir. Areas are the real ones for the tile's rows.
+def write_pixel_area(folder, size, tile_id=tile_id):
+
+    xmin, ymax = missing_tile.tile_origin(tile_id)
+    kwargs = dict(driver='GTiff', width=size, height=size, count=1, dtype='float32', crs='EPSG:4326',
+                  transform=from_origin(xmin, ymax, cn.Hansen_res, cn.Hansen_res), nodata=0)
+    raster_profile.update(kwargs)
+
+    path = os.path.join(folder, tile_name(tile_id, cn.pattern_pixel_area))
+    rows = pixel_area.tile_rows(tile_id)
+
+    with rasterio.open(path, 'w', **kwargs) as dst:
+        for row in range(0, size, cn.tile_window_rows):
+            height = min(cn.tile_window_rows, size - row)
+            band = np.broadcast_to(rows[row:row + height, np.newaxis], (height, size))
+            dst.write(band.astype('float32'), 1, window=Window(0, row, size, height))
+
+    return path
+
+
+# Writes the synthetic input tiles with the patterns (all layers if patterns isn't given) into the folder.
+# Returns the paths of the tiles.
+def write_inputs(folder, size, seed=0, patterns=None, tile_id=tile_id):
+
+    if patterns is None:
+        patterns = list(layers)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    paths = []
+    for pattern in patterns:
+        dtype, kind, values, fraction = layers[pattern]
+        path = os.path.join(folder, tile_name(tile_id, pattern))
+        paths.append(write_tile(path, pattern, dtype, kind, values, fraction, size, seed, tile_id))
+
+    return paths
+
+
+# Synthetic lookup tables, shaped like the ones the mp_ scripts make from the spreadsheets:
+# removal rates for forest age categories (continent-ecozone codes), IPCC default removal rates and standard
+# deviations (continent-ecozone-age codes), mangrove removal rates and pool ratios (continent-ecozone codes) and
+# US removal rates and standard deviations (age-group-region and group-region codes).
+# Every table has 0 for code 0, like the model's.
+def lookup_tables(seed=0):
+
+    rng = _rng(seed, 'lookup_tables')
+
+    def table(codes, maximum, float_keys=True):
+        values = dict(zip(codes, (rng.random_sample(len(codes)) * maximum).tolist()))
+        values[0] = 0
+        if float_keys:
+            values = {float(key): value for key, value in values.items()}
+        return values
+
+    cont_eco_age_codes = [code + age for age in [10000, 20000, 30000] for code in cont_eco_codes]
+    group_region_codes = [group * 100 + region for group in range(1, 11) for region in range(1, 9)]
+    group_region_age_codes = [age * 10000 + code for age in [1, 2, 3] for code in group_region_codes]
+
+    return {
+        'age_category': table(cont_eco_codes, 10, float_keys=False),
+        'IPCC_gain': table(cont_eco_age_codes, 10),
+        'IPCC_stdev': table(cont_eco_age_codes, 3),
+        'mangrove_gain_above': table(cont_eco_codes, 10),
+        'mangrove_gain_below': table(cont_eco_codes, 3),
+        'mangrove_stdev': table(cont_eco_codes, 3),
+        'mangrove_BGB_AGB_ratio': table(cont_eco_codes, 0.6),
+        'mangrove_deadwood_AGB_ratio': table(cont_eco_codes, 0.2),
+        'mangrove_litter_AGB_ratio': table(cont_eco_codes, 0.05),
+        'US_gain_group_region_age': table(group_region_age_codes, 6, float_keys=False),
+        'US_gain_group_region': table(group_region_codes, 6, float_keys=False),
+        'US_stdev_group_region_age': table(group_region_age_codes, 2, float_keys=False),
+        'US_stdev_group_region': table(group_region_codes, 2, float_keys=False)
+    }
+
+
+# Synthetic versions of the removal rate spreadsheets the mp_ scripts read: cn.gain_spreadsheet (IPCC default and
+# mangrove removal rates and standard deviations by continent-ecozone) and cn.table_US_removal_rate (US removal
+# rates and standard deviations by FIA region and forest group). Returns the paths of the spreadsheets.
+def write_spreadsheets(folder, seed=0):
+
+    rng = _rng(seed, 'spreadsheets')
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    def column(maximum, count=len(cont_eco_codes)):
+        return (rng.random_sample(count) * maximum).round(3)
+
+    gain = pd.DataFrame({'gainEcoCon': cont_eco_codes, 'growth_primary': column(3),
+                         'growth_secondary_greater_20': column(6), 'growth_secondary_less_20': column(10)})
+    stdev = pd.DataFrame({'gainEcoCon': cont_eco_codes, 'stdev_primary': column(1),
+                          'stdev_secondary_greater_20': column(2), 'stdev_secondary_less_20': column(3)})
+    mangrove_gain = pd.DataFrame({'gainEcoCon': cont_eco_codes, 'mangType': rng.randint(1, 4, len(cont_eco_codes)),
+                                  'AGB_gain_tons_ha_yr': column(10)})
+    mangrove_stdev = pd.DataFrame({'gainEcoCon': cont_eco_codes, 'AGB_gain_stdev_tons_ha_yr': column(3)})
+
+    gain_path = os.path.join(folder, cn.gain_spreadsheet)
+    with pd.ExcelWriter(gain_path) as writer:
+        gain.to_excel(writer, sheet_name='natrl fores gain, for std model', index=False)
+        gain.assign(growth_primary=0).to_excel(writer, sheet_name='natrl fores gain, no_prim_gain', index=False)
+        stdev.to_excel(writer, sheet_name='natrl fores stdv, for std model', index=False)
+        stdev.assign(stdev_primary=0).to_excel(writer, sheet_name='natrl fores stdv, no_prim_gain', index=False)
+        mangrove_gain.to_excel(writer, sheet_name='mangrove gain, for model', index=False)
+        mangrove_stdev.to_excel(writer, sheet_name='mangrove stdev, for model', index=False)
+
+    group_regions = [(region, group) for group in range(1, 11) for region in range(1, 9)]
+    us_rates = pd.DataFrame({'FIA_region_code': [region for region, group in group_regions],
+                             'forest_group_code': [group for region, group in group_regions],
+                             'growth_young': column(6, len(group_regions)),
+                             'growth_middle': column(4, len(group_regions)),
+                             'growth_old': column(2, len(group_regions)),
+                             'SD_young': column(2, len(group_regions)),
+                             'SD_middle': column(1.5, len(group_regions)),
+                             'SD_old': column(1, len(group_regions))})
+
+    us_path = os.path.join(folder, cn.table_US_removal_rate)
+    with pd.ExcelWriter(us_path) as writer:
+        us_rates.to_excel(writer, sheet_name='US_rates_AGC+BGC', index=False)
+
+    return [gain_path, us_path]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write deterministic synthetic input tiles')
+    parser.add_argument('--size', '-s', type=int, default=4000,
+                        help='Width and height of the synthetic tiles in pixels. Full tiles are 40000.')
+    parser.add_argument('--folder', '-f', default=os.path.join(cn.docker_tmp, 'synthetic_tiles'),
+                        help='Folder to write the synthetic tiles in')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic tiles')
+    parser.add_argument('--patterns', '-p', default=None,
+                        help='Comma-separated patterns of the tiles to write (all input layers if not given)')
+    args = parser.parse_args()
+
+    patterns = args.patterns.split(',') if args.patterns else None
+    for path in write_inputs(args.folder, args.size, args.seed, patterns) + \
+                write_burned_area(args.folder, args.size, args.seed):
+        print(path)
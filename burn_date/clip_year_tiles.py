@@ -5,6 +5,7 @@ import sys
 import utilities
 sys.path.append('../')
 import universal_util as uu
+import raster_profile
 import constants_and_names as cn
 
 currentdir = os.path.dirname(os.path.abspath(__file__))
@@ -29,7 +30,7 @@ def clip_year_tiles(tile_year_list):
     uu.print_log("Clipping burn year vrt to {0} for {1}".format(tile_id, year))
 
     clipped_raster = "ba_clipped_{0}_{1}.tif".format(year, tile_id)
-    cmd = ['gdal_translate', '-ot', 'Byte', '-co', 'COMPRESS=LZW', '-a_nodata', '0']
+    cmd = ['gdal_translate', '-ot', 'Byte', *raster_profile.gdal_options('scratch', 'Byte'), '-a_nodata', '0']
     cmd += [vrt_name, clipped_raster, '-tr', '.00025', '.00025']
     cmd += ['-projwin', str(xmin), str(ymax), str(xmax), str(ymin)]
     uu.log_subprocess_output_full(cmd)
@@ -39,7 +40,7 @@ def clip_year_tiles(tile_year_list):
     recoded_output = "ba_{0}_{1}.tif".format(year, tile_id)
     outfile = '--outfile={}'.format(recoded_output)
 
-    cmd = ['gdal_calc.py', '-A', clipped_raster, calc, outfile, '--NoDataValue=0', '--co', 'COMPRESS=LZW', '--quiet']
+    cmd = ['gdal_calc.py', '-A', clipped_raster, calc, outfile, '--NoDataValue=0', *raster_profile.gdal_options('archive', 'Byte', '--co'), '--quiet']
     uu.log_subprocess_output_full(cmd)
 
     # Only copies to s3 if the tile has data.
@@ -52,8 +53,7 @@ def clip_year_tiles(tile_year_list):
 
     else:
         uu.print_log("  Data found in {}. Copying tile to s3...".format(tile_id))
-        cmd = ['aws', 's3', 'cp', recoded_output, cn.burn_year_warped_to_Hansen_dir]
-        uu.log_subprocess_output_full(cmd)
+        uu.s3_copy(recoded_output, cn.burn_year_warped_to_Hansen_dir)
         uu.print_log("    Tile copied to", cn.burn_year_warped_to_Hansen_dir)
 
     # Prints information about the tile that was just processed
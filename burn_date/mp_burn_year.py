@@ -39,6 +39,7 @@ import utilities
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'burn_date'))
 import stack_ba_hv
 import clip_year_tiles
@@ -72,8 +73,7 @@ def mp_burn_year(tile_id_list, run_date = None):
     uu.log_subprocess_output_full(cmd)
 
     # Uploads the latest year of raw burn area hdfs to s3
-    cmd = ['aws', 's3', 'cp', '.', cn.burn_year_hdf_raw_dir, '--recursive', '--exclude', '*', '--include', '*hdf']
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy('.', cn.burn_year_hdf_raw_dir, recursive=True, exclude=['*'], include=['*hdf'])
 
     global_grid_hv = ["h00v08", "h00v09", "h00v10", "h01v07", "h01v08", "h01v09", "h01v10", "h01v11", "h02v06",
                       "h02v08", "h02v09", "h02v10", "h02v11", "h03v06", "h03v07", "h03v09", "h03v10", "h03v11",
@@ -137,9 +137,7 @@ def mp_burn_year(tile_id_list, run_date = None):
 
         uu.print_log("Downloading MODIS burn date files from s3...")
 
-        cmd = ['aws', 's3', 'cp', cn.burn_year_stacked_hv_tif_dir, year_tifs_folder]
-        cmd += ['--recursive', '--exclude', "*", '--include', include]
-        uu.log_subprocess_output_full(cmd)
+        uu.s3_copy(cn.burn_year_stacked_hv_tif_dir, year_tifs_folder, recursive=True, exclude=['*'], include=[include])
 
         uu.print_log("Creating vrt of MODIS files...")
 
@@ -195,16 +193,9 @@ def mp_burn_year(tile_id_list, run_date = None):
     uu.print_log("Extracting burn year data that coincides with tree cover loss...")
 
     # Downloads the 10x10 deg burn year tiles (1 for each year in which there was burned areaa), stack and evaluate
-    # to return burn year values on hansen loss pixels within 1 year of loss date
-    if cn.count == 96:
-        processes = 5
-        # 6 processors = >750 GB peak (1 processor can use up to 130 GB of memory)
-    else:
-        processes = 1
-    pool = multiprocessing.Pool(processes)
-    pool.map(hansen_burnyear_final.hansen_burnyear, tile_id_list)
-    pool.close()
-    pool.join()
+    # to return burn year values on hansen loss pixels within 1 year of loss date.
+    # Tiles are combined a window at a time, so each processor uses about 1 GB of memory.
+    tile_scheduler.run(hansen_burnyear_final.hansen_burnyear, tile_id_list, 'burn_year', memory_gb=1)
 
     # # For single processor use
     # for tile_id in tile_id_list:
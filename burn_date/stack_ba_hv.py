@@ -40,8 +40,7 @@ def stack_ba_hv(hv_tile):
                                                             year_folder)
 
             # upload to s3
-            cmd = ['aws', 's3', 'cp', stacked_year_raster, cn.burn_year_stacked_hv_tif_dir]
-            uu.log_subprocess_output_full(cmd)
+            uu.s3_copy(stacked_year_raster, cn.burn_year_stacked_hv_tif_dir)
 
             # remove files
             shutil.rmtree(output_dir)
@@ -8,6 +8,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 
 def hdf_to_array(hdf):
@@ -55,7 +56,7 @@ def array_to_raster_simple(array, outname, template):
         y_pixels,
         1,
         gdal.GDT_Int16,
-        options=["COMPRESS=LZW"])
+        options=raster_profile.creation_options('scratch', 'Int16'))
 
     dataset.SetGeoTransform((
         minx,    # 0
@@ -131,12 +132,6 @@ def makedir(dir):
 
 def download_df(year, hv_tile, output_dir):
         include = '*A{0}*{1}*'.format(year, hv_tile)
-        cmd = ['aws', 's3', 'cp', cn.burn_year_hdf_raw_dir, output_dir, '--recursive', '--exclude',
-               "*", '--include', include]
-
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.s3_copy(cn.burn_year_hdf_raw_dir, output_dir, recursive=True, exclude=['*'], include=[include])
 
 
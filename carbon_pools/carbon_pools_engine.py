@@ -0,0 +1,356 @@
+'''
+Creates all the carbon pools of a tile (aboveground, belowground, deadwood, litter, soil and total carbon, in 2000
+and/or in the year of loss) in one pass over the tile.
+The separate pool scripts in create_carbon_pools.py write each pool to a tile that the next pool's script reads back
+(AGC is read by BGC, deadwood and litter; all pools are read by total carbon). Here, each window of the roughly 12
+underlying inputs is read once and every pool is calculated from it in memory, using the same equations in the same
+order, so outputs are the same as those of the separate scripts.
+Only the pools that are asked for are written. Pools that aren't asked for are only calculated if another pool
+needs them (e.g., total carbon needs all the other pools), so, for example, a run for gross emissions can skip
+total carbon and carbon in 2000.
+Windows are read, calculated and written at the same time by window_pipeline.
+'''
+
+import datetime
+import os
+import numpy as np
+import rasterio
+import sys
+sys.path.append('../')
+import constants_and_names as cn
+import universal_util as uu
+import missing_tile
+import reclassify
+import raster_profile
+import tile_metadata
+import window_pipeline
+
+# Carbon pools, in the order they are calculated
+pool_names = ['AGC', 'BGC', 'deadwood', 'litter', 'soil', 'total']
+
+# Pools each pool is calculated from
+pool_inputs = {
+    'AGC': [],
+    'BGC': ['AGC'],
+    'deadwood': ['AGC'],
+    'litter': ['AGC'],
+    'soil': ['AGC'],
+    'total': ['AGC', 'BGC', 'deadwood', 'litter', 'soil']
+}
+
+# Output file name pattern of each pool in 2000 and in the year of loss.
+# Soil carbon in 2000 is an input (created by mp_create_soil_C.py), so it isn't an output here.
+output_patterns = {
+    ('AGC', '2000'): cn.pattern_AGC_2000,
+    ('BGC', '2000'): cn.pattern_BGC_2000,
+    ('deadwood', '2000'): cn.pattern_deadwood_2000,
+    ('litter', '2000'): cn.pattern_litter_2000,
+    ('total', '2000'): cn.pattern_total_C_2000,
+    ('AGC', 'loss'): cn.pattern_AGC_emis_year,
+    ('BGC', 'loss'): cn.pattern_BGC_emis_year,
+    ('deadwood', 'loss'): cn.pattern_deadwood_emis_year_2000,
+    ('litter', 'loss'): cn.pattern_litter_emis_year_2000,
+    ('soil', 'loss'): cn.pattern_soil_C_emis_year_2000,
+    ('total', 'loss'): cn.pattern_total_C_emis_year
+}
+
+# Data types of the windows of 0s read for inputs that don't exist, if not uint8
+missing_dtypes = {
+    'annual_gain_AGC': 'float32',
+    'cumul_gain_AGCO2': 'float32'
+}
+
+# Deadwood and litter equations for non-mangrove forests: (elevation, precipitation and bor/temp/trop conditions,
+# deadwood:AGB ratio, litter:AGB ratio). From https://cdm.unfccc.int/methodologies/ARmethodologies/tools/ar-am-tool-12-v3.0.pdf, p. 17-18
+deadwood_litter_equations = [
+    (lambda elevation, precip, bor_tem_trop: (elevation <= 2000) & (precip <= 1000) & (bor_tem_trop == 1), 0.02, 0.04),
+    (lambda elevation, precip, bor_tem_trop: (elevation <= 2000) & ((precip > 1000) & (precip <= 1600)) & (bor_tem_trop == 1), 0.01, 0.01),
+    (lambda elevation, precip, bor_tem_trop: (elevation <= 2000) & (precip > 1600) & (bor_tem_trop == 1), 0.06, 0.01),
+    (lambda elevation, precip, bor_tem_trop: (elevation > 2000) & (bor_tem_trop == 1), 0.07, 0.01),
+    (lambda elevation, precip, bor_tem_trop: bor_tem_trop != 1, 0.08, 0.04)
+]
+
+
+# Pools that have to be calculated to create the requested pools
+def pools_to_calculate(pools):
+
+    needed = set()
+    for pool in pools:
+        needed.add(pool)
+        needed.update(pool_inputs[pool])
+
+    return [pool for pool in pool_names if pool in needed]
+
+
+# Outputs (pool, '2000' or 'loss') written for the requested pools and carbon pool extent
+def requested_outputs(pools, carbon_pool_extent):
+
+    outputs = []
+    for year in ['2000', 'loss']:
+        if year in carbon_pool_extent:
+            outputs.extend((pool, year) for pool in pool_names if pool in pools and (pool, year) in output_patterns)
+
+    return outputs
+
+
+# Calculates the carbon pools of one window.
+# windows has the input windows, by input name. has_biomass and has_mangrove say whether the natural forest and
+# mangrove biomass tiles exist. Returns the pools, by (pool, '2000' or 'loss').
+def carbon_pools_window(windows, luts, carbon_pool_extent, pools, has_biomass, has_mangrove, has_soil):
+
+    years = [year for year in ['2000', 'loss'] if year in carbon_pool_extent]
+    result = {}
+
+    removal_forest_type_window = windows['removal_forest_type']
+    mangrove_biomass_2000_window = windows['mangrove_biomass_2000']
+    natrl_forest_biomass_2000_window = windows['natrl_forest_biomass_2000']
+
+    ### Aboveground carbon
+
+    # Creates aboveground carbon density in 2000. Where mangrove biomass is found, it is used. Otherwise, WHRC or JPL AGB is used.
+    # This is necessary for calculating AGC in emissions year.
+    agc_2000_window = np.where(mangrove_biomass_2000_window != 0,
+                               mangrove_biomass_2000_window * cn.biomass_to_c_mangrove,
+                               natrl_forest_biomass_2000_window * cn.biomass_to_c_non_mangrove
+                               ).astype('float32')
+    result[('AGC', '2000')] = agc_2000_window
+
+    if 'loss' in years:
+
+        loss_year_window = windows['loss']
+        gain_window = windows['gain']
+
+        # Limits the AGC to the model extent
+        agc_2000_model_extent_window = np.where(removal_forest_type_window > 0, agc_2000_window, 0)
+
+        # Creates a mask based on whether the pixels had loss and gain in them. Loss&gain pixels are 1, all else are 0.
+        # This is used to determine how much post-2000 carbon gain to add to AGC2000 pixels.
+        loss_gain_mask = np.ma.masked_where(loss_year_window == 0, gain_window).filled(0)
+
+        # Loss-only pixels: all the carbon accumulated after 2000 is added to the carbon in 2000.
+        AGC_emis_year_non_loss_and_gain = agc_2000_model_extent_window + (windows['cumul_gain_AGCO2'] / cn.c_to_co2)
+        AGC_emis_year_non_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 1, AGC_emis_year_non_loss_and_gain).filled(0)
+
+        # Loss&gain pixels: only the gain that occurred before the loss year is added to the carbon in 2000.
+        gain_before_loss = windows['annual_gain_AGC'] * (loss_year_window - 1)
+        AGC_emis_year_loss_and_gain = agc_2000_model_extent_window + gain_before_loss
+        AGC_emis_year_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 0, AGC_emis_year_loss_and_gain).filled(0)
+
+        # Each loss pixel falls into only one of those categories. Limits output to only pixels that had tree cover loss.
+        AGC_emis_year_all = AGC_emis_year_non_loss_and_gain_masked + AGC_emis_year_loss_and_gain_masked
+        AGC_emis_year_all = np.where(loss_year_window > 0, AGC_emis_year_all, 0)
+
+        result[('AGC', 'loss')] = AGC_emis_year_all.astype('float32')
+
+    if 'BGC' in pools or 'deadwood' in pools or 'litter' in pools:
+        cont_ecozone_window = windows['cont_eco'].astype('float32')
+
+    ### Belowground carbon
+
+    if 'BGC' in pools:
+
+        # Applies the mangrove BGB:AGB ratios to the ecozone raster. Codes that aren't in the dictionary keep their code.
+        BGB_AGB_ratio_window = luts['BGB'].apply(cont_ecozone_window, default=cont_ecozone_window)
+
+        for year in years:
+
+            AGC_window = result[('AGC', year)]
+
+            # Applies mangrove-specific AGB:BGB ratios by ecozone (ratio applies to AGC:BGC as well)
+            mangrove_BGC = np.where(removal_forest_type_window == cn.mangrove_rank, AGC_window * BGB_AGB_ratio_window, 0)
+            # Applies non-mangrove AGB:BGB ratio to all non-mangrove pixels
+            non_mangrove_BGC = np.where(removal_forest_type_window != cn.mangrove_rank, AGC_window * cn.below_to_above_non_mang, 0)
+            # Combines mangrove and non-mangrove pixels
+            result[('BGC', year)] = (mangrove_BGC + non_mangrove_BGC).astype('float32')
+
+    ### Deadwood and litter carbon
+
+    if 'deadwood' in pools or 'litter' in pools:
+
+        # Starts with deadwood and litter at the extent of AGB2000. Clipped to loss extent later.
+        deadwood_2000_output = np.zeros(agc_2000_window.shape, dtype='float32')
+        litter_2000_output = np.zeros(agc_2000_window.shape, dtype='float32')
+
+        # This allows the script to bypass the few tiles that have mangrove biomass but not WHRC biomass
+        if has_biomass:
+
+            # The deadwood and litter conversions depend on the elevation, precipitation, and broad biome category
+            for condition, deadwood_ratio, litter_ratio in deadwood_litter_equations:
+
+                condition_mask = condition(windows['elevation'], windows['precip'], windows['bor_tem_trop'])
+                agb_masked = np.ma.array(natrl_forest_biomass_2000_window, mask=np.invert(condition_mask))
+                deadwood_masked = agb_masked * deadwood_ratio * cn.biomass_to_c_non_mangrove
+                deadwood_2000_output = deadwood_2000_output + deadwood_masked.filled(0)
+                litter_masked = agb_masked * litter_ratio * cn.biomass_to_c_non_mangrove_litter
+                litter_2000_output = litter_2000_output + litter_masked.filled(0)
+
+            deadwood_2000_output = deadwood_2000_output.astype('float32')
+            litter_2000_output = litter_2000_output.astype('float32')
+
+        # Replaces non-mangrove deadwood and litter with special mangrove deadwood and litter values if there is mangrove
+        if has_mangrove:
+
+            # Applies the mangrove deadwood:AGB and litter:AGB ratios to the ecozone raster. Codes that aren't in the dictionary keep their code.
+            deadwood_AGB_ratio_window = luts['deadwood'].apply(cont_ecozone_window, default=cont_ecozone_window)
+            mangrove_C_final = mangrove_biomass_2000_window * deadwood_AGB_ratio_window * cn.biomass_to_c_mangrove
+            deadwood_2000_output = mangrove_C_final + np.ma.masked_where(mangrove_biomass_2000_window > 0, deadwood_2000_output).filled(0)
+
+            litter_AGB_ratio_window = luts['litter'].apply(cont_ecozone_window, default=cont_ecozone_window)
+            mangrove_C_final = mangrove_biomass_2000_window * litter_AGB_ratio_window * cn.biomass_to_c_mangrove
+            litter_2000_output = mangrove_C_final + np.ma.masked_where(mangrove_biomass_2000_window > 0, litter_2000_output).filled(0)
+
+        result[('deadwood', '2000')] = deadwood_2000_output.astype('float32')
+        result[('litter', '2000')] = litter_2000_output.astype('float32')
+
+        # Deadwood and litter in the emissions year are clipped to AGC emissions year pixels, not loss pixels, because
+        # AGC in the emissions year is already clipped to the model extent.
+        if 'loss' in years:
+            result[('deadwood', 'loss')] = np.where(result[('AGC', 'loss')] > 0, deadwood_2000_output, 0).astype('float32')
+            result[('litter', 'loss')] = np.where(result[('AGC', 'loss')] > 0, litter_2000_output, 0).astype('float32')
+
+    ### Soil carbon
+
+    if 'soil' in pools:
+
+        if has_soil:
+            result[('soil', '2000')] = windows['soil']
+        else:
+            result[('soil', '2000')] = np.zeros(agc_2000_window.shape)
+
+        # Removes soil pixels that do not have AGC in the emissions year
+        if 'loss' in years:
+            if has_soil:
+                result[('soil', 'loss')] = np.ma.masked_where(result[('AGC', 'loss')] == 0, windows['soil']).filled(0).astype('uint16')
+            else:
+                result[('soil', 'loss')] = np.zeros(agc_2000_window.shape)
+
+    ### Total carbon
+
+    if 'total' in pools:
+        for year in years:
+            total_C_window = result[('AGC', year)] + result[('BGC', year)] + result[('deadwood', year)] + \
+                             result[('litter', year)] + result[('soil', year)]
+            result[('total', year)] = total_C_window.astype('float32')
+
+    return result
+
+
+# Creates the requested carbon pools of a tile in 2000 and/or the year of loss, reading each input once per window
+def create_carbon_pools(tile_id, mang_BGB_AGB_ratio, mang_deadwood_AGB_ratio, mang_litter_AGB_ratio,
+                        carbon_pool_extent, sensit_type, pools=None):
+
+    # Start time
+    start = datetime.datetime.now()
+
+    if pools is None:
+        pools = cn.carbon_pools
+
+    # Lookup tables of the mangrove BGB:AGB, deadwood:AGB and litter:AGB ratios for each continent-ecozone code
+    luts = {'BGB': reclassify.compile_lut(mang_BGB_AGB_ratio),
+            'deadwood': reclassify.compile_lut(mang_deadwood_AGB_ratio),
+            'litter': reclassify.compile_lut(mang_litter_AGB_ratio)}
+
+    # Names of the input tiles. Creates the names even if the files don't exist.
+    inputs = {
+        'removal_forest_type': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_removal_forest_type),
+        'mangrove_biomass_2000': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_mangrove_biomass_2000),
+        'gain': uu.sensit_tile_rename(sensit_type, cn.pattern_gain, tile_id),
+        'annual_gain_AGC': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_annual_gain_AGC_all_types),
+        'cumul_gain_AGCO2': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_cumul_gain_AGCO2_all_types),
+        'cont_eco': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_cont_eco_processed),
+        'bor_tem_trop': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_bor_tem_trop_processed),
+        'precip': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_precip),
+        'elevation': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_elevation),
+        'soil': uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_soil_C_full_extent_2000)
+    }
+
+    # Biomass tile name depends on the sensitivity analysis
+    if sensit_type == 'biomass_swap':
+        inputs['natrl_forest_biomass_2000'] = '{0}_{1}.tif'.format(tile_id, cn.pattern_JPL_unmasked_processed)
+        uu.print_log("Using JPL biomass tile for {} sensitivity analysis".format(sensit_type))
+    else:
+        inputs['natrl_forest_biomass_2000'] = '{0}_{1}.tif'.format(tile_id, cn.pattern_WHRC_biomass_2000_unmasked)
+        uu.print_log("Using WHRC biomass tile for {} sensitivity analysis".format(sensit_type))
+
+    # Loss tile name depends on the sensitivity analysis
+    if sensit_type == 'legal_Amazon_loss':
+        inputs['loss'] = '{}_{}.tif'.format(tile_id, cn.pattern_Brazil_annual_loss_processed)
+    elif os.path.exists('{}_{}.tif'.format(tile_id, cn.pattern_Mekong_loss_processed)):
+        inputs['loss'] = '{}_{}.tif'.format(tile_id, cn.pattern_Mekong_loss_processed)
+    else:
+        inputs['loss'] = '{0}_{1}.tif'.format(cn.pattern_loss, tile_id)
+
+    # Only the inputs of the pools being calculated are read
+    pools = pools_to_calculate(pools)
+    outputs = requested_outputs(pools, carbon_pool_extent)
+    needed_inputs = ['removal_forest_type', 'mangrove_biomass_2000', 'natrl_forest_biomass_2000']
+    if 'loss' in carbon_pool_extent:
+        needed_inputs += ['loss', 'gain', 'annual_gain_AGC', 'cumul_gain_AGCO2']
+    if 'BGC' in pools or 'deadwood' in pools or 'litter' in pools:
+        needed_inputs += ['cont_eco']
+    if 'deadwood' in pools or 'litter' in pools:
+        needed_inputs += ['bor_tem_trop', 'precip', 'elevation']
+    if 'soil' in pools:
+        needed_inputs += ['soil']
+
+    uu.print_log("  Reading input files for {}...".format(tile_id))
+
+    # This input should exist. The others are read as 0s if they don't exist.
+    removal_forest_type_src = rasterio.open(inputs['removal_forest_type'])
+    srcs = {'removal_forest_type': removal_forest_type_src}
+    for name in needed_inputs[1:]:
+        if os.path.exists(inputs[name]):
+            uu.print_log("    {0} tile found for {1}".format(name, tile_id))
+        else:
+            uu.print_log("    No {0} tile for {1}".format(name, tile_id))
+        srcs[name] = missing_tile.open_tile(inputs[name], tile_id, missing_dtypes.get(name, 'uint8'))
+
+    has_biomass = os.path.exists(inputs['natrl_forest_biomass_2000'])
+    has_mangrove = os.path.exists(inputs['mangrove_biomass_2000'])
+    has_soil = os.path.exists(inputs['soil'])
+
+    # Soil carbon in the emissions year is only created where there is soil carbon in 2000
+    if not has_soil and ('soil', 'loss') in outputs:
+        uu.print_log("Soil C 2000 not found for {}. Skipping soil C in loss extent.".format(tile_id))
+        outputs.remove(('soil', 'loss'))
+
+    # Grabs metadata for one of the input tiles, like its location/projection/cellsize.
+    # Carbon pools are float32. Soil carbon is integers.
+    kwargs = removal_forest_type_src.meta
+    kwargs.update(driver='GTiff', count=1, nodata=0, dtype='float32')
+    raster_profile.update(kwargs)
+
+    # The output files. Creates names and rasters to write to.
+    dsts = {}
+    for output in outputs:
+        output_pattern_list = [output_patterns[output]]
+        if sensit_type != 'std':
+            output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
+
+        output_kwargs = dict(kwargs)
+        if output[0] == 'soil':
+            output_kwargs.update(dtype='uint16')
+            raster_profile.update(output_kwargs)
+
+        dst = rasterio.open('{0}_{1}.tif'.format(tile_id, output_pattern_list[0]), 'w', **output_kwargs)
+
+        # Adds metadata tags to the output raster
+        tile_metadata.update_tags(dst, output_pattern_list[0], sensit_type)
+        dsts[output] = dst
+
+    uu.print_log("  Creating {0} for {1} using carbon_pool_extent '{2}'...".format(
+        ', '.join('{0} {1}'.format(pool, year) for pool, year in outputs), tile_id, carbon_pool_extent))
+
+    # Reads, calculates and writes windows of the input tiles at the same time
+    def kernel(windows, window):
+        return carbon_pools_window(windows, luts, carbon_pool_extent, pools, has_biomass, has_mangrove, has_soil)
+
+    window_pipeline.run(kernel, srcs, dsts)
+
+    for src in srcs.values():
+        src.close()
+    for dst in dsts.values():
+        dst.close()
+
+    # Prints information about the tile that was just processed
+    uu.end_of_fx_summary(start, tile_id, 'carbon_pools')
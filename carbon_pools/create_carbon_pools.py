@@ -1,4 +1,5 @@
 import datetime
+import functools
 import sys
 import pandas as pd
 import os
@@ -7,6 +8,12 @@ import rasterio
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+import reclassify
+import missing_tile
+import window_pipeline
 
 
 # Creates a dictionary of biomass in belowground, deadwood, and litter emitted_pools to aboveground biomass pool
@@ -38,6 +45,78 @@ def mangrove_pool_ratio_dict(gain_table_simplified, tropical_dry, tropical_wet,
     return mang_x_pool_AGB_ratio
 
 
+# Aboveground carbon density of one window in 2000 and/or the year of loss, by carbon pool extent.
+# For windows from tiles that may not exist, windows has arrays of all 0s.
+def AGC_window(carbon_pool_extent, windows, window):
+
+    removal_forest_type_window = windows['removal_forest_type']
+    annual_gain_AGC_window = windows['annual_gain_AGC']
+    cumul_gain_AGCO2_window = windows['cumul_gain_AGCO2']
+    loss_year_window = windows['loss_year']
+    gain_window = windows['gain']
+    mangrove_biomass_2000_window = windows['mangrove_biomass_2000']
+    natrl_forest_biomass_2000_window = windows['natrl_forest_biomass_2000']
+
+    result = {}
+
+    # Creates aboveground carbon density in 2000. Where mangrove biomass is found, it is used. Otherwise, WHRC or JPL AGB is used.
+    # This is necessary for calculating AGC in emissions year.
+    agc_2000_window = np.where(mangrove_biomass_2000_window != 0,
+                               mangrove_biomass_2000_window * cn.biomass_to_c_mangrove,
+                               natrl_forest_biomass_2000_window * cn.biomass_to_c_non_mangrove
+                               ).astype('float32')
+
+    # Only returns the AGC2000 window if user asked for carbon emitted_pools in 2000
+    if '2000' in carbon_pool_extent:
+        result['2000'] = agc_2000_window
+
+
+    # From here on, AGC in the year of emissions is being calculated
+    if 'loss' in carbon_pool_extent:
+
+        # Limits the AGC to the model extent
+        agc_2000_model_extent_window = np.where(removal_forest_type_window > 0, agc_2000_window, 0)
+        # print(agc_2000_model_extent_window[0][0:5])
+
+        # Creates a mask based on whether the pixels had loss and gain in them. Loss&gain pixels are 1, all else are 0.
+        # This is used to determine how much post-2000 carbon gain to add to AGC2000 pixels.
+        loss_gain_mask = np.ma.masked_where(loss_year_window == 0, gain_window).filled(0)
+
+        # Loss pixels that also have gain pixels are treated differently from loss-only pixels.
+        # Calculates AGC in emission year for pixels that don't have gain and loss (excludes loss_gain_mask = 1).
+        # To do this, it adds all the accumulated carbon after 2000 to the carbon in 2000 (all accumulated C is emitted).
+        AGC_emis_year_non_loss_and_gain = agc_2000_model_extent_window + (cumul_gain_AGCO2_window / cn.c_to_co2)
+        # print(AGC_emis_year_non_loss_and_gain[0][0:5])
+        AGC_emis_year_non_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 1, AGC_emis_year_non_loss_and_gain).filled(0)
+        # print(AGC_emis_year_non_loss_and_gain_masked[0][0:5])
+
+
+        # Calculates AGC in emission year for pixels that had loss & gain (excludes loss_gain_mask = 0).
+        # To do this, it adds only the portion of the gain that occurred before the loss year to the carbon in 2000.
+        gain_before_loss = annual_gain_AGC_window * (loss_year_window - 1)
+        AGC_emis_year_loss_and_gain = agc_2000_model_extent_window + gain_before_loss
+        AGC_emis_year_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 0, AGC_emis_year_loss_and_gain).filled(0)
+        # print(AGC_emis_year_loss_and_gain_masked[0][0:5])
+
+        # Adds the loss year pixels that had loss&gain to those that didn't have loss&gain.
+        # Each pixel falls into only one of those categories.
+        AGC_emis_year_all = AGC_emis_year_non_loss_and_gain_masked + AGC_emis_year_loss_and_gain_masked
+        # print(AGC_emis_year_all[0][0:5])
+
+        # Limits output to only pixels that had tree cover loss.
+        AGC_emis_year_all = np.where(loss_year_window > 0, AGC_emis_year_all, 0)
+        # print(AGC_emis_year_all[0][0:5])
+
+        # Converts the output to float32 since float64 is an unnecessary level of precision
+        AGC_emis_year_all = AGC_emis_year_all.astype('float32')
+        # print(AGC_emis_year_all[0][0:5])
+
+        # AGC in emissions year
+        result['loss'] = AGC_emis_year_all
+
+    return result
+
+
 # Creates aboveground carbon emitted_pools in 2000 and/or the year of loss (loss pixels only)
 def create_AGC(tile_id, sensit_type, carbon_pool_extent):
 
@@ -75,46 +154,21 @@ def create_AGC(tile_id, sensit_type, carbon_pool_extent):
     # This input should exist
     removal_forest_type_src = rasterio.open(removal_forest_type)
 
-    # Opens the input tiles if they exist
-    try:
-        annual_gain_AGC_src = rasterio.open(annual_gain_AGC)
-        uu.print_log("    Aboveground removal factor tile found for", tile_id)
-    except:
-        uu.print_log("    No aboveground removal factor tile for", tile_id)
-
-    try:
-        cumul_gain_AGCO2_src = rasterio.open(cumul_gain_AGCO2)
-        uu.print_log("    Gross aboveground removal tile found for", tile_id)
-    except:
-        uu.print_log("    No gross aboveground removal tile for", tile_id)
+    # Opens the input tiles if they exist. Windows from tiles that don't exist are all 0s.
+    srcs = {'removal_forest_type': removal_forest_type_src}
+    for name, tile, description, dtype in [
+            ('annual_gain_AGC', annual_gain_AGC, 'aboveground removal factor tile', 'float32'),
+            ('cumul_gain_AGCO2', cumul_gain_AGCO2, 'gross aboveground removal tile', 'float32'),
+            ('mangrove_biomass_2000', mangrove_biomass_2000, 'mangrove tile', 'uint8'),
+            ('natrl_forest_biomass_2000', natrl_forest_biomass_2000, 'biomass', 'uint8'),
+            ('gain', gain, 'gain tile', 'uint8'),
+            ('loss_year', loss_year, 'loss tile', 'uint8')]:
+        if os.path.exists(tile):
+            uu.print_log("    {} found for".format(description.capitalize()), tile_id)
+        else:
+            uu.print_log("    No {} for".format(description), tile_id)
+        srcs[name] = missing_tile.open_tile(tile, tile_id, dtype)
 
-    try:
-        mangrove_biomass_2000_src = rasterio.open(mangrove_biomass_2000)
-        uu.print_log("    Mangrove tile found for", tile_id)
-    except:
-        uu.print_log("    No mangrove tile for", tile_id)
-
-    try:
-        natrl_forest_biomass_2000_src = rasterio.open(natrl_forest_biomass_2000)
-        uu.print_log("    Biomass found for", tile_id)
-    except:
-        uu.print_log("    No biomass found for", tile_id)
-
-    try:
-        gain_src = rasterio.open(gain)
-        uu.print_log("    Gain tile found for", tile_id)
-    except:
-        uu.print_log("    No gain tile found for", tile_id)
-
-    try:
-        loss_year_src = rasterio.open(loss_year)
-        uu.print_log("    Loss tile found for", tile_id)
-    except:
-        uu.print_log("    No loss tile found for", tile_id)
-
-
-    # Grabs the windows of a tile to iterate over the entire tif without running out of memory
-    windows = removal_forest_type_src.block_windows(1)
 
     # Grabs metadata for one of the input tiles, like its location/projection/cellsize
     kwargs = removal_forest_type_src.meta
@@ -124,132 +178,43 @@ def create_AGC(tile_id, sensit_type, carbon_pool_extent):
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0,
         dtype='float32'
     )
+    raster_profile.update(kwargs)
 
 
     # The output files: aboveground carbon density in 2000 and in the year of loss. Creates names and rasters to write to.
+    dsts = {}
     if '2000' in carbon_pool_extent:
         output_pattern_list = [cn.pattern_AGC_2000]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         AGC_2000 = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_AGC_2000 = rasterio.open(AGC_2000, 'w', **kwargs)
+        dsts['2000'] = dst_AGC_2000
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_AGC_2000, sensit_type)
-        dst_AGC_2000.update_tags(
-            units='megagrams aboveground carbon (AGC)/ha')
-        dst_AGC_2000.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018)')
-        dst_AGC_2000.update_tags(
-            extent='aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis) and mangrove AGB. Mangrove AGB has precedence.')
+        tile_metadata.update_tags(dst_AGC_2000, output_pattern_list[0], sensit_type)
     if 'loss' in carbon_pool_extent:
         output_pattern_list = [cn.pattern_AGC_emis_year]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         AGC_emis_year = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_AGC_emis_year = rasterio.open(AGC_emis_year, 'w', **kwargs)
+        dsts['loss'] = dst_AGC_emis_year
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_AGC_emis_year, sensit_type)
-        dst_AGC_emis_year.update_tags(
-            units='megagrams aboveground carbon (AGC)/ha')
-        dst_AGC_emis_year.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year.')
-        dst_AGC_emis_year.update_tags(
-            extent='tree cover loss pixels within model extent')
+        tile_metadata.update_tags(dst_AGC_emis_year, output_pattern_list[0], sensit_type)
 
 
     uu.print_log("  Creating aboveground carbon density for {0} using carbon_pool_extent '{1}'...".format(tile_id, carbon_pool_extent))
 
-    # Iterates across the windows (1 pixel strips) of the input tiles
-    for idx, window in windows:
-
-        # Reads the input tiles' windows. For windows from tiles that may not exist, an array of all 0s is created.
-        removal_forest_type_window = removal_forest_type_src.read(1, window=window)
-        try:
-            annual_gain_AGC_window = annual_gain_AGC_src.read(1, window=window)
-        except:
-            annual_gain_AGC_window = np.zeros((window.height, window.width), dtype='float32')
-        try:
-            cumul_gain_AGCO2_window = cumul_gain_AGCO2_src.read(1, window=window)
-        except:
-            cumul_gain_AGCO2_window = np.zeros((window.height, window.width), dtype='float32')
-        try:
-            loss_year_window = loss_year_src.read(1, window=window)
-        except:
-            loss_year_window = np.zeros((window.height, window.width), dtype='uint8')
-        try:
-            gain_window = gain_src.read(1, window=window)
-        except:
-            gain_window = np.zeros((window.height, window.width), dtype='uint8')
-        try:
-            mangrove_biomass_2000_window = mangrove_biomass_2000_src.read(1, window=window)
-        except:
-            mangrove_biomass_2000_window = np.zeros((window.height, window.width), dtype='uint8')
-        try:
-            natrl_forest_biomass_2000_window = natrl_forest_biomass_2000_src.read(1, window=window)
-        except:
-            natrl_forest_biomass_2000_window = np.zeros((window.height, window.width), dtype='uint8')
-
-
-        # Creates aboveground carbon density in 2000. Where mangrove biomass is found, it is used. Otherwise, WHRC or JPL AGB is used.
-        # This is necessary for calculating AGC in emissions year.
-        agc_2000_window = np.where(mangrove_biomass_2000_window != 0,
-                                   mangrove_biomass_2000_window * cn.biomass_to_c_mangrove,
-                                   natrl_forest_biomass_2000_window * cn.biomass_to_c_non_mangrove
-                                   ).astype('float32')
-
-        # Only writes AGC2000 window to raster if user asked for carbon emitted_pools in 2000
-        if '2000' in carbon_pool_extent:
-            dst_AGC_2000.write_band(1, agc_2000_window, window=window)
-
-
-        # From here on, AGC in the year of emissions is being calculated
-        if 'loss' in carbon_pool_extent:
-
-            # Limits the AGC to the model extent
-            agc_2000_model_extent_window = np.where(removal_forest_type_window > 0, agc_2000_window, 0)
-            # print(agc_2000_model_extent_window[0][0:5])
-
-            # Creates a mask based on whether the pixels had loss and gain in them. Loss&gain pixels are 1, all else are 0.
-            # This is used to determine how much post-2000 carbon gain to add to AGC2000 pixels.
-            loss_gain_mask = np.ma.masked_where(loss_year_window == 0, gain_window).filled(0)
-
-            # Loss pixels that also have gain pixels are treated differently from loss-only pixels.
-            # Calculates AGC in emission year for pixels that don't have gain and loss (excludes loss_gain_mask = 1).
-            # To do this, it adds all the accumulated carbon after 2000 to the carbon in 2000 (all accumulated C is emitted).
-            AGC_emis_year_non_loss_and_gain = agc_2000_model_extent_window + (cumul_gain_AGCO2_window / cn.c_to_co2)
-            # print(AGC_emis_year_non_loss_and_gain[0][0:5])
-            AGC_emis_year_non_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 1, AGC_emis_year_non_loss_and_gain).filled(0)
-            # print(AGC_emis_year_non_loss_and_gain_masked[0][0:5])
-
-
-            # Calculates AGC in emission year for pixels that had loss & gain (excludes loss_gain_mask = 0).
-            # To do this, it adds only the portion of the gain that occurred before the loss year to the carbon in 2000.
-            gain_before_loss = annual_gain_AGC_window * (loss_year_window - 1)
-            AGC_emis_year_loss_and_gain = agc_2000_model_extent_window + gain_before_loss
-            AGC_emis_year_loss_and_gain_masked = np.ma.masked_where(loss_gain_mask == 0, AGC_emis_year_loss_and_gain).filled(0)
-            # print(AGC_emis_year_loss_and_gain_masked[0][0:5])
-
-            # Adds the loss year pixels that had loss&gain to those that didn't have loss&gain.
-            # Each pixel falls into only one of those categories.
-            AGC_emis_year_all = AGC_emis_year_non_loss_and_gain_masked + AGC_emis_year_loss_and_gain_masked
-            # print(AGC_emis_year_all[0][0:5])
-
-            # Limits output to only pixels that had tree cover loss.
-            AGC_emis_year_all = np.where(loss_year_window > 0, AGC_emis_year_all, 0)
-            # print(AGC_emis_year_all[0][0:5])
-
-            # Converts the output to float32 since float64 is an unnecessary level of precision
-            AGC_emis_year_all = AGC_emis_year_all.astype('float32')
-            # print(AGC_emis_year_all[0][0:5])
-
-            # Writes AGC in emissions year to raster
-            dst_AGC_emis_year.write_band(1, AGC_emis_year_all, window=window)
-
+    # Reads, calculates and writes the windows of the tiles at the same time
+    window_pipeline.run(functools.partial(AGC_window, carbon_pool_extent), srcs, dsts)
 
+    for src in srcs.values():
+        src.close()
+    for dst in dsts.values():
+        dst.close()
 
     # Prints information about the tile that was just processed
     if 'loss' in carbon_pool_extent:
@@ -263,6 +228,9 @@ def create_BGC(tile_id, mang_BGB_AGB_ratio, carbon_pool_extent, sensit_type):
 
     start = datetime.datetime.now()
 
+    # Lookup table of the mangrove BGB:AGB ratio for each continent-ecozone code
+    mang_BGB_AGB_lut = reclassify.compile_lut(mang_BGB_AGB_ratio)
+
     # Names of the input tiles
     removal_forest_type = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_removal_forest_type)
     cont_ecozone = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_cont_eco_processed)
@@ -272,42 +240,32 @@ def create_BGC(tile_id, mang_BGB_AGB_ratio, carbon_pool_extent, sensit_type):
         AGC_2000 = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_AGC_2000)
         AGC_2000_src = rasterio.open(AGC_2000)
         kwargs = AGC_2000_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_2000_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_2000_src)
         output_pattern_list = [cn.pattern_BGC_2000]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         BGC_2000 = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_BGC_2000 = rasterio.open(BGC_2000, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_BGC_2000, sensit_type)
-        dst_BGC_2000.update_tags(
-            units='megagrams belowground carbon (BGC)/ha')
-        dst_BGC_2000.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:BGC for mangrove and non-mangrove forests applied.')
-        dst_BGC_2000.update_tags(
-            extent='aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis) and mangrove AGB. Mangrove AGB has precedence.')
+        tile_metadata.update_tags(dst_BGC_2000, output_pattern_list[0], sensit_type)
 
     # For BGC in emissions year, opens AGC, names the output tile, creates the output tile
     if 'loss' in carbon_pool_extent:
         AGC_emis_year = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_AGC_emis_year)
         AGC_emis_year_src = rasterio.open(AGC_emis_year)
         kwargs = AGC_emis_year_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_emis_year_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_emis_year_src)
         output_pattern_list = [cn.pattern_BGC_emis_year]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         BGC_emis_year = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_BGC_emis_year = rasterio.open(BGC_emis_year, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_BGC_emis_year, sensit_type)
-        dst_BGC_emis_year.update_tags(
-            units='megagrams belowground carbon (BGC)/ha')
-        dst_BGC_emis_year.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:BGC for mangrove and non-mangrove forests applied.')
-        dst_BGC_emis_year.update_tags(
-            extent='tree cover loss pixels within model extent')
+        tile_metadata.update_tags(dst_BGC_emis_year, output_pattern_list[0], sensit_type)
 
 
     uu.print_log("  Reading input files for {}...".format(tile_id))
@@ -341,9 +299,9 @@ def create_BGC(tile_id, mang_BGB_AGB_ratio, carbon_pool_extent, sensit_type):
         except:
             removal_forest_type_window = np.zeros((window.height, window.width))
 
-        # Applies the mangrove BGB:AGB ratios (3 different ratios) to the ecozone raster to create a raster of BGB:AGB ratios
-        for key, value in mang_BGB_AGB_ratio.items():
-            cont_ecozone_window[cont_ecozone_window == key] = value
+        # Applies the mangrove BGB:AGB ratios (3 different ratios) to the ecozone raster to create a raster of BGB:AGB ratios.
+        # Codes that aren't in the dictionary keep their code.
+        cont_ecozone_window = mang_BGB_AGB_lut.apply(cont_ecozone_window, default=cont_ecozone_window)
 
         # Calculates BGC2000 from AGC2000
         if '2000' in carbon_pool_extent:
@@ -381,6 +339,10 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
 
     start = datetime.datetime.now()
 
+    # Lookup tables of the mangrove deadwood:AGB and litter:AGB ratios for each continent-ecozone code
+    mang_deadwood_AGB_lut = reclassify.compile_lut(mang_deadwood_AGB_ratio)
+    mang_litter_AGB_lut = reclassify.compile_lut(mang_litter_AGB_ratio)
+
     # Names of the input tiles. Creates the names even if the files don't exist.
     mangrove_biomass_2000 = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_mangrove_biomass_2000)
     bor_tem_trop = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_bor_tem_trop_processed)
@@ -399,8 +361,9 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
         AGC_2000 = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_AGC_2000)
         AGC_2000_src = rasterio.open(AGC_2000)
         kwargs = AGC_2000_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_2000_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_2000_src)
         output_pattern_list = [cn.pattern_deadwood_2000, cn.pattern_litter_2000]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
@@ -409,29 +372,18 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
         dst_deadwood_2000 = rasterio.open(deadwood_2000, 'w', **kwargs)
         dst_litter_2000 = rasterio.open(litter_2000, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_deadwood_2000, sensit_type)
-        dst_deadwood_2000.update_tags(
-            units='megagrams deadwood carbon/ha')
-        dst_deadwood_2000.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:deadwood carbon for mangrove and non-mangrove forests applied.')
-        dst_deadwood_2000.update_tags(
-            extent='aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis) and mangrove AGB. Mangrove AGB has precedence.')
+        tile_metadata.update_tags(dst_deadwood_2000, output_pattern_list[0], sensit_type)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_litter_2000, sensit_type)
-        dst_litter_2000.update_tags(
-            units='megagrams litter carbon/ha')
-        dst_litter_2000.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:litter carbon for mangrove and non-mangrove forests applied.')
-        dst_litter_2000.update_tags(
-            extent='aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis) and mangrove AGB. Mangrove AGB has precedence.')
+        tile_metadata.update_tags(dst_litter_2000, output_pattern_list[1], sensit_type)
 
     # For deadwood and litter in emissions year, opens AGC, names the output tiles, creates the output tiles
     if 'loss' in carbon_pool_extent:
         AGC_emis_year = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_AGC_emis_year)
         AGC_emis_year_src = rasterio.open(AGC_emis_year)
         kwargs = AGC_emis_year_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_emis_year_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_emis_year_src)
 
         output_pattern_list = [cn.pattern_deadwood_emis_year_2000, cn.pattern_litter_emis_year_2000]
         if sensit_type != 'std':
@@ -441,21 +393,9 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
         dst_deadwood_emis_year = rasterio.open(deadwood_emis_year, 'w', **kwargs)
         dst_litter_emis_year = rasterio.open(litter_emis_year, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_deadwood_emis_year, sensit_type)
-        dst_deadwood_emis_year.update_tags(
-            units='megagrams deadwood carbon/ha')
-        dst_deadwood_emis_year.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:litter carbon for mangrove and non-mangrove forests applied.')
-        dst_deadwood_emis_year.update_tags(
-            extent='tree cover loss pixels within model extent')
+        tile_metadata.update_tags(dst_deadwood_emis_year, output_pattern_list[0], sensit_type)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_litter_emis_year, sensit_type)
-        dst_litter_emis_year.update_tags(
-            units='megagrams litter carbon/ha')
-        dst_litter_emis_year.update_tags(
-            source='WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:litter carbon for mangrove and non-mangrove forests applied.')
-        dst_litter_emis_year.update_tags(
-            extent='tree cover loss pixels within model extent')
+        tile_metadata.update_tags(dst_litter_emis_year, output_pattern_list[1], sensit_type)
 
     uu.print_log("  Reading input files for {}...".format(tile_id))
 
@@ -613,9 +553,9 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
             # Reads in the window for mangrove biomass if it exists
             mangrove_biomass_2000_window = mangrove_biomass_2000_src.read(1, window=window)
 
-            # Applies the mangrove deadwood:AGB ratios (2 different ratios) to the ecozone raster to create a raster of deadwood:AGB ratios
-            for key, value in mang_deadwood_AGB_ratio.items():
-                cont_ecozone_window[cont_ecozone_window == key] = value
+            # Applies the mangrove deadwood:AGB ratios (2 different ratios) to the ecozone raster to create a raster of deadwood:AGB ratios.
+            # Codes that aren't in the dictionary keep their code.
+            cont_ecozone_window = mang_deadwood_AGB_lut.apply(cont_ecozone_window, default=cont_ecozone_window)
 
             # Multiplies the AGB in the loss year (2000 for deadwood) by the correct mangrove deadwood:AGB ratio to get an array of deadwood
             mangrove_C_final = mangrove_biomass_2000_window * cont_ecozone_window * cn.biomass_to_c_mangrove
@@ -639,9 +579,9 @@ def create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_rat
             except:
                 cont_ecozone_window = np.zeros((window.height, window.width), dtype='float32')
 
-            # Applies the mangrove deadwood:AGB ratios (2 different ratios) to the ecozone raster to create a raster of deadwood:AGB ratios
-            for key, value in mang_litter_AGB_ratio.items():
-                cont_ecozone_window[cont_ecozone_window == key] = value
+            # Applies the mangrove deadwood:AGB ratios (2 different ratios) to the ecozone raster to create a raster of deadwood:AGB ratios.
+            # Codes that aren't in the dictionary keep their code.
+            cont_ecozone_window = mang_litter_AGB_lut.apply(cont_ecozone_window, default=cont_ecozone_window)
 
             mangrove_C_final = mangrove_biomass_2000_window * cont_ecozone_window * cn.biomass_to_c_mangrove
 
@@ -706,30 +646,24 @@ def create_soil_emis_extent(tile_id, pattern, sensit_type):
 
     # Grabs metadata for one of the input tiles, like its location/projection/cellsize
     kwargs = AGC_emis_year_src.meta
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = AGC_emis_year_src.block_windows(1)
+    # Grabs the windows of the tile to iterate over the entire tif without running out of memory
+    windows = tile_layout.windows(AGC_emis_year_src)
 
     # Updates kwargs for the output dataset.
     # Need to update data type to float 32 so that it can handle fractional carbon emitted_pools
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0,
         dtype='uint16'
     )
+    raster_profile.update(kwargs)
 
     # The output file: belowground carbon denity in the year of tree cover loss for pixels with tree cover loss
     dst_soil_emis_year = rasterio.open(soil_emis_year, 'w', **kwargs)
 
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_soil_emis_year, sensit_type)
-    dst_soil_emis_year.update_tags(
-        units='megagrams soil carbon/ha')
-    dst_soil_emis_year.update_tags(
-        source='ISRIC SoilGrids250 (May 2020 update) soil organic carbon stock data. 0-30 cm data.')
-    dst_soil_emis_year.update_tags(
-        extent='tree cover loss pixels')
+    tile_metadata.update_tags(dst_soil_emis_year, pattern, sensit_type)
 
     uu.print_log("  Creating soil carbon density for loss pixels in {}...".format(tile_id))
 
@@ -781,21 +715,16 @@ def create_total_C(tile_id, carbon_pool_extent, sensit_type):
             uu.print_log("    No soil C 2000 tile found for", tile_id)
 
         kwargs = AGC_2000_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_2000_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_2000_src)
         output_pattern_list = [cn.pattern_total_C_2000]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         total_C_2000 = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_total_C_2000 = rasterio.open(total_C_2000, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_total_C_2000, sensit_type)
-        dst_total_C_2000.update_tags(
-            units='megagrams total (all emitted_pools) carbon/ha')
-        dst_total_C_2000.update_tags(
-            source='AGC, BGC, deadwood carbon, litter carbon, and soil carbon')
-        dst_total_C_2000.update_tags(
-            extent='aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis), mangrove AGB, and soil carbon. Mangrove AGB has precedence.')
+        tile_metadata.update_tags(dst_total_C_2000, output_pattern_list[0], sensit_type)
 
 
     if 'loss' in carbon_pool_extent:
@@ -815,21 +744,16 @@ def create_total_C(tile_id, carbon_pool_extent, sensit_type):
             uu.print_log("    No soil C emission year tile found for", tile_id)
 
         kwargs = AGC_emis_year_src.meta
-        kwargs.update(driver='GTiff', count=1, compress='lzw', nodata=0)
-        windows = AGC_emis_year_src.block_windows(1)
+        kwargs.update(driver='GTiff', count=1, nodata=0)
+        raster_profile.update(kwargs)
+        windows = tile_layout.windows(AGC_emis_year_src)
         output_pattern_list = [cn.pattern_total_C_emis_year]
         if sensit_type != 'std':
             output_pattern_list = uu.alter_patterns(sensit_type, output_pattern_list)
         total_C_emis_year = '{0}_{1}.tif'.format(tile_id, output_pattern_list[0])
         dst_total_C_emis_year = rasterio.open(total_C_emis_year, 'w', **kwargs)
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst_total_C_emis_year, sensit_type)
-        dst_total_C_emis_year.update_tags(
-            units='megagrams total (all emitted_pools) carbon/ha')
-        dst_total_C_emis_year.update_tags(
-            source='AGC, BGC, deadwood carbon, litter carbon, and soil carbon')
-        dst_total_C_emis_year.update_tags(
-            extent='tree cover loss pixels within model extent')
+        tile_metadata.update_tags(dst_total_C_emis_year, output_pattern_list[0], sensit_type)
 
 
     uu.print_log("  Creating total carbon density for {0} using carbon_pool_extent '{1}'...".format(tile_id, carbon_pool_extent))
@@ -10,6 +10,8 @@ from scipy import stats
 import sys
 sys.path.append('../')
 import universal_util as uu
+import tile_layout
+import raster_profile
 import constants_and_names as cn
 
 
@@ -31,37 +33,37 @@ def create_input_files(tile_id):
     uu.warp_to_Hansen('add_30s_precip.tif', '{0}_{1}.tif'.format(tile_id, cn.pattern_precip), xmin, ymin, xmax, ymax, 'Int32')
 
     uu.print_log("Rasterizing ecozone into boreal-temperate-tropical categories for", tile_id)
-    blocksizex = 1024
-    blocksizey = 1024
+    blocksizex = cn.mode_fill_window_size
+    blocksizey = cn.mode_fill_window_size
     uu.rasterize('fao_ecozones_bor_tem_tro.shp',
                    "{0}_{1}.tif".format(tile_id, cn.pattern_bor_tem_trop_intermediate),
                         xmin, ymin, xmax, ymax, blocksizex, blocksizey, '.00025', 'Int16', 'recode', '0')
 
     # Opens boreal/temperate/tropical ecozone tile.
-    # Everything from here down is used to assign pixels without boreal-tem-tropical codes to a bor-tem-trop in the 1024x1024 windows.
+    # Everything from here down is used to assign pixels without boreal-tem-tropical codes to a bor-tem-trop in the mode fill windows.
     bor_tem_trop_src = rasterio.open("{0}_{1}.tif".format(tile_id, cn.pattern_bor_tem_trop_intermediate))
 
     # Grabs metadata about the tif, like its location/projection/cellsize
     kwargs = bor_tem_trop_src.meta
 
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = bor_tem_trop_src.block_windows(1)
+    # Grabs the mode fill windows of the tile, whatever the blocks of the tile are
+    windows = tile_layout.windows(bor_tem_trop_src, cn.mode_fill_window_size, cn.mode_fill_window_size)
 
     # Updates kwargs for the output dataset.
     # Need to update data type to float 32 so that it can handle fractional gain rates
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0
     )
+    raster_profile.update(kwargs)
 
     bor_tem_trop_processed = '{0}_{1}.tif'.format(tile_id, cn.pattern_bor_tem_trop_processed)
 
     # The output file: aboveground carbon density in the year of tree cover loss for pixels with tree cover loss
     dst_bor_tem_trop = rasterio.open(bor_tem_trop_processed, 'w', **kwargs)
 
-    # Iterates across the windows (1024 x 1024 pixel boxes) of the input tile.
+    # Iterates across the mode fill windows of the input tile.
     for idx, window in windows:
 
         # Creates window for input raster
@@ -89,10 +91,7 @@ def create_input_files(tile_id):
         # Assigns all pixels without a bor-tem-trop code in that window to that most common code
         bor_tem_trop_window[bor_tem_trop_window == 0] = mode
 
-        # Writes the output window to the output.
-        # Although the windows for the input tiles are 1024 x 1024 pixels,
-        # the windows for these output files are 40000 x 1 pixels, like all the other tiles in this model,
-        # so they should work fine with all the other tiles.
+        # Writes the output window to the output
         dst_bor_tem_trop.write_band(1, bor_tem_trop_window, window=window)
 
     # Prints information about the tile that was just processed
@@ -21,6 +21,8 @@ import os
 import sys
 sys.path.append('../')
 import universal_util as uu
+import tile_layout
+import raster_profile
 import constants_and_names as cn
 
 # Creates 10x10 mangrove soil C tiles
@@ -50,10 +52,7 @@ def create_mangrove_soil_C(tile_id):
         uu.print_log("Masking mangrove soil to mangrove biomass for", tile_id)
         cmd = ['gdal_calc.py', '-A', mangrove_soil, '-B', mangrove_biomass,
                calc, out, '--NoDataValue=0', '--co', 'COMPRESS=DEFLATE', '--overwrite', datatype, '--quiet']
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.log_subprocess_output_full(cmd)
 
     else:
 
@@ -84,8 +83,8 @@ def create_combined_soil_C(tile_id):
         mangrove_soil_src = rasterio.open(mangrove_soil)
         # Grabs metadata for one of the input tiles, like its location/projection/cellsize
         kwargs = mangrove_soil_src.meta
-        # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-        windows = mangrove_soil_src.block_windows(1)
+        # Grabs the windows of the tile to iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(mangrove_soil_src)
 
         mineral_soil_src = rasterio.open(mineral_soil)
 
@@ -94,9 +93,9 @@ def create_combined_soil_C(tile_id):
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # The output file: soil C with mangrove soil C taking precedence over mineral soil C
         dst_combined_soil = rasterio.open(combined_soil, 'w', **kwargs)
@@ -18,6 +18,10 @@ emitted_pools in 2000 only need to be updated if mangrove AGB, WHRC AGB, or soil
 Which carbon emitted_pools are being generated (2000 and/or loss pixels) is controlled through the command line argument --carbon-pool-extent (-ce).
 This extent argument determines which AGC function is used and how the outputs of the other emitted_pools' scripts are named.
 Carbon emitted_pools in both 2000 and in the year of loss can be created in a single run by using '2000,loss' or 'loss,2000'.
+
+All pools of a tile are created in one pass over the tile by carbon_pools_engine.py.
+Which pools are written is controlled through cn.carbon_pools or the command line argument --pools (-p), e.g.,
+'AGC,BGC,deadwood,litter,soil' for a run that only needs the pools used by gross emissions.
 '''
 
 import multiprocessing
@@ -32,10 +36,12 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'carbon_pools'))
 import create_carbon_pools
+import carbon_pools_engine
 
-def mp_create_carbon_pools(sensit_type, tile_id_list, carbon_pool_extent, run_date = None):
+def mp_create_carbon_pools(sensit_type, tile_id_list, carbon_pool_extent, run_date = None, pools = None):
 
     os.chdir(cn.docker_base_dir)
 
@@ -162,8 +168,7 @@ def mp_create_carbon_pools(sensit_type, tile_id_list, carbon_pool_extent, run_da
 
 
     # Table with IPCC Wetland Supplement Table 4.4 default mangrove gain rates
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
     pd.options.mode.chained_assignment = None
 
@@ -189,248 +194,46 @@ def mp_create_carbon_pools(sensit_type, tile_id_list, carbon_pool_extent, run_da
                                                                                             cn.litter_to_above_trop_wet_mang,
                                                                                             cn.litter_to_above_subtrop_mang)
 
-    uu.print_log("Creating tiles of aboveground carbon in {}".format(carbon_pool_extent))
-    if cn.count == 96:
-        # More processors can be used for loss carbon pools than for 2000 carbon pools
-        if carbon_pool_extent == 'loss':
-            if sensit_type == 'biomass_swap':
-                processes = 16  # 16 processors = XXX GB peak
-            else:
-                processes = 20  # 25 processors > 750 GB peak; 16 = 560 GB peak;
-                # 18 = 570 GB peak; 19 = 620 GB peak; 20 = 670 GB peak; 21 > 750 GB peak
-        else: # For 2000, or loss & 2000
-            processes = 15  # 12 processors = 490 GB peak (stops around 455, then increases slowly); 15 = XXX GB peak
-    else:
-        processes = 2
-    uu.print_log('AGC loss year max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(create_carbon_pools.create_AGC,
-                     sensit_type=sensit_type, carbon_pool_extent=carbon_pool_extent), tile_id_list)
-    pool.close()
-    pool.join()
-
-    # # For single processor use
-    # for tile_id in tile_id_list:
-    #     create_carbon_pools.create_AGC(tile_id, sensit_type, carbon_pool_extent)
-
-    if carbon_pool_extent in ['loss', '2000']:
-        uu.upload_final_set(output_dir_list[0], output_pattern_list[0])
-    else:
-        uu.upload_final_set(output_dir_list[0], output_pattern_list[0])
-        uu.upload_final_set(output_dir_list[6], output_pattern_list[6])
-    uu.check_storage()
-
-    uu.print_log(":::::Freeing up memory for belowground carbon creation; deleting unneeded tiles")
-    tiles_to_delete = glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_all_types))
-    tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cumul_gain_AGCO2_all_types)))
-    uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-    for tile_to_delete in tiles_to_delete:
-        os.remove(tile_to_delete)
-    uu.print_log(":::::Deleted unneeded tiles")
-    uu.check_storage()
-
+    # The pools to write. Pools that the requested pools need are calculated but not written.
+    if pools is None:
+        pools = cn.carbon_pools
+    for pool in pools:
+        if pool not in carbon_pools_engine.pool_names:
+            uu.exception_log("Invalid carbon pool {0}. Please choose from {1}.".format(pool, ', '.join(carbon_pools_engine.pool_names)))
 
-    uu.print_log("Creating tiles of belowground carbon in {}".format(carbon_pool_extent))
-    # Creates a single filename pattern to pass to the multiprocessor call
-    if cn.count == 96:
-        # More processors can be used for loss carbon pools than for 2000 carbon pools
-        if carbon_pool_extent == 'loss':
-            if sensit_type == 'biomass_swap':
-                processes = 30  # 30 processors = XXX GB peak
-            else:
-                processes = 38  # 20 processors = 370 GB peak; 32 = 590 GB peak; 36 = 670 GB peak; 38 = 700 GB peak
-        else: # For 2000, or loss & 2000
-            processes = 30  # 20 processors = 370 GB peak; 25 = 460 GB peak; 30 = XXX GB peak
-    else:
-        processes = 2
-    uu.print_log('BGC max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(create_carbon_pools.create_BGC, mang_BGB_AGB_ratio=mang_BGB_AGB_ratio,
-                     carbon_pool_extent=carbon_pool_extent,
-                     sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
-
-    # # For single processor use
-    # for tile_id in tile_id_list:
-    #     create_carbon_pools.create_BGC(tile_id, mang_BGB_AGB_ratio, carbon_pool_extent, sensit_type)
-
-    if carbon_pool_extent in ['loss', '2000']:
-        uu.upload_final_set(output_dir_list[1], output_pattern_list[1])
-    else:
-        uu.upload_final_set(output_dir_list[1], output_pattern_list[1])
-        uu.upload_final_set(output_dir_list[7], output_pattern_list[7])
-    uu.check_storage()
-
-
-    # 825 GB isn't enough space to create deadwood and litter 2000 while having AGC and BGC 2000 on.
-    # Thus must delete AGC, BGC, and soil C 2000 for creation of deadwood and litter, then copy them back to spot machine
-    # for total C 2000 calculation.
+    # Output directory and file name pattern of each pool in each year, in the same order as output_dir_list
+    output_keys = []
     if '2000' in carbon_pool_extent:
-        uu.print_log(":::::Freeing up memory for deadwood and litter carbon 2000 creation; deleting unneeded tiles")
-        tiles_to_delete = []
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_BGC_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_removal_forest_type)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_loss)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gain)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_soil_C_full_extent_2000)))
-
-        uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-        for tile_to_delete in tiles_to_delete:
-            os.remove(tile_to_delete)
-        uu.print_log(":::::Deleted unneeded tiles")
-        uu.check_storage()
-
-
-    uu.print_log("Creating tiles of deadwood and litter carbon in {}".format(carbon_pool_extent))
-    if cn.count == 96:
-        # More processors can be used for loss carbon pools than for 2000 carbon pools
-        if carbon_pool_extent == 'loss':
-            if sensit_type == 'biomass_swap':
-                processes = 10  # 10 processors = XXX GB peak
-            else:
-                processes = 14  # 32 processors = >750 GB peak; 24 > 750 GB peak; 14 = 650 GB peak; 15 = 700 GB peak
-        else: # For 2000, or loss & 2000
-            ### Note: deleted precip, elevation, and WHRC AGB tiles at equatorial latitudes as deadwood and litter were produced.
-            ### There wouldn't have been enough room for all deadwood and litter otherwise.
-            ### For example, when deadwood and litter generation started getting up to around 50N, I deleted
-            ### 00N precip, elevation, and WHRC AGB. I deleted all of those from 30N to 20S.
-            processes = 16  # 7 processors = 320 GB peak; 14 = 620 GB peak; 16 = XXX GB peak
+        output_keys = output_keys + [(pool, '2000') for pool in carbon_pools_engine.pool_names]
+    if 'loss' in carbon_pool_extent:
+        output_keys = output_keys + [(pool, 'loss') for pool in carbon_pools_engine.pool_names]
+    output_dirs = dict(zip(output_keys, zip(output_dir_list, output_pattern_list)))
+
+    uu.print_log("Creating tiles of {0} carbon in {1}".format(', '.join(pools), carbon_pool_extent))
+    # All pools are calculated in one pass over each tile, a window at a time, so the pools no longer have to
+    # be written to disk and read back by the next pool's stage (or deleted and redownloaded to make room on disk).
+    # Per-tile memory is for cn.window_pipeline_windows windows of about 12 inputs and the intermediate arrays of all
+    # pools of a window on each of cn.window_pipeline_threads threads.
+    if sensit_type == 'biomass_swap':
+        memory_gb = 7
     else:
-        processes = 2
-    uu.print_log('Deadwood and litter max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(
-        partial(create_carbon_pools.create_deadwood_litter, mang_deadwood_AGB_ratio=mang_deadwood_AGB_ratio,
-                mang_litter_AGB_ratio=mang_litter_AGB_ratio,
-                carbon_pool_extent=carbon_pool_extent,
-                sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 6
+    tile_scheduler.run(partial(carbon_pools_engine.create_carbon_pools, mang_BGB_AGB_ratio=mang_BGB_AGB_ratio,
+                               mang_deadwood_AGB_ratio=mang_deadwood_AGB_ratio,
+                               mang_litter_AGB_ratio=mang_litter_AGB_ratio,
+                               carbon_pool_extent=carbon_pool_extent, sensit_type=sensit_type, pools=pools),
+                       tile_id_list, 'carbon_pools_{0}_{1}'.format(carbon_pool_extent, sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
-    #     create_carbon_pools.create_deadwood_litter(tile_id, mang_deadwood_AGB_ratio, mang_litter_AGB_ratio, carbon_pool_extent, sensit_type)
-
-    if carbon_pool_extent in ['loss', '2000']:
-        uu.upload_final_set(output_dir_list[2], output_pattern_list[2])  # deadwood
-        uu.upload_final_set(output_dir_list[3], output_pattern_list[3])  # litter
-    else:
-        uu.upload_final_set(output_dir_list[2], output_pattern_list[2])  # deadwood
-        uu.upload_final_set(output_dir_list[3], output_pattern_list[3])  # litter
-        uu.upload_final_set(output_dir_list[8], output_pattern_list[8])  # deadwood
-        uu.upload_final_set(output_dir_list[9], output_pattern_list[9])  # litter
-    uu.check_storage()
-
-    uu.print_log(":::::Freeing up memory for soil and total carbon creation; deleting unneeded tiles")
-    tiles_to_delete = []
-    tiles_to_delete .extend(glob.glob('*{}*tif'.format(cn.pattern_elevation)))
-    tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_precip)))
-    tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_WHRC_biomass_2000_unmasked)))
-    tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_JPL_unmasked_processed)))
-    tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cont_eco_processed)))
-    uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-    for tile_to_delete in tiles_to_delete:
-        os.remove(tile_to_delete)
-    uu.print_log(":::::Deleted unneeded tiles")
-    uu.check_storage()
-
-
-    if 'loss' in carbon_pool_extent:
-
-        uu.print_log("Creating tiles of soil carbon in loss extent")
-
-        # If pools in 2000 weren't generated, soil carbon in emissions extent is 4.
-        # If pools in 2000 were generated, soil carbon in emissions extent is 10.
-        if '2000' not in carbon_pool_extent:
-            pattern = output_pattern_list[4]
-        else:
-            pattern = output_pattern_list[10]
-
-        if cn.count == 96:
-            # More processors can be used for loss carbon pools than for 2000 carbon pools
-            if carbon_pool_extent == 'loss':
-                if sensit_type == 'biomass_swap':
-                    processes = 36  # 36 processors = XXX GB peak
-                else:
-                    processes = 42  # 24 processors = 360 GB peak; 32 = 490 GB peak; 38 = 580 GB peak; 42 = XXX GB peak
-            else: # For 2000, or loss & 2000
-                processes = 12  # 12 processors = XXX GB peak
-        else:
-            processes = 2
-        uu.print_log('Soil carbon loss year max processors=', processes)
-        pool = multiprocessing.Pool(processes)
-        pool.map(partial(create_carbon_pools.create_soil_emis_extent, pattern=pattern,
-                         sensit_type=sensit_type), tile_id_list)
-        pool.close()
-        pool.join()
-
-        # # For single processor use
-        # for tile_id in tile_id_list:
-        #     create_carbon_pools.create_soil_emis_extent(tile_id, pattern, sensit_type)
-
-        # If pools in 2000 weren't generated, soil carbon in emissions extent is 4.
-        # If pools in 2000 were generated, soil carbon in emissions extent is 10.
-        if '2000' not in carbon_pool_extent:
-            uu.upload_final_set(output_dir_list[4], output_pattern_list[4])
-        else:
-            uu.upload_final_set(output_dir_list[10], output_pattern_list[10])
-
-        uu.check_storage()
+    #     carbon_pools_engine.create_carbon_pools(tile_id, mang_BGB_AGB_ratio, mang_deadwood_AGB_ratio,
+    #                                             mang_litter_AGB_ratio, carbon_pool_extent, sensit_type, pools)
 
     if '2000' in carbon_pool_extent:
         uu.print_log("Skipping soil for 2000 carbon pool calculation. Soil carbon in 2000 already created.")
-        uu.check_storage()
 
-
-    # 825 GB isn't enough space to create deadwood and litter 2000 while having AGC and BGC 2000 on.
-    # Thus must delete BGC and soil C 2000 for creation of deadwood and litter, then copy them back to spot machine
-    # for total C 2000 calculation.
-    if '2000' in carbon_pool_extent:
-
-        # Files to download for total C 2000. Previously deleted to save space
-        download_dict = {
-            cn.BGC_2000_dir: [cn.pattern_BGC_2000],
-            cn.soil_C_full_extent_2000_dir: [cn.pattern_soil_C_full_extent_2000]
-        }
-
-        for key, values in download_dict.items():
-            dir = key
-            pattern = values[0]
-            uu.s3_flexible_download(dir, pattern, cn.docker_base_dir, sensit_type, tile_id_list)
-
-
-    uu.print_log("Creating tiles of total carbon")
-    if cn.count == 96:
-        # More processors can be used for loss carbon pools than for 2000 carbon pools
-        if carbon_pool_extent == 'loss':
-            if sensit_type == 'biomass_swap':
-                processes = 14  # 14 processors = XXX GB peak
-            else:
-                processes = 18  # 20 processors > 750 GB peak (by just a bit, I think); 15 = 550 GB peak; 18 = XXX GB peak
-        else: # For 2000, or loss & 2000
-            processes = 12  # 12 processors = XXX GB peak
-    else:
-        processes = 2
-    uu.print_log('Total carbon loss year max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(create_carbon_pools.create_total_C, carbon_pool_extent=carbon_pool_extent,
-                     sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
-
-    # # For single processor use
-    # for tile_id in tile_id_list:
-    #     create_carbon_pools.create_total_C(tile_id, carbon_pool_extent, sensit_type)
-
-    if carbon_pool_extent in ['loss', '2000']:
-        uu.upload_final_set(output_dir_list[5], output_pattern_list[5])
-    else:
-        uu.upload_final_set(output_dir_list[5], output_pattern_list[5])
-        uu.upload_final_set(output_dir_list[11], output_pattern_list[11])
+    for output in carbon_pools_engine.requested_outputs(pools, carbon_pool_extent):
+        uu.upload_final_set(output_dirs[output][0], output_dirs[output][1])
     uu.check_storage()
 
 
@@ -447,11 +250,16 @@ if __name__ == '__main__':
                         help='Extent over which carbon emitted_pools should be calculated: loss, 2000, loss,2000, or 2000,loss')
     parser.add_argument('--run-date', '-d', required=False,
                         help='Date of run. Must be format YYYYMMDD.')
+    parser.add_argument('--pools', '-p', required=False,
+                        help='Carbon pools to write: any of AGC,BGC,deadwood,litter,soil,total. Default is all pools.')
     args = parser.parse_args()
     sensit_type = args.model_type
     tile_id_list = args.tile_id_list
     carbon_pool_extent = args.carbon_pool_extent  # Tells the pool creation functions to calculate carbon emitted_pools as they were at the year of loss in loss pixels only
     run_date = args.run_date
+    pools = args.pools
+    if pools is not None:
+        pools = pools.split(',')
 
     # Create the output log
     uu.initiate_log(tile_id_list=tile_id_list, sensit_type=sensit_type, run_date=run_date, carbon_pool_extent=carbon_pool_extent)
@@ -461,4 +269,4 @@ if __name__ == '__main__':
     tile_id_list = uu.tile_id_list_check(tile_id_list)
 
     mp_create_carbon_pools(sensit_type=sensit_type, tile_id_list=tile_id_list,
-                           carbon_pool_extent=carbon_pool_extent, run_date=run_date)
\ No newline at end of file
+                           carbon_pool_extent=carbon_pool_extent, run_date=run_date, pools=pools)
\ No newline at end of file
@@ -45,16 +45,13 @@ def mp_create_inputs_for_C_pools(tile_id_list, run_date = None):
     uu.print_log("Unzipping boreal/temperate/tropical file (from FAO ecozones)")
     cmd = ['unzip', '{}'.format(cn.pattern_fao_ecozone_raw), '-d', cn.docker_base_dir]
 
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+    uu.log_subprocess_output_full(cmd)
 
     uu.print_log("Copying elevation (srtm) files")
     uu.s3_folder_download(cn.srtm_raw_dir, './srtm', sensit_type)
 
     uu.print_log("Making elevation (srtm) vrt")
-    check_call('gdalbuildvrt srtm.vrt srtm/*.tif', shell=True)  # I don't know how to convert this to output to the pipe, so just leaving as is
+    uu.log_subprocess_output_full('gdalbuildvrt srtm.vrt srtm/*.tif', shell=True)
 
     # Worked with count/3 on an r4.16xlarge (140 out of 480 GB used). I think it should be fine with count/2 but didn't try it.
     processes = int(cn.count/2)
@@ -26,6 +26,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 def mp_create_soil_C(tile_id_list):
 
@@ -198,7 +199,7 @@ def mp_create_soil_C(tile_id_list):
     calc = '--calc=(A-B)/3'
     out_filearg = '--outfile={}'.format(soil_C_stdev_global)
     cmd = ['gdal_calc.py', '-A', vrt_CI95, '-B', vrt_CI05, calc, out_filearg,
-           '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type=Float32']
+           '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options('scratch', 'Float32', '--co'), '--type=Float32']
     uu.log_subprocess_output_full(cmd)
 
     uu.print_log("{} created.".format(soil_C_stdev_global))
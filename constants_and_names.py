@@ -86,6 +86,46 @@ docker_app = '/usr/local/app'
 
 c_emis_compile_dst = '{0}/emissions/cpp_util'.format(docker_app)
 
+# Layout of the tiles the model writes (tile_layout.py): GeoTIFFs tiled in square blocks of tile_block_size pixels
+# (None writes 40000x1 strips), read and calculated in windows of tile_window_rows x tile_window_cols pixels.
+# Windows should be whole numbers of blocks so that each block is decompressed once per window.
+tile_block_size = 1024
+tile_window_rows = 1024
+tile_window_cols = 4096
+# Pixels without a continent-ecozone, boreal/temperate/tropical or climate zone code are assigned the most common code
+# in their mode_fill_window_size x mode_fill_window_size window
+mode_fill_window_size = 1024
+
+# Compression of the tiles the model writes (raster_profile.py), by profile: 'scratch' for tiles that are only used in
+# the working folder, 'archive' for tiles that are uploaded to s3 and 'published' for the outputs in published_patterns.
+# level is the ZSTD or DEFLATE level. With predictor, integer tiles are compressed with horizontal differencing and
+# floating point tiles with floating point prediction. Published outputs use DEFLATE because more software reads it.
+raster_profiles = {
+    'scratch': {'compress': 'ZSTD', 'level': 1, 'predictor': False},
+    'archive': {'compress': 'ZSTD', 'level': 9, 'predictor': True},
+    'published': {'compress': 'DEFLATE', 'level': 6, 'predictor': True}
+}
+# Published outputs are converted to Cloud-Optimized GeoTIFFs with cog_block_size blocks and overviews resampled
+# with cog_overview_resampling
+cog_block_size = 512
+cog_overview_resampling = 'average'
+
+# Gross emissions engine: 'numpy' (emissions/gross_emissions_engine.py) or 'cpp' (the compiled C++ scripts in c_emis_compile_dst).
+# The numpy engine calculates the windows of a tile (tile_layout.windows()) on gross_emissions_threads threads.
+gross_emissions_engine = 'numpy'
+gross_emissions_threads = 4
+
+# Carbon pools created by carbon_pools/carbon_pools_engine.py.
+# Pools that other pools need are calculated but only the pools listed here are written, e.g., gross emissions
+# runs don't use total carbon, so it can be removed from the list (or left out with --pools in mp_create_carbon_pools.py).
+carbon_pools = ['AGC', 'BGC', 'deadwood', 'litter', 'soil', 'total']
+
+# Per-tile pipelines (window_pipeline.py) read, calculate and write the windows of a tile at the same time.
+# Windows are calculated on window_pipeline_threads threads, and at most window_pipeline_windows windows are
+# being read, calculated or written at once (each holds one window of every input in memory).
+window_pipeline_threads = 2
+window_pipeline_windows = 4
+
 # Model log
 start = datetime.datetime.now()
 date = datetime.datetime.now()
@@ -93,6 +133,61 @@ date_formatted = date.strftime("%Y_%m_%d__%H_%M_%S")
 model_log_dir = os.path.join(s3_base_dir, 'model_logs/v{}/'.format(version))
 model_log = "flux_model_log_{}.txt".format(date_formatted)
 
+# The local log is copied to model_log_dir after this many seconds or this many new bytes, whichever comes first,
+# as well as at the end of each model stage
+log_upload_interval = 60
+log_upload_bytes = 256 * 1024
+
+# Alternative s3 endpoint (e.g., a local s3-compatible server for testing). None uses AWS s3.
+s3_endpoint_url = os.environ.get('AWS_ENDPOINT_URL')
+
+# In-process s3 transfers (s3_transfer.py): threads per process, size of each ranged GET/multipart PUT part
+# (8 MB matches aws-cli uploads, so their ETags can be verified), attempts per request,
+# whether downloads and uploads are checked against s3's MD5 ETags, and files downloaded at once
+s3_transfer_threads = 32
+s3_transfer_chunk_bytes = 8 * 1024 * 1024
+s3_transfer_retries = 5
+s3_transfer_verify = True
+s3_transfer_max_files = 64
+
+# Local index of the tiles in s3 folders (tile_manifest.py): SQLite file in docker_tmp,
+# seconds before a folder is listed again, and number of folders listed at once
+tile_manifest_db = 'tile_manifest.sqlite'
+tile_manifest_max_age = 12 * 60 * 60
+tile_manifest_threads = 16
+
+# Local cache of downloaded s3 objects (tile_cache.py). Should be on the same disk as docker_base_dir so cached tiles
+# can be cloned (reflinked) into it instead of copied. At most this many bytes, and never more than the free disk minus
+# tile_scheduler_disk_reserve_gb. 0 bytes turns the cache off.
+tile_cache_dir = '/usr/local/tile_cache'
+tile_cache_max_bytes = 600 * 1024 ** 3
+
+# Adaptive tile scheduler (tile_scheduler.py): SQLite file in docker_tmp with the recorded memory and disk use of each
+# tile in each stage, share of available memory that running tiles can use, margin added to recorded peaks,
+# disk space always left free, and disk space assumed for a tile's outputs if the stage driver doesn't say
+tile_scheduler_db = 'tile_scheduler.sqlite'
+tile_scheduler_memory_fraction = 0.9
+tile_scheduler_memory_margin = 1.1
+tile_scheduler_disk_reserve_gb = 20
+tile_scheduler_default_disk_gb = 2
+
+# Stage graph of run_full_model.py (stage_graph.py): SQLite file in docker_tmp with the tiles each stage has finished
+# and a fingerprint of their inputs, so that an interrupted model run resumes where it stopped
+stage_checkpoint_db = 'stage_checkpoints.sqlite'
+
+# Telemetry of model runs (telemetry.py): SQLite file in docker_tmp with the time, CPU, memory and disk I/O of every
+# tile, program and s3 transfer; quantile of a stage's recorded peak memory per tile that tile_scheduler assumes for
+# tiles that haven't run in the stage before, once the stage has at least telemetry_min_tiles recorded tiles;
+# number of slowest tiles listed in the report at the end of a run
+telemetry_db = 'telemetry.sqlite'
+telemetry_new_tile_quantile = 0.95
+telemetry_min_tiles = 20
+telemetry_slowest_tiles = 10
+
+# Incremental update of the model for a new year of loss (loss_year_update.py): SQLite file in docker_tmp with the
+# tiles and blocks where the loss tiles of the previous and current model versions differ
+loss_update_db = 'loss_year_update.sqlite'
+
 
 # Blank created tile list txt
 # Stores the tile names for blank tiles. These tiles will be deleted at the end of the script so that they
@@ -104,6 +199,11 @@ blank_tile_txt = "blank_tiles.txt"
 tile_stats_pattern = 'tile_stats_model'
 tile_stats_dir = os.path.join(s3_base_dir, 'tile_stats/')
 
+# Largest relative error of quantiles from the quantile sketch (for tiles that aren't 8 or 16 bit integers)
+tile_stats_relative_accuracy = 0.005
+# Values closer to 0 than this are counted as 0 in the quantile sketch
+tile_stats_smallest_value = 1e-9
+
 ######
 ### Model extent
 ######
@@ -141,6 +241,15 @@ mangrove_biomass_2000_dir = os.path.join(s3_base_dir, 'mangrove_biomass/processe
 pattern_pixel_area = 'hanson_2013_area'
 pixel_area_dir = 's3://gfw2-data/analyses/area_28m/'
 
+# Largest relative difference allowed between pixel areas calculated by pixel_area.py and the pixel area tiles.
+# float32 areas have a precision of about 6e-8, so this allows for small differences in the ellipsoid constants.
+pixel_area_tolerance = 1e-5
+
+# Whether supplementary outputs, 4 km aggregation and tile statistics calculate pixel areas from tile coordinates
+# (pixel_area.py) instead of reading the pixel area tiles. Off until the calculated areas have been compared with the
+# pixel area tiles (python pixel_area.py -l) and the largest difference has been recorded in pixel_area.py.
+pixel_area_calculated = False
+
 # Spreadsheet with annual gain rates
 gain_spreadsheet = 'gain_rate_continent_ecozone_age_20200820.xlsx'
 gain_spreadsheet_dir = os.path.join(s3_base_dir, 'removal_rate_tables/')
@@ -149,6 +258,11 @@ gain_spreadsheet_dir = os.path.join(s3_base_dir, 'removal_rate_tables/')
 pattern_loss = 'GFW2019'
 loss_dir = 's3://gfw2-data/forest_change/hansen_2019/'
 
+# Annual Hansen loss tiles of the previous model version, for incremental updates with a new year of loss
+# (run_full_model.py --loss-year-update). When the loss tiles above are changed, these should be the ones they replace.
+previous_pattern_loss = 'GFW2019'
+previous_loss_dir = 's3://gfw2-data/forest_change/hansen_2019/'
+
 # Hansen gain tiles (2001-2012)
 pattern_gain = 'Hansen_GFC2015_gain'
 gain_dir = 's3://gfw2-data/forest_change/tree_cover_gain/gaindata_2012/'
@@ -234,6 +348,17 @@ gadm_plant_1x1_index_dir = os.path.join(s3_base_dir, 'gadm_plantation_1x1_tile_i
 pattern_gadm_1x1_index = 'gadm_index_1x1'
 pattern_plant_1x1_index = 'plantation_index_1x1'
 
+# Plantation geodatabase: one feature class per country with plantations, each with growth, species_simp and SD_error
+# fields. Rasterized directly (without PostGIS) by mp_plantation_preparation.py --plantation-gdb.
+plantation_gdb_path = 's3://gfw-files/plantations/final/global/plantations_v3_1.gdb.zip'
+plantation_gdb = 'plantations_v3_1.gdb'
+
+# Plantation type of each species_simp value: 1 (oil palm), 2 (wood fiber/timber); any other value is 3 (other).
+# Same as the type_reclass column of the PostGIS plantation table, including the trailing spaces in the gdb values.
+plantation_type_reclass = {'Oil Palm ': 1, 'Oil Palm Mix ': 1, 'Oil Palm Mix': 1,
+                           'Wood fiber / timber': 2, 'Wood fiber / timber ': 2}
+plantation_type_other = 3
+
 # Countries with planted forests in them according to the planted forest geodatabase
 plantation_countries = [
                         'ARG', 'VNM', 'VEN', 'THA', 'RWA', 'PNG', 'PHL', 'PAN', 'NIC', 'IND', 'HND', 'CRI', 'COD', 'COL',
@@ -608,6 +733,29 @@ pattern_aggreg_sensit_sign_change = 'net_flux_0_4deg_modelv{}_sign_change_std'.f
 
 output_aggreg_dir = os.path.join(s3_base_dir, '0_4deg_output_aggregation/biomass_soil/standard/20200920/')
 
+# Outputs that are published, which uu.upload_final_set converts to Cloud-Optimized GeoTIFFs before uploading
+# (see raster_profile.py). Sensitivity analysis and aggregated outputs that contain these patterns are also published.
+published_patterns = [pattern_gross_emis_commod_biomass_soil, pattern_gross_emis_forestry_biomass_soil,
+                      pattern_gross_emis_shifting_ag_biomass_soil, pattern_gross_emis_urban_biomass_soil,
+                      pattern_gross_emis_wildfire_biomass_soil, pattern_gross_emis_no_driver_biomass_soil,
+                      pattern_gross_emis_co2_only_all_drivers_biomass_soil, pattern_gross_emis_non_co2_all_drivers_biomass_soil,
+                      pattern_gross_emis_all_gases_all_drivers_biomass_soil,
+                      pattern_gross_emis_commod_soil_only, pattern_gross_emis_forestry_soil_only,
+                      pattern_gross_emis_shifting_ag_soil_only, pattern_gross_emis_urban_soil_only,
+                      pattern_gross_emis_wildfire_soil_only, pattern_gross_emis_no_driver_soil_only,
+                      pattern_gross_emis_co2_only_all_drivers_soil_only, pattern_gross_emis_non_co2_all_drivers_soil_only,
+                      pattern_gross_emis_all_gases_all_drivers_soil_only,
+                      pattern_cumul_gain_AGCO2_BGCO2_all_types, pattern_net_flux,
+                      pattern_gross_emis_all_gases_all_drivers_biomass_soil_forest_extent,
+                      pattern_cumul_gain_AGCO2_BGCO2_all_types_forest_extent, pattern_net_flux_forest_extent,
+                      pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent,
+                      pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent,
+                      pattern_net_flux_per_pixel_full_extent,
+                      pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent,
+                      pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent,
+                      pattern_net_flux_per_pixel_forest_extent,
+                      pattern_aggreg]
+
 
 
 ### Standard deviation maps
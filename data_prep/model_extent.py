@@ -7,6 +7,9 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
 
 def model_extent(tile_id, pattern, sensit_type):
 
@@ -48,16 +51,16 @@ def model_extent(tile_id, pattern, sensit_type):
         # Grabs metadata about the tif, like its location/projection/cellsize
         kwargs = tcd_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = tcd_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(tcd_src)
 
         # Updates kwargs for the output dataset
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Checks whether each input tile exists
         try:
@@ -89,17 +92,7 @@ def model_extent(tile_id, pattern, sensit_type):
         dst = rasterio.open(out_tile, 'w', **kwargs)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst, sensit_type)
-        dst.update_tags(
-            units='unitless. 1 = in model extent. 0 = not in model extent')
-        if sensit_type == 'biomass_swap':
-            dst.update_tags(
-                source='Pixels with ((Hansen 2000 tree cover AND NASA JPL AGB2000) OR Hansen gain OR mangrove biomass 2000) NOT pre-2000 plantations')
-        else:
-            dst.update_tags(
-                source='Pixels with ((Hansen 2000 tree cover AND WHRC AGB2000) OR Hansen gain OR mangrove biomass 2000) NOT pre-2000 plantations')
-        dst.update_tags(
-            extent='Full model extent. This defines which pixels are included in the model.')
+        tile_metadata.update_tags(dst, pattern, sensit_type)
 
 
         uu.print_log("  Creating model extent for {}".format(tile_id))
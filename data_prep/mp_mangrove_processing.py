@@ -33,14 +33,11 @@ def mp_mangrove_processing(tile_id_list, run_date = None):
     # Unzips mangrove images into a flat structure (all tifs into main folder using -j argument)
     # NOTE: Unzipping some tifs (e.g., Australia, Indonesia) takes a very long time, so don't worry if the script appears to stop on that.
     cmd = ['unzip', '-o', '-j', cn.mangrove_biomass_raw_file]
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+    uu.log_subprocess_output_full(cmd)
 
     # Creates vrt for the Saatchi biomass rasters
     mangrove_vrt = 'mangrove_biomass.vrt'
-    os.system('gdalbuildvrt {} *.tif'.format(mangrove_vrt))
+    uu.log_subprocess_output_full('gdalbuildvrt {} *.tif'.format(mangrove_vrt), shell=True)
 
     # Converts the mangrove AGB vrt into Hansen tiles
     source_raster = mangrove_vrt
@@ -19,6 +19,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'data_prep'))
 import model_extent
 
@@ -88,19 +89,14 @@ def mp_model_extent(sensit_type, tile_id_list, run_date = None):
 
     # This configuration of the multiprocessing call is necessary for passing multiple arguments to the main function
     # It is based on the example here: http://spencerimp.blogspot.com/2015/12/python-multiprocess-with-multiple.html
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 38
-        else:
-            processes = 42 # 30 processors = 480 GB peak (sporadic decreases followed by sustained increases);
-            # 36 = 550 GB peak; 40 = 590 GB peak; 42 = XXX GB peak
+    # Per-tile memory for the first run of the stage on a machine: 30 processors = 480 GB peak
+    # (sporadic decreases followed by sustained increases); 36 = 550 GB peak; 40 = 590 GB peak (about 16 GB per tile)
+    if sensit_type == 'biomass_swap':
+        memory_gb = 18
     else:
-        processes = 3
-    uu.print_log('Removal model forest extent processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(model_extent.model_extent, pattern=pattern, sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 16
+    tile_scheduler.run(partial(model_extent.model_extent, pattern=pattern, sensit_type=sensit_type),
+                       tile_id_list, 'model_extent_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
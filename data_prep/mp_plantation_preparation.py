@@ -4,7 +4,7 @@ and plantation category out of the plantation geodatabase.
 Its outputs are two sets of tiles at the full extent of planted forest features (not masked by mangrove or
 non-mangrove natural forest): above+belowground carbon accumulation rate, and plantation type (1: oil palm, 2: wood fiber,
 3: other).
-Unlike other carbon model scripts, this one requires prep work done outside of the script (the large, commented chunk
+Unlike other carbon model scripts, the first three entry points require prep work done outside of the script (the large, commented chunk
 below this).
 Once that prep work of converting the gdb to a PostGIS table has been done, there are a few entry points to this script,
 unlike other carbon model scripts.
@@ -37,7 +37,16 @@ planted forest extent tiles,
 e.g., python mp_plantation_preparation.py -gi None -pi s3://gfw2-data/climate/carbon_model/gadm_plantation_1x1_tile_index/plantation_index_1x1_20190813.shp
 e.g., python mp_plantation_preparation.py -gi s3://gfw2-data/climate/carbon_model/gadm_plantation_1x1_tile_index/gadm_index_1x1_20190108.shp -pi s3://gfw2-data/climate/carbon_model/gadm_plantation_1x1_tile_index/plantation_index_1x1_20190813.shp
 
-All entry points conclude with creating 10x10 degree tiles of planted forest carbon accumulation rates and
+Fourth entry point: Script rasterizes the plantation gdb directly into 10x10 tiles of planted forest carbon
+accumulation rate, type and accumulation rate standard deviation, without PostGIS or 1x1 tiles. The polygons of all
+country feature classes are loaded once and indexed in an STRtree (in memory), then each 10x10 tile is rasterized
+window by window, looking up only the polygons in that window. Pixels are burned the same way gdal_rasterize burned
+them from PostGIS (pixel centers in polygons; overlapping polygons in table order). None of the prep work below is needed,
+and the other arguments are ignored.
+This entry point is accessed by providing the zipped gdb on s3 or a local gdb,
+e.g., python mp_plantation_preparation.py -pg s3://gfw-files/plantations/final/global/plantations_v3_1.gdb.zip
+
+The first three entry points conclude with creating 10x10 degree tiles of planted forest carbon accumulation rates and
 planted forest type from 1x1 tiles of planted forest extent.
 
 To run this for just a part of the world, create a new shapefile of 1x1 GADM or plantation tile boundaries (making sure that they
@@ -114,9 +123,10 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 
 
-def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
+def mp_plantation_preparation(gadm_index_shp, planted_index_shp, plantation_gdb='None'):
 
     os.chdir(cn.docker_base_dir)
 
@@ -153,6 +163,28 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
     uu.print_log("Number of 10x10 tiles to evaluate after extreme latitudes have been removed:", len(planted_lat_tile_list))
 
 
+    ### Entry point 4:
+    # If the plantation gdb is supplied, the 10x10 tiles are rasterized directly from it. No PostGIS or 1x1 tiles.
+    if plantation_gdb != 'None':
+
+        uu.print_log("Plantation gdb supplied. Rasterizing 10x10 planted forest tiles directly from it...")
+
+        # Downloads and unzips the gdb if it is on s3
+        if plantation_gdb.startswith('s3://'):
+            uu.s3_file_download(plantation_gdb, cn.docker_base_dir, 'std')
+            cmd = ['unzip', '-o', os.path.basename(plantation_gdb)]
+            uu.log_subprocess_output_full(cmd, check=True)
+            plantation_gdb = os.path.basename(plantation_gdb)[:-4]
+
+        # Loads and indexes the polygons once. The tile processes are forked from this process, so they share them.
+        plantation_preparation.load_plantations(plantation_gdb)
+
+        tile_scheduler.run(plantation_preparation.create_10x10_plantation_rasters, planted_lat_tile_list,
+                           'plantation_rasters', memory_gb=2)
+
+        return
+
+
     # If a planted forest extent 1x1 tile index shapefile isn't supplied
     if 'None' in args.planted_tile_index:
 
@@ -197,12 +229,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
 
             # Creates a shapefile of the boundaries of the 1x1 GADM tiles in countries with planted forests
             os.system('''gdaltindex {0}_{1}.shp GADM_*.tif'''.format(cn.pattern_gadm_1x1_index, uu.date_time_today))
-            cmd = ['aws', 's3', 'cp', cn.docker_base_dir, cn.gadm_plant_1x1_index_dir, '--exclude', '*', '--include', '{}*'.format(cn.pattern_gadm_1x1_index), '--recursive']
-
-            # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-            process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-            with process.stdout:
-                uu.log_subprocess_output(process.stdout)
+            uu.s3_copy(cn.docker_base_dir, cn.gadm_plant_1x1_index_dir, recursive=True, exclude=['*'], include=['{}*'.format(cn.pattern_gadm_1x1_index)])
 
 
             # # Saves the 1x1 country extent tiles to s3
@@ -235,12 +262,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
             uu.print_log('{}/'.format(gadm_index_path))
 
             # Copies the shapefile of 1x1 tiles of extent of countries with planted forests
-            cmd = ['aws', 's3', 'cp', '{}/'.format(gadm_index_path), cn.docker_base_dir, '--recursive', '--exclude', '*', '--include', '{}*'.format(gadm_index_shp)]
-
-            # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-            process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-            with process.stdout:
-                uu.log_subprocess_output(process.stdout)
+            uu.s3_copy('{}/'.format(gadm_index_path), cn.docker_base_dir, recursive=True, exclude=['*'], include=['{}*'.format(gadm_index_shp)])
 
             # Gets the attribute table of the country extent 1x1 tile shapefile
             gadm = glob.glob('{}*.dbf'.format(cn.pattern_gadm_1x1_index))[0]
@@ -282,12 +304,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
         # Creates a shapefile in which each feature is the extent of a plantation extent tile.
         # This index shapefile can be used the next time this process is run if starting with Entry Point 3.
         os.system('''gdaltindex {0}_{1}.shp plant_gain_*.tif'''.format(cn.pattern_plant_1x1_index, uu.date_time_today))
-        cmd = ['aws', 's3', 'cp', cn.docker_base_dir, cn.gadm_plant_1x1_index_dir, '--exclude', '*', '--include', '{}*'.format(cn.pattern_plant_1x1_index), '--recursive']
-
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.s3_copy(cn.docker_base_dir, cn.gadm_plant_1x1_index_dir, recursive=True, exclude=['*'], include=['{}*'.format(cn.pattern_plant_1x1_index)])
 
     ### Entry point 3
     # If a shapefile of the extents of 1x1 planted forest tiles is provided.
@@ -298,13 +315,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
         uu.print_log("Planted forest 1x1 tile index shapefile supplied. Using that to create 1x1 planted forest growth rate and forest type tiles...")
 
         # Copies the shapefile of 1x1 tiles of extent of planted forests
-        cmd = ['aws', 's3', 'cp', '{}/'.format(planted_index_path), cn.docker_base_dir, '--recursive', '--exclude', '*', '--include',
-               '{}*'.format(planted_index_shp), '--recursive']
-
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.s3_copy('{}/'.format(planted_index_path), cn.docker_base_dir, recursive=True, exclude=['*'], include=['{}*'.format(planted_index_shp)])
 
 
         # Gets the attribute table of the planted forest extent 1x1 tile shapefile
@@ -331,7 +342,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
 
         # For multiprocessor use
         # processes=40 uses about 360 GB of memory. Works on r4.16xlarge with space to spare
-      	# processes=52 uses about 465 GB of memory (quite stably), so this is basically the max.
+        # processes=52 uses about 465 GB of memory (quite stably), so this is basically the max.
         num_of_processes = 52
         pool = Pool(num_of_processes)
         pool.map(plantation_preparation.create_1x1_plantation_growth_from_1x1_planted, planted_list_1x1)
@@ -349,12 +360,12 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
         pool.join()
 
         # This rasterizes the plantation removal factor standard deviations 
-	      # processes=50 peaks at about 450 GB
+        # processes=50 peaks at about 450 GB
         num_of_processes = 50
-    	  pool = Pool(num_of_processes)
-	      pool.map(plantation_preparation.create_1x1_plantation_stdev_from_1x1_planted, planted_list_1x1)
-	      pool.close()
-	      pool.join()
+        pool = Pool(num_of_processes)
+        pool.map(plantation_preparation.create_1x1_plantation_stdev_from_1x1_planted, planted_list_1x1)
+        pool.close()
+        pool.join()
 
 
     ### All script entry points meet here: creation of 10x10 degree planted forest gain rate and rtpe tiles
@@ -414,7 +425,7 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
     plant_stdev_1x1_vrt = 'plant_stdev_1x1.vrt'
 
     # Creates a mosaic of all the 1x1 plantation gain rate standard deviation tiles
-    print "Creating vrt of 1x1 plantation gain rate standard deviation tiles"
+    uu.print_log("Creating vrt of 1x1 plantation gain rate standard deviation tiles")
     os.system('gdalbuildvrt {} plant_stdev_*.tif'.format(plant_stdev_1x1_vrt))
 
     # Creates 10x10 degree tiles of plantation gain rate standard deviation by iterating over the set of pixel area tiles supplied
@@ -430,10 +441,12 @@ def mp_plantation_preparation(gadm_index_shp, planted_index_shp):
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Create planted forest carbon gain rate tiles')
-    parser.add_argument('--gadm-tile-index', '-gi', required=True,
+    parser.add_argument('--gadm-tile-index', '-gi', required=False, default='None',
                         help='Shapefile of 1x1 degree tiles of countries that contain planted forests (i.e. countries with planted forests rasterized to 1x1 deg). If no shapefile, write None.')
-    parser.add_argument('--planted-tile-index', '-pi', required=True,
+    parser.add_argument('--planted-tile-index', '-pi', required=False, default='None',
                         help='Shapefile of 1x1 degree tiles of that contain planted forests (i.e. planted forest extent rasterized to 1x1 deg). If no shapefile, write None.')
+    parser.add_argument('--plantation-gdb', '-pg', required=False, default='None',
+                        help='Plantation gdb (zipped on s3, or local) to rasterize directly into 10x10 tiles, without PostGIS. If supplied, the tile index arguments are ignored.')
     # # This is the beginning of adding a way to have the model run on a selected area, rather than globally. I didn't finish implementing it, though.
     # parser.add_argument('--bounding-box', '-bb', required=False, type=int, nargs='+',
     #                     help='The bounding box of the tiles to be update, supplied in the order min-x, max-x, min-y, max-y. They must be at 10 degree increments.')
@@ -453,4 +466,4 @@ if __name__ == '__main__':
     # Create the output log
     uu.initiate_log()
 
-    mp_plantation_preparation(gadm_index_shp=gadm_index_shp, planted_index_shp=planted_index_shp)
+    mp_plantation_preparation(gadm_index_shp=gadm_index_shp, planted_index_shp=planted_index_shp, plantation_gdb=args.plantation_gdb)
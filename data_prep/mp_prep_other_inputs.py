@@ -81,12 +81,9 @@ def mp_prep_other_inputs(tile_id_list, run_date):
     # For some reason, using uu.s3_file_download or otherwise using AWSCLI as a subprocess doesn't work for this raster.
     # Thus, using wget instead.
     cmd = ['wget', '{}'.format(cn.annual_gain_AGC_natrl_forest_young_raw_URL), '-P', '{}'.format(cn.docker_base_dir)]
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
-    uu.s3_file_download(cn.stdev_annual_gain_AGC_natrl_forest_young_raw_URL, cn.docker_base_dir, sensit_type)
-    cmd = ['aws', 's3', 'cp', cn.primary_raw_dir, cn.docker_base_dir, '--recursive']
     uu.log_subprocess_output_full(cmd)
+    uu.s3_file_download(cn.stdev_annual_gain_AGC_natrl_forest_young_raw_URL, cn.docker_base_dir, sensit_type)
+    uu.s3_copy(cn.primary_raw_dir, cn.docker_base_dir, recursive=True)
 
     uu.s3_flexible_download(cn.ifl_dir, cn.pattern_ifl, cn.docker_base_dir, sensit_type, tile_id_list)
 
@@ -198,7 +195,7 @@ def mp_prep_other_inputs(tile_id_list, run_date):
     # Creates a vrt of the primary forests with nodata=0 from the continental primary forest rasters
     uu.print_log("Creating vrt of humid tropial primary forest...")
     primary_vrt = 'primary_2001.vrt'
-    os.system('gdalbuildvrt -srcnodata 0 {} *2001_primary.tif'.format(primary_vrt))
+    uu.log_subprocess_output_full('gdalbuildvrt -srcnodata 0 {} *2001_primary.tif'.format(primary_vrt), shell=True)
     uu.print_log("  Humid tropical primary forest vrt created")
 
     # Creates primary forest tiles
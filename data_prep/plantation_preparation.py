@@ -1,11 +1,23 @@
 
 from subprocess import Popen, PIPE, STDOUT, check_call
+import datetime
 import os
 import psycopg2
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.transform import from_origin
+from osgeo import ogr
+from shapely import wkb
+from shapely.geometry import box
+from shapely.strtree import STRtree
 import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_layout
+import tile_metadata
 
 # Creates 1x1 tiles of the extent of select countries are in select latitude bands, with the defining coordinates of each tile
 # in the northwest corner
@@ -35,7 +47,7 @@ def rasterize_gadm_1x1(tile_id):
             tile_1x1 = 'GADM_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1)
             uu.print_log("Rasterizing", tile_1x1)
             cmd = ['gdal_rasterize', '-tr', '{}'.format(str(cn.Hansen_res)), '{}'.format(str(cn.Hansen_res)),
-                   '-co', 'COMPRESS=LZW', '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1),
+                   *raster_profile.gdal_options(), '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1),
                    '-burn', '1', '-a_nodata', '0', cn.gadm_iso, tile_1x1]
             # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
             process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
@@ -45,9 +57,9 @@ def rasterize_gadm_1x1(tile_id):
             # Only keeps 1x1 GADM tiles if they actually include a country; many 1x1 tiles created out of 10x10 tiles
             # don't actually include a country.
             uu.print_log("Checking if {} contains any data...".format(tile_1x1))
-            stats = uu.check_for_data(tile_1x1)
+            no_data = uu.check_for_data(tile_1x1)
 
-            if stats[1] > 0:
+            if not no_data:
                 uu.print_log("  Data found in {}. Keeping tile".format(tile_1x1))
 
             else:
@@ -101,7 +113,7 @@ def create_1x1_plantation_from_1x1_gadm(tile_1x1):
 
         # https://gis.stackexchange.com/questions/187224/how-to-use-gdal-rasterize-with-postgis-vector
         # For plantation gain rate
-        cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), '-co', 'COMPRESS=LZW', 'PG:dbname=ubuntu', '-l', 'all_plant', 'plant_gain_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1), '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1), '-a', 'growth', '-a_nodata', '0']
+        cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), *raster_profile.gdal_options(), 'PG:dbname=ubuntu', '-l', 'all_plant', 'plant_gain_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1), '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1), '-a', 'growth', '-a_nodata', '0']
         # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
         process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
         with process.stdout:
@@ -109,7 +121,7 @@ def create_1x1_plantation_from_1x1_gadm(tile_1x1):
 
         # https://gis.stackexchange.com/questions/187224/how-to-use-gdal-rasterize-with-postgis-vector
         # For plantation type
-        cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), '-co', 'COMPRESS=LZW', 'PG:dbname=ubuntu', '-l', 'all_plant', 'plant_type_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1), '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1), '-a', 'type_reclass', '-a_nodata', '0']
+        cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), *raster_profile.gdal_options(), 'PG:dbname=ubuntu', '-l', 'all_plant', 'plant_type_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1), '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1), '-a', 'type_reclass', '-a_nodata', '0']
         # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
         process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
         with process.stdout:
@@ -139,7 +151,7 @@ def create_1x1_plantation_growth_from_1x1_planted(tile_1x1):
     uu.print_log("There are plantations in {}. Converting to raster...".format(tile_1x1))
 
     # https://gis.stackexchange.com/questions/187224/how-to-use-gdal-rasterize-with-postgis-vector
-    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), '-co', 'COMPRESS=LZW',
+    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), *raster_profile.gdal_options(),
            'PG:dbname=ubuntu', '-l', 'all_plant', 'plant_gain_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1), '-te',
            str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1), '-a', 'growth', '-a_nodata', '0']
     # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
@@ -167,7 +179,7 @@ def create_1x1_plantation_type_from_1x1_planted(tile_1x1):
     uu.print_log("There are plantations in {}. Converting to raster...".format(tile_1x1))
 
     # https://gis.stackexchange.com/questions/187224/how-to-use-gdal-rasterize-with-postgis-vector
-    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), '-co', 'COMPRESS=LZW', 'PG:dbname=ubuntu',
+    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), *raster_profile.gdal_options(), 'PG:dbname=ubuntu',
            '-l', 'all_plant', 'plant_type_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1),
            '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1),
            '-a', 'type_reclass', '-a_nodata', '0', '-ot', 'Byte']
@@ -188,16 +200,16 @@ def create_1x1_plantation_stdev_from_1x1_planted(tile_1x1):
     ymax_1x1 = int(coords[2])
     ymin_1x1 = ymax_1x1 - 1
 
-    print "For", tile_1x1, "-- xmin_1x1:", xmin_1x1, "; xmax_1x1:", xmax_1x1, "; ymin_1x1", ymin_1x1, "; ymax_1x1:", ymax_1x1
+    uu.print_log("For", tile_1x1, "-- xmin_1x1:", xmin_1x1, "; xmax_1x1:", xmax_1x1, "; ymin_1x1", ymin_1x1, "; ymax_1x1:", ymax_1x1)
 
-    print "There are plantations in {}. Converting to stdev raster...".format(tile_1x1)
+    uu.print_log("There are plantations in {}. Converting to stdev raster...".format(tile_1x1))
 
     # https://gis.stackexchange.com/questions/187224/how-to-use-gdal-rasterize-with-postgis-vector
-    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), '-co', 'COMPRESS=LZW', 'PG:dbname=ubuntu',
+    cmd = ['gdal_rasterize', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res), *raster_profile.gdal_options(), 'PG:dbname=ubuntu',
            '-l', 'all_plant', 'plant_stdev_{0}_{1}.tif'.format(ymax_1x1, xmin_1x1),
            '-te', str(xmin_1x1), str(ymin_1x1), str(xmax_1x1), str(ymax_1x1),
            '-a', 'SD_error', '-a_nodata', '0']
-    subprocess.check_call(cmd)
+    uu.log_subprocess_output_full(cmd, check=True)
 
 
 
@@ -211,7 +223,7 @@ def create_10x10_plantation_gain(tile_id, plant_gain_1x1_vrt):
     tile_10x10 = '{0}_{1}.tif'.format(tile_id, cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked)
     uu.print_log("Rasterizing", tile_10x10)
     cmd = ['gdalwarp', '-tr', '{}'.format(str(cn.Hansen_res)), '{}'.format(str(cn.Hansen_res)),
-           '-co', 'COMPRESS=LZW', '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
+           *raster_profile.gdal_options(), '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
            '-dstnodata', '0', '-t_srs', 'EPSG:4326', '-overwrite', '-ot', 'Float32', plant_gain_1x1_vrt, tile_10x10]
     # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
     process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
@@ -219,9 +231,9 @@ def create_10x10_plantation_gain(tile_id, plant_gain_1x1_vrt):
         uu.log_subprocess_output(process.stdout)
 
     uu.print_log("Checking if {} contains any data...".format(tile_id))
-    stats = uu.check_for_data(tile_10x10)
+    no_data = uu.check_for_data(tile_10x10)
 
-    if stats[0] > 0:
+    if not no_data:
 
         uu.print_log("  Data found in {}. Copying tile to s3...".format(tile_id))
         uu.upload_final(cn.annual_gain_AGC_BGC_planted_forest_unmasked_dir, tile_id, cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked)
@@ -242,7 +254,7 @@ def create_10x10_plantation_type(tile_id, plant_type_1x1_vrt):
     tile_10x10 = '{0}_{1}.tif'.format(tile_id, cn.pattern_planted_forest_type_unmasked)
     uu.print_log("Rasterizing", tile_10x10)
     cmd = ['gdalwarp', '-tr', '{}'.format(str(cn.Hansen_res)), '{}'.format(str(cn.Hansen_res)),
-           '-co', 'COMPRESS=LZW', '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
+           *raster_profile.gdal_options(), '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
            '-dstnodata', '0', '-t_srs', 'EPSG:4326', '-overwrite', '-ot', 'Byte', plant_type_1x1_vrt, tile_10x10]
     # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
     process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
@@ -250,9 +262,9 @@ def create_10x10_plantation_type(tile_id, plant_type_1x1_vrt):
         uu.log_subprocess_output(process.stdout)
 
     uu.print_log("Checking if {} contains any data...".format(tile_id))
-    stats = uu.check_for_data(tile_10x10)
+    no_data = uu.check_for_data(tile_10x10)
     
-    if stats[0] > 0:
+    if not no_data:
 
         uu.print_log("  Data found in {}. Copying tile to s3...".format(tile_id))
         uu.upload_final(cn.planted_forest_type_unmasked_dir, tile_id, cn.pattern_planted_forest_type_unmasked)
@@ -260,33 +272,185 @@ def create_10x10_plantation_type(tile_id, plant_type_1x1_vrt):
 
     else:
 
-        print "  No data found. Not copying {}.".format(tile_id)
+        uu.print_log("  No data found. Not copying {}.".format(tile_id))
 
 
 # Combines the 1x1 plantation tiles into 10x10 plantation carbon gain rate tiles, the final output of this process
 def create_10x10_plantation_gain_stdev(tile_id, plant_stdev_1x1_vrt):
 
-    print "Getting bounding coordinates for tile", tile_id
+    uu.print_log("Getting bounding coordinates for tile", tile_id)
     xmin, ymin, xmax, ymax = uu.coords(tile_id)
-    print "  xmin:", xmin, "; xmax:", xmax, "; ymin", ymin, "; ymax:", ymax
+    uu.print_log("  xmin:", xmin, "; xmax:", xmax, "; ymin", ymin, "; ymax:", ymax)
 
-    tile_10x10 = '{0}_{1}.tif'.format(tile_id, cn.pattern_planted_forest_stdev_unmasked)
-    print "Rasterizing", tile_10x10
+    tile_10x10 = '{0}_{1}.tif'.format(tile_id, cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked)
+    uu.print_log("Rasterizing", tile_10x10)
     cmd = ['gdalwarp', '-tr', '{}'.format(str(cn.Hansen_res)), '{}'.format(str(cn.Hansen_res)),
-           '-co', 'COMPRESS=LZW', '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
+           *raster_profile.gdal_options(), '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
            '-dstnodata', '0', '-t_srs', 'EPSG:4326', '-overwrite', '-ot', 'Float32', plant_stdev_1x1_vrt, tile_10x10]
-    subprocess.check_call(cmd)
+    uu.log_subprocess_output_full(cmd, check=True)
 
-    print "Checking if {} contains any data...".format(tile_id)
-    stats = uu.check_for_data_old(tile_10x10)
+    uu.print_log("Checking if {} contains any data...".format(tile_id))
+    no_data = uu.check_for_data(tile_10x10)
 
-    if stats[0] > 0:
+    if not no_data:
 
-        print "  Data found in {}. Copying tile to s3...".format(tile_id)
-        uu.upload_final(cn.planted_forest_stdev_unmasked_dir, tile_id, cn.pattern_planted_forest_stdev_unmasked)
-        print "    Tile converted and copied to s3"
+        uu.print_log("  Data found in {}. Copying tile to s3...".format(tile_id))
+        uu.upload_final(cn.stdev_annual_gain_AGC_BGC_planted_forest_unmasked_dir, tile_id, cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked)
+        uu.print_log("    Tile converted and copied to s3")
 
     else:
 
-        print "  No data found. Not copying {}.".format(tile_id)
+        uu.print_log("  No data found. Not copying {}.".format(tile_id))
+
+
+# Plantation polygons and their attributes, loaded once by load_plantations() before the tile processes are forked,
+# so all tile processes share them. Index 0 of the attribute arrays is for pixels without plantations;
+# the attributes of polygon i are at index i + 1.
+plantation_geoms = []
+plantation_growth = None
+plantation_type = None
+plantation_stdev = None
+plantation_tree = None
+
+
+# Plantation type of a species_simp value, the same as the type_reclass column of the PostGIS table
+def plantation_type_code(species_simp):
+
+    return cn.plantation_type_reclass.get(species_simp, cn.plantation_type_other)
+
+
+# Indexes plantation polygons and their growth, type and stdev in an STRtree.
+# Polygons must be in the order of the PostGIS table, because where polygons overlap, the last one is burned.
+def index_plantations(geoms, growth, types, stdev):
+
+    global plantation_geoms, plantation_growth, plantation_type, plantation_stdev, plantation_tree
+
+    if len(geoms) == 0:
+        uu.exception_log("No plantation polygons to index")
+
+    plantation_geoms = geoms
+    plantation_growth = np.array([0] + growth, dtype='float32')
+    plantation_type = np.array([0] + types, dtype='uint8')
+    plantation_stdev = np.array([0] + stdev, dtype='float32')
+    plantation_tree = STRtree(geoms)
+
+    uu.print_log("Indexed", len(geoms), "plantation polygons")
+
+
+# Loads the polygons of all country feature classes (the ones with "plant" in their names) of the plantation gdb
+# and indexes them. The feature classes and features are read in the same order they were appended to
+# the PostGIS table, so overlapping polygons are burned the same way.
+def load_plantations(plantation_gdb):
+
+    source = ogr.Open(plantation_gdb)
+    if source is None:
+        uu.exception_log("Could not open plantation geodatabase", plantation_gdb)
+
+    geoms = []
+    growth = []
+    types = []
+    stdev = []
+
+    for layer_index in range(source.GetLayerCount()):
+
+        layer = source.GetLayerByIndex(layer_index)
+        if 'plant' not in layer.GetName():
+            continue
+
+        uu.print_log("Loading plantations from", layer.GetName())
+
+        for feature in layer:
+
+            geometry = feature.GetGeometryRef()
+            if geometry is None:
+                continue
+
+            # Curved geometries are approximated, as they are when copied to PostGIS
+            geoms.append(wkb.loads(bytes(geometry.GetLinearGeometry().ExportToWkb())))
+            growth.append(feature.GetField('growth') or 0)
+            types.append(plantation_type_code(feature.GetField('species_simp')))
+            stdev.append(feature.GetField('SD_error') or 0)
+
+    index_plantations(geoms, growth, types, stdev)
+
+
+# Rasterizes the indexed plantations into 10x10 tiles of planted forest gain rate, type and gain rate stdev,
+# without PostGIS or 1x1 tiles. Replaces the 1x1 tiles from PostGIS and the 10x10 tiles warped from their vrts:
+# pixels are burned where their centers are in a polygon and overlapping polygons are burned in table order,
+# like gdal_rasterize did for the 1x1 tiles.
+# Each window of the tile is rasterized once, with the position of the plantation polygon burned into each pixel,
+# and all three outputs are looked up from that.
+def create_10x10_plantation_rasters(tile_id):
+
+    # Start time
+    start = datetime.datetime.now()
+
+    xmin, ymin, xmax, ymax = [float(coord) for coord in uu.coords(tile_id)]
+
+    if len(plantation_tree.query_items(box(xmin, ymin, xmax, ymax))) == 0:
+        uu.print_log("No plantations in", tile_id)
+        return
+
+    outputs = [
+        (cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked, cn.annual_gain_AGC_BGC_planted_forest_unmasked_dir, plantation_growth),
+        (cn.pattern_planted_forest_type_unmasked, cn.planted_forest_type_unmasked_dir, plantation_type),
+        (cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked, cn.stdev_annual_gain_AGC_BGC_planted_forest_unmasked_dir, plantation_stdev)
+    ]
+
+    size = int(round((xmax - xmin) / cn.Hansen_res))
+
+    dsts = []
+    for pattern, upload_dir, values in outputs:
+
+        kwargs = {
+            'driver': 'GTiff',
+            'count': 1,
+            'dtype': values.dtype.name,
+            'nodata': 0,
+            'width': size,
+            'height': size,
+            'crs': 'EPSG:4326',
+            'transform': from_origin(xmin, ymax, cn.Hansen_res, cn.Hansen_res)
+        }
+        raster_profile.update(kwargs)
+
+        dst = rasterio.open('{0}_{1}.tif'.format(tile_id, pattern), 'w', **kwargs)
+        tile_metadata.update_tags(dst, pattern, 'std')
+        dsts.append(dst)
+
+    uu.print_log("Rasterizing plantations in", tile_id)
+
+    has_data = [False] * len(outputs)
+
+    for idx, window in tile_layout.windows(dsts[0]):
+
+        left, bottom, right, top = dsts[0].window_bounds(window)
+        window_polygons = sorted(plantation_tree.query_items(box(left, bottom, right, top)))
+
+        # Windows without plantations are left unwritten, so they are nodata
+        if not window_polygons:
+            continue
+
+        burned = features.rasterize(((plantation_geoms[i], i + 1) for i in window_polygons),
+                                    out_shape=(window.height, window.width), transform=dsts[0].window_transform(window),
+                                    fill=0, dtype='int32')
+
+        for output_index, (dst, output) in enumerate(zip(dsts, outputs)):
+
+            out_window = output[2][burned]
+            has_data[output_index] = has_data[output_index] or bool(out_window.any())
+            dst.write_band(1, out_window, window=window)
+
+    for dst in dsts:
+        dst.close()
+
+    for has_output_data, (pattern, upload_dir, values) in zip(has_data, outputs):
+
+        if has_output_data:
+            uu.upload_final(upload_dir, tile_id, pattern)
+        else:
+            uu.print_log("  No data found. Not copying {0}_{1}.tif".format(tile_id, pattern))
+            os.remove('{0}_{1}.tif'.format(tile_id, pattern))
 
+    # Prints information about the tile that was just processed
+    uu.end_of_fx_summary(start, tile_id, cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked)
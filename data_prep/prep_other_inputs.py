@@ -14,6 +14,8 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
 
 # Prepares the non ifl/primary forest tiles
 def rasterize_pre_2000_plantations(tile_id):
@@ -26,13 +28,10 @@ def rasterize_pre_2000_plantations(tile_id):
 
     out_tile = '{0}_{1}.tif'.format(tile_id, cn.pattern_plant_pre_2000)
 
-    cmd= ['gdal_rasterize', '-burn', '1', '-co', 'COMPRESS=LZW', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
+    cmd= ['gdal_rasterize', '-burn', '1', *raster_profile.gdal_options('archive', 'Byte'), '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
           '-tap', '-ot', 'Byte', '-a_nodata', '0', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
           '{}.shp'.format(cn.pattern_plant_pre_2000_raw), out_tile]
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+    uu.log_subprocess_output_full(cmd)
 
 
     # Prints information about the tile that was just processed
@@ -48,25 +47,22 @@ def create_climate_zone_tiles(tile_id):
     xmin, ymin, xmax, ymax = uu.coords(tile_id)
 
     # Makes a 10x10 degree chunk of the global climate zone raster conform to Hansen tile properties.
-    # Rather than the usual 40000x1 windows, this creates 1024x1024 windows for filling in missing values (see below).
+    # This tiles the raster in blocks the size of the windows for filling in missing values (see below).
     # The output of gdalwarp ("climate_zone_intermediate") is not used anywhere else.
     uu.print_log("Warping climate zone tile", tile_id)
-    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', '-co', 'COMPRESS=LZW', '-tr', str(cn.Hansen_res), str(cn.Hansen_res),
+    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', '-tr', str(cn.Hansen_res), str(cn.Hansen_res),
            '-tap', '-te',
            str(xmin), str(ymin), str(xmax), str(ymax), '-dstnodata', '0', '-ot', 'Byte', '-overwrite',
-           '-co', 'TILED=YES', '-co', 'BLOCKXSIZE=1024', '-co', 'BLOCKYSIZE=1024',
+           *raster_profile.gdal_options('scratch', 'Byte', block_size=cn.mode_fill_window_size),
            cn.climate_zone_raw, '{0}_{1}.tif'.format(tile_id, "climate_zone_intermediate")]
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+    uu.log_subprocess_output_full(cmd)
 
-    # Fills in empty pixels in the climate zone raster with whatever value is most common (mode) in its 1024x1024 pixel window.
-    # That is, any 1024x1024 processing window that has >=1 climate zone pixel in it will have its empty pixels filled in
+    # Fills in empty pixels in the climate zone raster with whatever value is most common (mode) in its cn.mode_fill_window_size x cn.mode_fill_window_size pixel window.
+    # That is, any mode fill window that has >=1 climate zone pixel in it will have its empty pixels filled in
     # with whatever value is most common in that window.
     # This extends the climate zone raster out into coastal areas and better covers coasts/islands, meaning that more
     # loss pixels will have climate zone pixels available to them during emissions processing.
-    # Everything from here down is used to assign pixels without climate zone to a climate zone in the 1024x1024 windows.
+    # Everything from here down is used to assign pixels without climate zone to a climate zone in the mode fill windows.
     uu.print_log("Re-tiling climate zone for tile", tile_id)
 
     # Opens climate zone tile
@@ -75,16 +71,16 @@ def create_climate_zone_tiles(tile_id):
     # Grabs metadata about the tif, like its location/projection/cellsize
     kwargs = climate_zone_src.meta
 
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = climate_zone_src.block_windows(1)
+    # Grabs the mode fill windows of the tile, whatever the blocks of the tile are
+    windows = tile_layout.windows(climate_zone_src, cn.mode_fill_window_size, cn.mode_fill_window_size)
 
     # Updates kwargs for the output dataset.
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0
     )
+    raster_profile.update(kwargs)
 
     # Output file name
     climate_zone_processed = '{0}_{1}.tif'.format(tile_id, cn.pattern_climate_zone)
@@ -92,7 +88,7 @@ def create_climate_zone_tiles(tile_id):
     # The output file: climate zone with empty pixels filled in
     dst_climate_zone = rasterio.open(climate_zone_processed, 'w', **kwargs)
 
-    # Iterates across the windows (1024 x 1024 pixel boxes) of the input tile.
+    # Iterates across the mode fill windows of the input tile.
     for idx, window in windows:
 
         # Creates window for input raster
@@ -118,10 +114,7 @@ def create_climate_zone_tiles(tile_id):
         # Assigns all pixels without a climate zone code in that window to that most common code
         climate_zone_window[climate_zone_window == 0] = mode
 
-        # Writes the output window to the output.
-        # Although the windows for the input tiles are 1024 x 1024 pixels,
-        # the windows for these output files are 40000 x 1 pixels, like all the other tiles in this model,
-        # so they should work fine with all the other tiles.
+        # Writes the output window to the output
         dst_climate_zone.write_band(1, climate_zone_window, window=window)
 
     # Prints information about the tile that was just processed
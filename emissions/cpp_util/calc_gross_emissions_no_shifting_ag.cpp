@@ -35,6 +35,12 @@
 
 // These provide constants for the emissions equations
 #include "flu_val.cpp"
+
+// How many loss years are in the model. Compile with -DMODEL_YEARS=<cn.loss_years> when the number of loss years changes.
+#ifndef MODEL_YEARS
+#define MODEL_YEARS 19
+#endif
+
 #include "equations.cpp"
 
 using namespace std;
@@ -43,13 +49,14 @@ using namespace std;
 int main(int argc, char* argv[])
 {
 // If code is run other than <program name> <tile id> , it will raise this error.
-if (argc != 4){cout << "Use <program name> <tile id><sensit_type><folder>" << endl; return 1;}
+if (argc < 4){cout << "Use <program name> <tile id><sensit_type><folder>[<metadata tag KEY=VALUE>...]" << endl; return 1;}
 
 // Input arguments
 string tile_id = argv[1];    // The tile id comes from the second argument. The first argument is the name of this code.
 string sensit_type = argv[2];   // For standard model or sensitivity analyses that use the standard emissions model.
                              // Used to name the input carbon pool tiles and output gross emissions tiles.
 string infolder = argv[3];     // The folder which has all the input files
+// Any further arguments are the metadata tags of the outputs as KEY=VALUE (tile_metadata.py), added when they are created
 
 cout << "Gross emissions C++ infolder:" <<  infolder << endl;
 
@@ -64,7 +71,7 @@ float C_to_CO2;       // The conversion of carbon to CO2
 C_to_CO2 = 44.0/12.0;
 
 int model_years;    // How many loss years are in the model
-model_years = 19;
+model_years = MODEL_YEARS;
 string model_years_str;
 model_years_str = to_string(model_years);
 
@@ -214,7 +221,16 @@ GDALRasterBand *OUTBAND20;
 OGRSpatialReference oSRS;
 char *OUTPRJ = NULL;
 char **papszOptions = NULL;
-papszOptions = CSLSetNameValue( papszOptions, "COMPRESS", "LZW" );
+// Same compression as the Python writers ("archive" in cn.raster_profiles in raster_profile.py). All outputs are floats.
+papszOptions = CSLSetNameValue( papszOptions, "COMPRESS", "ZSTD" );
+papszOptions = CSLSetNameValue( papszOptions, "ZSTD_LEVEL", "9" );
+papszOptions = CSLSetNameValue( papszOptions, "PREDICTOR", "3" );
+// Same internal tiling as the Python writers (cn.tile_block_size in tile_layout.py)
+papszOptions = CSLSetNameValue( papszOptions, "TILED", "YES" );
+papszOptions = CSLSetNameValue( papszOptions, "BLOCKXSIZE", "1024" );
+papszOptions = CSLSetNameValue( papszOptions, "BLOCKYSIZE", "1024" );
+char **papszMetadata = NULL;
+for (int i = 4; i < argc; i++) { papszMetadata = CSLAddString( papszMetadata, argv[i] ); }
 OUTDRIVER = GetGDALDriverManager()->GetDriverByName("GTIFF");
 if( OUTDRIVER == NULL ) {cout << "no driver" << endl; exit( 1 );};
 oSRS.SetWellKnownGeogCS( "WGS84" );
@@ -223,61 +239,61 @@ double adfGeoTransform[6] = { ulx, pixelsize, 0, uly, 0, -1*pixelsize };
 
 // Commoditiy gross emissions
 OUTGDAL1 = OUTDRIVER->Create( out_name1.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL1->SetGeoTransform(adfGeoTransform); OUTGDAL1->SetProjection(OUTPRJ);
+OUTGDAL1->SetGeoTransform(adfGeoTransform); OUTGDAL1->SetProjection(OUTPRJ); OUTGDAL1->SetMetadata(papszMetadata);
 OUTBAND1 = OUTGDAL1->GetRasterBand(1);
 OUTBAND1->SetNoDataValue(0);
 
 // Shifting ag gross emissions
 OUTGDAL2 = OUTDRIVER->Create( out_name2.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL2->SetGeoTransform(adfGeoTransform); OUTGDAL2->SetProjection(OUTPRJ);
+OUTGDAL2->SetGeoTransform(adfGeoTransform); OUTGDAL2->SetProjection(OUTPRJ); OUTGDAL2->SetMetadata(papszMetadata);
 OUTBAND2 = OUTGDAL2->GetRasterBand(1);
 OUTBAND2->SetNoDataValue(0);
 
 // Forestry gross emissions
 OUTGDAL3 = OUTDRIVER->Create( out_name3.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL3->SetGeoTransform(adfGeoTransform); OUTGDAL3->SetProjection(OUTPRJ);
+OUTGDAL3->SetGeoTransform(adfGeoTransform); OUTGDAL3->SetProjection(OUTPRJ); OUTGDAL3->SetMetadata(papszMetadata);
 OUTBAND3 = OUTGDAL3->GetRasterBand(1);
 OUTBAND3->SetNoDataValue(0);
 
 // Wildfire gross emissions
 OUTGDAL4 = OUTDRIVER->Create( out_name4.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL4->SetGeoTransform(adfGeoTransform); OUTGDAL4->SetProjection(OUTPRJ);
+OUTGDAL4->SetGeoTransform(adfGeoTransform); OUTGDAL4->SetProjection(OUTPRJ); OUTGDAL4->SetMetadata(papszMetadata);
 OUTBAND4 = OUTGDAL4->GetRasterBand(1);
 OUTBAND4->SetNoDataValue(0);
 
 // Urbanization gross emissions
 OUTGDAL5 = OUTDRIVER->Create( out_name5.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL5->SetGeoTransform(adfGeoTransform); OUTGDAL5->SetProjection(OUTPRJ);
+OUTGDAL5->SetGeoTransform(adfGeoTransform); OUTGDAL5->SetProjection(OUTPRJ); OUTGDAL5->SetMetadata(papszMetadata);
 OUTBAND5 = OUTGDAL5->GetRasterBand(1);
 OUTBAND5->SetNoDataValue(0);
 
 // No driver gross emissions
 OUTGDAL6 = OUTDRIVER->Create( out_name6.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL6->SetGeoTransform(adfGeoTransform); OUTGDAL6->SetProjection(OUTPRJ);
+OUTGDAL6->SetGeoTransform(adfGeoTransform); OUTGDAL6->SetProjection(OUTPRJ); OUTGDAL6->SetMetadata(papszMetadata);
 OUTBAND6 = OUTGDAL6->GetRasterBand(1);
 OUTBAND6->SetNoDataValue(0);
 
 // All gases, all drivers combined
 OUTGDAL10 = OUTDRIVER->Create( out_name10.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL10->SetGeoTransform(adfGeoTransform); OUTGDAL10->SetProjection(OUTPRJ);
+OUTGDAL10->SetGeoTransform(adfGeoTransform); OUTGDAL10->SetProjection(OUTPRJ); OUTGDAL10->SetMetadata(papszMetadata);
 OUTBAND10 = OUTGDAL10->GetRasterBand(1);
 OUTBAND10->SetNoDataValue(0);
 
 // CO2 only, all drivers combined
 OUTGDAL11 = OUTDRIVER->Create( out_name11.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL11->SetGeoTransform(adfGeoTransform); OUTGDAL11->SetProjection(OUTPRJ);
+OUTGDAL11->SetGeoTransform(adfGeoTransform); OUTGDAL11->SetProjection(OUTPRJ); OUTGDAL11->SetMetadata(papszMetadata);
 OUTBAND11 = OUTGDAL11->GetRasterBand(1);
 OUTBAND11->SetNoDataValue(0);
 
 // Non-CO2, all drivers combined
 OUTGDAL12 = OUTDRIVER->Create( out_name12.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL12->SetGeoTransform(adfGeoTransform); OUTGDAL12->SetProjection(OUTPRJ);
+OUTGDAL12->SetGeoTransform(adfGeoTransform); OUTGDAL12->SetProjection(OUTPRJ); OUTGDAL12->SetMetadata(papszMetadata);
 OUTBAND12 = OUTGDAL12->GetRasterBand(1);
 OUTBAND12->SetNoDataValue(0);
 
 // Decision tree node
 OUTGDAL20 = OUTDRIVER->Create( out_name20.c_str(), xsize, ysize, 1, GDT_Float32, papszOptions );
-OUTGDAL20->SetGeoTransform(adfGeoTransform); OUTGDAL20->SetProjection(OUTPRJ);
+OUTGDAL20->SetGeoTransform(adfGeoTransform); OUTGDAL20->SetProjection(OUTPRJ); OUTGDAL20->SetMetadata(papszMetadata);
 OUTBAND20 = OUTGDAL20->GetRasterBand(1);
 OUTBAND20->SetNoDataValue(0);
 
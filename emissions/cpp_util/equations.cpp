@@ -6,11 +6,16 @@
 #include <stdlib.h>
 using namespace std;
 
+// How many loss years are in the model. Compile with -DMODEL_YEARS=<cn.loss_years> when the number of loss years changes.
+#ifndef MODEL_YEARS
+#define MODEL_YEARS 19
+#endif
+
 void def_variables(float *q, int ecozone, int forestmodel_data, int ifl, int climate, int plant_data, int lossyr)
 {
 
 	int model_years;    // How many loss years are in the model
-    model_years = 19;
+    model_years = MODEL_YEARS;
 
 	int tropical;       // The ecozone code for the tropics
     tropical = 1;
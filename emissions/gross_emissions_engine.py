@@ -0,0 +1,490 @@
+'''
+Calculates gross emissions with numpy instead of the compiled C++ scripts in cpp_util.
+It is the same per-pixel decision tree (same equations, constants and node codes as calc_gross_emissions_generic.cpp,
+equations.cpp and flu_val.cpp), but evaluated on all pixels of a window at once with masks.
+The C++ versions for soil_only, no_shifting_ag and convert_to_grassland are options of the same tree:
+soil_only has no biomass emissions, no_shifting_ag treats shifting agriculture as commodity-driven deforestation,
+and convert_to_grassland has no mineral soil emissions for commodities and shifting agriculture.
+Arithmetic is done in float32 (and float64 where the C++ multiplies by pow(10,-3)) in the same order as the C++,
+so outputs are the same as the C++ outputs pixel for pixel.
+The windows of a tile (tile_layout.windows()) are calculated on cn.gross_emissions_threads threads.
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+import rasterio
+import sys
+sys.path.append('../')
+import constants_and_names as cn
+import missing_tile
+import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+
+# Same constants as the C++
+CH4_equiv = 28
+N2O_equiv = 265
+C_to_CO2 = np.float32(44.0 / 12.0)
+model_years = cn.loss_years
+tropical = 1
+boreal = 2
+temperate = 3
+
+# Inputs in the order the C++ opens them
+input_names = ['agc', 'bgc', 'driver', 'loss', 'peat', 'burn', 'ifl_primary', 'ecozone', 'climate',
+               'deadwood', 'litter', 'soil', 'plantation']
+
+# Decision tree for each driver: (node, conditions that must all be true, CO2 terms, non-CO2 terms).
+# Terms are added in the listed order. Nodes are described in node_codes.txt.
+# Conditions match the C++ comparisons exactly (e.g., some branches test plantation >= 1, others plantation > 0).
+commodity_tree = [
+    (10,  ['peat', 'burned'], ['yesfire_CO2', 'drain_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (11,  ['peat', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (111, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (12,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (13,  ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (131, ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (14,  ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (141, ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (15,  ['peat_zero', 'burned', 'boreal'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (16,  ['peat_zero', 'burned', 'temperate', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (161, ['peat_zero', 'burned', 'temperate', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (17,  ['peat_zero', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2'], []),
+    (171, ['peat_zero', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2', 'minsoil'], []),
+    (18,  ['peat_zero', 'burn_zero', 'boreal'], ['nofire_CO2', 'minsoil'], []),
+    (19,  ['peat_zero', 'burn_zero', 'temperate', 'plant_ge_1'], ['nofire_CO2'], []),
+    (191, ['peat_zero', 'burn_zero', 'temperate', 'plant_zero'], ['nofire_CO2', 'minsoil'], [])
+]
+
+# Node 21 adds the non-CO2 peat burning emissions to the CO2 emissions, like the C++ does
+shifting_ag_tree = [
+    (20,  ['peat', 'burned', 'boreal_temperate'], ['yesfire_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'peatburn_non_CO2']),
+    (21,  ['peat', 'burned', 'tropical'], ['yesfire_CO2', 'drain_CO2', 'peatburn_non_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (22,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2'], []),
+    (23,  ['peat', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (231, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (24,  ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (241, ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (25,  ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (251, ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (26,  ['peat_zero', 'burned', 'boreal'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (27,  ['peat_zero', 'burned', 'temperate', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (271, ['peat_zero', 'burned', 'temperate', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (28,  ['peat_zero', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2'], []),
+    (281, ['peat_zero', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2', 'minsoil'], []),
+    (29,  ['peat_zero', 'burn_zero', 'boreal'], ['nofire_CO2', 'minsoil'], []),
+    (291, ['peat_zero', 'burn_zero', 'temperate', 'plant_ge_1'], ['nofire_CO2'], []),
+    (292, ['peat_zero', 'burn_zero', 'temperate', 'plant_zero'], ['nofire_CO2', 'minsoil'], [])
+]
+
+forestry_tree = [
+    (30,  ['peat', 'burned'], ['yesfire_CO2', 'drain_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (31,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2'], []),
+    (32,  ['peat', 'burn_zero', 'tropical', 'plant_gt_0'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (321, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (33,  ['not_peat', 'burned'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (34,  ['not_peat', 'burn_zero'], ['nofire_CO2'], [])
+]
+
+wildfire_tree = [
+    (40,  ['peat', 'burned'], ['yesfire_CO2', 'drain_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (41,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2'], []),
+    (42,  ['peat', 'burn_zero', 'tropical', 'plant_gt_0'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (421, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (43,  ['not_peat', 'burned'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (44,  ['not_peat', 'not_burned'], ['nofire_CO2'], [])
+]
+
+urbanization_tree = [
+    (50,  ['peat', 'burned'], ['yesfire_CO2', 'drain_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (51,  ['peat', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (511, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (52,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (53,  ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (531, ['peat_zero', 'burned', 'tropical', 'ifl_one', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (54,  ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (541, ['peat_zero', 'burned', 'tropical', 'ifl_zero', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (55,  ['peat_zero', 'burned', 'boreal'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (56,  ['peat_zero', 'burned', 'temperate', 'plant_ge_1'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (561, ['peat_zero', 'burned', 'temperate', 'plant_zero'], ['yesfire_CO2', 'minsoil'], ['yesfire_non_CO2']),
+    (57,  ['peat_zero', 'burn_zero', 'tropical', 'plant_ge_1'], ['nofire_CO2'], []),
+    (571, ['peat_zero', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2', 'minsoil'], []),
+    (58,  ['peat_zero', 'burn_zero', 'boreal'], ['nofire_CO2', 'minsoil'], []),
+    (59,  ['peat_zero', 'burn_zero', 'temperate', 'plant_ge_1'], ['nofire_CO2'], []),
+    (591, ['peat_zero', 'burn_zero', 'temperate', 'plant_zero'], ['nofire_CO2', 'minsoil'], [])
+]
+
+no_driver_tree = [
+    (60,  ['peat', 'burned'], ['yesfire_CO2', 'drain_CO2', 'peatburn_CO2'], ['yesfire_non_CO2', 'drain_non_CO2', 'peatburn_non_CO2']),
+    (61,  ['peat', 'burn_zero', 'boreal_temperate'], ['nofire_CO2'], []),
+    (62,  ['peat', 'burn_zero', 'tropical', 'plant_gt_0'], ['nofire_CO2', 'drain_CO2'], ['drain_non_CO2']),
+    (621, ['peat', 'burn_zero', 'tropical', 'plant_zero'], ['nofire_CO2'], []),
+    (63,  ['not_peat', 'burned'], ['yesfire_CO2'], ['yesfire_non_CO2']),
+    (64,  ['not_peat', 'burn_zero'], ['nofire_CO2'], [])
+]
+
+
+# Vectorized def_variables() from equations.cpp: combustion factor, emissions factors, and peat burning and drainage
+# emissions for each pixel. Like the C++, the inputs are truncated to integers first.
+def def_variables(ecozone, driver, ifl, plantation, loss):
+
+    ecozone = ecozone.astype('int32')
+    driver = driver.astype('int32')
+    ifl = ifl.astype('int32')
+    plantation = plantation.astype('int32')
+    loss = loss.astype('int32')
+
+    is_boreal = ecozone == boreal
+    is_temperate = ecozone == temperate
+    is_tropical = ~is_boreal & ~is_temperate    # Includes pixels without a boreal/temperate/tropical assignment
+    commodity_shifting_ag_urban_wildfire = np.isin(driver, [1, 2, 4, 5])
+
+    Cf = np.where(is_boreal, np.where(commodity_shifting_ag_urban_wildfire, np.float32(0.59), np.float32(0.33)),
+         np.where(is_temperate, np.where(commodity_shifting_ag_urban_wildfire, np.float32(0.51), np.float32(0.62)),
+         np.where(ifl > 0, np.float32(0.36), np.float32(0.55))))
+
+    Gef_CO2 = np.where(is_tropical, np.float32(1580), np.float32(1569))
+    Gef_CH4 = np.where(is_tropical, np.float32(6.8), np.float32(4.7))
+    Gef_N2O = np.where(is_tropical, np.float32(0.2), np.float32(0.26))
+
+    peatburn_CO2 = np.where(is_tropical, np.where(driver == 4, np.float32(601), np.float32(264)), np.float32(446))
+    peatburn_non_CO2 = np.where(is_tropical, np.where(driver == 4, np.float32(208), np.float32(91)), np.float32(85))
+
+    drain_annual_CO2 = np.where(is_boreal, np.float32(2), np.where(is_temperate, np.float32(11),
+                       np.where(plantation == 1, np.float32(43), np.where(plantation == 2, np.float32(76), np.float32(58)))))
+    drain_annual_non_CO2 = np.where(is_boreal, np.float32(1), np.where(is_temperate, np.float32(3),
+                           np.where(plantation == 1, np.float32(2), np.float32(3))))
+
+    years_after_loss = (model_years - loss).astype('float32')
+
+    return Cf, Gef_CO2, Gef_CH4, Gef_N2O, peatburn_CO2, peatburn_non_CO2, \
+           years_after_loss * drain_annual_CO2, years_after_loss * drain_annual_non_CO2
+
+
+# Vectorized flu_val() from flu_val.cpp: fraction of mineral soil carbon emitted by land use change.
+# Like the C++, the inputs are truncated to integers first.
+def flu_val(climate, ecozone):
+
+    climate = climate.astype('int32')
+    ecozone = ecozone.astype('int32')
+
+    dry = np.isin(climate, [2, 4, 6, 8, 12])
+    wet = np.isin(climate, [1, 3, 5, 7, 10, 11])
+    montane = climate == 9
+    is_tropical = ecozone == tropical
+    boreal_temperate = (ecozone == boreal) | (ecozone == temperate)
+
+    flu = np.zeros(climate.shape, dtype='float32')
+    flu[dry & is_tropical] = np.float32(0.58)
+    flu[dry & boreal_temperate] = np.float32(0.8)
+    flu[wet & is_tropical] = np.float32(0.48)
+    flu[wet & boreal_temperate] = np.float32(0.69)
+    flu[montane & is_tropical] = np.float32(0.64)
+    flu[montane & boreal_temperate] = np.float32(0.75)
+
+    return flu
+
+
+# Non-CO2 emissions from burning biomass: (2 * carbon) * Cf * Gef * pow(10,-3) * CO2 equivalency for CH4 and N2O.
+# The C++ does the last two multiplications and the sum in double precision, so this does too.
+def biomass_fire_non_CO2(carbon, Cf, Gef_CH4, Gef_N2O):
+
+    CH4 = ((2 * carbon) * Cf * Gef_CH4).astype('float64') * 1e-3 * CH4_equiv
+    N2O = ((2 * carbon) * Cf * Gef_N2O).astype('float64') * 1e-3 * N2O_equiv
+
+    return (CH4 + N2O).astype('float32')
+
+
+# Calculates the CO2 and non-CO2 emissions and the decision tree node for the pixels of one driver.
+# pixels has the input values of just those pixels. biomass_carbon is 'all' for drivers that emit all non-soil carbon
+# (commodities, shifting agriculture, urbanization) and 'AGC' for drivers that burn only aboveground carbon.
+# flu is the mineral soil emissions fraction, or None if the driver has no mineral soil emissions.
+def driver_emissions(pixels, tree, biomass_carbon, flu, emitted_pools):
+
+    Cf, Gef_CO2, Gef_CH4, Gef_N2O, peatburn_CO2, peatburn_non_CO2, drain_CO2, drain_non_CO2 = \
+        def_variables(pixels['ecozone'], pixels['driver'], pixels['ifl_primary'], pixels['plantation'], pixels['loss'])
+
+    size = pixels['agc'].shape
+    zero = np.zeros(size, dtype='float32')
+
+    terms = {'drain_CO2': drain_CO2, 'drain_non_CO2': drain_non_CO2,
+             'peatburn_CO2': peatburn_CO2, 'peatburn_non_CO2': peatburn_non_CO2}
+
+    # soil_only doesn't have biomass emissions
+    if emitted_pools == 'soil_only':
+        terms['nofire_CO2'] = zero
+        terms['yesfire_CO2'] = zero
+        terms['yesfire_non_CO2'] = zero
+    elif biomass_carbon == 'all':
+        non_soil_c = pixels['agc'] + pixels['bgc'] + pixels['deadwood'] + pixels['litter']
+        terms['nofire_CO2'] = non_soil_c * C_to_CO2
+        terms['yesfire_CO2'] = terms['nofire_CO2']
+        terms['yesfire_non_CO2'] = biomass_fire_non_CO2(non_soil_c, Cf, Gef_CH4, Gef_N2O)
+    else:
+        above_below_c = pixels['agc'] + pixels['bgc']
+        terms['nofire_CO2'] = above_below_c * C_to_CO2
+        terms['yesfire_CO2'] = (((2 * pixels['agc']) * Cf * Gef_CO2).astype('float64') * 1e-3).astype('float32')
+        terms['yesfire_non_CO2'] = biomass_fire_non_CO2(pixels['agc'], Cf, Gef_CH4, Gef_N2O)
+
+    if flu is None:
+        terms['minsoil'] = zero
+    else:
+        soil = pixels['soil']
+        terms['minsoil'] = ((soil - (soil * flu)) / np.float32(20)) * (np.float32(model_years) - pixels['loss'])
+
+    # Conditions of the decision tree branches, matching the C++ comparisons
+    peat = pixels['peat']
+    burn = pixels['burn']
+    ecozone = pixels['ecozone']
+    plantation = pixels['plantation']
+    conditions = {
+        'peat': peat > 0, 'peat_zero': peat == 0, 'not_peat': ~(peat > 0),
+        'burned': burn > 0, 'burn_zero': burn == 0, 'not_burned': ~(burn > 0),
+        'tropical': ecozone == tropical, 'boreal': ecozone == boreal, 'temperate': ecozone == temperate,
+        'boreal_temperate': (ecozone == boreal) | (ecozone == temperate),
+        'ifl_one': pixels['ifl_primary'] == 1, 'ifl_zero': pixels['ifl_primary'] == 0,
+        'plant_ge_1': plantation >= 1, 'plant_gt_0': plantation > 0, 'plant_zero': plantation == 0
+    }
+
+    CO2_only = np.zeros(size, dtype='float32')
+    non_CO2 = np.zeros(size, dtype='float32')
+    node = np.zeros(size, dtype='float32')
+
+    # Branches are applied in the C++ order, so a later branch replaces an earlier one, as in the C++
+    for node_code, branch_conditions, CO2_terms, non_CO2_terms in tree:
+
+        mask = conditions[branch_conditions[0]]
+        for condition in branch_conditions[1:]:
+            mask = mask & conditions[condition]
+
+        if not mask.any():
+            continue
+
+        CO2_only[mask] = sum_terms(terms, CO2_terms, mask)
+        non_CO2[mask] = sum_terms(terms, non_CO2_terms, mask)
+        node[mask] = node_code
+
+    return CO2_only, non_CO2, node
+
+
+# Adds the emissions terms for the masked pixels, in order
+def sum_terms(terms, names, mask):
+
+    if not names:
+        return np.float32(0)
+
+    total = terms[names[0]][mask]
+    for name in names[1:]:
+        total = total + terms[name][mask]
+
+    return total
+
+
+# Calculates the gross emissions outputs for one window.
+# windows is a dictionary of the input arrays (float32), keyed by the names in input_names.
+# Returns the outputs in the order of the output patterns: emissions from each of the six drivers, all gases from
+# all drivers, CO2 from all drivers, non-CO2 from all drivers, and the decision tree node.
+def gross_emissions_window(windows, emitted_pools, sensit_type):
+
+    shape = windows['agc'].shape
+    outputs = [np.zeros(shape, dtype='float32') for i in range(0, 10)]
+
+    # Only pixels with loss and aboveground carbon have emissions
+    emitting = np.flatnonzero((windows['loss'] > 0) & (windows['agc'] > 0))
+    if emitting.size == 0:
+        return outputs
+
+    # Position of each emitting pixel's driver in drivers (below).
+    # Driver codes other than 1-5 are no driver. no_shifting_ag treats shifting agriculture as commodities.
+    driver = windows['driver'].ravel()[emitting]
+    driver_index = np.full(emitting.shape, 5, dtype='int8')
+    for code in [1, 2, 3, 4, 5]:
+        driver_index[driver == code] = code - 1
+    if sensit_type == 'no_shifting_ag':
+        driver_index[driver_index == 1] = 0
+
+    # Emitting pixels are gathered once, sorted by driver, so each driver's pixels are a contiguous slice
+    order = np.argsort(driver_index, kind='stable')
+    emitting = emitting[order]
+    ends = np.cumsum(np.bincount(driver_index, minlength=6))
+    gathered = dict((name, window.ravel()[emitting]) for name, window in windows.items())
+
+    # Decision tree, carbon emitted by biomass burning and mineral soil emissions fraction for each driver, in output order.
+    # The fraction is calculated per pixel for commodities only; shifting ag and urbanization use fixed fractions.
+    drivers = [(commodity_tree, 'all', 'flu_val'),
+               (shifting_ag_tree, 'all', np.float32(0.72)),
+               (forestry_tree, 'AGC', None),
+               (wildfire_tree, 'AGC', None),
+               (urbanization_tree, 'all', np.float32(0.8)),
+               (no_driver_tree, 'AGC', None)]
+
+    CO2_only = np.zeros(emitting.shape, dtype='float32')
+    non_CO2 = np.zeros(emitting.shape, dtype='float32')
+    node = np.zeros(emitting.shape, dtype='float32')
+    total = np.zeros(emitting.shape, dtype='float32')
+
+    for output_index, (tree, biomass_carbon, flu) in enumerate(drivers):
+
+        start = ends[output_index - 1] if output_index > 0 else 0
+        end = ends[output_index]
+        if start == end:
+            continue
+
+        pixels = dict((name, values[start:end]) for name, values in gathered.items())
+
+        # convert_to_grassland doesn't have mineral soil emissions for commodities and shifting agriculture
+        if sensit_type == 'convert_to_grassland' and output_index in [0, 1]:
+            flu = None
+        elif isinstance(flu, str):
+            flu = flu_val(pixels['climate'], pixels['ecozone'])
+
+        CO2_only[start:end], non_CO2[start:end], node[start:end] = \
+            driver_emissions(pixels, tree, biomass_carbon, flu, emitted_pools)
+        total[start:end] = CO2_only[start:end] + non_CO2[start:end]
+
+        outputs[output_index].ravel()[emitting[start:end]] = total[start:end]
+
+    # Pixels whose total emissions are 0 are 0 in all three all-driver outputs.
+    # Adding 0 makes -0 into 0, like adding the other drivers' (0) emissions does in the C++.
+    has_emissions = total != 0
+    outputs[6].ravel()[emitting] = np.where(has_emissions, total + np.float32(0), np.float32(0))
+    outputs[7].ravel()[emitting] = np.where(has_emissions, CO2_only + np.float32(0), np.float32(0))
+    outputs[8].ravel()[emitting] = np.where(has_emissions, non_CO2 + np.float32(0), np.float32(0))
+    outputs[9].ravel()[emitting] = node
+
+    return outputs
+
+
+# Names of the input tiles for the C++ inputs, in the order of input_names
+def tile_names(tile_id, sensit_type, folder):
+
+    if sensit_type == 'legal_Amazon_loss':
+        loss = '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_Brazil_annual_loss_processed)
+    elif sensit_type == 'Mekong_loss':
+        loss = '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_Mekong_loss_processed)
+    else:
+        loss = '{0}{1}_{2}.tif'.format(folder, cn.pattern_loss, tile_id)
+
+    # Carbon pools get the sensitivity analysis name if that version of the tile exists
+    def pool(pattern):
+        return '{0}{1}'.format(folder, uu.sensit_tile_rename(sensit_type, tile_id, pattern))
+
+    names = {
+        'agc': pool(cn.pattern_AGC_emis_year),
+        'bgc': pool(cn.pattern_BGC_emis_year),
+        'driver': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_drivers),
+        'loss': loss,
+        'peat': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_peat_mask),
+        'burn': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_burn_year),
+        'ifl_primary': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_ifl_primary),
+        'ecozone': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_bor_tem_trop_processed),
+        'climate': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_climate_zone),
+        'deadwood': pool(cn.pattern_deadwood_emis_year_2000),
+        'litter': pool(cn.pattern_litter_emis_year_2000),
+        'soil': pool(cn.pattern_soil_C_emis_year_2000),
+        'plantation': '{0}{1}_{2}.tif'.format(folder, tile_id, cn.pattern_planted_forest_type_unmasked)
+    }
+
+    return [names[name] for name in input_names]
+
+
+# Patterns of the output tiles, in the order gross_emissions_window returns them
+def output_patterns(emitted_pools, sensit_type):
+
+    patterns = [cn.pattern_gross_emis_commod_biomass_soil,
+                cn.pattern_gross_emis_shifting_ag_biomass_soil,
+                cn.pattern_gross_emis_forestry_biomass_soil,
+                cn.pattern_gross_emis_wildfire_biomass_soil,
+                cn.pattern_gross_emis_urban_biomass_soil,
+                cn.pattern_gross_emis_no_driver_biomass_soil,
+                cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_co2_only_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_non_co2_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_nodes_biomass_soil]
+
+    if emitted_pools == 'soil_only':
+        patterns = [pattern.replace('biomass_soil', 'soil_only') for pattern in patterns]
+    elif sensit_type != 'std':
+        patterns = ['{0}_{1}'.format(pattern, sensit_type) for pattern in patterns]
+
+    return patterns
+
+
+# Names of the output tiles, in the order gross_emissions_window returns them
+def output_names(tile_id, emitted_pools, sensit_type):
+
+    return ['{0}_{1}.tif'.format(tile_id, pattern) for pattern in output_patterns(emitted_pools, sensit_type)]
+
+
+# Calculates gross emissions for a tile and writes the ten output tiles to the working folder
+def create_gross_emissions(tile_id, emitted_pools, sensit_type, folder):
+
+    input_paths = tile_names(tile_id, sensit_type, folder)
+
+    # Each thread reads with its own open datasets because a rasterio dataset can't be read by two threads at once.
+    # Inputs that don't exist for the tile (e.g., no peat) are read as 0s without a blank tile on disk.
+    thread_data = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def read_window(window):
+        if not hasattr(thread_data, 'sources'):
+            thread_data.sources = [missing_tile.open_tile(path, tile_id) for path in input_paths]
+            with opened_lock:
+                opened.extend(thread_data.sources)
+        windows = dict((name, src.read(1, window=window).astype('float32'))
+                       for name, src in zip(input_names, thread_data.sources))
+        return gross_emissions_window(windows, emitted_pools, sensit_type)
+
+    with rasterio.open(input_paths[0]) as agc_src:
+
+        # Grabs metadata about the tif, like its location/projection/cellsize
+        kwargs = agc_src.meta
+
+        # Updates kwargs for the output datasets
+        kwargs.update(
+            driver='GTiff',
+            count=1,
+            nodata=0,
+            dtype='float32'
+        )
+        raster_profile.update(kwargs)
+
+        windows = [window for idx, window in tile_layout.windows(agc_src)]
+
+    # Opens the output tiles and adds their metadata tags
+    dst_list = [tile_metadata.update_tags(rasterio.open('{0}_{1}.tif'.format(tile_id, pattern), 'w', **kwargs),
+                                          pattern, sensit_type)
+                for pattern in output_patterns(emitted_pools, sensit_type)]
+
+    # Windows are calculated in parallel and written in order.
+    # At most two windows per thread are held in memory at once.
+    # Each output tile is written (and compressed) on its own thread, so the ten outputs of a window are written at once.
+    with ThreadPoolExecutor(max_workers=cn.gross_emissions_threads) as executor, \
+            ThreadPoolExecutor(max_workers=len(dst_list)) as writer:
+
+        in_progress = deque()
+        for window in windows:
+            in_progress.append((window, executor.submit(read_window, window)))
+
+            if len(in_progress) >= 2 * cn.gross_emissions_threads:
+                write_window(writer, dst_list, *in_progress.popleft())
+
+        while in_progress:
+            write_window(writer, dst_list, *in_progress.popleft())
+
+    for dst in dst_list:
+        dst.close()
+    for src in opened:
+        src.close()
+
+
+# Writes the outputs of a finished window, one output tile per writer thread
+def write_window(writer, dst_list, window, future):
+
+    writes = [writer.submit(dst.write_band, 1, output, window=window) for dst, output in zip(dst_list, future.result())]
+    for write in writes:
+        write.result()
@@ -2,8 +2,9 @@
 This script calculates the gross emissions in tonnes CO2e/ha for every loss pixel.
 The properties of each pixel determine the appropriate emissions equation, the constants for the equation, and the
 carbon pool values that go into the equation.
-Unlike all other flux model components, this one uses C++ to quickly iterate through every pixel in each tile.
-Before running the model, the C++ script must be compiled.
+By default, the decision tree is evaluated with numpy (gross_emissions_engine.py), many pixels at once, which gives
+the same outputs as the C++ scripts in cpp_util. The C++ scripts can be used instead by setting
+cn.gross_emissions_engine to 'cpp'. Then the C++ script must be compiled before running the model.
 From carbon-budget/emissions/, do:
 c++ /usr/local/app/emissions/cpp_util/calc_gross_emissions_generic.cpp -o /usr/local/app/emissions/cpp_util/calc_gross_emissions_generic.exe -lgdal
 (for the standard model and some sensitivity analysis versions).
@@ -31,6 +32,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'emissions'))
 import calculate_gross_emissions
 
@@ -108,7 +110,10 @@ def mp_calculate_gross_emissions(sensit_type, tile_id_list, emitted_pools, run_d
 
         # Some sensitivity analyses have specific gross emissions scripts.
         # The rest of the sensitivity analyses and the standard model can all use the same, generic gross emissions script.
-        if sensit_type in ['no_shifting_ag', 'convert_to_grassland']:
+        # The numpy engine doesn't need compiling.
+        if cn.gross_emissions_engine == 'numpy':
+            uu.print_log("Gross emissions calculated with numpy")
+        elif sensit_type in ['no_shifting_ag', 'convert_to_grassland']:
             # if os.path.exists('../carbon-budget/emissions/cpp_util/calc_gross_emissions_{}.exe'.format(sensit_type)):
             if os.path.exists('{0}/calc_gross_emissions_{1}.exe'.format(cn.c_emis_compile_dst, sensit_type)):
                 uu.print_log("C++ for {} already compiled.".format(sensit_type))
@@ -121,8 +126,8 @@ def mp_calculate_gross_emissions(sensit_type, tile_id_list, emitted_pools, run_d
                 uu.exception_log('Must compile generic emissions C++...')
 
     elif (emitted_pools == 'soil_only') & (sensit_type == 'std'):
-        if os.path.exists('{0}/calc_gross_emissions_soil_only.exe'.format(cn.c_emis_compile_dst)):
-            uu.print_log("C++ for soil_only already compiled.")
+        if cn.gross_emissions_engine == 'numpy' or os.path.exists('{0}/calc_gross_emissions_soil_only.exe'.format(cn.c_emis_compile_dst)):
+            uu.print_log("Gross emissions for soil_only calculated with {}".format(cn.gross_emissions_engine))
 
             # Output file directories for soil_only. Must be in same order as output pattern directories.
             output_dir_list = [cn.gross_emis_commod_soil_only_dir,
@@ -180,45 +185,38 @@ def mp_calculate_gross_emissions(sensit_type, tile_id_list, emitted_pools, run_d
     # This function creates "dummy" tiles for all Hansen tiles that currently have non-existent tiles.
     # That way, the C++ script gets all the necessary input files.
     # If it doesn't get the necessary inputs, it skips that tile.
-    uu.print_log("Making blank tiles for inputs that don't currently exist")
-    # All of the inputs that need to have dummy tiles made in order to match the tile list of the carbon emitted_pools
-    pattern_list = [cn.pattern_planted_forest_type_unmasked, cn.pattern_peat_mask, cn.pattern_ifl_primary,
-                    cn.pattern_drivers, cn.pattern_bor_tem_trop_processed, cn.pattern_burn_year, cn.pattern_climate_zone,
-                    cn.pattern_soil_C_emis_year_2000]
-
-
-    # textfile that stores the names of the blank tiles that are created for processing.
-    # This will be iterated through to delete the tiles at the end of the script.
-    uu.create_blank_tile_txt()
-
-    for pattern in pattern_list:
-        pool = multiprocessing.Pool(processes=60)  # 60 = 100 GB peak
-        pool.map(partial(uu.make_blank_tile, pattern=pattern, folder=folder,
-                                             sensit_type=sensit_type), tile_id_list)
-        pool.close()
-        pool.join()
-
-    # # For single processor use
-    # for pattern in pattern_list:
-    #     for tile in tile_id_list:
-    #         uu.make_blank_tile(tile, pattern, folder, sensit_type)
-
-
-    # Calculates gross emissions for each tile
-    # count/4 uses about 390 GB on a r4.16xlarge spot machine.
-    # processes=18 uses about 440 GB on an r4.16xlarge spot machine.
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 15 # 15 processors = XXX GB peak
-        else:
-            processes = 19   # 17 = 650 GB peak; 18 = 677 GB peak; 19 = 714 GB peak
+    # The dummy tiles are sparse GeoTIFFs of a few kB each, so they are quick to make.
+    # The numpy engine reads inputs that don't exist as 0s, so it doesn't need dummy tiles.
+    if cn.gross_emissions_engine != 'numpy':
+
+        uu.print_log("Making blank tiles for inputs that don't currently exist")
+        # All of the inputs that need to have dummy tiles made in order to match the tile list of the carbon emitted_pools
+        pattern_list = [cn.pattern_planted_forest_type_unmasked, cn.pattern_peat_mask, cn.pattern_ifl_primary,
+                        cn.pattern_drivers, cn.pattern_bor_tem_trop_processed, cn.pattern_burn_year, cn.pattern_climate_zone,
+                        cn.pattern_soil_C_emis_year_2000]
+
+        # textfile that stores the names of the blank tiles that are created for processing.
+        # This will be iterated through to delete the tiles at the end of the script.
+        uu.create_blank_tile_txt()
+
+        for pattern in pattern_list:
+            for tile in tile_id_list:
+                uu.make_blank_tile(tile, pattern, folder, sensit_type)
+
+
+    # Calculates gross emissions for each tile.
+    # Per-tile memory for the first run of the stage on a machine: with C++, 17 processors = 650 GB peak; 18 = 677 GB peak;
+    # 19 = 714 GB peak (about 38 GB per tile). biomass_swap used 15 processors.
+    # The numpy engine holds up to two windows per thread, about 1 GB each.
+    if cn.gross_emissions_engine == 'numpy':
+        memory_gb = 2 * cn.gross_emissions_threads
+    elif sensit_type == 'biomass_swap':
+        memory_gb = 48
     else:
-        processes = 9
-    uu.print_log('Gross emissions max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(calculate_gross_emissions.calc_emissions, emitted_pools=emitted_pools, sensit_type=sensit_type, folder=folder), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 38
+    tile_scheduler.run(partial(calculate_gross_emissions.calc_emissions, emitted_pools=emitted_pools,
+                               sensit_type=sensit_type, folder=folder),
+                       tile_id_list, 'gross_emissions_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile in tile_id_list:
@@ -226,27 +224,8 @@ def mp_calculate_gross_emissions(sensit_type, tile_id_list, emitted_pools, run_d
 
 
     # Print the list of blank created tiles, delete the tiles, and delete their text file
-    uu.list_and_delete_blank_tiles()
-
-
-    for i in range(0, len(output_pattern_list)):
-        pattern = output_pattern_list[i]
-
-        uu.print_log("Adding metadata tags for pattern {}".format(pattern))
-
-        if cn.count == 96:
-            processes = 45  # 45 processors = XXX GB peak
-        else:
-            processes = 9
-        uu.print_log('Adding metadata tags max processors=', processes)
-        pool = multiprocessing.Pool(processes)
-        pool.map(partial(calculate_gross_emissions.add_metadata_tags, pattern=pattern, sensit_type=sensit_type),
-                 tile_id_list)
-        pool.close()
-        pool.join()
-
-        # for tile_id in tile_id_list:
-        #     calculate_gross_emissions.add_metadata_tags(tile_id, pattern, sensit_type)
+    if cn.gross_emissions_engine != 'numpy':
+        uu.list_and_delete_blank_tiles()
 
 
     # Uploads emissions to appropriate directory for the carbon emitted_pools chosen
@@ -18,6 +18,7 @@ from subprocess import Popen, PIPE, STDOUT, check_call
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 def mp_peatland_processing(tile_id_list, run_date = None):
 
@@ -50,7 +51,7 @@ def mp_peatland_processing(tile_id_list, run_date = None):
     uu.log_subprocess_output_full(cmd)
 
     uu.print_log("Making SoilGrids250 most likely soil class vrt...")
-    check_call('gdalbuildvrt most_likely_soil_class.vrt *{}*'.format(cn.pattern_soilgrids_most_likely_class), shell=True)
+    uu.log_subprocess_output_full('gdalbuildvrt most_likely_soil_class.vrt *{}*'.format(cn.pattern_soilgrids_most_likely_class), shell=True)
     uu.print_log("Done making SoilGrids250 most likely soil class vrt")
 
     # Downloads peat layers
@@ -65,7 +66,7 @@ def mp_peatland_processing(tile_id_list, run_date = None):
 
     # Converts the Jukka peat shapefile to a raster
     uu.print_log('Rasterizing jukka peat...')
-    cmd= ['gdal_rasterize', '-burn', '1', '-co', 'COMPRESS=LZW', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
+    cmd= ['gdal_rasterize', '-burn', '1', *raster_profile.gdal_options('scratch', 'Byte'), '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
           '-tap', '-ot', 'Byte', '-a_nodata', '0', cn.jukka_peat_shp, jukka_tif]
     uu.log_subprocess_output_full(cmd)
     uu.print_log('   Jukka peat rasterized')
@@ -7,13 +7,13 @@ Any pixel that is marked as most likely being a histosol subgroup is classified
 
 from subprocess import Popen, PIPE, STDOUT, check_call
 import os
-import rasterio
-from shutil import copyfile
 import datetime
 import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_metadata
 
 def create_peat_mask_tiles(tile_id):
 
@@ -43,7 +43,7 @@ def create_peat_mask_tiles(tile_id):
         calc = '--calc=(A==14)'
         peat_mask_out_filearg = '--outfile={}'.format(out_tile_no_tag)
         cmd = ['gdal_calc.py', '-A', out_intermediate, calc, peat_mask_out_filearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type=Byte', '--quiet']
+               '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options('scratch', 'Byte', '--co'), '--type=Byte', '--quiet']
         uu.log_subprocess_output_full(cmd)
 
         uu.print_log("{} created.".format(tile_id))
@@ -57,64 +57,21 @@ def create_peat_mask_tiles(tile_id):
         uu.print_log("{} is inside CIFOR band. Using CIFOR/Jukka combination...".format(tile_id))
 
         # Combines CIFOR and Jukka (if it occurs there)
-        cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', '-co', 'COMPRESS=LZW', '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
+        cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', *raster_profile.gdal_options('scratch', 'Byte'), '-tr', '{}'.format(cn.Hansen_res), '{}'.format(cn.Hansen_res),
                '-tap', '-te', str(xmin), str(ymin), str(xmax), str(ymax),
                '-dstnodata', '0', '-overwrite', '{}'.format(cn.cifor_peat_file), 'jukka_peat.tif', out_tile_no_tag]
         uu.log_subprocess_output_full(cmd)
 
         uu.print_log("{} created.".format(tile_id))
 
-    # All of the below is to add metadata tags to the output peat masks.
-    # For some reason, just doing what's at https://rasterio.readthedocs.io/en/latest/topics/tags.html
-    # results in the data getting removed.
-    # I found it necessary to copy the peat mask and read its windows into a new copy of the file, to which the
-    # metadata tags are added. I'm sure there's an easier way to do this but I couldn't figure out how.
-    # I know it's very convoluted but I really couldn't figure out how to add the tags without erasing the data.
-    # To make it even stranger, adding the tags before the gdal processing seemed to work fine for the non-tropical
-    # (SoilGrids) tiles but not for the tropical (CIFOR/Jukka) tiles (i.e. data didn't disappear in the non-tropical
-    # tiles if I added the tags before the GDAL steps but the tropical data did disappear).
-
-    copyfile(out_tile_no_tag, out_tile)
-
-    uu.print_log("Adding metadata tags to", tile_id)
-    # Opens the output tile, only so that metadata tags can be added
-    # Based on https://rasterio.readthedocs.io/en/latest/topics/tags.html
-    with rasterio.open(out_tile_no_tag) as out_tile_no_tag_src:
-
-        # Grabs metadata about the tif, like its location/projection/cellsize
-        kwargs = out_tile_no_tag_src.meta
-
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = out_tile_no_tag_src.block_windows(1)
-
-        # Updates kwargs for the output dataset
-        kwargs.update(
-            driver='GTiff',
-            count=1,
-            compress='lzw',
-            nodata=0
-        )
-
-        out_tile_tagged = rasterio.open(out_tile, 'w', **kwargs)
-
-        # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(out_tile_tagged, 'std')
-        out_tile_tagged.update_tags(
-            key='1 = peat. 0 = not peat.')
-        out_tile_tagged.update_tags(
-            source='Jukka for IDN and MYS; CIFOR for rest of tropics; SoilGrids250 (May 2020) most likely histosol for outside tropics')
-        out_tile_tagged.update_tags(
-            extent='Full extent of input datasets')
-
-        # Iterates across the windows (1 pixel strips) of the input tile
-        for idx, window in windows:
-
-            peat_mask_window = out_tile_no_tag_src.read(1, window=window)
-
-            # Writes the output window to the output
-            out_tile_tagged.write_band(1, peat_mask_window, window=window)
-
-    # Otherwise, the untagged version is counted and eventually copied to s3 if it has data in it
+    # Writes the output peat mask with its metadata tags from the untagged mask.
+    # gdal_calc.py and gdalwarp can't add metadata tags in GDAL 3.0, so the mask is written with the scratch profile
+    # and gdal_translate writes the output with the tags and the archive profile.
+    uu.print_log("Writing peat mask with metadata tags for", tile_id)
+    cmd = ['gdal_translate', '-a_nodata', '0', *raster_profile.gdal_options('archive', 'Byte'),
+           *tile_metadata.gdal_options(cn.pattern_peat_mask, 'std'), out_tile_no_tag, out_tile]
+    uu.log_subprocess_output_full(cmd)
+
     os.remove(out_tile_no_tag)
 
     # Prints information about the tile that was just processed
@@ -6,6 +6,10 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+import reclassify
 
 
 # Creates annual AGC and BGC removal rate rasters for US using US-specific removal rates
@@ -17,6 +21,12 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
     # Start time
     start = datetime.datetime.now()
 
+    # Lookup tables of the removal rates and standard deviations for each group-region-age and group-region code
+    gain_group_region_age_lut = reclassify.compile_lut(gain_table_group_region_age_dict)
+    gain_group_region_lut = reclassify.compile_lut(gain_table_group_region_dict)
+    stdev_group_region_age_lut = reclassify.compile_lut(stdev_table_group_region_age_dict)
+    stdev_group_region_lut = reclassify.compile_lut(stdev_table_group_region_dict)
+
     # Names of the input tiles
     gain = '{0}_{1}.tif'.format(cn.pattern_gain, tile_id)
     US_age_cat = '{0}_{1}.tif'.format(tile_id, cn.pattern_age_cat_natrl_forest_US)
@@ -29,8 +39,8 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
         # Grabs metadata about the tif, like its location/projection/cell size
         kwargs = US_age_cat_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = US_age_cat_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(US_age_cat_src)
 
         # Opens other necessary tiles
         gain_src = rasterio.open(gain)
@@ -41,31 +51,19 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0,
             dtype='float32'
         )
+        raster_profile.update(kwargs)
 
         # Opens the output tile (aboveground + belowground), giving it the modified metadata of the age category tile
         agc_bgc_rate_dst = rasterio.open('{0}_{1}.tif'.format(tile_id, output_pattern_list[0]), 'w', **kwargs)
         agc_bgc_stdev_dst = rasterio.open('{0}_{1}.tif'.format(tile_id, output_pattern_list[1]), 'w', **kwargs)
 
         # Adds metadata tags to the output rasters
-        uu.add_rasterio_tags(agc_bgc_rate_dst, 'std')
-        agc_bgc_rate_dst.update_tags(
-            units='megagrams aboveground+belowground carbon/ha/yr')
-        agc_bgc_rate_dst.update_tags(
-            source='US Forest Service FIA database, queried by Rich Birdsey, and consolidated by Nancy Harris')
-        agc_bgc_rate_dst.update_tags(
-            extent='Continental USA. Applies to pixels for which an FIA region, FIA forest group, and Pan et al. forest age category are available or interpolated.')
-
-        uu.add_rasterio_tags(agc_bgc_stdev_dst, 'std')
-        agc_bgc_stdev_dst.update_tags(
-            units='standard deviation of removal factor, in megagrams aboveground+belowground carbon/ha/yr')
-        agc_bgc_stdev_dst.update_tags(
-            source='US Forest Service FIA database, queried by Rich Birdsey, and reorganized by Nancy Harris')
-        agc_bgc_stdev_dst.update_tags(
-            extent='Continental USA. Applies to pixels for which an FIA region, FIA forest group, and Pan et al. forest age category are available or interpolated.')
+        tile_metadata.update_tags(agc_bgc_rate_dst, output_pattern_list[0], 'std')
+
+        tile_metadata.update_tags(agc_bgc_stdev_dst, output_pattern_list[1], 'std')
 
         # Iterates across the windows (1 pixel strips) of the input tile
         for idx, window in windows:
@@ -79,12 +77,11 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
 
             ### For removal factors
 
-            # Creates empty windows (arrays) that will store gain rates. There are separate arrays for
-            # no Hansen gain pixels and for Hansen gain pixels. These are later combined.
+            # There are separate arrays of gain rates for no Hansen gain pixels and for Hansen gain pixels.
+            # These are later combined.
             # Pixels without and with Hansen gain are treated separately because gain pixels automatically get the youngest
             # removal rate, regardless of their age category.
-            agc_bgc_without_gain_pixel_window = np.zeros((window.height, window.width), dtype='float32')
-            agc_bgc_with_gain_pixel_window = np.zeros((window.height, window.width), dtype='float32')
+            # Codes that aren't in the dictionaries (including 0, for masked pixels) get a rate of 0.
 
             # Performs the same operation on the three rasters as is done on the values in the table in order to
             # make the codes (dictionary key) match. Then, combines the three rasters. These values now match the key values in the spreadsheet.
@@ -100,8 +97,7 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
 
             # Applies the dictionary of group-region-age gain rates to the group-region-age numpy array to
             # get annual gain rates (Mg AGC+BGC/ha/yr) for each non-Hansen gain pixel
-            for key, value in gain_table_group_region_age_dict.items():
-                agc_bgc_without_gain_pixel_window[group_region_age_combined_window == key] = value
+            agc_bgc_without_gain_pixel_window = gain_group_region_age_lut.apply(group_region_age_combined_window)
 
 
             # This is for pixels with Hansen gain, so it assumes the age category is young and therefore only
@@ -120,8 +116,7 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
 
             # Applies the dictionary of group-region gain rates to the group-region numpy array to
             # get annual gain rates (Mg AGC+BGC/ha/yr) for each pixel that doesn't have Hansen gain
-            for key, value in gain_table_group_region_dict.items():
-                agc_bgc_with_gain_pixel_window[group_region_combined_window == key] = value
+            agc_bgc_with_gain_pixel_window = gain_group_region_lut.apply(group_region_combined_window)
 
             # Pixels with Hansen gain fill in the pixels that don't have Hansen gain. Each pixel has a value in
             # one or neither of these arrays but not both of these arrays
@@ -133,22 +128,18 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
 
             ### For removal factor standard deviation
 
-            # Creates empty windows (arrays) that will store stdev. There are separate arrays for
-            # no Hansen gain pixels and for Hansen gain pixels. These are later combined.
+            # There are separate arrays of stdev for no Hansen gain pixels and for Hansen gain pixels.
+            # These are later combined.
             # Pixels without and with Hansen gain are treated separately because gain pixels automatically get the youngest
             # removal rate stdev, regardless of their age category.
-            stdev_agc_bgc_without_gain_pixel_window = np.zeros((window.height, window.width), dtype='float32')
-            stdev_agc_bgc_with_gain_pixel_window = np.zeros((window.height, window.width), dtype='float32')
 
             # Applies the dictionary of group-region-age gain rates to the group-region-age numpy array to
             # get annual gain rates (Mg AGC+BGC/ha/yr) for each non-Hansen gain pixel
-            for key, value in stdev_table_group_region_age_dict.items():
-                stdev_agc_bgc_without_gain_pixel_window[group_region_age_combined_window == key] = value
+            stdev_agc_bgc_without_gain_pixel_window = stdev_group_region_age_lut.apply(group_region_age_combined_window)
 
             # Applies the dictionary of group-region gain rates to the group-region numpy array to
             # get annual gain rates (Mg AGC+BGC/ha/yr) for each pixel that doesn't have Hansen gain
-            for key, value in stdev_table_group_region_dict.items():
-                stdev_agc_bgc_with_gain_pixel_window[group_region_combined_window == key] = value
+            stdev_agc_bgc_with_gain_pixel_window = stdev_group_region_lut.apply(group_region_combined_window)
 
             # Pixels with Hansen gain fill in the pixels that don't have Hansen gain. Each pixel has a value in
             # one or neither of these arrays but not both of these arrays
@@ -7,6 +7,9 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
 
 def annual_gain_rate_AGC_BGC_all_forest_types(tile_id, output_pattern_list, sensit_type):
 
@@ -48,16 +51,16 @@ def annual_gain_rate_AGC_BGC_all_forest_types(tile_id, output_pattern_list, sens
         # Grabs metadata about the tif, like its location/projection/cellsize
         kwargs = model_extent_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = model_extent_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(model_extent_src)
 
         # Updates kwargs for the output dataset
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Checks whether there are mangrove or planted forest tiles. If so, they are opened.
         try:
@@ -113,16 +116,11 @@ def annual_gain_rate_AGC_BGC_all_forest_types(tile_id, output_pattern_list, sens
         removal_forest_type_dst = rasterio.open(removal_forest_type, 'w', **kwargs)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(removal_forest_type_dst, sensit_type)
-        removal_forest_type_dst.update_tags(
-            key='6: mangroves. 5: European-specific rates. 4: planted forests. 3: US-specific rates. 2: young (<20 year) secondary forests. 1: old (>20 year) secondary forests and primary forests. Priority goes to the highest number.')
-        removal_forest_type_dst.update_tags(
-            source='Mangroves: IPCC wetlands supplement. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9')
-        removal_forest_type_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(removal_forest_type_dst, output_pattern_list[0], sensit_type)
 
         # Updates kwargs for the removal rate outputs-- just need to change datatype
         kwargs.update(dtype='float32')
+        raster_profile.update(kwargs)
 
         annual_gain_AGC_all_forest_types_dst = rasterio.open(annual_gain_AGC_all_forest_types, 'w', **kwargs)
         annual_gain_BGC_all_forest_types_dst = rasterio.open(annual_gain_BGC_all_forest_types, 'w', **kwargs)
@@ -130,40 +128,16 @@ def annual_gain_rate_AGC_BGC_all_forest_types(tile_id, output_pattern_list, sens
         stdev_annual_gain_AGC_all_forest_types_dst = rasterio.open(stdev_annual_gain_AGC_all_forest_types, 'w', **kwargs)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(annual_gain_AGC_all_forest_types_dst, sensit_type)
-        annual_gain_AGC_all_forest_types_dst.update_tags(
-            units='megagrams aboveground carbon/ha/yr')
-        annual_gain_AGC_all_forest_types_dst.update_tags(
-            source='Mangroves: IPCC wetlands supplement Table 4.4. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9')
-        annual_gain_AGC_all_forest_types_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(annual_gain_AGC_all_forest_types_dst, output_pattern_list[1], sensit_type)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(annual_gain_BGC_all_forest_types_dst, sensit_type)
-        annual_gain_BGC_all_forest_types_dst.update_tags(
-            units='megagrams belowground carbon/ha/yr')
-        annual_gain_BGC_all_forest_types_dst.update_tags(
-            source='Mangroves: IPCC wetlands supplement Table 4.4. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9')
-        annual_gain_BGC_all_forest_types_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(annual_gain_BGC_all_forest_types_dst, output_pattern_list[2], sensit_type)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(annual_gain_AGC_BGC_all_forest_types_dst, sensit_type)
-        annual_gain_AGC_BGC_all_forest_types_dst.update_tags(
-            units='megagrams aboveground + belowground carbon/ha/yr')
-        annual_gain_AGC_BGC_all_forest_types_dst.update_tags(
-            source='Mangroves: IPCC wetlands supplement Table 4.4. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9')
-        annual_gain_AGC_BGC_all_forest_types_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(annual_gain_AGC_BGC_all_forest_types_dst, output_pattern_list[3], sensit_type)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(stdev_annual_gain_AGC_all_forest_types_dst, sensit_type)
-        stdev_annual_gain_AGC_all_forest_types_dst.update_tags(
-            units='standard deviation for removal factor, in terms of megagrams aboveground carbon/ha/yr')
-        stdev_annual_gain_AGC_all_forest_types_dst.update_tags(
-            source='Mangroves: IPCC wetlands supplement Table 4.4. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9')
-        stdev_annual_gain_AGC_all_forest_types_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(stdev_annual_gain_AGC_all_forest_types_dst, output_pattern_list[4], sensit_type)
 
         uu.print_log("  Creating removal model forest type tile, AGC removal factor tile, BGC removal factor tile, and AGC removal factor standard deviation tile for {}".format(tile_id))
 
@@ -6,6 +6,10 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+import reclassify
 
 # Necessary to suppress a pandas error later on
 np.set_printoptions(threshold=np.nan)
@@ -19,6 +23,11 @@ def annual_gain_rate(tile_id, sensit_type, gain_table_dict, stdev_table_dict, ou
     # The key in the dictionary is the forest age category decision tree endpoints.
     age_dict = {0: 0, 1: 10000, 2: 20000, 3: 30000}
 
+    # Lookup tables for the age categories, removal rates and removal rate standard deviations
+    age_lut = reclassify.compile_lut(age_dict, dtype='int32')
+    gain_lut = reclassify.compile_lut(gain_table_dict)
+    stdev_lut = reclassify.compile_lut(stdev_table_dict)
+
     uu.print_log("Processing:", tile_id)
 
     # Start time
@@ -51,49 +60,31 @@ def annual_gain_rate(tile_id, sensit_type, gain_table_dict, stdev_table_dict, ou
     # Grabs metadata about the continent ecozone tile, like its location/projection/cellsize
     kwargs = cont_eco_src.meta
 
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = cont_eco_src.block_windows(1)
+    # Grabs the windows of the tile to iterate over the entire tif without running out of memory
+    windows = tile_layout.windows(cont_eco_src)
 
     # Updates kwargs for the output dataset.
     # Need to update data type to float 32 so that it can handle fractional gain rates
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0,
         dtype='float32'
     )
+    raster_profile.update(kwargs)
 
     # The output files, aboveground and belowground biomass gain rates
     dst_above = rasterio.open(AGB_IPCC_default_gain_rate, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_above, sensit_type)
-    dst_above.update_tags(
-        units='megagrams aboveground biomass (AGB or dry matter)/ha/yr')
-    dst_above.update_tags(
-        source='IPCC Guidelines 2019 refinement, forest section, Table 4.9')
-    dst_above.update_tags(
-        extent='Full model extent, even though these rates will not be used over the full model extent')
+    tile_metadata.update_tags(dst_above, output_pattern_list[0], sensit_type)
 
     dst_below = rasterio.open(BGB_IPCC_default_gain_rate, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_below, sensit_type)
-    dst_below.update_tags(
-        units='megagrams belowground biomass (AGB or dry matter)/ha/yr')
-    dst_below.update_tags(
-        source='IPCC Guidelines 2019 refinement, forest section, Table 4.9')
-    dst_below.update_tags(
-        extent='Full model extent, even though these rates will not be used over the full model extent')
+    tile_metadata.update_tags(dst_below, output_pattern_list[1], sensit_type)
 
     dst_stdev_above = rasterio.open(AGB_IPCC_default_gain_stdev, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_stdev_above, sensit_type)
-    dst_stdev_above.update_tags(
-        units='standard deviation, in terms of megagrams aboveground biomass (AGB or dry matter)/ha/yr')
-    dst_stdev_above.update_tags(
-        source='IPCC Guidelines 2019 refinement, forest section, Table 4.9')
-    dst_stdev_above.update_tags(
-        extent='Full model extent, even though these standard deviations will not be used over the full model extent')
+    tile_metadata.update_tags(dst_stdev_above, output_pattern_list[2], sensit_type)
 
     # Iterates across the windows (1 pixel strips) of the input tiles
     for idx, window in windows:
@@ -110,19 +101,16 @@ def annual_gain_rate(tile_id, sensit_type, gain_table_dict, stdev_table_dict, ou
             age_cat_window = np.zeros((window.height, window.width), dtype='uint8')
 
         # Recodes the input forest age category array with 10 different decision tree end values into the 3 actual age categories
-        age_recode = np.vectorize(age_dict.get)(age_cat_window)
+        age_recode = age_lut.apply(age_cat_window)
 
         # Adds the age category codes to the continent-ecozone codes to create an array of unique continent-ecozone-age codes
         cont_eco_age = cont_eco_window + age_recode
 
         ## Aboveground removal factors
-        # Converts the continent-ecozone array to float so that the values can be replaced with fractional gain rates
-        gain_rate_AGB = cont_eco_age.astype('float32')
-
         # Applies the dictionary of continent-ecozone-age gain rates to the continent-ecozone-age array to
-        # get annual gain rates (metric tons aboveground biomass/yr) for each pixel
-        for key, value in gain_table_dict.items():
-            gain_rate_AGB[gain_rate_AGB == key] = value
+        # get annual gain rates (metric tons aboveground biomass/yr) for each pixel.
+        # Codes that aren't in the dictionary keep their code.
+        gain_rate_AGB = gain_lut.apply(cont_eco_age, default=cont_eco_age.astype('float32'))
 
         # Writes the output window to the output file
         dst_above.write_band(1, gain_rate_AGB, window=window)
@@ -135,13 +123,10 @@ def annual_gain_rate(tile_id, sensit_type, gain_table_dict, stdev_table_dict, ou
         dst_below.write_band(1, gain_rate_BGB, window=window)
 
         ## Aboveground removal factor standard deviation
-        # Converts the continent-ecozone array to float so that the values can be replaced with fractional standard deviations
-        gain_stdev_AGB = cont_eco_age.astype('float32')
-
         # Applies the dictionary of continent-ecozone-age gain rate standard deviations to the continent-ecozone-age array to
-        # get annual gain rate standard deviations (metric tons aboveground biomass/yr) for each pixel
-        for key, value in stdev_table_dict.items():
-            gain_stdev_AGB[gain_stdev_AGB == key] = value
+        # get annual gain rate standard deviations (metric tons aboveground biomass/yr) for each pixel.
+        # Codes that aren't in the dictionary keep their code.
+        gain_stdev_AGB = stdev_lut.apply(cont_eco_age, default=cont_eco_age.astype('float32'))
 
         # Writes the output window to the output file
         dst_stdev_above.write_band(1, gain_stdev_AGB, window=window)
@@ -10,6 +10,10 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+import reclassify
 
 # Necessary to suppress a pandas error later on
 np.set_printoptions(threshold=np.nan)
@@ -28,6 +32,11 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
         uu.print_log("{} does not contain mangroves. Skipping tile.".format(tile_id))
         return
 
+    # Lookup tables for the aboveground and belowground gain rates and the aboveground gain rate standard deviations
+    gain_above_lut = reclassify.compile_lut(gain_above_dict)
+    gain_below_lut = reclassify.compile_lut(gain_below_dict)
+    stdev_lut = reclassify.compile_lut(stdev_dict)
+
     # Name of the input files
     mangrove_biomass = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_mangrove_biomass_2000)
     cont_eco = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_cont_eco_processed)
@@ -45,48 +54,30 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
     # Grabs metadata about the tif, like its location/projection/cellsize
     kwargs = cont_eco_src.meta
 
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = cont_eco_src.block_windows(1)
+    # Grabs the windows of the tile to iterate over the entire tif without running out of memory
+    windows = tile_layout.windows(cont_eco_src)
 
     # Updates kwargs for the output dataset.
     # Need to update data type to float 32 so that it can handle fractional gain rates
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0,
         dtype='float32'
     )
+    raster_profile.update(kwargs)
 
     dst_above = rasterio.open(AGB_gain_rate, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_above, sensit_type)
-    dst_above.update_tags(
-        units='megagrams aboveground biomass (AGB or dry matter)/ha/yr')
-    dst_above.update_tags(
-        source='IPCC Guidelines, 2013 Coastal Wetlands Supplement, Table 4.4')
-    dst_above.update_tags(
-        extent='Simard et al. 2018, based on Giri et al. 2011 (Global Ecol. Biogeogr.) mangrove extent')
+    tile_metadata.update_tags(dst_above, output_pattern_list[0], sensit_type)
 
     dst_below = rasterio.open(BGB_gain_rate, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_below, sensit_type)
-    dst_below.update_tags(
-        units='megagrams belowground biomass (BGB or dry matter)/ha/yr')
-    dst_below.update_tags(
-        source='IPCC Guidelines, 2013 Coastal Wetlands Supplement, Table 4.4')
-    dst_below.update_tags(
-        extent='Simard et al. 2018, based on Giri et al. 2011 (Global Ecol. Biogeogr.) mangrove extent')
+    tile_metadata.update_tags(dst_below, output_pattern_list[1], sensit_type)
 
     dst_stdev_above = rasterio.open(AGB_gain_stdev, 'w', **kwargs)
     # Adds metadata tags to the output raster
-    uu.add_rasterio_tags(dst_stdev_above, sensit_type)
-    dst_stdev_above.update_tags(
-        units='standard deviation, in terms of megagrams aboveground biomass (AGB or dry matter)/ha/yr')
-    dst_stdev_above.update_tags(
-        source='IPCC Guidelines, 2013 Coastal Wetlands Supplement, Table 4.4')
-    dst_stdev_above.update_tags(
-        extent='Simard et al. 2018, based on Giri et al. 2011 (Global Ecol. Biogeogr.) mangrove extent')
+    tile_metadata.update_tags(dst_stdev_above, output_pattern_list[2], sensit_type)
 
     # Iterates across the windows (1 pixel strips) of the input tile
     for idx, window in windows:
@@ -95,13 +86,8 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
         cont_eco = cont_eco_src.read(1, window=window)
         mangrove_AGB = mangrove_AGB_src.read(1, window=window)
 
-        # Converts the continent-ecozone array to float so that the values can be replaced with fractional gain rates.
-        # Creates two copies: one for aboveground gain and one for belowground gain.
-        # Creating only one copy of the cont_eco raster made it so that belowground gain rates weren't being
-        # written correctly for some reason.
-        cont_eco_above = cont_eco.astype('float32')
-        cont_eco_below = cont_eco.astype('float32')
-        cont_eco_stdev = cont_eco.astype('float32')
+        # Codes that aren't in the gain rate dictionaries keep their continent-ecozone code
+        cont_eco_float = cont_eco.astype('float32')
 
         # Reclassifies mangrove biomass to 1 or 0 to make a mask of mangrove pixels.
         # Ultimately, only these pixels (ones with mangrove biomass) will get values.
@@ -110,8 +96,7 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
 
         # Applies the dictionary of continent-ecozone aboveground gain rates to the continent-ecozone array to
         # get annual aboveground gain rates (metric tons aboveground biomass/yr) for each pixel
-        for key, value in gain_above_dict.items():
-            cont_eco_above[cont_eco_above == key] = value
+        cont_eco_above = gain_above_lut.apply(cont_eco, default=cont_eco_float)
 
         # Masks out pixels without mangroves, leaving gain rates in only pixels with mangroves
         dst_above_data = cont_eco_above * mangrove_AGB
@@ -121,8 +106,7 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
 
 
         # Same as above but for belowground gain rates
-        for key, value in gain_below_dict.items():
-            cont_eco_below[cont_eco_below == key] = value
+        cont_eco_below = gain_below_lut.apply(cont_eco, default=cont_eco_float)
 
         dst_below_data = cont_eco_below * mangrove_AGB
 
@@ -131,8 +115,7 @@ def annual_gain_rate(tile_id, sensit_type, output_pattern_list, gain_above_dict,
 
         # Applies the dictionary of continent-ecozone aboveground gain rate standard deviations to the continent-ecozone array to
         # get annual aboveground gain rate standard deviations (metric tons aboveground biomass/yr) for each pixel
-        for key, value in stdev_dict.items():
-            cont_eco_stdev[cont_eco_stdev == key] = value
+        cont_eco_stdev = stdev_lut.apply(cont_eco, default=cont_eco_float)
 
         # Masks out pixels without mangroves, leaving gain rates in only pixels with mangroves
         dst_stdev = cont_eco_stdev * mangrove_AGB
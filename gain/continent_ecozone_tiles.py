@@ -23,6 +23,8 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
 
 def create_continent_ecozone_tiles(tile_id):
 
@@ -38,38 +40,38 @@ def create_continent_ecozone_tiles(tile_id):
 
     cont_eco_raw = "{0}_{1}".format(tile_id, cn.pattern_cont_eco_raw)
 
-    # This makes rasters that are made of 1024 x 1024 pixel windows instead of 40000 x 1 pixel windows
-    # to improve assigning pixels without continent-ecozone codes to a continent-ecozone code.
+    # Pixels without continent-ecozone codes are assigned the most common code in their mode fill window (below).
     # This way, pixels without continent-ecozone are assigned a code based on what's in a window nearby, rather
     # than a window that spans the entire 10x10 degree tile.
-    blocksizex = 1024
-    blocksizey = 1024
+    # The raster is tiled in blocks the size of the mode fill windows, so each window is one block.
+    blocksizex = cn.mode_fill_window_size
+    blocksizey = cn.mode_fill_window_size
     uu.rasterize('fao_ecozones_fra_2000_continents_assigned_dissolved_FINAL_20180906.shp',
                                               cont_eco_raw, xmin, ymin, xmax, ymax, blocksizex, blocksizey, '.00025', 'Int16', 'gainEcoCon', '0')
 
     # Opens continent-ecozone tile.
-    # Everything from here down is used to assign pixels without continent ecozone codes to a continent-ecozone in the 1024x1024 windows.
+    # Everything from here down is used to assign pixels without continent ecozone codes to a continent-ecozone in the mode fill windows.
     with rasterio.open('{}.tif'.format(cont_eco_raw)) as cont_eco_raw_src:
 
         # Grabs metadata about the tif, like its location/projection/cellsize
         kwargs = cont_eco_raw_src.meta
 
-        # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-        windows = cont_eco_raw_src.block_windows(1)
+        # Grabs the mode fill windows of the tile, whatever the blocks of the tile are
+        windows = tile_layout.windows(cont_eco_raw_src, cn.mode_fill_window_size, cn.mode_fill_window_size)
 
         # Updates kwargs for the output dataset.
         # Need to update data type to float 32 so that it can handle fractional gain rates
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Opens the output tile, giving it the arguments of the input tiles
         with rasterio.open('{0}_{1}.tif'.format(tile_id, cn.pattern_cont_eco_processed), 'w', **kwargs) as dst:
 
-            # Iterates across the windows (1024 x 1024 pixel boxes) of the input tile.
+            # Iterates across the mode fill windows of the input tile.
             for idx, window in windows:
 
                 # Creates windows for each input raster
@@ -99,10 +101,7 @@ def create_continent_ecozone_tiles(tile_id):
                 # Assigns all pixels without a continent-ecozone code in that window to that most common code
                 cont_eco_processed[cont_eco_processed == 0] = mode
 
-                # Writes the output window to the output.
-                # Although the windows for the input tiles are 1024 x 1024 pixels,
-                # the windows for these output files are 40000 x 1 pixels, like all the other tiles in this model,
-                # so they should work fine with all the other tiles.
+                # Writes the output window to the output
                 dst.write_band(1, cont_eco_processed, window=window)
 
     # Prints information about the tile that was just processed
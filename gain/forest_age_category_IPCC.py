@@ -7,6 +7,10 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
+import reclassify
 
 def forest_age_category(tile_id, gain_table_dict, pattern, sensit_type):
 
@@ -29,6 +33,9 @@ def forest_age_category(tile_id, gain_table_dict, pattern, sensit_type):
 
     uu.print_log("  Tile in tropics:", tropics)
 
+    # Lookup table of the <=20 year secondary forest growth rate for each continent-ecozone code
+    gain_lut = reclassify.compile_lut(gain_table_dict, dtype='float64')
+
     # Names of the input tiles
     gain = '{0}_{1}.tif'.format(cn.pattern_gain, tile_id)
     model_extent = uu.sensit_tile_rename(sensit_type, tile_id, cn.pattern_model_extent)
@@ -60,8 +67,8 @@ def forest_age_category(tile_id, gain_table_dict, pattern, sensit_type):
         # Grabs metadata about the tif, like its location/projection/cellsize
         kwargs = model_extent_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = model_extent_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(model_extent_src)
 
         # Opens the input tiles if they exist
         try:
@@ -98,21 +105,15 @@ def forest_age_category(tile_id, gain_table_dict, pattern, sensit_type):
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Opens the output tile, giving it the arguments of the input tiles
         dst = rasterio.open('{0}_{1}.tif'.format(tile_id, pattern), 'w', **kwargs)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(dst, sensit_type)
-        dst.update_tags(
-            key='1: young (<20 year) secondary forest; 2: old (>20 year) secondary forest; 3: primary forest or IFL')
-        dst.update_tags(
-            source='Decision tree that uses Hansen gain and loss, IFL/primary forest extent, and aboveground biomass to assign an age category')
-        dst.update_tags(
-            extent='Full model extent, even though these age categories will not be used over the full model extent. They apply to just the rates from IPCC defaults.')
+        tile_metadata.update_tags(dst, pattern, sensit_type)
 
 
         uu.print_log("    Assigning IPCC age categories for", tile_id)
@@ -151,7 +152,8 @@ def forest_age_category(tile_id, gain_table_dict, pattern, sensit_type):
             # Creates a numpy array that has the <=20 year secondary forest growth rate x 20
             # based on the continent-ecozone code of each pixel (the dictionary).
             # This is used to assign pixels to the correct age category.
-            gain_20_years = np.vectorize(gain_table_dict.get)(cont_eco_window)*20
+            # Codes that aren't in the dictionary get NaN, so they don't meet any of the growth rate conditions.
+            gain_20_years = gain_lut.apply(cont_eco_window, default=np.nan)*20
 
             # Create a 0s array for the output
             dst_data = np.zeros((window.height, window.width), dtype='uint8')
@@ -1,5 +1,5 @@
-from subprocess import Popen, PIPE, STDOUT, check_call
 import datetime
+import math
 import rasterio
 import numpy as np
 import os
@@ -7,6 +7,9 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import tile_metadata
 
 # Gets the names of the input tiles
 def tile_names(tile_id, sensit_type):
@@ -22,309 +25,148 @@ def tile_names(tile_id, sensit_type):
     return loss, gain, model_extent
 
 
-# Creates gain year count tiles for pixels that only had loss
-def create_gain_year_count_loss_only(tile_id, sensit_type):
+# Pixels that are NoData in an input. Inputs without a NoData value have no NoData pixels.
+def nodata_pixels(window, nodata):
 
-    uu.print_log("Gain year count for loss only pixels:", tile_id)
+    if nodata is None:
+        return np.zeros(window.shape, dtype=bool)
 
-    # start time
-    start = datetime.datetime.now()
+    return window == nodata
 
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
-
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in loss only pixel gain year count.".format(tile_id))
-        loss_calc = '--calc=(A>0)*(B==0)*(C>0)*(A-1)'
-        loss_outfilename = '{}_growth_years_loss_only.tif'.format(tile_id)
-        loss_outfilearg = '--outfile={}'.format(loss_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, loss_calc, loss_outfilearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-    else:
-        uu.print_log("No loss tile found for {}. Skipping loss only pixel gain year count.".format(tile_id))
 
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_loss_only')
+# Calculates the gain year count for one window from its loss, gain and model extent values.
+# There are four combinations of loss and gain in a pixel: loss only, gain only, neither loss nor gain, and loss and gain.
+# Each combination gets its own equation, and each pixel belongs to at most one of them.
+# Pixels outside the model extent or that are NoData in an input the equation uses get 0 (NoData).
+def gain_year_count_window(loss_window, gain_window, model_extent_window,
+                           loss_nodata, gain_nodata, model_extent_nodata, sensit_type):
 
+    # Equations use integer arithmetic so that loss years (1 to loss_years) can't wrap around like they would as uint8
+    loss_window = loss_window.astype('int16')
 
-# Creates gain year count tiles for pixels that only had gain
-def create_gain_year_count_gain_only_standard(tile_id, sensit_type):
+    in_extent = model_extent_window > 0
+    no_loss = loss_window == 0
+    no_gain = gain_window == 0
+    has_gain = gain_window == 1
 
-    uu.print_log("Gain year count for gain only pixels using standard function:", tile_id)
+    # Pixels that are NoData in the inputs used by each equation
+    nodata_gain_extent = nodata_pixels(gain_window, gain_nodata) | nodata_pixels(model_extent_window, model_extent_nodata)
+    nodata_all = nodata_gain_extent | nodata_pixels(loss_window, loss_nodata)
 
-    # start time
-    start = datetime.datetime.now()
+    gain_year_count = np.zeros(loss_window.shape, dtype='int16')
 
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
+    # Loss only: years before the loss year
+    loss_only = ~no_loss & no_gain & in_extent & ~nodata_all
+    gain_year_count[loss_only] = loss_window[loss_only] - 1
 
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in gain only pixel gain year count.".format(tile_id))
-        gain_calc = '--calc=(A==0)*(B==1)*(C>0)*({}/2)'.format(cn.gain_years)
-        gain_outfilename = '{}_growth_years_gain_only.tif'.format(tile_id)
-        gain_outfilearg = '--outfile={}'.format(gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, gain_calc, gain_outfilearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-    else:
-        uu.print_log("No loss tile found for {}. Not using it for gain only pixel gain year count.".format(tile_id))
-        gain_calc = '--calc=(A==1)*(B>0)*({}/2)'.format(cn.gain_years)
-        gain_outfilename = '{}_growth_years_gain_only.tif'.format(tile_id)
-        gain_outfilearg = '--outfile={}'.format(gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', gain, '-B', model_extent, gain_calc, gain_outfilearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_gain_only')
-
-
-# Creates gain year count tiles for pixels that only had gain
-def create_gain_year_count_gain_only_maxgain(tile_id, sensit_type):
-
-    uu.print_log("Gain year count for gain only pixels using maxgain function:", tile_id)
+    if sensit_type == 'legal_Amazon_loss':
 
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
+        # Gain doesn't apply to legal_Amazon_loss, so pixels without loss grow for the full loss period regardless of gain.
+        # The 0 (NoData) pixels of the PRODES loss tile (model v.1.1.2) are pixels without loss, so loss NoData is ignored here.
+        no_change = no_loss & in_extent & ~nodata_pixels(model_extent_window, model_extent_nodata)
+        gain_year_count[no_change] = cn.loss_years
 
-    # start time
-    start = datetime.datetime.now()
-
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in gain only pixel gain year count.".format(tile_id))
-        gain_calc = '--calc=(A==0)*(B==1)*(C>0)*({})'.format(cn.loss_years)
-        gain_outfilename = '{}_growth_years_gain_only.tif'.format(tile_id)
-        gain_outfilearg = '--outfile={}'.format(gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, gain_calc, gain_outfilearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
     else:
-        uu.print_log("No loss tile found for {}. Not using loss for gain only pixel gain year count.".format(tile_id))
-        gain_calc = '--calc=(A==1)*(B>0)*({})'.format(cn.loss_years)
-        gain_outfilename = '{}_growth_years_gain_only.tif'.format(tile_id)
-        gain_outfilearg = '--outfile={}'.format(gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', gain, '-B', model_extent, gain_calc, gain_outfilearg,
-               '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_gain_only')
-
-
-# Creates gain year count tiles for pixels that had neither loss not gain.
-# For all models except legal_Amazon_loss.
-def create_gain_year_count_no_change_standard(tile_id, sensit_type):
-
-    uu.print_log("Gain year count for pixels with neither loss nor gain:", tile_id)
-
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
-
-    # start time
-    start = datetime.datetime.now()
 
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in no change pixel gain year count.".format(tile_id))
-        no_change_calc = '--calc=(A==0)*(B==0)*(C>0)*{}'.format(cn.loss_years)
-        no_change_outfilename = '{}_growth_years_no_change.tif'.format(tile_id)
-        no_change_outfilearg = '--outfile={}'.format(no_change_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, no_change_calc,
-               no_change_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
+        # Gain only: half of the gain period for the standard model; the full loss period for maxgain.
+        # Written as a Byte rounded half up, like the gdal_calc output this replaces.
+        gain_only = no_loss & has_gain & in_extent & ~nodata_all
+        if sensit_type == 'maxgain':
+            gain_year_count[gain_only] = cn.loss_years
+        else:
+            gain_year_count[gain_only] = math.floor(cn.gain_years / 2 + 0.5)
+
+        # Neither loss nor gain: the full loss period
+        no_change = no_loss & no_gain & in_extent & ~nodata_all
+        gain_year_count[no_change] = cn.loss_years
+
+    # Loss and gain: years before the loss year, plus half of the years after loss for the standard model.
+    # For maxgain, the full loss period minus the loss year.
+    loss_and_gain = ~no_loss & has_gain & in_extent & ~nodata_all
+    if sensit_type == 'maxgain':
+        gain_year_count[loss_and_gain] = cn.loss_years - 1
     else:
-        uu.print_log("No loss tile found for {}. Not using it for no change pixel gain year count.".format(tile_id))
-        no_change_calc = '--calc=(A==0)*(B>0)*{}'.format(cn.loss_years)
-        no_change_outfilename = '{}_growth_years_no_change.tif'.format(tile_id)
-        no_change_outfilearg = '--outfile={}'.format(no_change_outfilename)
-        cmd = ['gdal_calc.py', '-A', gain, '-B', model_extent, no_change_calc,
-               no_change_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
+        loss_and_gain_years = loss_window[loss_and_gain]
+        gain_year_count[loss_and_gain] = (loss_and_gain_years - 1) + (cn.loss_years + 1 - loss_and_gain_years) // 2
 
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_no_change')
+    return gain_year_count.astype('uint8')
 
 
-# Creates gain year count tiles for pixels that did not have loss (doesn't matter if they had gain or not).
-# For legal_Amazon_loss sensitivity analysis.
-def create_gain_year_count_no_change_legal_Amazon_loss(tile_id, sensit_type):
+# Creates the gain year count tile in a single pass over the loss, gain and model extent tiles.
+# This replaces four gdal_calc steps (one per combination of loss and gain), which each wrote an intermediate tile,
+# and the merge of those intermediate tiles.
+def create_gain_year_count(tile_id, pattern, sensit_type):
 
-    uu.print_log("Gain year count for pixels without loss for legal_Amazon_loss:", tile_id)
-
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
+    uu.print_log("Gain year count for all loss and gain combinations:", tile_id)
 
     # start time
     start = datetime.datetime.now()
 
-    # For unclear reasons, gdal_calc doesn't register the 0 (NoData) pixels in the loss tile, so I have to convert it
-    # to a vrt so that the 0 pixels are recognized.
-    # This was the case with PRODES loss in model v.1.1.2.
-    loss_vrt = '{}_loss.vrt'.format(tile_id)
-    os.system('gdalbuildvrt -vrtnodata None {0} {1}'.format(loss_vrt, loss))
-
-    no_change_calc = '--calc=(A==0)*(B>0)*{}'.format(cn.loss_years)
-    no_change_outfilename = '{}_growth_years_no_change.tif'.format(tile_id)
-    no_change_outfilearg = '--outfile={}'.format(no_change_outfilename)
-    cmd = ['gdal_calc.py', '-A', loss_vrt, '-B', model_extent, no_change_calc,
-           no_change_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-    uu.log_subprocess_output_full(cmd)
-    
-    os.remove(loss_vrt)
-
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_no_change')
-
-
-# Creates gain year count tiles for pixels that had both loss and gain
-def create_gain_year_count_loss_and_gain_standard(tile_id, sensit_type):
-
-    uu.print_log("Loss and gain pixel processing using standard function:", tile_id)
-
-    # Names of the loss, gain and tree cover density tiles
-    loss, gain, model_extent = tile_names(tile_id, sensit_type)
-
-    # start time
-    start = datetime.datetime.now()
-
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in loss and gain pixel gain year count.".format(tile_id))
-        loss_and_gain_calc = '--calc=((A>0)*(B==1)*(C>0)*((A-1)+floor(({}+1-A)/2)))'.format(cn.loss_years)
-        loss_and_gain_outfilename = '{}_growth_years_loss_and_gain.tif'.format(tile_id)
-        loss_and_gain_outfilearg = '--outfile={}'.format(loss_and_gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, loss_and_gain_calc,
-               loss_and_gain_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-    else:
-        uu.print_log("No loss tile found for {}. Skipping loss and gain pixel gain year count.".format(tile_id))
-
-
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_loss_and_gain')
-
-
-# Creates gain year count tiles for pixels that had both loss and gain
-def create_gain_year_count_loss_and_gain_maxgain(tile_id, sensit_type):
-
-    uu.print_log("Loss and gain pixel processing using maxgain function:", tile_id)
-
-    # Names of the loss, gain and tree cover density tiles
+    # Names of the loss, gain and model extent tiles
     loss, gain, model_extent = tile_names(tile_id, sensit_type)
 
-    # start time
-    start = datetime.datetime.now()
-
-    if os.path.exists(loss):
-        uu.print_log("Loss tile found for {}. Using it in loss and gain pixel gain year count".format(tile_id))
-        loss_and_gain_calc = '--calc=((A>0)*(B==1)*(C>0)*({}-1))'.format(cn.loss_years)
-        loss_and_gain_outfilename = '{}_growth_years_loss_and_gain.tif'.format(tile_id)
-        loss_and_gain_outfilearg = '--outfile={}'.format(loss_and_gain_outfilename)
-        cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', model_extent, loss_and_gain_calc,
-               loss_and_gain_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-        uu.log_subprocess_output_full(cmd)
-    else:
-        uu.print_log("No loss tile found for {}. Skipping loss and gain pixel gain year count.".format(tile_id))
-
-    # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, 'growth_years_loss_and_gain')
-
-
-# Merges the four gain year count tiles above to create a single gain year count tile
-def create_gain_year_count_merge(tile_id, pattern, sensit_type):
-
-    uu.print_log("Merging loss, gain, no change, and loss/gain pixels into single raster for {}".format(tile_id))
-
-    # start time
-    start = datetime.datetime.now()
+    # Name of the output tile
+    gain_year_count = '{0}_{1}.tif'.format(tile_id, pattern)
 
-    # The four rasters from above that are to be merged
-    no_change_gain_years = '{}_growth_years_no_change.tif'.format(tile_id)
-    loss_only_gain_years = '{}_growth_years_loss_only.tif'.format(tile_id)
-    gain_only_gain_years = '{}_growth_years_gain_only.tif'.format(tile_id)
-    loss_and_gain_gain_years = '{}_growth_years_loss_and_gain.tif'.format(tile_id)
-
-    # Names of the output tiles
-    gain_year_count_merged = '{0}_{1}.tif'.format(tile_id, pattern)
-
-    # Opens no change gain year count tile. This should exist for all tiles.
-    with rasterio.open(no_change_gain_years) as no_change_gain_years_src:
+    # Opens the model extent tile. This should exist for all tiles.
+    with rasterio.open(model_extent) as model_extent_src:
 
         # Grabs metadata about the tif, like its location/projection/cellsize
-        kwargs = no_change_gain_years_src.meta
+        kwargs = model_extent_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = no_change_gain_years_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(model_extent_src)
 
         # Updates kwargs for the output dataset
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
-            nodata=0
+            nodata=0,
+            dtype='uint8'
         )
+        raster_profile.update(kwargs)
 
-        # Opens the other gain year count tiles. They may not exist for all other tiles.
-        try:
-            loss_only_gain_years_src = rasterio.open(loss_only_gain_years)
-            uu.print_log("   Loss only tile found for {}".format(tile_id))
-        except:
-            uu.print_log("   No loss only tile found for {}".format(tile_id))
+        # Opens the gain tile. This should exist for all tiles.
+        gain_src = rasterio.open(gain)
 
+        # Opens the loss tile. Tiles without loss are treated as having no loss in every pixel.
         try:
-            gain_only_gain_years_src = rasterio.open(gain_only_gain_years)
-            uu.print_log("   Gain only tile found for {}".format(tile_id))
+            loss_src = rasterio.open(loss)
+            uu.print_log("   Loss tile found for {}".format(tile_id))
         except:
-            uu.print_log("   No gain only tile found for {}".format(tile_id))
-
-        try:
-            loss_and_gain_gain_years_src = rasterio.open(loss_and_gain_gain_years)
-            uu.print_log("   Loss and gain tile found for {}".format(tile_id))
-        except:
-            uu.print_log("   No loss and gain tile found for {}".format(tile_id))
+            loss_src = None
+            uu.print_log("   No loss tile found for {}".format(tile_id))
 
+        # NoData value of the loss tile (None if it doesn't have one or there is no loss tile)
+        loss_nodata = loss_src.nodata if loss_src is not None else None
 
         # Opens the output tile, giving it the arguments of the input tiles
-        gain_year_count_merged_dst = rasterio.open(gain_year_count_merged, 'w', **kwargs)
-        uu.print_log("No change tile exists for {} by default".format(tile_id))
+        gain_year_count_dst = rasterio.open(gain_year_count, 'w', **kwargs)
 
         # Adds metadata tags to the output raster
-        uu.add_rasterio_tags(gain_year_count_merged_dst, sensit_type)
-        gain_year_count_merged_dst.update_tags(
-            units='years')
-        gain_year_count_merged_dst.update_tags(
-            min_possible_value='0')
-        gain_year_count_merged_dst.update_tags(
-            max_possible_value=cn.loss_years)
-        gain_year_count_merged_dst.update_tags(
-            source='Gain years are assigned based on the combination of Hansen loss and gain in each pixel. There are four combinations: neither loss nor gain, loss only, gain only, loss and gain.')
-        gain_year_count_merged_dst.update_tags(
-            extent='Full model extent')
+        tile_metadata.update_tags(gain_year_count_dst, pattern, sensit_type)
 
         # Iterates across the windows (1 pixel strips) of the input tile
         for idx, window in windows:
 
-            no_change_gain_years_window = no_change_gain_years_src.read(1, window=window)
-
-            try:
-                loss_only_gain_years_window = loss_only_gain_years_src.read(1, window=window)
-            except:
-                loss_only_gain_years_window = np.zeros((window.height, window.width), dtype='uint8')
-
-            try:
-                gain_only_gain_years_window = gain_only_gain_years_src.read(1, window=window)
-            except:
-                gain_only_gain_years_window = np.zeros((window.height, window.width), dtype='uint8')
+            model_extent_window = model_extent_src.read(1, window=window)
+            gain_window = gain_src.read(1, window=window)
 
-            try:
-                loss_and_gain_gain_years_window = loss_and_gain_gain_years_src.read(1, window=window)
-            except:
-                loss_and_gain_gain_years_window = np.zeros((window.height, window.width), dtype='uint8')
+            if loss_src is not None:
+                loss_window = loss_src.read(1, window=window)
+            else:
+                loss_window = np.zeros((window.height, window.width), dtype='uint8')
 
+            gain_year_count_window_out = gain_year_count_window(loss_window, gain_window, model_extent_window,
+                                                                loss_nodata, gain_src.nodata, model_extent_src.nodata,
+                                                                sensit_type)
 
-            gain_year_count_merged_window = loss_only_gain_years_window + gain_only_gain_years_window + \
-                                            no_change_gain_years_window + loss_and_gain_gain_years_window
+            gain_year_count_dst.write_band(1, gain_year_count_window_out, window=window)
 
-            gain_year_count_merged_dst.write_band(1, gain_year_count_merged_window, window=window)
+        gain_year_count_dst.close()
+        gain_src.close()
+        if loss_src is not None:
+            loss_src.close()
 
     # Prints information about the tile that was just processed
-    uu.end_of_fx_summary(start, tile_id, pattern)
\ No newline at end of file
+    uu.end_of_fx_summary(start, tile_id, pattern)
@@ -5,6 +5,22 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
+import tile_metadata
+import window_pipeline
+
+
+# Converts the annual removal rates of one window into gross removals
+def gross_removals_window(windows, window):
+
+    cumulative_gain_AGCO2_window = windows['gain_rate_AGC'] * windows['gain_year_count'] * cn.c_to_co2
+    cumulative_gain_BGCO2_window = windows['gain_rate_BGC'] * windows['gain_year_count'] * cn.c_to_co2
+    cumulative_gain_AGCO2_BGCO2_window = cumulative_gain_AGCO2_window + cumulative_gain_BGCO2_window
+
+    return {'AGCO2': cumulative_gain_AGCO2_window,
+            'BGCO2': cumulative_gain_BGCO2_window,
+            'AGCO2_BGCO2': cumulative_gain_AGCO2_BGCO2_window}
+
 
 # Calculates cumulative aboveground carbon dioxide gain in mangroves
 def gross_removals_all_forest_types(tile_id, output_pattern_list, sensit_type):
@@ -32,62 +48,35 @@ def gross_removals_all_forest_types(tile_id, output_pattern_list, sensit_type):
     # Grabs metadata for an input tile
     kwargs = gain_rate_AGC_src.meta
 
-    # Grabs the windows of the tile (stripes) to iterate over the entire tif without running out of memory
-    windows = gain_rate_AGC_src.block_windows(1)
-
     # Updates kwargs for the output dataset.
     kwargs.update(
         driver='GTiff',
         count=1,
-        compress='lzw',
         nodata=0
     )
+    raster_profile.update(kwargs)
 
     # The output files: aboveground gross removals, belowground gross removals, above+belowground gross removals. Adds metadata tags
     cumulative_gain_AGCO2_dst = rasterio.open(cumulative_gain_AGCO2, 'w', **kwargs)
-    uu.add_rasterio_tags(cumulative_gain_AGCO2_dst, sensit_type)
-    cumulative_gain_AGCO2_dst.update_tags(
-        units='megagrams aboveground CO2/ha over entire model period')
-    cumulative_gain_AGCO2_dst.update_tags(
-        source='annual removal factors and gain year count')
-    cumulative_gain_AGCO2_dst.update_tags(
-        extent='Full model extent')
+    tile_metadata.update_tags(cumulative_gain_AGCO2_dst, output_pattern_list[0], sensit_type)
 
     cumulative_gain_BGCO2_dst = rasterio.open(cumulative_gain_BGCO2, 'w', **kwargs)
-    uu.add_rasterio_tags(cumulative_gain_BGCO2_dst, sensit_type)
-    cumulative_gain_BGCO2_dst.update_tags(
-        units='megagrams belowground CO2/ha over entire model period')
-    cumulative_gain_BGCO2_dst.update_tags(
-        source='annual removal factors and gain year count')
-    cumulative_gain_BGCO2_dst.update_tags(
-        extent='Full model extent')
+    tile_metadata.update_tags(cumulative_gain_BGCO2_dst, output_pattern_list[1], sensit_type)
 
     cumulative_gain_AGCO2_BGCO2_dst = rasterio.open(cumulative_gain_AGCO2_BGCO2, 'w', **kwargs)
-    cumulative_gain_AGCO2_BGCO2_dst.update_tags(
-        units='megagrams aboveground+belowground CO2/ha over entire model period')
-    cumulative_gain_AGCO2_BGCO2_dst.update_tags(
-        source='annual removal factors and gain year count')
-    cumulative_gain_AGCO2_BGCO2_dst.update_tags(
-        extent='Full model extent')
-
-    # Iterates across the windows (1 pixel strips) of the input tiles
-    for idx, window in windows:
-
-        # Creates a processing window for each input raster
-        gain_rate_AGC_window = gain_rate_AGC_src.read(1, window=window)
-        gain_rate_BGC_window = gain_rate_BGC_src.read(1, window=window)
-        gain_year_count_window = gain_year_count_src.read(1, window=window)
-
-        # Converts the annual removal rate into gross removals
-        cumulative_gain_AGCO2_window = gain_rate_AGC_window * gain_year_count_window * cn.c_to_co2
-        cumulative_gain_BGCO2_window = gain_rate_BGC_window * gain_year_count_window * cn.c_to_co2
-        cumulative_gain_AGCO2_BGCO2_window = cumulative_gain_AGCO2_window + cumulative_gain_BGCO2_window
-
-        # Writes the output windows to the output files
-        cumulative_gain_AGCO2_dst.write_band(1, cumulative_gain_AGCO2_window, window=window)
-        cumulative_gain_BGCO2_dst.write_band(1, cumulative_gain_BGCO2_window, window=window)
-        cumulative_gain_AGCO2_BGCO2_dst.write_band(1, cumulative_gain_AGCO2_BGCO2_window, window=window)
-
+    tile_metadata.update_tags(cumulative_gain_AGCO2_BGCO2_dst, output_pattern_list[2], sensit_type)
+
+    # Reads, calculates and writes the windows of the tiles at the same time
+    srcs = {'gain_rate_AGC': gain_rate_AGC_src, 'gain_rate_BGC': gain_rate_BGC_src,
+            'gain_year_count': gain_year_count_src}
+    dsts = {'AGCO2': cumulative_gain_AGCO2_dst, 'BGCO2': cumulative_gain_BGCO2_dst,
+            'AGCO2_BGCO2': cumulative_gain_AGCO2_BGCO2_dst}
+    window_pipeline.run(gross_removals_window, srcs, dsts)
+
+    for src in srcs.values():
+        src.close()
+    for dst in dsts.values():
+        dst.close()
 
     # Prints information about the tile that was just processed
     uu.end_of_fx_summary(start, tile_id, output_pattern_list[0])
@@ -49,6 +49,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 
 def mp_US_removal_rates(sensit_type, tile_id_list, run_date):
 
@@ -91,8 +92,7 @@ def mp_US_removal_rates(sensit_type, tile_id_list, run_date):
 
 
     # Table with US-specific removal rates
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.table_US_removal_rate), cn.docker_base_dir]
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.table_US_removal_rate), cn.docker_base_dir)
 
 
     ### To make the removal factor dictionaries
@@ -175,20 +175,15 @@ def mp_US_removal_rates(sensit_type, tile_id_list, run_date):
     uu.print_log(stdev_table_group_region_dict)
 
 
-    if cn.count == 96:
-        processes = 68   # 68 processors (only 16 tiles though) = 310 GB peak
-    else:
-        processes = 24
-    uu.print_log('US natural forest AGC+BGC removal rate max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(US_removal_rates.US_removal_rate_calc,
-                     gain_table_group_region_age_dict=gain_table_group_region_age_dict,
-                     gain_table_group_region_dict=gain_table_group_region_dict,
-                     stdev_table_group_region_age_dict=stdev_table_group_region_age_dict,
-                     stdev_table_group_region_dict=stdev_table_group_region_dict,
-                     output_pattern_list=output_pattern_list), tile_id_list)
-    pool.close()
-    pool.join()
+    # Per-tile memory for the first run of the stage on a machine: 68 processors (only 16 tiles though) = 310 GB peak
+    # (about 20 GB per tile)
+    tile_scheduler.run(partial(US_removal_rates.US_removal_rate_calc,
+                               gain_table_group_region_age_dict=gain_table_group_region_age_dict,
+                               gain_table_group_region_dict=gain_table_group_region_dict,
+                               stdev_table_group_region_age_dict=stdev_table_group_region_age_dict,
+                               stdev_table_group_region_dict=stdev_table_group_region_dict,
+                               output_pattern_list=output_pattern_list),
+                       tile_id_list, 'annual_removals_US', memory_gb=20)
 
     # # For single processor use
     # for tile_id in tile_id_list:
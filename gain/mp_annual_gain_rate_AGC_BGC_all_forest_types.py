@@ -21,6 +21,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'gain'))
 import annual_gain_rate_AGC_BGC_all_forest_types
 
@@ -85,21 +86,15 @@ def mp_annual_gain_rate_AGC_BGC_all_forest_types(sensit_type, tile_id_list, run_
         output_dir_list = uu.replace_output_dir_date(output_dir_list, run_date)
 
 
-    # This configuration of the multiprocessing call is necessary for passing multiple arguments to the main function
-    # It is based on the example here: http://spencerimp.blogspot.com/2015/12/python-multiprocess-with-multiple.html
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 13
-        else:
-            processes = 17  # 30 processors > 740 GB peak; 18 = >740 GB peak; 16 = 660 GB peak; 17 = XXX GB peak
+    # Per-tile memory for the first run of the stage on a machine:
+    # 30 processors > 740 GB peak; 18 = >740 GB peak; 16 = 660 GB peak (about 42 GB per tile). biomass_swap used 13 processors.
+    if sensit_type == 'biomass_swap':
+        memory_gb = 55
     else:
-        processes = 2
-    uu.print_log('Removal factor processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(annual_gain_rate_AGC_BGC_all_forest_types.annual_gain_rate_AGC_BGC_all_forest_types,
-                     output_pattern_list=output_pattern_list, sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 42
+    tile_scheduler.run(partial(annual_gain_rate_AGC_BGC_all_forest_types.annual_gain_rate_AGC_BGC_all_forest_types,
+                               output_pattern_list=output_pattern_list, sensit_type=sensit_type),
+                       tile_id_list, 'annual_removal_factor_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
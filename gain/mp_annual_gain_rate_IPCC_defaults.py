@@ -26,6 +26,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'gain'))
 import annual_gain_rate_IPCC_defaults
 
@@ -78,8 +79,7 @@ def mp_annual_gain_rate_IPCC_defaults(sensit_type, tile_id_list, run_date = None
 
 
     # Table with IPCC Table 4.9 default gain rates
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
 
     ### To make the removal factor dictionaries
@@ -195,20 +195,12 @@ def mp_annual_gain_rate_IPCC_defaults(sensit_type, tile_id_list, run_date = None
 
     # This configuration of the multiprocessing call is necessary for passing multiple arguments to the main function
     # It is based on the example here: http://spencerimp.blogspot.com/2015/12/python-multiprocess-with-multiple.html
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 24 # 24 processors = 590 GB peak
-        else:
-            processes = 30  # 30 processors = 725 GB peak
-    else:
-        processes = 2
-    uu.print_log('Annual gain rate natural forest max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(annual_gain_rate_IPCC_defaults.annual_gain_rate, sensit_type=sensit_type,
-                     gain_table_dict=gain_table_dict, stdev_table_dict=stdev_table_dict,
-                     output_pattern_list=output_pattern_list), tile_id_list)
-    pool.close()
-    pool.join()
+    # Per-tile memory for the first run of the stage on a machine: 30 processors = 725 GB peak
+    # (about 25 GB per tile). biomass_swap: 24 processors = 590 GB peak (also about 25 GB per tile).
+    tile_scheduler.run(partial(annual_gain_rate_IPCC_defaults.annual_gain_rate, sensit_type=sensit_type,
+                               gain_table_dict=gain_table_dict, stdev_table_dict=stdev_table_dict,
+                               output_pattern_list=output_pattern_list),
+                       tile_id_list, 'annual_removals_IPCC_defaults_{}'.format(sensit_type), memory_gb=25)
 
     # # For single processor use
     # for tile_id in tile_id_list:
@@ -16,6 +16,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'gain'))
 import annual_gain_rate_mangrove
 
@@ -61,8 +62,7 @@ def mp_annual_gain_rate_mangrove(sensit_type, tile_id_list, run_date = None):
 
 
     # Table with IPCC Wetland Supplement Table 4.4 default mangrove gain rates
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
 
     ### To make the removal factor dictionaries
@@ -120,17 +120,11 @@ def mp_annual_gain_rate_mangrove(sensit_type, tile_id_list, run_date = None):
 
     # This configuration of the multiprocessing call is necessary for passing multiple arguments to the main function
     # It is based on the example here: http://spencerimp.blogspot.com/2015/12/python-multiprocess-with-multiple.html
-    # Ran with 18 processors on r4.16xlarge (430 GB memory peak)
-    if cn.count == 96:
-        processes = 20    #26 processors = >740 GB peak; 18 = 550 GB peak; 20 = 610 GB peak; 23 = 700 GB peak; 24 > 750 GB peak
-    else:
-        processes = 4
-    uu.print_log('Mangrove annual gain rate max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(annual_gain_rate_mangrove.annual_gain_rate, sensit_type=sensit_type, output_pattern_list=output_pattern_list,
-                     gain_above_dict=gain_above_dict, gain_below_dict=gain_below_dict, stdev_dict=stdev_dict), tile_id_list)
-    pool.close()
-    pool.join()
+    # Per-tile memory for the first run of the stage on a machine: 26 processors = >740 GB peak; 18 = 550 GB peak;
+    # 20 = 610 GB peak; 23 = 700 GB peak; 24 > 750 GB peak (about 31 GB per tile)
+    tile_scheduler.run(partial(annual_gain_rate_mangrove.annual_gain_rate, sensit_type=sensit_type, output_pattern_list=output_pattern_list,
+                               gain_above_dict=gain_above_dict, gain_below_dict=gain_below_dict, stdev_dict=stdev_dict),
+                       tile_id_list, 'annual_removals_mangrove_{}'.format(sensit_type), memory_gb=31)
 
     # # For single processor use
     # for tile in tile_id_list:
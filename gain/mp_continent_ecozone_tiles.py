@@ -45,10 +45,7 @@ def mp_continent_ecozone_tiles(tile_id_list, run_date = None):
 
     # Unzips ecozone shapefile
     cmd = ['unzip', cn.cont_eco_zip]
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+    uu.log_subprocess_output_full(cmd)
 
 
     # List of output directories and output file name patterns
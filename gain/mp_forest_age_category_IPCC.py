@@ -23,6 +23,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'gain'))
 import forest_age_category_IPCC
 
@@ -86,8 +87,7 @@ def mp_forest_age_category_IPCC(sensit_type, tile_id_list, run_date = None):
 
 
      # Table with IPCC Table 4.9 default gain rates
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-    uu.log_subprocess_output_full(cmd)
+    uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
 
     # Imports the table with the ecozone-continent codes and the carbon gain rates
@@ -109,21 +109,15 @@ def mp_forest_age_category_IPCC(sensit_type, tile_id_list, run_date = None):
 
     # This configuration of the multiprocessing call is necessary for passing multiple arguments to the main function
     # It is based on the example here: http://spencerimp.blogspot.com/2015/12/python-multiprocess-with-multiple.html
-    # With processes=30, peak usage was about 350 GB using WHRC AGB.
-    # processes=26 maxes out above 480 GB for biomass_swap, so better to use fewer than that.
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 32 # 32 processors = 610 GB peak
-        else:
-            processes = 42 # 30 processors=460 GB peak; 36 = 550 GB peak; 40 = XXX GB peak
+    # Per-tile memory for the first run of the stage on a machine: 30 processors = 460 GB peak; 36 = 550 GB peak
+    # (about 16 GB per tile). biomass_swap: 32 processors = 610 GB peak (about 19 GB per tile).
+    if sensit_type == 'biomass_swap':
+        memory_gb = 19
     else:
-        processes = 2
-    uu.print_log('Natural forest age category max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(forest_age_category_IPCC.forest_age_category, gain_table_dict=gain_table_dict,
-                     pattern=pattern, sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 16
+    tile_scheduler.run(partial(forest_age_category_IPCC.forest_age_category, gain_table_dict=gain_table_dict,
+                               pattern=pattern, sensit_type=sensit_type),
+                       tile_id_list, 'forest_age_category_IPCC_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
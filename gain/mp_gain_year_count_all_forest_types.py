@@ -1,12 +1,10 @@
 '''
 Creates tiles of the number of years in which carbon removals occur during the model duration (2001 to 2019 currently).
 It is based on the annual Hansen loss data and the 2000-2012 Hansen gain data.
-First it separately calculates rasters of gain years for model pixels that had loss only,
-gain only, neither loss nor gain, and both loss and gain.
-The gain years for each of these conditions are calculated according to rules that are found in the function called by the multiprocessor commands.
+It calculates gain years for model pixels that had loss only, gain only, neither loss nor gain, and both loss and gain
+in a single windowed pass over the loss, gain and model extent tiles, writing one gain year raster for each tile.
+The gain years for each of these conditions are calculated according to rules that are found in gain_year_count_window().
 The same gain year count rules are applied to all types of forest (mangrove, planted, etc.).
-Then it combines those four rasters into a single gain year raster for each tile using rasterio because
-summing the arrays using rasterio is faster and uses less memory than combining them with gdalmerge.
 If different input rasters for loss (e.g., 2001-2017) and gain (e.g., 2000-2018) are used, the year count constants in constants_and_names.py must be changed.
 '''
 
@@ -20,6 +18,7 @@ import gain_year_count_all_forest_types
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 
 def mp_gain_year_count_all_forest_types(sensit_type, tile_id_list, run_date = None):
 
@@ -75,98 +74,15 @@ def mp_gain_year_count_all_forest_types(sensit_type, tile_id_list, run_date = No
     # Creates a single filename pattern to pass to the multiprocessor call
     pattern = output_pattern_list[0]
 
-    # Creates gain year count tiles using only pixels that had only loss
-    # count/3 maxes out at about 300 GB
-    if cn.count == 96:
-        processes = 90   # 66 = 310 GB peak; 75 = 380 GB peak; 90 = 480 GB peak
-    else:
-        processes = int(cn.count/2)
-    uu.print_log('Gain year count loss only pixels max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_loss_only, sensit_type=sensit_type), tile_id_list)
-
-    if cn.count == 96:
-        processes = 90   # 66 = 330 GB peak; 75 = 380 GB peak; 90 = 530 GB peak
-    else:
-        processes = int(cn.count/2)
-    uu.print_log('Gain year count gain only pixels max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    if sensit_type == 'maxgain':
-        # Creates gain year count tiles using only pixels that had only gain
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_gain_only_maxgain, sensit_type=sensit_type), tile_id_list)
-    if sensit_type == 'legal_Amazon_loss':
-        uu.print_log("Gain-only pixels do not apply to legal_Amazon_loss sensitivity analysis. Skipping this step.")
-    else:
-        # Creates gain year count tiles using only pixels that had only gain
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_gain_only_standard, sensit_type=sensit_type), tile_id_list)
-
-    # Creates gain year count tiles using only pixels that had neither loss nor gain pixels
-    if cn.count == 96:
-        processes = 90   # 66 = 360 GB peak; 88 = 430 GB peak; 90 = 510 GB peak
-    else:
-        processes = int(cn.count/2)
-    uu.print_log('Gain year count no change pixels max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    if sensit_type == 'legal_Amazon_loss':
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_no_change_legal_Amazon_loss, sensit_type=sensit_type), tile_id_list)
-    else:
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_no_change_standard, sensit_type=sensit_type), tile_id_list)
-
-    if cn.count == 96:
-        processes = 90   # 66 = 370 GB peak; 88 = 430 GB peak; 90 = 550 GB peak
-    else:
-        processes = int(cn.count/2)
-    uu.print_log('Gain year count loss & gain pixels max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    if sensit_type == 'maxgain':
-        # Creates gain year count tiles using only pixels that had only gain
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_loss_and_gain_maxgain, sensit_type=sensit_type), tile_id_list)
-    else:
-        # Creates gain year count tiles using only pixels that had only gain
-        pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_loss_and_gain_standard, sensit_type=sensit_type), tile_id_list)
-
-    # Combines the four above gain year count tiles for each Hansen tile into a single output tile
-    if cn.count == 96:
-        processes = 84   # 28 processors = 220 GB peak; 62 = 470 GB peak; 78 = 600 GB peak; 80 = 620 GB peak; 84 = XXX GB peak
-    elif cn.count < 4:
-        processes = 1
-    else:
-        processes = int(cn.count/4)
-    uu.print_log('Gain year count gain merge all combos max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(gain_year_count_all_forest_types.create_gain_year_count_merge, pattern=pattern, sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
-
+    # Creates gain year count tiles for all combinations of loss and gain in a single pass over the inputs.
+    # Per-tile memory for the first run of the stage on a machine: the merge of the four separate combination tiles
+    # that this replaces used 80 processors = 620 GB peak (about 8 GB per tile).
+    tile_scheduler.run(partial(gain_year_count_all_forest_types.create_gain_year_count, pattern=pattern, sensit_type=sensit_type),
+                       tile_id_list, 'gain_year_count_{}'.format(sensit_type), memory_gb=8)
 
     # # For single processor use
     # for tile_id in tile_id_list:
-    #     gain_year_count_all_forest_types.create_gain_year_count_loss_only(tile_id)
-    #
-    # for tile_id in tile_id_list:
-    #     if sensit_type == 'maxgain':
-    #         gain_year_count_all_forest_types.create_gain_year_count_gain_only_maxgain(tile_id)
-    #     else:
-    #         gain_year_count_all_forest_types.create_gain_year_count_gain_only_standard(tile_id)
-    #
-    # for tile_id in tile_id_list:
-    #     gain_year_count_all_forest_types.create_gain_year_count_no_change_standard(tile_id)
-    #
-    # for tile_id in tile_id_list:
-    #     if sensit_type == 'maxgain':
-    #         gain_year_count_all_forest_types.create_gain_year_count_loss_and_gain_maxgain(tile_id)
-    #     else:
-    #         gain_year_count_all_forest_types.create_gain_year_count_loss_and_gain_standard(tile_id)
-    #
-    # for tile_id in tile_id_list:
-    #     gain_year_count_all_forest_types.create_gain_year_count_merge(tile_id, pattern, sensit_type)
-
-
-    # Intermediate output tiles for checking outputs
-    uu.upload_final_set(output_dir_list[0], "growth_years_loss_only")
-    uu.upload_final_set(output_dir_list[0], "growth_years_gain_only")
-    uu.upload_final_set(output_dir_list[0], "growth_years_no_change")
-    uu.upload_final_set(output_dir_list[0], "growth_years_loss_and_gain")
+    #     gain_year_count_all_forest_types.create_gain_year_count(tile_id, pattern, sensit_type)
 
     # This is the final output used later in the model
     uu.upload_final_set(output_dir_list[0], output_pattern_list[0])
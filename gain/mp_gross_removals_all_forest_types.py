@@ -16,6 +16,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_scheduler
 sys.path.append(os.path.join(cn.docker_app,'gain'))
 import gross_removals_all_forest_types
 
@@ -65,19 +66,15 @@ def mp_gross_removals_all_forest_types(sensit_type, tile_id_list, run_date = Non
 
 
     # Calculates gross removals
-    if cn.count == 96:
-        if sensit_type == 'biomass_swap':
-            processes = 18
-        else:
-            processes = 22   # 50 processors > 740 GB peak; 25 = >740 GB peak; 15 = 490 GB peak; 20 = 590 GB peak; 22 = XXX GB peak
+    # Per-tile memory for the first run of the stage on a machine: 50 processors > 740 GB peak; 25 = >740 GB peak;
+    # 15 = 490 GB peak; 20 = 590 GB peak (about 30 GB per tile)
+    if sensit_type == 'biomass_swap':
+        memory_gb = 37
     else:
-        processes = 2
-    uu.print_log('Gross removals max processors=', processes)
-    pool = multiprocessing.Pool(processes)
-    pool.map(partial(gross_removals_all_forest_types.gross_removals_all_forest_types, output_pattern_list=output_pattern_list,
-                     sensit_type=sensit_type), tile_id_list)
-    pool.close()
-    pool.join()
+        memory_gb = 30
+    tile_scheduler.run(partial(gross_removals_all_forest_types.gross_removals_all_forest_types, output_pattern_list=output_pattern_list,
+                               sensit_type=sensit_type),
+                       tile_id_list, 'gross_removals_{}'.format(sensit_type), memory_gb)
 
     # # For single processor use
     # for tile_id in tile_id_list:
@@ -0,0 +1,244 @@
+'''
+Batched shipping of the model log.
+All processes (the main process and its multiprocessing pool workers) log through a pipe to a single listener in the
+main process. The listener appends each record to the local log file as soon as it arrives.
+Each record is written to the pipe in one write of at most PIPE_BUF bytes, which the OS does atomically,
+so processes share the pipe without a lock: a worker killed while logging (e.g., by the OOM killer) can't leave
+a lock held or half a record in the pipe, and the other processes and the local log carry on.
+Records that don't fit in one atomic write, or that would block because the pipe is full, are appended to the local
+log directly instead.
+A shipper thread copies the local log to its destination (an s3 folder or a local folder)
+when enough time has passed or enough new bytes have been written since the last copy,
+and whenever ship() is called explicitly (e.g., at the end of a model stage or before an exception ends the model).
+This replaces copying the entire log to s3 after every single line.
+'''
+
+import logging
+import os
+import select
+import shutil
+import threading
+import time
+import atexit
+import constants_and_names as cn
+import s3_transfer
+
+# Format of each line in the log
+log_format = '%(levelname)s @ %(asctime)s: %(message)s'
+log_datefmt = '%Y/%m/%d %I:%M:%S %p'
+
+# State of the shipper. Only the process that started the shipper (the main process) ships the log.
+_owner_pid = None
+_log_path = None
+_log_dest = None
+_interval = None
+_size_threshold = None
+_read_fd = None
+_write_fd = None
+_log_file = None
+_listener_thread = None
+_read_lock = threading.Lock()
+_ship_lock = threading.Lock()
+_wake = threading.Event()
+_stopping = threading.Event()
+_shipped_bytes = 0
+_last_ship = 0
+
+
+# Appends bytes to the local log in one write. The file is opened for appending, so writes from different processes
+# don't overwrite each other.
+def _append(path, data):
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+# Writes each formatted record to the pipe that pool workers share with the main process.
+# The write end of the pipe is non-blocking, so a write either puts the whole record on the pipe or nothing.
+class _PipeHandler(logging.Handler):
+
+    def __init__(self, write_fd, log_path):
+        logging.Handler.__init__(self)
+        self.write_fd = write_fd
+        self.log_path = log_path
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + '\n').encode('utf-8')
+
+            if len(data) <= select.PIPE_BUF:
+                try:
+                    os.write(self.write_fd, data)
+                    return
+                except BlockingIOError:
+                    pass
+
+            _append(self.log_path, data)
+
+        except Exception:
+            self.handleError(record)
+
+
+# Moves everything on the pipe to the local log
+def _read_records():
+
+    with _read_lock:
+
+        if _read_fd is None:
+            return
+
+        while True:
+            try:
+                data = os.read(_read_fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            _log_file.write(data)
+
+        _log_file.flush()
+
+    if _pending_bytes() >= _size_threshold:
+        _wake.set()
+
+
+# Reads records from the pipe in a thread in the main process
+def _listener_loop():
+
+    while not _stopping.is_set():
+        select.select([_read_fd], [], [], 1)
+        _read_records()
+
+
+# Bytes written to the local log since the last copy, from the listener and from records appended directly
+def _pending_bytes():
+
+    try:
+        return os.path.getsize(_log_path) - _shipped_bytes
+    except OSError:
+        return 0
+
+
+# Copies the local log to the destination folder, which can be an s3 folder or a local folder (e.g., for tests).
+# s3 copies use cn.s3_endpoint_url if it is set, so the log can be shipped to a local s3-compatible endpoint.
+def _copy_log(log_path, log_dest):
+
+    if log_dest.startswith('s3://'):
+        s3_transfer.upload_file(log_path, log_dest)
+
+    else:
+        if not os.path.exists(log_dest):
+            os.makedirs(log_dest)
+        shutil.copy(log_path, log_dest)
+
+
+# Ships the log if anything has been written since the last copy.
+# With force=False, it only ships if the time or size threshold has been reached.
+def ship(force=True):
+    global _shipped_bytes, _last_ship
+
+    # Pool workers don't ship the log. The main process ships everything they logged.
+    if _owner_pid != os.getpid():
+        return
+
+    with _ship_lock:
+
+        pending = _pending_bytes()
+
+        if pending <= 0:
+            return
+
+        if not force and pending < _size_threshold and time.time() - _last_ship < _interval:
+            return
+
+        _last_ship = time.time()
+
+        try:
+            _copy_log(_log_path, _log_dest)
+        except Exception as e:
+            # A failed copy shouldn't stop the model. The bytes still count as new, so the next copy is tried
+            # after the interval rather than after another size threshold of log.
+            print("LOG: Could not copy log to {0}: {1}".format(_log_dest, e))
+            return
+
+        _shipped_bytes += pending
+
+
+# Background loop that ships the log when the time or size threshold is reached
+def _shipper_loop():
+
+    while not _stopping.is_set():
+        _wake.wait(timeout=min(_interval, 5))
+        _wake.clear()
+        ship(force=False)
+
+
+# Writes every record already on the pipe to the local log
+def drain():
+
+    if _owner_pid != os.getpid():
+        return
+
+    _read_records()
+
+
+# Routes all logging through the pipe to a single local log file and starts shipping that file to log_dest.
+# Must be called in the main process before any pool is created so that the workers inherit the pipe handler.
+def start(log_path, log_dest, interval=None, size_threshold=None):
+    global _owner_pid, _log_path, _log_dest, _interval, _size_threshold, _read_fd, _write_fd, _log_file, \
+        _listener_thread, _shipped_bytes, _last_ship
+
+    # The shipper is only started once per model run (e.g., run_full_model and the stage scripts both initiate the log)
+    if _owner_pid == os.getpid():
+        return
+
+    _log_path = log_path
+    _log_dest = log_dest
+    _interval = interval if interval is not None else cn.log_upload_interval
+    _size_threshold = size_threshold if size_threshold is not None else cn.log_upload_bytes
+    _last_ship = time.time()
+
+    _log_file = open(log_path, 'ab')
+    _shipped_bytes = os.path.getsize(log_path)
+
+    _read_fd, _write_fd = os.pipe()
+    os.set_blocking(_read_fd, False)
+    os.set_blocking(_write_fd, False)
+
+    pipe_handler = _PipeHandler(_write_fd, log_path)
+    pipe_handler.setFormatter(logging.Formatter(log_format, datefmt=log_datefmt))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(pipe_handler)
+    root.setLevel(logging.INFO)
+
+    _owner_pid = os.getpid()
+
+    _stopping.clear()
+    _listener_thread = threading.Thread(target=_listener_loop, name='log_listener', daemon=True)
+    _listener_thread.start()
+    threading.Thread(target=_shipper_loop, name='log_shipper', daemon=True).start()
+
+    atexit.register(stop)
+
+
+# Writes out everything on the pipe, ships the log one last time, and stops the background threads
+def stop():
+    global _listener_thread
+
+    if _owner_pid != os.getpid() or _listener_thread is None:
+        return
+
+    _stopping.set()
+    _wake.set()
+    _listener_thread.join()
+    _listener_thread = None
+
+    _read_records()
+
+    ship(force=True)
@@ -0,0 +1,275 @@
+'''
+Incremental update of the model for a new year of tree cover loss (run_full_model.py --loss-year-update true).
+Adding a year of loss used to mean running every stage again on every tile. Instead, the previous model version's
+outputs are reused where the new loss can't change them. By how they depend on loss, stages are (loss_dependence()):
+1. Independent of loss: stages that don't read loss or the outputs of stages that do (e.g., model extent).
+   They aren't run; their outputs are copied forward from the previous version.
+2. Dependent on loss pixels: stages that read loss or the outputs of such stages, but not the number of loss years
+   (e.g., forest age category and the removal factors from it). They are only run on tiles where the previous and
+   current loss tiles differ; the outputs of the other tiles are copied forward.
+3. Dependent on loss years: stages declared with uses_loss_years (gain year count, gross emissions, aggregation) and
+   the stages downstream of them (gross removals, carbon pools, net flux, supplementary outputs).
+   Every pixel gets another year of removals and every loss pixel another year since loss, so these outputs change
+   everywhere and are run on all tiles.
+Tiles and blocks where loss changed are found by comparing the previous (cn.previous_loss_dir) and current
+(cn.loss_dir) loss tiles window by window. They are recorded in a SQLite file in cn.docker_tmp, so they are only
+compared once. Loss that was revised in earlier years counts as changed, too.
+Stages are rerun on whole tiles, not on the changed blocks. This is deliberate: the stage scripts write whole tiles,
+so rerunning only some blocks would mean merging their outputs into the previous version's tiles, and the stages
+that depend on loss years change every block anyway. The changed blocks are recorded for the log and for this
+script's listing, not to limit what is recalculated.
+Outputs are copied forward on s3 from the previous version's folders (in constants_and_names) to the folders with
+the run date. Without a run date, outputs are updated in place, so nothing needs to be copied.
+benchmarks/offline_model_run.py --loss-year-update checks that the update gives the same tiles as running
+the model from the start with the current loss.
+Running this script prints the tiles and blocks with changed loss that were recorded.
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import numpy as np
+import rasterio
+import constants_and_names as cn
+import universal_util as uu
+import s3_transfer
+import stage_graph
+import tile_layout
+import tile_manifest
+import tile_scheduler
+
+# Working folder subfolder for the previous version's loss tiles, which can have the same names as the current ones
+previous_loss_folder = 'previous_loss'
+
+
+# Opens the database of loss changes, creating its table if it doesn't exist.
+# changed_blocks is a JSON list of the [col, row, width, height] windows with changed loss.
+def _connect():
+
+    if not os.path.exists(cn.docker_tmp):
+        os.makedirs(cn.docker_tmp, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.docker_tmp, cn.loss_update_db), timeout=120)
+    connection.execute('CREATE TABLE IF NOT EXISTS loss_changes (previous_dir TEXT, current_dir TEXT, tile_id TEXT, '
+                       'blocks INTEGER, changed_blocks TEXT, changed_pixels INTEGER, '
+                       'PRIMARY KEY (previous_dir, current_dir, tile_id))')
+
+    return connection
+
+
+# Previous and current loss tiles of a tile, in the working folder
+def _loss_tiles(tile_id):
+
+    previous = os.path.join(previous_loss_folder, '{0}_{1}.tif'.format(cn.previous_pattern_loss, tile_id))
+    current = '{0}_{1}.tif'.format(cn.pattern_loss, tile_id)
+
+    return previous, current
+
+
+# Compares the previous and current loss tiles of a tile window by window and records the windows where they differ.
+# A tile that only one version has changed wherever that version has loss.
+def compare_loss_tiles(tile_id):
+
+    previous, current = _loss_tiles(tile_id)
+
+    srcs = [rasterio.open(tile) if os.path.exists(tile) else None for tile in [previous, current]]
+    reference = srcs[1] if srcs[1] is not None else srcs[0]
+
+    blocks = 0
+    changed_blocks = []
+    changed_pixels = 0
+
+    if reference is not None:
+
+        for idx, window in tile_layout.windows(reference):
+
+            previous_window, current_window = [src.read(1, window=window) if src is not None else 0 for src in srcs]
+            changed = np.count_nonzero(np.not_equal(previous_window, current_window))
+
+            blocks += 1
+            if changed:
+                changed_blocks.append([window.col_off, window.row_off, window.width, window.height])
+                changed_pixels += changed
+
+    for src in srcs:
+        if src is not None:
+            src.close()
+
+    uu.print_log("  {0}: loss changed in {1} of {2} blocks ({3} pixels)".format(tile_id, len(changed_blocks), blocks, changed_pixels))
+
+    connection = _connect()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO loss_changes VALUES (?, ?, ?, ?, ?, ?)',
+                           (cn.previous_loss_dir, cn.loss_dir, tile_id, blocks, json.dumps(changed_blocks), changed_pixels))
+    connection.close()
+
+
+# Recorded loss changes of the tiles between the previous and current loss folders, as
+# {tile_id: (blocks, changed blocks, changed pixels)}
+def recorded_changes(tile_ids=None):
+
+    connection = _connect()
+    rows = connection.execute('SELECT tile_id, blocks, changed_blocks, changed_pixels FROM loss_changes '
+                              'WHERE previous_dir = ? AND current_dir = ?', (cn.previous_loss_dir, cn.loss_dir)).fetchall()
+    connection.close()
+
+    return dict((tile_id, (blocks, json.loads(changed_blocks), changed_pixels)) for tile_id, blocks, changed_blocks, changed_pixels in rows
+                if tile_ids is None or tile_id in tile_ids)
+
+
+# Finds the tiles and blocks where loss changed between the previous and current loss tiles.
+# Tiles that were already compared aren't compared again. Returns the changes of the tiles, as recorded_changes() does.
+def detect_changes(tile_id_list):
+
+    tile_ids = tile_manifest.union([cn.previous_loss_dir, cn.loss_dir])
+    if tile_id_list != 'all':
+        tile_ids = [tile_id for tile_id in tile_ids if tile_id in tile_id_list]
+
+    to_compare = [tile_id for tile_id in tile_ids if tile_id not in recorded_changes(tile_ids)]
+
+    uu.print_log("Comparing previous ({0}) and current ({1}) loss in {2} tiles".format(cn.previous_loss_dir, cn.loss_dir, len(to_compare)))
+
+    if to_compare:
+
+        if not os.path.exists(previous_loss_folder):
+            os.mkdir(previous_loss_folder)
+
+        uu.s3_flexible_download(cn.loss_dir, cn.pattern_loss, cn.docker_base_dir, 'std', to_compare)
+        uu.s3_copy(cn.previous_loss_dir, previous_loss_folder, recursive=True, exclude=['*'],
+                   include=['{0}_{1}.tif'.format(cn.previous_pattern_loss, tile_id) for tile_id in to_compare])
+
+        tile_scheduler.run(compare_loss_tiles, to_compare, 'loss_year_changes', memory_gb=1)
+
+        shutil.rmtree(previous_loss_folder)
+
+    changes = recorded_changes(tile_ids)
+
+    missing = [tile_id for tile_id in tile_ids if tile_id not in changes]
+    if missing:
+        uu.exception_log("Loss wasn't compared for", missing)
+
+    return changes
+
+
+# How each stage of the graph depends on loss for the model run: 'none', 'pixels' or 'years' (see above).
+# Stages that read a sensitivity analysis's own loss (e.g., Brazil loss) count as 'years', because only the Hansen
+# loss tiles are compared.
+def loss_dependence(graph, args):
+
+    dependence = {}
+    pattern_dependence = {cn.pattern_loss: 'pixels'}
+    order = ['none', 'pixels', 'years']
+
+    for stage in graph:
+
+        inputs = stage.input_list(args)
+        level = 'years' if stage.uses_loss_years else 'none'
+
+        raw_patterns = [pattern for s3_dir, pattern in (stage.inputs(args) if callable(stage.inputs) else stage.inputs)]
+        if cn.pattern_loss in raw_patterns and (cn.loss_dir, cn.pattern_loss) not in inputs:
+            level = 'years'
+
+        for s3_dir, pattern in inputs:
+            input_level = pattern_dependence.get(pattern, 'none')
+            if order.index(input_level) > order.index(level):
+                level = input_level
+
+        dependence[stage.name] = level
+        for s3_dir, pattern in stage.output_list(args):
+            pattern_dependence[pattern] = level
+
+    return dependence
+
+
+# Copies the previous version's output tiles of a stage for the tiles to the output folders of the run.
+# Without a run date, the outputs are in the previous version's folders already.
+def copy_forward(stage, args, tile_ids):
+
+    if not args['run_date']:
+        return
+
+    outputs = stage.output_list(args)
+    new_dirs = uu.replace_output_dir_date([s3_dir for s3_dir, pattern in outputs], args['run_date'])
+
+    pairs = []
+    for (s3_dir, pattern), new_dir in zip(outputs, new_dirs):
+        if new_dir == s3_dir:
+            continue
+        for name, tile_id, size, etag, mtime in tile_manifest.tiles(s3_dir, pattern):
+            if tile_id in tile_ids:
+                pairs.append((s3_dir + name, new_dir + name))
+
+    if not pairs:
+        return
+
+    uu.print_log("Copying forward {0} tiles of {1} from the previous version".format(len(pairs), stage.name))
+    uu.print_transfer_summary("Copied", s3_transfer.copy_objects(pairs))
+
+    for new_dir in set(new_dirs):
+        tile_manifest.invalidate(new_dir)
+
+
+# Tiles of the previous version's outputs of a stage (within the tile list)
+def _output_tiles(stage, args):
+
+    tile_ids = tile_manifest.union([s3_dir for s3_dir, pattern in stage.output_list(args)])
+
+    if args['tile_id_list'] == 'all':
+        return tile_ids
+
+    return [tile_id for tile_id in tile_ids if tile_id in args['tile_id_list']]
+
+
+# Runs the named stages of the graph as an incremental update for new loss: stages independent of loss are copied
+# forward, stages dependent on loss pixels are run only on tiles with changed loss (and copied forward for the
+# other tiles), and stages dependent on the number of loss years are run on all tiles.
+def run(graph, stage_names, args, resume=True):
+
+    uu.print_log(":::::Incremental update from the loss in {0} to the loss in {1}".format(cn.previous_loss_dir, cn.loss_dir))
+
+    changes = detect_changes(args['tile_id_list'])
+    changed_tiles = sorted(tile_id for tile_id, (blocks, changed_blocks, changed_pixels) in changes.items() if changed_blocks)
+
+    total_blocks = sum(blocks for blocks, changed_blocks, changed_pixels in changes.values())
+    changed_block_count = sum(len(changed_blocks) for blocks, changed_blocks, changed_pixels in changes.values())
+    uu.print_log("Loss changed in {0} of {1} tiles and {2} of {3} blocks".format(
+        len(changed_tiles), len(changes), changed_block_count, total_blocks))
+
+    dependence = loss_dependence(graph, args)
+
+    stage_tiles = {}
+    for stage in graph:
+
+        if stage.name not in stage_names or not stage.runs_for(args['sensit_type']):
+            continue
+
+        if dependence[stage.name] == 'none':
+            uu.print_log("  {} doesn't depend on loss. Copying its outputs forward.".format(stage.name))
+            copy_forward(stage, args, _output_tiles(stage, args))
+            stage_tiles[stage.name] = []
+
+        elif dependence[stage.name] == 'pixels':
+            uu.print_log("  {0} depends on loss pixels. Running it on the {1} tiles with changed loss.".format(stage.name, len(changed_tiles)))
+            copy_forward(stage, args, [tile_id for tile_id in _output_tiles(stage, args) if tile_id not in changed_tiles])
+            stage_tiles[stage.name] = changed_tiles
+
+        else:
+            uu.print_log("  {} depends on the number of loss years. Running it on all tiles.".format(stage.name))
+
+    stage_graph.run(graph, stage_names, args, resume=resume, stage_tiles=stage_tiles)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Print the tiles and blocks with changed loss recorded for the incremental update')
+    parser.add_argument('--all-tiles', action='store_true', help='Also list tiles without changed loss')
+    args = parser.parse_args()
+
+    changes = recorded_changes()
+    uu.print_log("Loss changes from {0} to {1}:".format(cn.previous_loss_dir, cn.loss_dir))
+    for tile_id in sorted(changes):
+        blocks, changed_blocks, changed_pixels = changes[tile_id]
+        if changed_blocks or args.all_tiles:
+            uu.print_log("  {0}: {1} of {2} blocks, {3} pixels".format(tile_id, len(changed_blocks), blocks, changed_pixels))
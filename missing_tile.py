@@ -0,0 +1,105 @@
+'''
+Stand-ins for input tiles that don't exist for a 10x10 (e.g., no peat or no plantations in a tile).
+Python readers use open_tile(), which gives a MissingTile for a missing file. A MissingTile returns windows of 0s
+without reading or writing anything.
+Programs outside Python (e.g., the C++ gross emissions scripts) need an actual file, so write_blank_tile() writes a
+sparse GeoTIFF with the tile's extent and resolution. None of its blocks are written, so it is a few kB instead of
+a 40000x40000 raster of 0s, and GDAL reads every pixel as 0.
+'''
+
+import os
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+import constants_and_names as cn
+import raster_profile
+
+
+# Top left corner of a tile (e.g., 00N_110E is (110, 0))
+def tile_origin(tile_id):
+
+    lat, lon = tile_id.split('_')
+
+    ymax = int(lat[:2]) * (-1 if lat[-1] == 'S' else 1)
+    xmin = int(lon[:3]) * (-1 if lon[-1] == 'W' else 1)
+
+    return xmin, ymax
+
+
+# Rasterio creation arguments for a tile of the given data type with the extent and resolution of the Hansen tiles
+def tile_profile(tile_id, dtype='uint8'):
+
+    xmin, ymax = tile_origin(tile_id)
+
+    return {
+        'driver': 'GTiff',
+        'width': int(cn.tile_width),
+        'height': int(cn.tile_height),
+        'count': 1,
+        'dtype': dtype,
+        'crs': 'EPSG:4326',
+        'transform': from_origin(xmin, ymax, cn.Hansen_res, cn.Hansen_res),
+        'nodata': None
+    }
+
+
+# Read-only stand-in for a rasterio dataset of a tile that doesn't exist. Every window is 0.
+class MissingTile(object):
+
+    def __init__(self, path, tile_id, dtype='uint8'):
+
+        self.name = path
+        self.meta = tile_profile(tile_id, dtype)
+        self.profile = self.meta
+        self.width = self.meta['width']
+        self.height = self.meta['height']
+        self.count = 1
+        self.dtypes = (dtype,)
+        self.nodata = None
+        self.crs = self.meta['crs']
+        self.transform = self.meta['transform']
+
+    def read(self, indexes=1, window=None, out=None):
+
+        if window is None:
+            shape = (self.height, self.width)
+        else:
+            if not isinstance(window, Window):
+                window = Window.from_slices(*window, height=self.height, width=self.width)
+            shape = (int(window.height), int(window.width))
+
+        if out is not None:
+            out.fill(0)
+            return out
+
+        return np.zeros(shape, dtype=self.dtypes[0])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Opens a tile with rasterio, or gives a MissingTile if the tile doesn't exist
+def open_tile(path, tile_id, dtype='uint8'):
+
+    if os.path.exists(path):
+        return rasterio.open(path)
+
+    return MissingTile(path, tile_id, dtype)
+
+
+# Writes a sparse GeoTIFF of 0s for a tile: the tile's extent and resolution, but no pixel blocks
+def write_blank_tile(path, tile_id, dtype='uint8'):
+
+    profile = tile_profile(tile_id, dtype)
+    profile.update(sparse_ok=True)
+    raster_profile.update(profile, 'scratch')
+
+    with rasterio.open(path, 'w', **profile):
+        pass
@@ -0,0 +1,110 @@
+'''
+Area of the 0.00025x0.00025 degree pixels of a tile, calculated from the tile's coordinates instead of read from the
+pixel area tiles in cn.pixel_area_dir.
+Pixel area depends only on latitude, so each row of a tile has one area. The area of a row is the area of the
+WGS84 ellipsoid between the row's northern and southern edges, times the fraction of the circle the pixel spans
+(0.00025/360), in m2. This is how the pixel area tiles were made, so areas should match those tiles to float32
+precision. validate() compares the calculated areas with a pixel area tile and fails if any pixel differs by
+more than cn.pixel_area_tolerance (relative).
+The calculated areas haven't been compared with the pixel area tiles yet, so read_window() reads the tiles unless
+cn.pixel_area_calculated is on. Turn it on once python pixel_area.py -l has passed for tiles across latitudes
+(e.g., 70N_020E,40N_090W,00N_000E,50S_070W), and record the largest relative difference here.
+'''
+
+import argparse
+import functools
+import os
+import numpy as np
+import rasterio
+import constants_and_names as cn
+import universal_util as uu
+import tile_layout
+
+# WGS84 semi-major and semi-minor axes, in m
+a = 6378137.0
+b = 6356752.3142
+
+
+# Area (m2) between the equator and each latitude, for a 360 degree band of the ellipsoid
+def _area_to_latitude(lat):
+
+    e = np.sqrt(1 - (b / a) ** 2)
+    sin_lat = np.sin(np.radians(lat))
+    zm = 1 - e * sin_lat
+    zp = 1 + e * sin_lat
+
+    return np.pi * b ** 2 * (np.log(zp / zm) / (2 * e) + sin_lat / (zp * zm))
+
+
+# Area (m2) of each row of pixels of a tile, from north to south
+@functools.lru_cache(maxsize=16)
+def tile_rows(tile_id, res=cn.Hansen_res, height=int(cn.tile_height)):
+
+    xmin, ymin, xmax, ymax = uu.coords(tile_id)
+
+    edges = ymax - np.arange(height + 1, dtype='float64') * res
+    areas = res / 360.0 * (_area_to_latitude(edges[:-1]) - _area_to_latitude(edges[1:]))
+    areas = areas.astype('float32')
+    areas.flags.writeable = False
+
+    return areas
+
+
+# Calculated pixel areas (m2) for a window of a tile, with the window's shape.
+# The array is a read-only view of the row areas, so it takes no more memory than one column.
+def calculate_window(tile_id, window):
+
+    rows = tile_rows(tile_id)[int(window.row_off):int(window.row_off + window.height)]
+
+    return np.broadcast_to(rows[:, np.newaxis], (int(window.height), int(window.width)))
+
+
+# Pixel areas (m2) for a window of a tile: calculated if cn.pixel_area_calculated is on, otherwise read from the
+# tile's pixel area tile in the working folder
+def read_window(tile_id, window):
+
+    if cn.pixel_area_calculated:
+        return calculate_window(tile_id, window)
+
+    with rasterio.open('{0}_{1}.tif'.format(cn.pattern_pixel_area, tile_id)) as src:
+        return src.read(1, window=window)
+
+
+# Compares the calculated pixel areas with a pixel area tile and raises an exception if they differ by more than
+# cn.pixel_area_tolerance (relative). Returns the largest relative difference.
+def validate(tile_id, pixel_area_tile):
+
+    largest_difference = 0
+
+    with rasterio.open(pixel_area_tile) as src:
+        for idx, window in tile_layout.windows(src):
+            tile_areas = src.read(1, window=window).astype('float64')
+            difference = np.abs(calculate_window(tile_id, window) - tile_areas) / tile_areas
+            largest_difference = max(largest_difference, float(difference.max()))
+
+    uu.print_log("Largest relative difference between calculated and tile pixel areas for {0}: {1:.2e}".format(
+        tile_id, largest_difference))
+
+    if largest_difference > cn.pixel_area_tolerance:
+        uu.exception_log("Calculated pixel areas for {0} differ from {1} by up to {2:.2e} (tolerance {3:.0e})".format(
+            tile_id, pixel_area_tile, largest_difference, cn.pixel_area_tolerance))
+
+    return largest_difference
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Compare calculated pixel areas with the pixel area tiles')
+    parser.add_argument('--tile_id_list', '-l', required=True,
+                        help='List of tile ids to compare. Format is 00N_000E,00N_010E')
+    args = parser.parse_args()
+
+    uu.initiate_log(args.tile_id_list)
+    os.chdir(cn.docker_base_dir)
+
+    tile_id_list = uu.tile_id_list_check(args.tile_id_list)
+    uu.s3_flexible_download(cn.pixel_area_dir, cn.pattern_pixel_area, cn.docker_base_dir, 'std', tile_id_list)
+
+    for tile_id in tile_id_list:
+        validate(tile_id, '{0}_{1}.tif'.format(cn.pattern_pixel_area, tile_id))
@@ -0,0 +1,236 @@
+'''
+Compression of the tiles the model writes. Every writer used to hardcode LZW, and the outputs uploaded for the public
+were plain GeoTIFFs without overviews.
+Writers now select a profile from cn.raster_profiles:
+'scratch' for tiles that are only used in the working folder (fast compression), 'archive' for tiles that are uploaded
+to s3 (ZSTD with a predictor: horizontal differencing for integers, floating point prediction for floats), and
+'published' for the outputs that people download, which are converted to Cloud-Optimized GeoTIFFs (COGs) with
+overviews right before they are uploaded (uu.upload_final_set converts outputs that match cn.published_patterns).
+rasterio writers add profile() or update() to their creation arguments and GDAL command line tools add gdal_options().
+Both include the tile layout (tile_layout.py).
+COGs are written with the GTiff driver (internal overviews copied with COPY_SRC_OVERVIEWS), since the COG driver
+needs GDAL 3.1 and the Docker image has GDAL 3.0.
+Running this script writes synthetic float32 and uint8 tiles with LZW and with each profile and prints the
+encode and decode throughput and the size on disk of each.
+'''
+
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+import constants_and_names as cn
+import universal_util as uu
+import tile_layout
+import tile_scheduler
+
+
+# Whether a data type is floating point. Works for numpy (float32) and GDAL (Float32) names of data types.
+def _floating(dtype):
+
+    return 'float' in str(dtype).lower()
+
+
+# GDAL creation options of a compression profile, as (option, value) pairs.
+# The predictor needs the data type; if it isn't known, horizontal differencing is used, which works for all types.
+def _compression(kind, dtype):
+
+    settings = cn.raster_profiles[kind]
+    compress = settings['compress'].upper()
+
+    options = [('COMPRESS', compress)]
+
+    if compress == 'ZSTD':
+        options.append(('ZSTD_LEVEL', settings['level']))
+    elif compress == 'DEFLATE':
+        options.append(('ZLEVEL', settings['level']))
+
+    if settings['predictor'] and compress != 'NONE':
+        options.append(('PREDICTOR', 3 if _floating(dtype) else 2))
+
+    return options
+
+
+# Creation arguments for rasterio writers for a compression profile and the tile layout
+def profile(kind='archive', dtype=None, block_size=None):
+
+    kwargs = dict((option.lower(), value) for option, value in _compression(kind, dtype))
+    kwargs.update(tile_layout.profile(block_size))
+
+    return kwargs
+
+
+# Adds the creation arguments of a compression profile for the data type in the arguments (e.g., src.meta)
+def update(kwargs, kind='archive'):
+
+    kwargs.update(profile(kind, kwargs.get('dtype')))
+
+    return kwargs
+
+
+# GDAL creation options (-co) for a compression profile and the tile layout, e.g., for gdal.Warp(creationOptions=...)
+def creation_options(kind='archive', dtype=None, block_size=None):
+
+    options = ['{0}={1}'.format(option, value) for option, value in _compression(kind, dtype)]
+
+    return options + tile_layout.creation_options(block_size)
+
+
+# GDAL command line creation options for a compression profile and the tile layout.
+# dtype is the output data type (e.g., the -ot argument). Most GDAL programs take -co; gdal_calc.py takes --co.
+# block_size=False leaves out the tile layout, for outputs whose block size is given separately or that aren't tiles.
+def gdal_options(kind='archive', dtype=None, flag='-co', block_size=None):
+
+    options = []
+    for option in creation_options(kind, dtype, block_size):
+        options.extend([flag, option])
+
+    return options
+
+
+# Whether outputs with a pattern are published (converted to COGs before they are uploaded).
+# Patterns of sensitivity analyses and aggregated outputs contain the pattern of the standard output.
+def published(pattern):
+
+    return any(published_pattern in pattern for published_pattern in cn.published_patterns)
+
+
+# Overview factors for a COG: halves the resolution until the whole raster fits in one block
+def overview_factors(width, height, block_size=None):
+
+    if block_size is None:
+        block_size = cn.cog_block_size
+
+    factors = []
+    factor = 2
+    while max(width, height) * 2 / factor > block_size:
+        factors.append(factor)
+        factor *= 2
+
+    return factors
+
+
+# Converts a tile to a Cloud-Optimized GeoTIFF with the 'published' profile, replacing it.
+# Overviews are added to a copy of the tile, which is then copied with them, so that they come before the full
+# resolution blocks. The tile itself is never opened for writing, so a tile that is a link to another file (e.g.,
+# in the tile cache) can't change that file. Tags (metadata) are kept.
+def to_cog(path):
+
+    with_overviews = '{}.ovr_tmp'.format(path)
+    shutil.copyfile(path, with_overviews)
+
+    with rasterio.open(with_overviews, 'r+') as src:
+        dtype = src.dtypes[0]
+        factors = overview_factors(src.width, src.height)
+        if factors:
+            src.build_overviews(factors, Resampling[cn.cog_overview_resampling])
+
+    cog = '{}.cog'.format(path)
+    rasterio.shutil.copy(with_overviews, cog, driver='GTiff', copy_src_overviews=True,
+                         **profile('published', dtype, cn.cog_block_size))
+    os.remove(with_overviews)
+    os.replace(cog, path)
+
+
+# Converts the output tiles in the working folder with the pattern to COGs
+def publish(pattern):
+
+    tiles = sorted(glob.glob(os.path.join(cn.docker_base_dir, '*{}*tif'.format(pattern))))
+
+    if not tiles:
+        return
+
+    uu.print_log("Converting {0} tiles with pattern {1} to Cloud-Optimized GeoTIFFs".format(len(tiles), pattern))
+    tile_scheduler.run(to_cog, tiles, 'cog', 2)
+
+
+# Synthetic tile that compresses about like a model output.
+# float32 tiles are smooth values in patches (e.g., carbon densities); integer tiles are categories in patches with
+# scattered single pixels (e.g., loss years).
+def synthetic_tile(size, dtype, seed=1):
+
+    if _floating(dtype):
+        return tile_layout.synthetic_tile(size, dtype, seed)
+
+    rng = np.random.RandomState(seed)
+
+    coarse = rng.randint(0, 20, (size // 100 + 2, size // 100 + 2))
+    rows = np.arange(size) // 100
+    values = coarse[rows][:, rows]
+    values[values > 12] = 0
+    scattered = rng.random_sample((size, size)) < 0.02
+    values[scattered] = rng.randint(1, 20, int(scattered.sum()))
+
+    return values.astype(dtype)
+
+
+# Writes synthetic tiles of each data type with LZW (the previous compression) and with each profile,
+# and reads them back. Returns (data type, profile, encode seconds, decode seconds, MB on disk).
+def benchmark(size=8000, dtypes=None, kinds=None):
+
+    if dtypes is None:
+        dtypes = ['float32', 'uint8']
+    if kinds is None:
+        kinds = ['lzw'] + list(cn.raster_profiles)
+
+    folder = tempfile.mkdtemp()
+    results = []
+
+    try:
+        for dtype in dtypes:
+
+            data = synthetic_tile(size, dtype)
+            megabytes = data.nbytes / 1024 ** 2
+
+            for kind in kinds:
+
+                if kind == 'lzw':
+                    options = dict(compress='lzw', **tile_layout.profile())
+                else:
+                    options = profile(kind, dtype)
+
+                path = os.path.join(folder, 'benchmark_{0}_{1}.tif'.format(dtype, kind))
+
+                # Writes the tile a window at a time, the way the model does
+                start = time.time()
+                with rasterio.open(path, 'w', driver='GTiff', width=size, height=size, count=1, dtype=dtype,
+                                   crs='EPSG:4326', transform=from_origin(0, 0, cn.Hansen_res, cn.Hansen_res),
+                                   nodata=0, **options) as dst:
+                    for idx, window in tile_layout.windows(dst):
+                        dst.write_band(1, data[window.toslices()], window=window)
+                encode_seconds = time.time() - start
+                disk_megabytes = os.path.getsize(path) / 1024 ** 2
+
+                start = time.time()
+                with rasterio.open(path) as src:
+                    for idx, window in tile_layout.windows(src):
+                        src.read(1, window=window)
+                decode_seconds = time.time() - start
+
+                results.append((dtype, kind, encode_seconds, decode_seconds, disk_megabytes))
+                uu.print_log("{0} {1}: encode {2:.0f} MB/s, decode {3:.0f} MB/s, {4:.1f} MB on disk ({5:.1f}x smaller)".format(
+                    dtype, kind, megabytes / encode_seconds, megabytes / decode_seconds, disk_megabytes,
+                    megabytes / disk_megabytes))
+    finally:
+        shutil.rmtree(folder)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark encode and decode throughput and size of compression profiles on synthetic tiles')
+    parser.add_argument('--size', '-s', type=int, default=8000,
+                        help='Width and height of the synthetic tiles in pixels')
+    parser.add_argument('--dtypes', '-d', default='float32,uint8',
+                        help='Comma-separated data types of the synthetic tiles')
+    args = parser.parse_args()
+
+    benchmark(args.size, args.dtypes.split(','))
@@ -0,0 +1,129 @@
+'''
+Reclassifies rasters of integer codes (e.g., continent-ecozone codes) into values (e.g., removal rates) with a lookup table.
+A dictionary of codes and values is compiled once per tile into a lookup table, which is then applied to each
+window in one vectorized step. This replaces np.vectorize(dict.get), which calls Python for every pixel, and
+loops of arr[arr == key] = value, which scan the window once per dictionary key.
+Codes that fit in a small range (like continent-ecozone or continent-ecozone-age codes) get a dense table indexed by
+the code. Codes spread over a large range get a sorted table that is searched.
+Codes that combine several inputs (e.g., US age category * 10000 + forest group * 100 + FIA region) can be given as
+tuples of the inputs' codes with the multiplier of each input; combined_code() makes the same codes from the input windows.
+'''
+
+import numpy as np
+
+# Largest range of codes that gets a dense table (8 MB for float64 values)
+max_dense_span = 2 ** 20
+
+
+# Combines the codes of several inputs into one code per pixel, e.g., age * 10000 + group * 100 + region
+def combined_code(arrays, multipliers):
+
+    code = np.zeros(np.shape(arrays[0]), dtype='int64')
+    for array, multiplier in zip(arrays, multipliers):
+        code += np.asarray(array).astype('int64') * multiplier
+
+    return code
+
+
+# Integer version of a code. Codes are dictionary keys or raster values, so they must be whole numbers.
+def _integer_key(key, multipliers):
+
+    if multipliers is not None:
+        key = sum(int(part) * multiplier for part, multiplier in zip(key, multipliers))
+
+    if float(key) != int(float(key)):
+        raise ValueError('Reclassification codes must be whole numbers; got {}'.format(key))
+
+    return int(float(key))
+
+
+# Lookup table compiled from a dictionary of codes and values
+class LookupTable(object):
+
+    def __init__(self, mapping, dtype='float32', multipliers=None):
+
+        items = sorted((_integer_key(key, multipliers), value) for key, value in mapping.items())
+
+        self.dtype = np.dtype(dtype)
+        self.keys = np.array([item[0] for item in items], dtype='int64')
+        self.values = np.array([item[1] for item in items], dtype=self.dtype)
+
+        if len(items) == 0 or self.keys[-1] - self.keys[0] < max_dense_span:
+            self.offset = int(self.keys[0]) if len(items) > 0 else 0
+            self.dense = True
+            self.table = np.zeros(int(self.keys[-1] - self.offset) + 1 if len(items) > 0 else 1, dtype=self.dtype)
+            self.table[self.keys - self.offset] = self.values
+            self.found = np.zeros(len(self.table), dtype=bool)
+            self.found[self.keys - self.offset] = True
+        else:
+            self.offset = 0
+            self.dense = False
+
+        # Tables covering every value of an 8 or 16 bit input, by (input type, default value)
+        self.full_tables = {}
+
+    # Values for an array of codes.
+    # Codes that aren't in the table get default, which is either a single value or an array with the shape of codes
+    # (e.g., codes itself to leave unmatched codes unchanged). Pixels that are nodata in codes get nodata_value.
+    def apply(self, codes, default=0, nodata=None, nodata_value=0):
+
+        codes = np.asarray(codes)
+
+        # 8 and 16 bit codes with a single default value: one gather from a table covering every possible code
+        if self.dense and np.ndim(default) == 0 and codes.dtype in [np.uint8, np.uint16, np.int8, np.int16]:
+            full_table = self._full_table(codes.dtype, default)
+            if codes.dtype.kind == 'u':
+                result = full_table[codes]
+            else:
+                result = full_table[codes.astype('int64') - np.iinfo(codes.dtype).min]
+
+        else:
+            if codes.dtype.kind == 'f':
+                whole = np.isfinite(codes) & (np.floor(codes) == codes)
+                integer_codes = np.where(whole, codes, 0).astype('int64')
+            else:
+                whole = None
+                integer_codes = codes.astype('int64')
+
+            if self.dense:
+                index = integer_codes - self.offset
+                in_table = (index >= 0) & (index < len(self.table))
+                index = np.where(in_table, index, 0)
+                matched = in_table & self.found[index]
+                looked_up = self.table[index]
+            else:
+                position = np.minimum(np.searchsorted(self.keys, integer_codes), len(self.keys) - 1)
+                matched = self.keys[position] == integer_codes
+                looked_up = self.values[position]
+
+            if whole is not None:
+                matched &= whole
+
+            result = np.where(matched, looked_up, default).astype(self.dtype)
+
+        if nodata is not None:
+            result = np.where(codes == nodata, nodata_value, result).astype(self.dtype)
+
+        return result
+
+    # Table indexed by (code - smallest code of the input type), covering every code of the input type
+    def _full_table(self, codes_dtype, default):
+
+        cache_key = (np.dtype(codes_dtype).str, np.float64(default).tobytes())
+        if cache_key not in self.full_tables:
+
+            type_info = np.iinfo(codes_dtype)
+            full_table = np.full(type_info.max - type_info.min + 1, default, dtype=self.dtype)
+
+            in_range = (self.keys >= type_info.min) & (self.keys <= type_info.max)
+            full_table[self.keys[in_range] - type_info.min] = self.values[in_range]
+            self.full_tables[cache_key] = full_table
+
+        return self.full_tables[cache_key]
+
+
+# Compiles a dictionary of codes and values into a lookup table.
+# With multipliers, the dictionary keys are tuples of codes of several inputs, combined as in combined_code().
+def compile_lut(mapping, dtype='float32', multipliers=None):
+
+    return LookupTable(mapping, dtype, multipliers)
@@ -13,11 +13,16 @@ python run_full_model.py -t biomass_swap -s all -r true -d 20200919 -l all -ce l
 
 import argparse
 import os
-import glob
 import datetime
 import logging
 import constants_and_names as cn
 import universal_util as uu
+import tile_manifest
+import tile_cache
+import stage_graph
+import loss_year_update
+import sensitivity_fanout
+import telemetry
 from data_prep.mp_model_extent import mp_model_extent
 from gain.mp_annual_gain_rate_mangrove import mp_annual_gain_rate_mangrove
 from gain.mp_US_removal_rates import mp_US_removal_rates
@@ -32,20 +37,273 @@ from analyses.mp_net_flux import mp_net_flux
 from analyses.mp_aggregate_results_to_4_km import mp_aggregate_results_to_4_km
 from analyses.mp_create_supplementary_outputs import mp_create_supplementary_outputs
 
+# Inputs that sensitivity analyses use instead of the standard model's loss and biomass
+loss_biomass_swaps = {
+    'legal_Amazon_loss': {cn.pattern_loss: (cn.Brazil_annual_loss_processed_dir, cn.pattern_Brazil_annual_loss_processed)},
+    'Mekong_loss': {cn.pattern_loss: (cn.Mekong_loss_processed_dir, cn.pattern_Mekong_loss_processed)},
+    'biomass_swap': {cn.pattern_WHRC_biomass_2000_unmasked: (cn.JPL_processed_dir, cn.pattern_JPL_unmasked_processed)}
+}
+
+
+# Carbon pools written in 2000 and/or the year of loss, depending on the carbon pool extent
+def carbon_pool_outputs(args):
+
+    outputs = []
+    if '2000' in args['carbon_pool_extent']:
+        outputs = outputs + [(cn.AGC_2000_dir, cn.pattern_AGC_2000), (cn.BGC_2000_dir, cn.pattern_BGC_2000),
+                             (cn.deadwood_2000_dir, cn.pattern_deadwood_2000), (cn.litter_2000_dir, cn.pattern_litter_2000),
+                             (cn.total_C_2000_dir, cn.pattern_total_C_2000)]
+    if 'loss' in args['carbon_pool_extent']:
+        outputs = outputs + [(cn.AGC_emis_year_dir, cn.pattern_AGC_emis_year), (cn.BGC_emis_year_dir, cn.pattern_BGC_emis_year),
+                             (cn.deadwood_emis_year_2000_dir, cn.pattern_deadwood_emis_year_2000),
+                             (cn.litter_emis_year_2000_dir, cn.pattern_litter_emis_year_2000),
+                             (cn.soil_C_emis_year_2000_dir, cn.pattern_soil_C_emis_year_2000),
+                             (cn.total_C_emis_year_dir, cn.pattern_total_C_emis_year)]
+
+    return outputs
+
+
+# Inputs of carbon pools. Carbon pools in the year of loss also need removals.
+def carbon_pool_inputs(args):
+
+    inputs = [(cn.removal_forest_type_dir, cn.pattern_removal_forest_type),
+              (cn.mangrove_biomass_2000_dir, cn.pattern_mangrove_biomass_2000),
+              (cn.WHRC_biomass_2000_unmasked_dir, cn.pattern_WHRC_biomass_2000_unmasked),
+              (cn.cont_eco_dir, cn.pattern_cont_eco_processed),
+              (cn.bor_tem_trop_processed_dir, cn.pattern_bor_tem_trop_processed),
+              (cn.precip_processed_dir, cn.pattern_precip),
+              (cn.elevation_processed_dir, cn.pattern_elevation),
+              (cn.soil_C_full_extent_2000_dir, cn.pattern_soil_C_full_extent_2000),
+              (cn.gain_dir, cn.pattern_gain),
+              (cn.loss_dir, cn.pattern_loss)]
+    if 'loss' in args['carbon_pool_extent']:
+        inputs = inputs + [(cn.annual_gain_AGC_all_types_dir, cn.pattern_annual_gain_AGC_all_types),
+                           (cn.cumul_gain_AGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_all_types)]
+
+    return inputs
+
+
+# Gross emissions outputs for the pools being used: biomass_soil or soil_only
+def gross_emissions_outputs(args):
+
+    if args['emitted_pools'] == 'biomass_soil':
+        return [(cn.gross_emis_commod_biomass_soil_dir, cn.pattern_gross_emis_commod_biomass_soil),
+                (cn.gross_emis_shifting_ag_biomass_soil_dir, cn.pattern_gross_emis_shifting_ag_biomass_soil),
+                (cn.gross_emis_forestry_biomass_soil_dir, cn.pattern_gross_emis_forestry_biomass_soil),
+                (cn.gross_emis_wildfire_biomass_soil_dir, cn.pattern_gross_emis_wildfire_biomass_soil),
+                (cn.gross_emis_urban_biomass_soil_dir, cn.pattern_gross_emis_urban_biomass_soil),
+                (cn.gross_emis_no_driver_biomass_soil_dir, cn.pattern_gross_emis_no_driver_biomass_soil),
+                (cn.gross_emis_all_gases_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil),
+                (cn.gross_emis_co2_only_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_co2_only_all_drivers_biomass_soil),
+                (cn.gross_emis_non_co2_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_non_co2_all_drivers_biomass_soil),
+                (cn.gross_emis_nodes_biomass_soil_dir, cn.pattern_gross_emis_nodes_biomass_soil)]
+
+    return [(cn.gross_emis_commod_soil_only_dir, cn.pattern_gross_emis_commod_soil_only),
+            (cn.gross_emis_shifting_ag_soil_only_dir, cn.pattern_gross_emis_shifting_ag_soil_only),
+            (cn.gross_emis_forestry_soil_only_dir, cn.pattern_gross_emis_forestry_soil_only),
+            (cn.gross_emis_wildfire_soil_only_dir, cn.pattern_gross_emis_wildfire_soil_only),
+            (cn.gross_emis_urban_soil_only_dir, cn.pattern_gross_emis_urban_soil_only),
+            (cn.gross_emis_no_driver_soil_only_dir, cn.pattern_gross_emis_no_driver_soil_only),
+            (cn.gross_emis_all_gases_all_drivers_soil_only_dir, cn.pattern_gross_emis_all_gases_all_drivers_soil_only),
+            (cn.gross_emis_co2_only_all_drivers_soil_only_dir, cn.pattern_gross_emis_co2_only_all_drivers_soil_only),
+            (cn.gross_emis_non_co2_all_drivers_soil_only_dir, cn.pattern_gross_emis_non_co2_all_drivers_soil_only),
+            (cn.gross_emis_nodes_soil_only_dir, cn.pattern_gross_emis_nodes_soil_only)]
+
+
+# The model's stages in the order they run, with the tiles each reads and writes (see stage_graph.py).
+# sensit_logic lists the sensitivity analyses that calculate a stage's outputs differently (not just from other inputs).
+# The mangrove and US removal stages only run if requested with --mangroves and --us-rates.
+model_graph = [
+
+    # Creates tiles of annual AGB and BGB gain rate and AGB stdev for mangroves using the standard model removal function
+    stage_graph.Stage('annual_removals_mangrove',
+        lambda tile_id_list, args: mp_annual_gain_rate_mangrove(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.cont_eco_dir, cn.pattern_cont_eco_processed),
+                (cn.mangrove_biomass_2000_dir, cn.pattern_mangrove_biomass_2000)],
+        outputs=[(cn.annual_gain_AGB_mangrove_dir, cn.pattern_annual_gain_AGB_mangrove),
+                 (cn.annual_gain_BGB_mangrove_dir, cn.pattern_annual_gain_BGB_mangrove),
+                 (cn.stdev_annual_gain_AGB_mangrove_dir, cn.pattern_stdev_annual_gain_AGB_mangrove)]),
+
+    # Creates tiles of annual AGC+BGC gain rate and AGC stdev for US-specific removals using the standard model removal function
+    stage_graph.Stage('annual_removals_us',
+        lambda tile_id_list, args: mp_US_removal_rates(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.gain_dir, cn.pattern_gain),
+                (cn.FIA_regions_processed_dir, cn.pattern_FIA_regions_processed),
+                (cn.FIA_forest_group_processed_dir, cn.pattern_FIA_forest_group_processed),
+                (cn.age_cat_natrl_forest_US_dir, cn.pattern_age_cat_natrl_forest_US)],
+        outputs=[(cn.annual_gain_AGC_BGC_natrl_forest_US_dir, cn.pattern_annual_gain_AGC_BGC_natrl_forest_US),
+                 (cn.stdev_annual_gain_AGC_BGC_natrl_forest_US_dir, cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US)]),
+
+    # Creates model extent tiles
+    stage_graph.Stage('model_extent',
+        lambda tile_id_list, args: mp_model_extent(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.mangrove_biomass_2000_dir, cn.pattern_mangrove_biomass_2000),
+                (cn.gain_dir, cn.pattern_gain),
+                (cn.plant_pre_2000_processed_dir, cn.pattern_plant_pre_2000),
+                (cn.tcd_dir, cn.pattern_tcd),
+                (cn.WHRC_biomass_2000_unmasked_dir, cn.pattern_WHRC_biomass_2000_unmasked)],
+        outputs=[(cn.model_extent_dir, cn.pattern_model_extent)],
+        sensit_inputs={
+            'legal_Amazon_loss': {cn.pattern_tcd: (cn.Brazil_forest_extent_2000_processed_dir, cn.pattern_Brazil_forest_extent_2000_processed)},
+            'biomass_swap': loss_biomass_swaps['biomass_swap']},
+        sensit_logic=['legal_Amazon_loss']),
+
+    # Creates age category tiles for natural forests
+    stage_graph.Stage('forest_age_category_IPCC',
+        lambda tile_id_list, args: mp_forest_age_category_IPCC(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.model_extent_dir, cn.pattern_model_extent),
+                (cn.gain_dir, cn.pattern_gain),
+                (cn.ifl_primary_processed_dir, cn.pattern_ifl_primary),
+                (cn.cont_eco_dir, cn.pattern_cont_eco_processed),
+                (cn.loss_dir, cn.pattern_loss),
+                (cn.WHRC_biomass_2000_unmasked_dir, cn.pattern_WHRC_biomass_2000_unmasked)],
+        outputs=[(cn.age_cat_IPCC_dir, cn.pattern_age_cat_IPCC)],
+        sensit_inputs=loss_biomass_swaps,
+        sensit_logic=['legal_Amazon_loss']),
+
+    # Creates tiles of annual AGB and BGB gain rates using IPCC Table 4.9 defaults
+    stage_graph.Stage('annual_removals_IPCC',
+        lambda tile_id_list, args: mp_annual_gain_rate_IPCC_defaults(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.age_cat_IPCC_dir, cn.pattern_age_cat_IPCC),
+                (cn.cont_eco_dir, cn.pattern_cont_eco_processed)],
+        outputs=[(cn.annual_gain_AGB_IPCC_defaults_dir, cn.pattern_annual_gain_AGB_IPCC_defaults),
+                 (cn.annual_gain_BGB_IPCC_defaults_dir, cn.pattern_annual_gain_BGB_IPCC_defaults),
+                 (cn.stdev_annual_gain_AGB_IPCC_defaults_dir, cn.pattern_stdev_annual_gain_AGB_IPCC_defaults)],
+        sensit_logic=['no_primary_gain']),
+
+    # Creates tiles of annual AGC and BGC removal factors for the entire model, combining removal factors from all forest types
+    stage_graph.Stage('annual_removals_all_forest_types',
+        lambda tile_id_list, args: mp_annual_gain_rate_AGC_BGC_all_forest_types(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.model_extent_dir, cn.pattern_model_extent),
+                (cn.annual_gain_AGB_mangrove_dir, cn.pattern_annual_gain_AGB_mangrove),
+                (cn.annual_gain_BGB_mangrove_dir, cn.pattern_annual_gain_BGB_mangrove),
+                (cn.annual_gain_AGC_BGC_natrl_forest_Europe_dir, cn.pattern_annual_gain_AGC_BGC_natrl_forest_Europe),
+                (cn.annual_gain_AGC_BGC_planted_forest_unmasked_dir, cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked),
+                (cn.annual_gain_AGC_BGC_natrl_forest_US_dir, cn.pattern_annual_gain_AGC_BGC_natrl_forest_US),
+                (cn.annual_gain_AGC_natrl_forest_young_dir, cn.pattern_annual_gain_AGC_natrl_forest_young),
+                (cn.age_cat_IPCC_dir, cn.pattern_age_cat_IPCC),
+                (cn.annual_gain_AGB_IPCC_defaults_dir, cn.pattern_annual_gain_AGB_IPCC_defaults),
+                (cn.stdev_annual_gain_AGB_mangrove_dir, cn.pattern_stdev_annual_gain_AGB_mangrove),
+                (cn.stdev_annual_gain_AGC_BGC_natrl_forest_Europe_dir, cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_Europe),
+                (cn.stdev_annual_gain_AGC_BGC_planted_forest_unmasked_dir, cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked),
+                (cn.stdev_annual_gain_AGC_BGC_natrl_forest_US_dir, cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US),
+                (cn.stdev_annual_gain_AGC_natrl_forest_young_dir, cn.pattern_stdev_annual_gain_AGC_natrl_forest_young),
+                (cn.stdev_annual_gain_AGB_IPCC_defaults_dir, cn.pattern_stdev_annual_gain_AGB_IPCC_defaults)],
+        outputs=[(cn.removal_forest_type_dir, cn.pattern_removal_forest_type),
+                 (cn.annual_gain_AGC_all_types_dir, cn.pattern_annual_gain_AGC_all_types),
+                 (cn.annual_gain_BGC_all_types_dir, cn.pattern_annual_gain_BGC_all_types),
+                 (cn.annual_gain_AGC_BGC_all_types_dir, cn.pattern_annual_gain_AGC_BGC_all_types),
+                 (cn.stdev_annual_gain_AGC_all_types_dir, cn.pattern_stdev_annual_gain_AGC_all_types)],
+        sensit_logic=['no_primary_gain', 'US_removals']),
+
+    # Creates tiles of the number of years of removals for all model pixels (across all forest types)
+    stage_graph.Stage('gain_year_count',
+        lambda tile_id_list, args: mp_gain_year_count_all_forest_types(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.gain_dir, cn.pattern_gain),
+                (cn.model_extent_dir, cn.pattern_model_extent),
+                (cn.loss_dir, cn.pattern_loss)],
+        outputs=[(cn.gain_year_count_dir, cn.pattern_gain_year_count)],
+        sensit_inputs=loss_biomass_swaps,
+        sensit_logic=['maxgain', 'legal_Amazon_loss'],
+        uses_loss_years=True),
+
+    # Creates tiles of gross removals for all forest types (aboveground, belowground, and above+belowground)
+    stage_graph.Stage('gross_removals_all_forest_types',
+        lambda tile_id_list, args: mp_gross_removals_all_forest_types(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.annual_gain_AGC_all_types_dir, cn.pattern_annual_gain_AGC_all_types),
+                (cn.annual_gain_BGC_all_types_dir, cn.pattern_annual_gain_BGC_all_types),
+                (cn.gain_year_count_dir, cn.pattern_gain_year_count)],
+        outputs=[(cn.cumul_gain_AGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_all_types),
+                 (cn.cumul_gain_BGCO2_all_types_dir, cn.pattern_cumul_gain_BGCO2_all_types),
+                 (cn.cumul_gain_AGCO2_BGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types)]),
+
+    # Creates carbon pools in 2000 and/or the year of loss
+    stage_graph.Stage('carbon_pools',
+        lambda tile_id_list, args: mp_create_carbon_pools(args['sensit_type'], tile_id_list, args['carbon_pool_extent'], run_date=args['run_date']),
+        inputs=carbon_pool_inputs,
+        outputs=carbon_pool_outputs,
+        sensit_inputs=loss_biomass_swaps),
+
+    # Creates gross emissions tiles by driver, gas, and all emissions combined
+    stage_graph.Stage('gross_emissions',
+        lambda tile_id_list, args: mp_calculate_gross_emissions(args['sensit_type'], tile_id_list, args['emitted_pools'], run_date=args['run_date']),
+        inputs=[(cn.AGC_emis_year_dir, cn.pattern_AGC_emis_year),
+                (cn.BGC_emis_year_dir, cn.pattern_BGC_emis_year),
+                (cn.deadwood_emis_year_2000_dir, cn.pattern_deadwood_emis_year_2000),
+                (cn.litter_emis_year_2000_dir, cn.pattern_litter_emis_year_2000),
+                (cn.soil_C_emis_year_2000_dir, cn.pattern_soil_C_emis_year_2000),
+                (cn.peat_mask_dir, cn.pattern_peat_mask),
+                (cn.ifl_primary_processed_dir, cn.pattern_ifl_primary),
+                (cn.planted_forest_type_unmasked_dir, cn.pattern_planted_forest_type_unmasked),
+                (cn.drivers_processed_dir, cn.pattern_drivers),
+                (cn.climate_zone_processed_dir, cn.pattern_climate_zone),
+                (cn.bor_tem_trop_processed_dir, cn.pattern_bor_tem_trop_processed),
+                (cn.burn_year_dir, cn.pattern_burn_year),
+                (cn.loss_dir, cn.pattern_loss)],
+        outputs=gross_emissions_outputs,
+        sensit_inputs=loss_biomass_swaps,
+        sensit_logic=['no_shifting_ag', 'convert_to_grassland'],
+        uses_loss_years=True),
+
+    # Creates net flux tiles (gross emissions - gross removals)
+    stage_graph.Stage('net_flux',
+        lambda tile_id_list, args: mp_net_flux(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.cumul_gain_AGCO2_BGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types),
+                (cn.gross_emis_all_gases_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil)],
+        outputs=[(cn.net_flux_dir, cn.pattern_net_flux)]),
+
+    # Aggregates gross emissions, gross removals, and net flux to coarser resolution.
+    # For sensitivity analyses, creates percent difference and sign change maps compared to standard model net flux.
+    # The aggregated maps aren't tiles, so they aren't listed as outputs.
+    stage_graph.Stage('aggregate',
+        lambda tile_id_list, args: mp_aggregate_results_to_4_km(args['sensit_type'], args['thresh'], tile_id_list,
+                                                                std_net_flux=args['std_net_flux'], run_date=args['run_date']),
+        inputs=[(cn.annual_gain_AGC_all_types_dir, cn.pattern_annual_gain_AGC_all_types),
+                (cn.cumul_gain_AGCO2_BGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types),
+                (cn.gross_emis_all_gases_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil),
+                (cn.net_flux_dir, cn.pattern_net_flux),
+                (cn.tcd_dir, cn.pattern_tcd),
+                (cn.gain_dir, cn.pattern_gain),
+                (cn.mangrove_biomass_2000_dir, cn.pattern_mangrove_biomass_2000)],
+        outputs=[],
+        uses_loss_years=True),
+
+    # Converts gross emissions, gross removals and net flux from per hectare rasters to per pixel rasters.
+    # Only run for the standard model.
+    stage_graph.Stage('create_supplementary_outputs',
+        lambda tile_id_list, args: mp_create_supplementary_outputs(args['sensit_type'], tile_id_list, run_date=args['run_date']),
+        inputs=[(cn.cumul_gain_AGCO2_BGCO2_all_types_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types),
+                (cn.gross_emis_all_gases_all_drivers_biomass_soil_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil),
+                (cn.net_flux_dir, cn.pattern_net_flux),
+                (cn.tcd_dir, cn.pattern_tcd),
+                (cn.gain_dir, cn.pattern_gain),
+                (cn.mangrove_biomass_2000_dir, cn.pattern_mangrove_biomass_2000)],
+        outputs=[(cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent),
+                 (cn.cumul_gain_AGCO2_BGCO2_all_types_forest_extent_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_forest_extent),
+                 (cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent_dir, cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent),
+                 (cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent),
+                 (cn.gross_emis_all_gases_all_drivers_biomass_soil_forest_extent_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_forest_extent),
+                 (cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent_dir, cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent),
+                 (cn.net_flux_per_pixel_full_extent_dir, cn.pattern_net_flux_per_pixel_full_extent),
+                 (cn.net_flux_forest_extent_dir, cn.pattern_net_flux_forest_extent),
+                 (cn.net_flux_per_pixel_forest_extent_dir, cn.pattern_net_flux_per_pixel_forest_extent)],
+        sensit_types=['std'])
+]
+
+
 def main ():
 
     os.chdir(cn.docker_base_dir)
 
     # List of possible model stages to run (not including mangrove and planted forest stages)
-    model_stages = ['all', 'model_extent', 'forest_age_category_IPCC', 'annual_removals_IPCC',
-                    'annual_removals_all_forest_types', 'gain_year_count', 'gross_removals_all_forest_types',
-                    'carbon_pools', 'gross_emissions',
-                    'net_flux', 'aggregate', 'create_supplementary_outputs']
+    model_stages = ['all'] + [stage.name for stage in model_graph
+                              if stage.name not in ['annual_removals_mangrove', 'annual_removals_us']]
 
 
     # The argument for what kind of model run is being done: standard conditions or a sensitivity analysis run
     parser = argparse.ArgumentParser(description='Run the full carbon flux model')
-    parser.add_argument('--model-type', '-t', required=True, help='{}'.format(cn.model_type_arg_help))
+    parser.add_argument('--model-type', '-t', required=True,
+                        help='{} Several model types can be run together, separated by commas (see sensitivity_fanout.py).'.format(cn.model_type_arg_help))
     parser.add_argument('--stages', '-s', required=True,
                         help='Stages for running the flux model. Options are {}'.format(model_stages))
     parser.add_argument('--run-through', '-r', required=True,
@@ -68,9 +326,14 @@ def main ():
                         help='Include US removal rate and standard deviation tile creation step (before model extent). true or false.')
     parser.add_argument('--log-note', '-ln', required=False,
                         help='Note to include in log header about model run.')
+    parser.add_argument('--resume', '-re', required=False, default='true',
+                        help='Options: true (default) or false. true: skip stages and tiles that a previous run with the same arguments finished. false: run all named stages again.')
+    parser.add_argument('--loss-year-update', '-lu', required=False, default='false',
+                        help='Options: true or false (default). true: update the previous model version for new loss, only running stages on the tiles the new loss changes (see loss_year_update.py).')
     args = parser.parse_args()
 
     sensit_type = args.model_type
+    sensit_types = sensit_type.split(',')
     stage_input = args.stages
     run_through = args.run_through
     run_date = args.run_date
@@ -84,10 +347,15 @@ def main ():
     include_mangroves = args.mangroves
     include_us = args.us_rates
     log_note = args.log_note
+    resume = args.resume
+    loss_year_update_mode = args.loss_year_update
 
     # Start time for script
     script_start = datetime.datetime.now()
 
+    # Names the run in the telemetry of its tiles, programs and s3 transfers
+    telemetry.start_run('{0}_{1:%Y%m%d_%H%M%S}'.format(sensit_type, script_start))
+
     # Create the output log
     uu.initiate_log(tile_id_list=tile_id_list, sensit_type=sensit_type, run_date=run_date, stage_input=stage_input, run_through=run_through,
                     carbon_pool_extent=carbon_pool_extent, emitted_pools=emitted_pools, thresh=thresh, std_net_flux=std_net_flux,
@@ -103,17 +371,24 @@ def main ():
         uu.exception_log('Invalid run through option. Please enter true or false.')
     else:
         pass
-
-    # Generates the list of stages to run
-    actual_stages = uu.analysis_stages(model_stages, stage_input, run_through, sensit_type,
+    if (resume not in ['true', 'false']):
+        uu.exception_log('Invalid resume option. Please enter true or false.')
+    if (loss_year_update_mode not in ['true', 'false']):
+        uu.exception_log('Invalid loss year update option. Please enter true or false.')
+    if (loss_year_update_mode == 'true') & (len(sensit_types) > 1):
+        uu.exception_log('The loss year update can only be run for one model type at a time.')
+
+    # Generates the list of stages to run. Runs of several model types include the standard model.
+    actual_stages = uu.analysis_stages(model_stages, stage_input, run_through, sensit_types[0] if len(sensit_types) == 1 else 'std',
                                        include_mangroves = include_mangroves, include_us=include_us)
     uu.print_log("Analysis stages to run:", actual_stages)
 
     # Reports how much storage is being used with files
     uu.check_storage()
 
-    # Checks whether the sensitivity analysis argument is valid
-    uu.check_sensit_type(sensit_type)
+    # Checks whether the sensitivity analysis arguments are valid
+    for model_type in sensit_types:
+        uu.check_sensit_type(model_type)
 
     # Checks if the carbon pool type is specified if the stages to run includes carbon pool generation.
     # Does this up front so the user knows before the run begins that information is missing.
@@ -124,28 +399,33 @@ def main ():
     # Does this up front so that the user is prompted to compile the C++ before the script starts running, if necessary.
     if 'gross_emissions' in actual_stages:
 
-        if emitted_pools == 'biomass_soil':
-            # Some sensitivity analyses have specific gross emissions scripts.
-            # The rest of the sensitivity analyses and the standard model can all use the same, generic gross emissions script.
-            if sensit_type in ['no_shifting_ag', 'convert_to_grassland']:
-                if os.path.exists('{0}/calc_gross_emissions_{1}.exe'.format(cn.c_emis_compile_dst, sensit_type)):
-                    uu.print_log("C++ for {} already compiled.".format(sensit_type))
+        for model_type in sensit_types:
+
+            if emitted_pools == 'biomass_soil':
+                # Some sensitivity analyses have specific gross emissions scripts.
+                # The rest of the sensitivity analyses and the standard model can all use the same, generic gross emissions script.
+                # The numpy engine doesn't need compiling.
+                if cn.gross_emissions_engine == 'numpy':
+                    uu.print_log("Gross emissions calculated with numpy")
+                elif model_type in ['no_shifting_ag', 'convert_to_grassland']:
+                    if os.path.exists('{0}/calc_gross_emissions_{1}.exe'.format(cn.c_emis_compile_dst, model_type)):
+                        uu.print_log("C++ for {} already compiled.".format(model_type))
+                    else:
+                        uu.exception_log('Must compile standard {} model C++...'.format(model_type))
                 else:
-                    uu.exception_log('Must compile standard {} model C++...'.format(sensit_type))
-            else:
-                if os.path.exists('{0}/calc_gross_emissions_generic.exe'.format(cn.c_emis_compile_dst)):
+                    if os.path.exists('{0}/calc_gross_emissions_generic.exe'.format(cn.c_emis_compile_dst)):
+                        uu.print_log("C++ for generic emissions already compiled.")
+                    else:
+                        uu.exception_log('Must compile generic emissions C++...')
+
+            elif (emitted_pools == 'soil_only') & (model_type == 'std'):
+                if cn.gross_emissions_engine == 'numpy' or os.path.exists('{0}/calc_gross_emissions_soil_only.exe'.format(cn.c_emis_compile_dst)):
                     uu.print_log("C++ for generic emissions already compiled.")
                 else:
-                    uu.exception_log('Must compile generic emissions C++...')
+                    uu.exception_log('Must compile soil_only C++...')
 
-        elif (emitted_pools == 'soil_only') & (sensit_type == 'std'):
-            if os.path.exists('{0}/calc_gross_emissions_soil_only.exe'.format(cn.c_emis_compile_dst)):
-                uu.print_log("C++ for generic emissions already compiled.")
             else:
-                uu.exception_log('Must compile soil_only C++...')
-
-        else:
-            uu.exception_log('Pool and/or sensitivity analysis option not valid for gross emissions')
+                uu.exception_log('Pool and/or sensitivity analysis option not valid for gross emissions')
 
     # Checks whether the canopy cover argument is valid up front.
     if 'aggregate' in actual_stages:
@@ -154,6 +434,17 @@ def main ():
         else:
             pass
 
+    # Lists all the s3 folders in constants_and_names at once (concurrently) for the local tile manifest,
+    # so that the model stages get their tile lists and counts without listing s3 again
+    uu.print_log("Listing model s3 folders for the tile manifest...")
+    tile_manifest.refresh(tile_manifest.model_dirs())
+
+    # Keeps the inputs that several model stages use in the local tile cache for the whole run,
+    # so they are downloaded once even though each stage deletes its working copies
+    tile_cache.pin([cn.pixel_area_dir, cn.tcd_dir, cn.loss_dir, cn.gain_dir, cn.mangrove_biomass_2000_dir,
+                    cn.WHRC_biomass_2000_unmasked_dir, cn.model_extent_dir, cn.cont_eco_dir, cn.removal_forest_type_dir,
+                    cn.drivers_processed_dir])
+
     # If the tile_list argument is an s3 folder, the list of tiles in it is created
     if 's3://' in tile_id_list:
         tile_id_list = uu.tile_list_s3(tile_id_list, 'std')
@@ -164,401 +455,39 @@ def main ():
         tile_id_list = uu.tile_id_list_check(tile_id_list)
 
 
-    # List of output directories and output file name patterns.
-    # The directory list is only used for counting tiles in output folders at the end of the model
-    output_dir_list = [
-        cn.model_extent_dir,
-        cn.age_cat_IPCC_dir,
-        cn.annual_gain_AGB_IPCC_defaults_dir, cn.annual_gain_BGB_IPCC_defaults_dir, cn.stdev_annual_gain_AGB_IPCC_defaults_dir,
-        cn.removal_forest_type_dir,
-        cn.annual_gain_AGC_all_types_dir, cn.annual_gain_BGC_all_types_dir,
-        cn.annual_gain_AGC_BGC_all_types_dir, cn.stdev_annual_gain_AGC_all_types_dir,
-        cn.gain_year_count_dir,
-        cn.cumul_gain_AGCO2_all_types_dir, cn.cumul_gain_BGCO2_all_types_dir,
-        cn.cumul_gain_AGCO2_BGCO2_all_types_dir
-    ]
-
-    # Prepends the mangrove and US output directories if mangroves are included
-    if 'annual_removals_mangrove' in actual_stages:
-
-        output_dir_list = [cn.annual_gain_AGB_mangrove_dir, cn.annual_gain_BGB_mangrove_dir,
-                           cn.stdev_annual_gain_AGB_mangrove_dir] + output_dir_list
-
-    if 'annual_removals_us' in actual_stages:
-
-        output_dir_list = [cn.annual_gain_AGC_BGC_natrl_forest_US_dir,
-                           cn.stdev_annual_gain_AGC_BGC_natrl_forest_US_dir] + output_dir_list
-
-    # Adds the carbon directories depending on which carbon emitted_pools are being generated: 2000 and/or emissions year
-    if 'carbon_pools' in actual_stages:
-        if 'loss' in carbon_pool_extent:
-            output_dir_list = output_dir_list + [cn.AGC_emis_year_dir, cn.BGC_emis_year_dir,
-                                                 cn.deadwood_emis_year_2000_dir, cn.litter_emis_year_2000_dir,
-                                                 cn.soil_C_emis_year_2000_dir, cn.total_C_emis_year_dir]
-
-        if '2000' in carbon_pool_extent:
-            output_dir_list = output_dir_list + [cn.AGC_2000_dir, cn.BGC_2000_dir,
-                                                 cn.deadwood_2000_dir, cn.litter_2000_dir,
-                                                 cn.soil_C_full_extent_2000_dir, cn.total_C_2000_dir]
-
-    # Adds the biomass_soil output directories or the soil_only output directories depending on the model run
-    if 'gross_emissions' in actual_stages:
-        if emitted_pools == 'biomass_soil':
-            output_dir_list = output_dir_list + [cn.gross_emis_commod_biomass_soil_dir,
-                               cn.gross_emis_shifting_ag_biomass_soil_dir,
-                               cn.gross_emis_forestry_biomass_soil_dir,
-                               cn.gross_emis_wildfire_biomass_soil_dir,
-                               cn.gross_emis_urban_biomass_soil_dir,
-                               cn.gross_emis_no_driver_biomass_soil_dir,
-                               cn.gross_emis_all_gases_all_drivers_biomass_soil_dir,
-                               cn.gross_emis_co2_only_all_drivers_biomass_soil_dir,
-                               cn.gross_emis_non_co2_all_drivers_biomass_soil_dir,
-                               cn.gross_emis_nodes_biomass_soil_dir]
-
-        else:
-            output_dir_list = output_dir_list + [cn.gross_emis_commod_soil_only_dir,
-                                   cn.gross_emis_shifting_ag_soil_only_dir,
-                                   cn.gross_emis_forestry_soil_only_dir,
-                                   cn.gross_emis_wildfire_soil_only_dir,
-                                   cn.gross_emis_urban_soil_only_dir,
-                                   cn.gross_emis_no_driver_soil_only_dir,
-                                   cn.gross_emis_all_gases_all_drivers_soil_only_dir,
-                                   cn.gross_emis_co2_only_all_drivers_soil_only_dir,
-                                   cn.gross_emis_non_co2_all_drivers_soil_only_dir,
-                                   cn.gross_emis_nodes_soil_only_dir]
-
-    output_dir_list = output_dir_list + [cn.net_flux_dir]
-
-    if create_supplementary_outputs in actual_stages:
-        output_dir_list = output_dir_list + \
-                        [cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent_dir,
-                        cn.cumul_gain_AGCO2_BGCO2_all_types_forest_extent_dir,
-                        cn.cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent_dir,
-                        cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent_dir,
-                        cn.gross_emis_all_gases_all_drivers_biomass_soil_forest_extent_dir,
-                        cn.gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent_dir,
-                        cn.net_flux_per_pixel_full_extent_dir,
-                        cn.net_flux_forest_extent_dir,
-                        cn.net_flux_per_pixel_forest_extent_dir]
-
-
-    # Creates tiles of annual AGB and BGB gain rate and AGB stdev for mangroves using the standard model
-    # removal function
-    if 'annual_removals_mangrove' in actual_stages:
-
-        uu.print_log(":::::Creating tiles of annual removals for mangrove")
-        start = datetime.datetime.now()
-
-        mp_annual_gain_rate_mangrove(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for annual_gain_rate_mangrove:", elapsed_time, "\n")
-
-
-    # Creates tiles of annual AGC+BGC gain rate and AGC stdev for US-specific removals using the standard model
-    # removal function
-    if 'annual_removals_us' in actual_stages:
-
-        uu.print_log(":::::Creating tiles of annual removals for US")
-        start = datetime.datetime.now()
-
-        mp_US_removal_rates(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for annual_gain_rate_us:", elapsed_time, "\n")
-
-
-    # Creates model extent tiles
-    if 'model_extent' in actual_stages:
-
-        uu.print_log(":::::Creating tiles of model extent")
-        start = datetime.datetime.now()
-
-        mp_model_extent(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for model_extent:", elapsed_time, "\n", "\n")
-
-
-    # Creates age category tiles for natural forests
-    if 'forest_age_category_IPCC' in actual_stages:
-
-        uu.print_log(":::::Creating tiles of forest age categories for IPCC removal rates")
-        start = datetime.datetime.now()
-
-        mp_forest_age_category_IPCC(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for forest_age_category_IPCC:", elapsed_time, "\n", "\n")
-
-
-    # Creates tiles of annual AGB and BGB gain rates using IPCC Table 4.9 defaults
-    if 'annual_removals_IPCC' in actual_stages:
-
-        uu.print_log(":::::Creating tiles of annual aboveground and belowground removal rates using IPCC defaults")
-        start = datetime.datetime.now()
-
-        mp_annual_gain_rate_IPCC_defaults(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for annual_gain_rate_IPCC:", elapsed_time, "\n", "\n")
-
-
-    # Creates tiles of annual AGC and BGC removal factors for the entire model, combining removal factors from all forest types
-    if 'annual_removals_all_forest_types' in actual_stages:
-        uu.print_log(":::::Creating tiles of annual aboveground and belowground removal rates for all forest types")
-        start = datetime.datetime.now()
-
-        mp_annual_gain_rate_AGC_BGC_all_forest_types(sensit_type, tile_id_list, run_date=run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for annual_gain_rate_AGC_BGC_all_forest_types:", elapsed_time, "\n", "\n")
-
-
-    # Creates tiles of the number of years of removals for all model pixels (across all forest types)
-    if 'gain_year_count' in actual_stages:
-
-        uu.print_log(":::::Freeing up memory for gain year count creation by deleting unneeded tiles")
-        tiles_to_delete = []
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_mangrove_biomass_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_WHRC_biomass_2000_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_BGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_natrl_forest_Europe)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_natrl_forest_US)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_natrl_forest_young)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_age_cat_IPCC)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_BGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_ifl_primary)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_planted_forest_type_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_plant_pre_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_Europe)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_natrl_forest_young)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_all_types)))
-        uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-        for tile_to_delete in tiles_to_delete:
-            os.remove(tile_to_delete)
-        uu.print_log(":::::Deleted unneeded tiles")
-        uu.check_storage()
-
-        uu.print_log(":::::Creating tiles of gain year count for all removal pixels")
-        start = datetime.datetime.now()
-
-        mp_gain_year_count_all_forest_types(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for gain_year_count:", elapsed_time, "\n", "\n")
-
-
-    # Creates tiles of gross removals for all forest types (aboveground, belowground, and above+belowground)
-    if 'gross_removals_all_forest_types' in actual_stages:
-
-        uu.print_log(":::::Creating gross removals for all forest types combined (above + belowground) tiles'")
-        start = datetime.datetime.now()
-
-        mp_gross_removals_all_forest_types(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for gross_removals_all_forest_types:", elapsed_time, "\n", "\n")
-
-
-    # Creates carbon emitted_pools in loss year
-    if 'carbon_pools' in actual_stages:
-
-        uu.print_log(":::::Freeing up memory for carbon pool creation by deleting unneeded tiles")
-        tiles_to_delete = []
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_model_extent)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_BGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_natrl_forest_Europe)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_natrl_forest_US)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_natrl_forest_young)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_age_cat_IPCC)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_BGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_BGC_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_BGC_all_types)))
-        tiles_to_delete.extend(glob.glob('*growth_years*tif'))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gain_year_count)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cumul_gain_BGCO2_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cumul_gain_AGCO2_BGCO2_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_ifl_primary)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_planted_forest_type_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_plant_pre_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGB_mangrove)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_Europe)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_natrl_forest_young)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGB_IPCC_defaults)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_stdev_annual_gain_AGC_all_types)))
-        uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-        for tile_to_delete in tiles_to_delete:
-            os.remove(tile_to_delete)
-        uu.print_log(":::::Deleted unneeded tiles")
-        uu.check_storage()
-
-        uu.print_log(":::::Creating carbon pool tiles")
-        start = datetime.datetime.now()
-
-        mp_create_carbon_pools(sensit_type, tile_id_list, carbon_pool_extent, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for create_carbon_pools:", elapsed_time, "\n", "\n")
-
-
-    # Creates gross emissions tiles by driver, gas, and all emissions combined
-    if 'gross_emissions' in actual_stages:
-
-        uu.print_log(":::::Freeing up memory for gross emissions creation by deleting unneeded tiles")
-        tiles_to_delete = []
-        # tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_removal_forest_type)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_AGC_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_BGC_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_deadwood_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_litter_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_total_C_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_elevation)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_precip)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_annual_gain_AGC_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cumul_gain_AGCO2_all_types)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_cont_eco_processed)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_WHRC_biomass_2000_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_mangrove_biomass_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_removal_forest_type)))
-        uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-        uu.print_log(tiles_to_delete)
-
-        for tile_to_delete in tiles_to_delete:
-            os.remove(tile_to_delete)
-        uu.print_log(":::::Deleted unneeded tiles")
-        uu.check_storage()
-
-        uu.print_log(":::::Creating gross emissions tiles")
-        start = datetime.datetime.now()
-
-        mp_calculate_gross_emissions(sensit_type, tile_id_list, emitted_pools, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for gross_emissions:", elapsed_time, "\n", "\n")
-
-
-    # Creates net flux tiles (gross emissions - gross removals)
-    if 'net_flux' in actual_stages:
-
-        uu.print_log(":::::Freeing up memory for net flux creation by deleting unneeded tiles")
-        tiles_to_delete = []
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_loss)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_non_co2_all_drivers_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_co2_only_all_drivers_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_commod_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_shifting_ag_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_forestry_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_wildfire_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_urban_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_no_driver_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_gross_emis_nodes_biomass_soil)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_AGC_emis_year)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_BGC_emis_year)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_deadwood_emis_year_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_litter_emis_year_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_soil_C_emis_year_2000)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_total_C_emis_year)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_peat_mask)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_ifl_primary)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_planted_forest_type_unmasked)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_drivers)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_climate_zone)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_bor_tem_trop_processed)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_burn_year)))
-        tiles_to_delete.extend(glob.glob('*{}*tif'.format(cn.pattern_plant_pre_2000)))
-        uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
-
-        for tile_to_delete in tiles_to_delete:
-            os.remove(tile_to_delete)
-        uu.print_log(":::::Deleted unneeded tiles")
-        uu.check_storage()
-
-        uu.print_log(":::::Creating net flux tiles")
-        start = datetime.datetime.now()
-
-        mp_net_flux(sensit_type, tile_id_list, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for net_flux:", elapsed_time, "\n", "\n")
-
-
-    # Aggregates gross emissions, gross removals, and net flux to coarser resolution.
-    # For sensitivity analyses, creates percent difference and sign change maps compared to standard model net flux.
-    if 'aggregate' in actual_stages:
-
-        uu.print_log(":::::Creating 4x4 km aggregate maps")
-        start = datetime.datetime.now()
-
-        mp_aggregate_results_to_4_km(sensit_type, thresh, tile_id_list, std_net_flux = std_net_flux, run_date = run_date)
-
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for aggregate:", elapsed_time, "\n", "\n")
-
-
-    # Converts gross emissions, gross removals and net flux from per hectare rasters to per pixel rasters
-    if 'create_supplementary_outputs' in actual_stages:
-
-        uu.print_log(":::::Creating supplementary versions of main model outputs (forest extent, per pixel)")
-        start = datetime.datetime.now()
+    # Arguments of the model run that the stages use
+    run_args = {
+        'sensit_type': sensit_type,
+        'tile_id_list': tile_id_list,
+        'run_date': run_date,
+        'carbon_pool_extent': carbon_pool_extent,
+        'emitted_pools': emitted_pools,
+        'thresh': thresh,
+        'std_net_flux': std_net_flux
+    }
+
+    # Runs the stages in order. Stages and tiles that a previous run with the same arguments finished are skipped,
+    # and tiles that no later stage needs are deleted before each stage.
+    # An incremental loss year update only runs stages on the tiles that the new loss changes.
+    # Several model types run the standard model first and then only the stages each sensitivity analysis changes.
+    if loss_year_update_mode == 'true':
+        loss_year_update.run(model_graph, actual_stages, run_args, resume=(resume == 'true'))
+    elif len(sensit_types) > 1:
+        sensitivity_fanout.run(model_graph, actual_stages, run_args, sensit_types, resume=(resume == 'true'))
+    else:
+        stage_graph.run(model_graph, actual_stages, run_args, resume=(resume == 'true'))
 
-        mp_create_supplementary_outputs(sensit_type, tile_id_list, run_date = run_date)
 
-        end = datetime.datetime.now()
-        elapsed_time = end - start
-        uu.check_storage()
-        uu.print_log(":::::Processing time for supplementary output raster creation:", elapsed_time, "\n", "\n")
+    # List of output directories. The directory list is only used for counting tiles in output folders at the end of the model.
+    # Sensitivity analysis output directories are already renamed.
+    if len(sensit_types) > 1:
+        output_dir_list = sensitivity_fanout.output_dirs(model_graph, actual_stages, run_args, sensit_types)
+    else:
+        output_dir_list = stage_graph.output_dirs(model_graph, actual_stages, run_args)
 
 
     uu.print_log(":::::Counting tiles output to each folder")
 
-    # Modifies output directory names to make them match those used during the model run.
-    # The tiles in each of these directories and counted and logged.
-    # If the model run isn't the standard one, the output directory and file names are changed
-    if sensit_type != 'std':
-        uu.print_log("Modifying output directory and file name pattern based on sensitivity analysis")
-        output_dir_list = uu.alter_dirs(sensit_type, output_dir_list)
-
     # Changes the date in the output directories. This date was used during the model run.
     # This replaces the date in constants_and_names.
     if run_date:
@@ -570,9 +499,16 @@ def main ():
         uu.print_log("Total tiles in", output, ": ", tile_count)
 
 
+    # The shared inputs no longer need to stay in the tile cache
+    tile_cache.unpin()
+
+    # Critical path, slowest tiles and memory per tile of each stage
+    telemetry.report()
+
     script_end = datetime.datetime.now()
     script_elapsed_time = script_end - script_start
     uu.print_log(":::::Processing time for entire run:", script_elapsed_time, "\n")
+    uu.upload_log()
 
 
 if __name__ == '__main__':
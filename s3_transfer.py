@@ -0,0 +1,458 @@
+'''
+In-process s3 transfers, used instead of running aws-cli in a subprocess for every file or folder.
+Each process has one boto3 client and one thread pool. Files are split into ranged GETs (downloads) and
+multipart PUTs (uploads) of cn.s3_transfer_chunk_bytes, and all parts of all files in a batch share the thread pool.
+Each request is retried with exponential backoff. Downloads are written to a temporary file, checked against the
+object's size and ETag (MD5), and only then renamed to their final name, so an interrupted download never leaves
+a partial tile behind. Batch functions return the number of files, bytes and seconds so callers can report throughput.
+cn.s3_endpoint_url sends all requests to another s3-compatible endpoint (e.g., moto or MinIO for tests).
+'''
+
+import base64
+import collections
+import fnmatch
+import glob
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import boto3
+import botocore
+from botocore.config import Config
+import constants_and_names as cn
+
+# Error codes that won't be fixed by retrying the request
+no_retry_codes = ['404', '403', 'NoSuchKey', 'NoSuchBucket', 'NoSuchUpload', 'AccessDenied']
+
+# s3 doesn't accept multipart upload parts smaller than this (except the last part)
+min_part_bytes = 5 * 1024 * 1024
+
+# Per-process boto3 client and thread pool. Pool workers are forked from the main process, so each
+# process creates its own the first time it transfers something.
+_pid = None
+_client = None
+_executor = None
+
+
+# Raised when a downloaded or uploaded file doesn't match the checksum s3 has for it
+class ChecksumError(Exception):
+    pass
+
+
+# Returns the boto3 client and thread pool for this process
+def _resources():
+    global _pid, _client, _executor
+
+    if _pid != os.getpid():
+        _client = boto3.client('s3', endpoint_url=cn.s3_endpoint_url,
+                               config=Config(max_pool_connections=cn.s3_transfer_threads,
+                                             retries={'max_attempts': 0}))
+        _executor = ThreadPoolExecutor(max_workers=cn.s3_transfer_threads)
+        _pid = os.getpid()
+
+    return _client, _executor
+
+
+# Splits s3://bucket/key into bucket and key
+def split_s3_path(s3_path):
+
+    bucket, _, key = s3_path[len('s3://'):].partition('/')
+
+    return bucket, key
+
+
+# Runs an s3 request, retrying with exponential backoff and jitter if it fails for a reason that might be temporary
+def _retry(fx, *args, **kwargs):
+
+    for attempt in range(cn.s3_transfer_retries):
+        try:
+            return fx(*args, **kwargs)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in no_retry_codes or attempt == cn.s3_transfer_retries - 1:
+                raise
+        except Exception:
+            if attempt == cn.s3_transfer_retries - 1:
+                raise
+
+        time.sleep(min(30, 0.5 * 2 ** attempt) * (1 + random.random()))
+
+
+# Returns the size, ETag and user metadata of an s3 object.
+# Raises botocore.exceptions.ClientError (code 404) if the object doesn't exist.
+def head(s3_path):
+
+    client, executor = _resources()
+    bucket, key = split_s3_path(s3_path)
+    response = _retry(client.head_object, Bucket=bucket, Key=key)
+
+    return {'size': response['ContentLength'], 'etag': response['ETag'], 'metadata': response.get('Metadata', {})}
+
+
+# Lists every object under an s3 folder, following pagination.
+# Returns a list of dictionaries with the key, size, ETag and last modified time of each object.
+def list_objects(s3_dir):
+
+    client, executor = _resources()
+    bucket, prefix = split_s3_path(s3_dir)
+    if prefix and not prefix.endswith('/'):
+        prefix = prefix + '/'
+
+    objects = []
+    paginator = client.get_paginator('list_objects_v2')
+    for page in _retry(lambda: list(paginator.paginate(Bucket=bucket, Prefix=prefix))):
+        for obj in page.get('Contents', []):
+            objects.append({'bucket': bucket, 'key': obj['Key'], 'relative': obj['Key'][len(prefix):],
+                            'size': obj['Size'], 'etag': obj['ETag'], 'mtime': obj['LastModified'].timestamp()})
+
+    return objects
+
+
+# Whether a path is copied, following aws-cli filter rules for how this model uses them:
+# anything matching an include pattern is copied; otherwise anything matching an exclude pattern is skipped.
+def included(relative_path, exclude, include):
+
+    if any(fnmatch.fnmatch(relative_path, pattern) for pattern in include or []):
+        return True
+
+    return not any(fnmatch.fnmatch(relative_path, pattern) for pattern in exclude or [])
+
+
+# MD5 of a whole local file
+def _file_md5(path):
+
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(cn.s3_transfer_chunk_bytes), b''):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+
+# MD5s of the parts of a local file split into parts of the given size
+def _file_part_md5s(path, part_bytes):
+
+    part_md5s = []
+    with open(path, 'rb') as f:
+        for part in iter(lambda: f.read(part_bytes), b''):
+            part_md5s.append(hashlib.md5(part).digest())
+
+    return part_md5s
+
+
+# The ETag s3 gives an object uploaded in parts of the given MD5s
+def _multipart_etag(part_md5s):
+
+    return '{0}-{1}'.format(hashlib.md5(b''.join(part_md5s)).hexdigest(), len(part_md5s))
+
+
+# Size of the first part of a multipart object, which is the part size it was uploaded with.
+# Returns None if the endpoint doesn't return part sizes.
+def _part_size(bucket, key):
+
+    client, executor = _resources()
+    try:
+        response = _retry(client.head_object, Bucket=bucket, Key=key, PartNumber=1)
+    except botocore.exceptions.ClientError:
+        return None
+
+    if not response.get('PartsCount'):
+        return None
+
+    return response['ContentLength']
+
+
+# Checks a downloaded file against the size and ETag of its s3 object.
+# Single-part ETags are the MD5 of the object. Multipart ETags depend on the part size the object was uploaded with,
+# which the part count alone doesn't give (e.g., a 16 MiB object is two parts of 8 MiB or of 8.5 MiB), so it's read
+# from s3. If it's the size used for downloading (true for this module's and aws-cli's default uploads), the MD5s of
+# the downloaded ranges are used; otherwise the file is hashed again in parts of that size.
+# If the endpoint doesn't return part sizes, only the size is checked.
+def _verify_download(path, size, etag, part_md5s, bucket, key):
+
+    if os.path.getsize(path) != size:
+        raise ChecksumError("{0} is {1} bytes but should be {2} bytes".format(path, os.path.getsize(path), size))
+
+    if not cn.s3_transfer_verify:
+        return
+
+    etag = etag.strip('"')
+
+    if '-' in etag:
+        part_bytes = _part_size(bucket, key)
+        if part_bytes is None:
+            return
+        if part_bytes != cn.s3_transfer_chunk_bytes:
+            part_md5s = _file_part_md5s(path, part_bytes)
+        local_etag = _multipart_etag(part_md5s)
+    elif len(part_md5s) == 1:
+        local_etag = part_md5s[0].hex()
+    else:
+        local_etag = _file_md5(path)
+
+    if local_etag != etag:
+        raise ChecksumError("{0} has checksum {1} but s3 has {2}".format(path, local_etag, etag))
+
+
+# Downloads one byte range of an object into its place in the local file
+def _get_range(client, bucket, key, fd, start, end):
+
+    response = client.get_object(Bucket=bucket, Key=key, Range='bytes={0}-{1}'.format(start, end))
+    data = response['Body'].read()
+
+    if len(data) != end - start + 1:
+        raise ChecksumError("Incomplete range {0}-{1} of {2}".format(start, end, key))
+
+    os.pwrite(fd, data, start)
+
+    return hashlib.md5(data).digest()
+
+
+# Submits all byte ranges of one download to the thread pool
+def _start_download(bucket, key, size, etag, local_path):
+
+    client, executor = _resources()
+
+    local_dir = os.path.dirname(local_path)
+    if local_dir and not os.path.exists(local_dir):
+        os.makedirs(local_dir, exist_ok=True)
+
+    # Named for the process, so processes downloading the same object (e.g., into the tile cache) don't truncate
+    # each other's partial file
+    tmp_path = '{0}.{1}.part'.format(local_path, os.getpid())
+    fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+    os.ftruncate(fd, size)
+
+    chunk = cn.s3_transfer_chunk_bytes
+    futures = [executor.submit(_retry, _get_range, client, bucket, key, fd, start, min(start + chunk, size) - 1)
+               for start in range(0, size, chunk)]
+
+    return {'fd': fd, 'tmp_path': tmp_path, 'local_path': local_path, 'size': size, 'etag': etag, 'futures': futures,
+            'bucket': bucket, 'key': key}
+
+
+# Stops a download: cancels the byte ranges that haven't started, waits for the ones being written (so nothing is
+# written to the file descriptor after it's closed), and deletes the partial file
+def _abort_download(job):
+
+    for future in job['futures']:
+        future.cancel()
+    wait(job['futures'])
+
+    if job['fd'] is not None:
+        os.close(job['fd'])
+        job['fd'] = None
+    if os.path.exists(job['tmp_path']):
+        os.remove(job['tmp_path'])
+
+
+# Waits for all byte ranges of a download, verifies the file, and moves it to its final name
+def _finish_download(job):
+
+    try:
+        part_md5s = [future.result() for future in job['futures']]
+        os.close(job['fd'])
+        job['fd'] = None
+        _verify_download(job['tmp_path'], job['size'], job['etag'], part_md5s, job['bucket'], job['key'])
+        os.replace(job['tmp_path'], job['local_path'])
+    except:
+        _abort_download(job)
+        raise
+
+    return job['size']
+
+
+# Downloads a batch of objects concurrently.
+# objects is a list of (s3 path, local path) pairs or of dictionaries from list_objects with a 'local_path' added.
+# At most cn.s3_transfer_max_files objects are downloaded at once (each has an open file and a full-size partial file).
+# If a download fails, the others in progress are stopped and their partial files deleted.
+# Returns the number of files, number of bytes and seconds it took.
+def download_files(objects):
+
+    start = time.time()
+
+    in_progress = collections.deque()
+    total_bytes = 0
+
+    try:
+        for obj in objects:
+            if len(in_progress) >= cn.s3_transfer_max_files:
+                total_bytes += _finish_download(in_progress.popleft())
+            if isinstance(obj, dict):
+                bucket, key, size, etag = obj['bucket'], obj['key'], obj['size'], obj['etag']
+                local_path = obj['local_path']
+            else:
+                info = head(obj[0])
+                bucket, key = split_s3_path(obj[0])
+                size, etag, local_path = info['size'], info['etag'], obj[1]
+            in_progress.append(_start_download(bucket, key, size, etag, local_path))
+
+        while in_progress:
+            total_bytes += _finish_download(in_progress.popleft())
+
+    except:
+        for job in in_progress:
+            _abort_download(job)
+        raise
+
+    return len(objects), total_bytes, time.time() - start
+
+
+# Downloads one s3 object. dest can be a folder (keeps the object's file name) or a file path.
+def download_file(s3_path, dest):
+
+    if os.path.isdir(dest) or dest.endswith('/'):
+        dest = os.path.join(dest, os.path.basename(s3_path))
+
+    return download_files([(s3_path, dest)])
+
+
+# Downloads everything under an s3 folder to a local folder, keeping the relative paths of the objects
+def download_dir(s3_dir, dest, exclude=None, include=None):
+
+    objects = [obj for obj in list_objects(s3_dir)
+               if obj['relative'] and included(obj['relative'], exclude, include)]
+    for obj in objects:
+        obj['local_path'] = os.path.join(dest, obj['relative'])
+
+    return download_files(objects)
+
+
+# Uploads one part of a multipart upload
+def _put_part(client, bucket, key, upload_id, part_number, path, start, length):
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(length)
+
+    md5 = hashlib.md5(data)
+    response = client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data,
+                                  ContentMD5=base64.b64encode(md5.digest()).decode('utf-8'))
+
+    return {'PartNumber': part_number, 'ETag': response['ETag']}, md5.digest()
+
+
+# Uploads a file small enough to be sent in one request. s3 checks the body against ContentMD5.
+def _put_whole(client, bucket, key, path):
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    md5 = hashlib.md5(data)
+    client.put_object(Bucket=bucket, Key=key, Body=data,
+                      ContentMD5=base64.b64encode(md5.digest()).decode('utf-8'))
+
+
+# Submits an upload to the thread pool: one request for small files, parts of a multipart upload for large files
+def _start_upload(local_path, s3_path):
+
+    client, executor = _resources()
+    bucket, key = split_s3_path(s3_path)
+    size = os.path.getsize(local_path)
+    chunk = max(cn.s3_transfer_chunk_bytes, min_part_bytes)
+
+    if size <= chunk:
+        futures = [executor.submit(_retry, _put_whole, client, bucket, key, local_path)]
+        return {'bucket': bucket, 'key': key, 'size': size, 'upload_id': None, 'futures': futures}
+
+    upload_id = _retry(client.create_multipart_upload, Bucket=bucket, Key=key)['UploadId']
+    futures = [executor.submit(_retry, _put_part, client, bucket, key, upload_id, part_number, local_path, start,
+                               min(chunk, size - start))
+               for part_number, start in enumerate(range(0, size, chunk), start=1)]
+
+    return {'bucket': bucket, 'key': key, 'size': size, 'upload_id': upload_id, 'futures': futures}
+
+
+# Waits for an upload and, for multipart uploads, completes it and checks the ETag s3 assigned
+def _finish_upload(job):
+
+    client, executor = _resources()
+
+    try:
+        results = [future.result() for future in job['futures']]
+
+        if job['upload_id'] is not None:
+            parts = [result[0] for result in results]
+            response = _retry(client.complete_multipart_upload, Bucket=job['bucket'], Key=job['key'],
+                              UploadId=job['upload_id'], MultipartUpload={'Parts': parts})
+            expected = _multipart_etag([result[1] for result in results])
+            if cn.s3_transfer_verify and response['ETag'].strip('"') != expected:
+                raise ChecksumError("s3://{0}/{1} has checksum {2} but should be {3}".format(
+                    job['bucket'], job['key'], response['ETag'], expected))
+
+    except:
+        for future in job['futures']:
+            future.cancel()
+        if job['upload_id'] is not None:
+            client.abort_multipart_upload(Bucket=job['bucket'], Key=job['key'], UploadId=job['upload_id'])
+        raise
+
+    return job['size']
+
+
+# Uploads a batch of files concurrently. pairs is a list of (local path, s3 path).
+# Returns the number of files, number of bytes and seconds it took.
+def upload_files(pairs):
+
+    start = time.time()
+
+    jobs = [_start_upload(local_path, s3_path) for local_path, s3_path in pairs]
+    total_bytes = sum(_finish_upload(job) for job in jobs)
+
+    return len(jobs), total_bytes, time.time() - start
+
+
+# Uploads one file. If s3_dest ends with /, the file keeps its name in that s3 folder.
+def upload_file(local_path, s3_dest):
+
+    if s3_dest.endswith('/'):
+        s3_dest = s3_dest + os.path.basename(local_path)
+
+    return upload_files([(local_path, s3_dest)])
+
+
+# Uploads everything under a local folder to an s3 folder, keeping the relative paths of the files
+def upload_dir(local_dir, s3_dir, exclude=None, include=None):
+
+    if not s3_dir.endswith('/'):
+        s3_dir = s3_dir + '/'
+
+    pairs = []
+    for path in sorted(glob.glob(os.path.join(local_dir, '**', '*'), recursive=True)):
+        relative_path = os.path.relpath(path, local_dir)
+        if os.path.isfile(path) and included(relative_path, exclude, include):
+            pairs.append((path, s3_dir + relative_path))
+
+    return upload_files(pairs)
+
+
+# Copies s3 objects to other s3 paths on s3 itself, without downloading them.
+# pairs is a list of (source s3 path, destination s3 path). Returns the number of files, number of bytes and seconds it took.
+def copy_objects(pairs):
+
+    client, executor = _resources()
+    start = time.time()
+
+    def _copy(source, dest):
+        source_bucket, source_key = split_s3_path(source)
+        bucket, key = split_s3_path(dest)
+        _retry(client.copy, {'Bucket': source_bucket, 'Key': source_key}, bucket, key)
+        return head(dest)['size']
+
+    futures = [executor.submit(_copy, source, dest) for source, dest in pairs]
+    total_bytes = sum(future.result() for future in futures)
+
+    return len(pairs), total_bytes, time.time() - start
+
+
+# Equivalent of `aws s3 cp` between s3 and the local machine, with --recursive, --exclude and --include
+def copy(source, dest, recursive=False, exclude=None, include=None):
+
+    if source.startswith('s3://'):
+        if recursive:
+            return download_dir(source, dest, exclude=exclude, include=include)
+        return download_file(source, dest)
+
+    if recursive:
+        return upload_dir(source, dest, exclude=exclude, include=include)
+    return upload_file(source, dest)
@@ -7,6 +7,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 # Replaces the default loss value of 100 with the year of loss for each loss year raster
 def recode_tiles(annual_loss):
@@ -27,11 +28,8 @@ def recode_tiles(annual_loss):
         recoded_output = "Mekong_loss_recoded_{}.tif".format(year)
         outfile = '--outfile={}'.format(recoded_output)
 
-        cmd = ['gdal_calc.py', '-A', annual_loss, calc, outfile, '--NoDataValue=0', '--co', 'COMPRESS=LZW', '--quiet']
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        cmd = ['gdal_calc.py', '-A', annual_loss, calc, outfile, '--NoDataValue=0', *raster_profile.gdal_options('scratch', flag='--co'), '--quiet']
+        uu.log_subprocess_output_full(cmd)
 
 def reset_nodata(tile_id):
 
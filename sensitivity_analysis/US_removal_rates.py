@@ -6,6 +6,9 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
+import reclassify
 
 # Creates Hansen tiles out of FIA region shapefile
 def prep_FIA_regions(tile_id):
@@ -52,6 +55,10 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
     # Start time
     start = datetime.datetime.now()
 
+    # Lookup tables of the removal rates for each group-region-age and group-region code
+    gain_group_region_age_lut = reclassify.compile_lut(gain_table_group_region_age_dict)
+    gain_group_region_lut = reclassify.compile_lut(gain_table_group_region_dict)
+
     # Names of the input tiles
     gain = '{0}_{1}.tif'.format(cn.pattern_gain, tile_id)
     annual_gain_standard = '{0}_{1}.tif'.format(tile_id, cn.pattern_annual_gain_AGB_IPCC_defaults)  # Used as the template extent/default for the US
@@ -65,8 +72,8 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
         # Grabs metadata about the tif, like its location/projection/cell size
         kwargs = annual_gain_standard_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = annual_gain_standard_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(annual_gain_standard_src)
 
         # Opens other necessary tiles
         gain_src = rasterio.open(gain)
@@ -78,9 +85,9 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Opens the output tiles (aboveground and belowground), giving them the proporties of the standard model removal rate tiles
         agb_dst = rasterio.open('{0}_{1}.tif'.format(tile_id, output_pattern_list[0]), 'w', **kwargs)
@@ -106,9 +113,10 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
             group_region_age_combined_window = (age_cat_masked_window * 10 + US_forest_group_masked_window * 100 + US_region_masked_window).astype('float32')
 
             # Applies the dictionary of group-region-age gain rates to the group-region-age numpy array to
-            # get annual gain rates (metric tons aboveground biomass/yr) for each pixel that has gain in the standard model
-            for key, value in gain_table_group_region_age_dict.items():
-                annual_gain_standard_window[group_region_age_combined_window == key] = value
+            # get annual gain rates (metric tons aboveground biomass/yr) for each pixel that has gain in the standard model.
+            # Pixels with codes that aren't in the dictionary keep the standard model rate.
+            annual_gain_standard_window = gain_group_region_age_lut.apply(group_region_age_combined_window,
+                                                                          default=annual_gain_standard_window)
 
             # Replaces all values that have Hansen gain pixels with 0 so that they can be filled with Hansen gain pixel-specific
             # values (rates for youngest forest age category)
@@ -121,8 +129,9 @@ def US_removal_rate_calc(tile_id, gain_table_group_region_age_dict, gain_table_g
 
             # Applies the dictionary of region-age-group gain rates to the region-age-group array to
             # get annual gain rates (metric tons aboveground biomass/yr) for each pixel that has gain in the standard model
-            for key, value in gain_table_group_region_dict.items():
-                agb_with_gain_pixel_window[agb_with_gain_pixel_window == key] = value
+            # Codes that aren't in the dictionary keep their code; they are replaced below.
+            agb_with_gain_pixel_window = gain_group_region_lut.apply(agb_with_gain_pixel_window,
+                                                                     default=agb_with_gain_pixel_window)
 
             # Combines the array of removal rates that has no rates where there are Hansen gain pixels with the array of
             # removal rates that has has values only where there are Hansen gain pixels
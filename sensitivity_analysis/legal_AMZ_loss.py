@@ -7,6 +7,8 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import tile_layout
+import raster_profile
 
 
 def legal_Amazon_forest_age_category(tile_id, sensit_type, output_pattern):
@@ -26,8 +28,8 @@ def legal_Amazon_forest_age_category(tile_id, sensit_type, output_pattern):
         # Grabs metadata about the tif, like its location/projection/cellsize
         kwargs = loss_src.meta
 
-        # Grabs the windows of the tile (stripes) so we can iterate over the entire tif without running out of memory
-        windows = loss_src.block_windows(1)
+        # Grabs the windows of the tile so we can iterate over the entire tif without running out of memory
+        windows = tile_layout.windows(loss_src)
 
         # Opens tiles
         gain_src = rasterio.open(gain)
@@ -51,9 +53,9 @@ def legal_Amazon_forest_age_category(tile_id, sensit_type, output_pattern):
         kwargs.update(
             driver='GTiff',
             count=1,
-            compress='lzw',
             nodata=0
         )
+        raster_profile.update(kwargs)
 
         # Opens the output tile, giving it the arguments of the input tiles
         dst = rasterio.open('{0}_{1}.tif'.format(tile_id, output_pattern), 'w', **kwargs)
@@ -121,11 +123,8 @@ def legal_Amazon_create_gain_year_count_loss_only(tile_id, sensit_type):
     loss_outfilename = '{}_growth_years_loss_only.tif'.format(tile_id)
     loss_outfilearg = '--outfile={}'.format(loss_outfilename)
     cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', extent, loss_calc, loss_outfilearg,
-           '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+           '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options('scratch', 'Byte', '--co'), '--type', 'Byte', '--quiet']
+    uu.log_subprocess_output_full(cmd)
 
     # Prints information about the tile that was just processed
     uu.end_of_fx_summary(start, tile_id, 'growth_years_loss_only')
@@ -149,18 +148,15 @@ def legal_Amazon_create_gain_year_count_no_change(tile_id, sensit_type):
     # For unclear reasons, gdal_calc doesn't register the 0 (NoData) pixels in the loss tile, so I have to convert it
     # to a vrt so that the 0 pixels are recognized.
     loss_vrt = '{}_loss.vrt'.format(tile_id)
-    os.system('gdalbuildvrt -vrtnodata None {0} {1}'.format(loss_vrt, loss))
+    uu.log_subprocess_output_full('gdalbuildvrt -vrtnodata None {0} {1}'.format(loss_vrt, loss), shell=True)
 
     # Pixels with loss but in areas with PRODES forest 2000 and biomass >0 (same as standard model)
     no_change_calc = '--calc=(A==0)*(B==1)*(C>0)*{}'.format(cn.loss_years)
     no_change_outfilename = '{}_growth_years_no_change.tif'.format(tile_id)
     no_change_outfilearg = '--outfile={}'.format(no_change_outfilename)
     cmd = ['gdal_calc.py', '-A', loss_vrt, '-B', extent, '-C', biomass, no_change_calc,
-           no_change_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+           no_change_outfilearg, '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options('scratch', 'Byte', '--co'), '--type', 'Byte', '--quiet']
+    uu.log_subprocess_output_full(cmd)
 
     # Prints information about the tile that was just processed
     uu.end_of_fx_summary(start, tile_id, 'growth_years_no_change')
@@ -182,11 +178,8 @@ def legal_Amazon_create_gain_year_count_loss_and_gain_standard(tile_id, sensit_t
     loss_and_gain_outfilename = '{}_growth_years_loss_and_gain.tif'.format(tile_id)
     loss_and_gain_outfilearg = '--outfile={}'.format(loss_and_gain_outfilename)
     cmd = ['gdal_calc.py', '-A', loss, '-B', gain, '-C', extent, loss_and_gain_calc,
-           loss_and_gain_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--type', 'Byte', '--quiet']
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+           loss_and_gain_outfilearg, '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options('scratch', 'Byte', '--co'), '--type', 'Byte', '--quiet']
+    uu.log_subprocess_output_full(cmd)
 
     # Prints information about the tile that was just processed
     uu.end_of_fx_summary(start, tile_id, 'growth_years_loss_and_gain')
@@ -208,11 +201,8 @@ def legal_Amazon_create_gain_year_count_merge(tile_id, output_pattern):
     # All four components are merged together to the final output raster
     age_outfile = '{}_{}.tif'.format(tile_id, output_pattern)
     cmd = ['gdal_merge.py', '-o', age_outfile, loss_outfilename, no_change_outfilename, loss_and_gain_outfilename,
-           '-co', 'COMPRESS=LZW', '-a_nodata', '0', '-ot', 'Byte']
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        uu.log_subprocess_output(process.stdout)
+           *raster_profile.gdal_options('archive', 'Byte'), '-a_nodata', '0', '-ot', 'Byte']
+    uu.log_subprocess_output_full(cmd)
 
     # Prints information about the tile that was just processed
     uu.end_of_fx_summary(start, tile_id, output_pattern)
@@ -17,6 +17,7 @@ import sys
 sys.path.append('../')
 import constants_and_names as cn
 import universal_util as uu
+import raster_profile
 
 
 def main ():
@@ -92,7 +93,7 @@ def main ():
         # This merges all six rasters together, so it takes a lot of memory and time. It seems to repeatedly max out
         # at about 300 GB as it progresses abot 15% each time; then the memory drops back to 0 and slowly increases.
         cmd = ['gdal_merge.py', '-o', '{}.tif'.format(cn.pattern_Brazil_forest_extent_2000_merged),
-               '-co', 'COMPRESS=LZW', '-a_nodata', '0', '-n', '0', '-ot', 'Byte', '-ps', '{}'.format(pixelSizeX), '{}'.format(pixelSizeY),
+               *raster_profile.gdal_options('scratch', 'Byte'), '-a_nodata', '0', '-n', '0', '-ot', 'Byte', '-ps', '{}'.format(pixelSizeX), '{}'.format(pixelSizeY),
                raw_forest_extent_inputs[0], raw_forest_extent_inputs[1], raw_forest_extent_inputs[2],
                raw_forest_extent_inputs[3], raw_forest_extent_inputs[4], raw_forest_extent_inputs[5]]
         uu.log_subprocess_output_full(cmd)
@@ -124,8 +125,7 @@ def main ():
         uu.print_log("There are {} tiles to process".format(str(len(tile_id_list))) + "\n")
 
         # Downloads input rasters and lists them
-        cmd = ['aws', 's3', 'cp', cn.Brazil_annual_loss_raw_dir, '.', '--recursive']
-        uu.log_subprocess_output_full(cmd)
+        uu.s3_copy(cn.Brazil_annual_loss_raw_dir, '.', recursive=True)
 
         uu.print_log("Input loss rasters downloaded. Getting resolution of recent raster...")
 
@@ -144,7 +144,7 @@ def main ():
         # This took about 8 minutes.
         uu.print_log("Merging input loss rasters into a composite for all years...")
         cmd = ['gdal_merge.py', '-o', '{}.tif'.format(cn.pattern_Brazil_annual_loss_merged),
-               '-co', 'COMPRESS=LZW', '-a_nodata', '0', '-n', '0', '-ot', 'Byte', '-ps', '{}'.format(pixelSizeX), '{}'.format(pixelSizeY),
+               *raster_profile.gdal_options('scratch', 'Byte'), '-a_nodata', '0', '-n', '0', '-ot', 'Byte', '-ps', '{}'.format(pixelSizeX), '{}'.format(pixelSizeY),
                'Prodes2019_annual_loss_2008_2019.tif', 'Prodes2014_annual_loss_2001_2007.tif']
         uu.log_subprocess_output_full(cmd)
         uu.print_log("  Loss rasters combined into composite")
@@ -335,12 +335,7 @@ def main ():
 
 
         # Table with IPCC Table 4.9 default gain rates
-        cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
         pd.options.mode.chained_assignment = None
 
@@ -597,12 +592,7 @@ def main ():
 
 
         # Table with IPCC Wetland Supplement Table 4.4 default mangrove gain rates
-        cmd = ['aws', 's3', 'cp', os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir]
-
-        # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-        process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-        with process.stdout:
-            uu.log_subprocess_output(process.stdout)
+        uu.s3_copy(os.path.join(cn.gain_spreadsheet_dir, cn.gain_spreadsheet), cn.docker_base_dir)
 
 
         pd.options.mode.chained_assignment = None
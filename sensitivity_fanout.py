@@ -0,0 +1,162 @@
+'''
+Runs several model types (the standard model and sensitivity analyses) in one model run
+(run_full_model.py -t std,maxgain,no_shifting_ag).
+Run by themselves, sensitivity analyses run every stage again, downloading and creating the same tiles as the
+standard model for the stages they don't change. Here, the standard model is run first and each sensitivity analysis
+only runs the stages whose outputs differ from the standard model's (divergent_stages()):
+1. stages declared with the sensitivity analysis in sensit_logic (e.g., gain year count for maxgain),
+2. stages with an input that the sensitivity analysis swaps (sensit_inputs, e.g., Brazil loss for legal_Amazon_loss),
+3. stages that read the outputs of divergent stages.
+The other stages are shared: the sensitivity analysis doesn't write its own copy of their outputs, and its divergent
+stages read the standard model's tiles instead, as they already do for inputs without a sensitivity analysis version
+(uu.s3_file_download, uu.sensit_tile_rename). The standard model's tiles that later model types read are kept in the
+working folder, so they are only downloaded once.
+Each model type has its own stage checkpoints (stage_graph.py), so standard model stages that already finished with
+the same inputs and arguments aren't run again.
+'''
+
+import glob
+import os
+import universal_util as uu
+import stage_graph
+import tile_manifest
+
+
+# Arguments of the model run for a model type. Sensitivity analyses only create carbon pools in the year of loss.
+def model_type_args(args, sensit_type):
+
+    if sensit_type == 'std':
+        return dict(args, sensit_type=sensit_type)
+
+    return dict(args, sensit_type=sensit_type, carbon_pool_extent='loss')
+
+
+# Names of the stages of the graph whose outputs differ from the standard model's for the sensitivity analysis, in
+# graph order
+def divergent_stages(graph, args, sensit_type):
+
+    std_args = model_type_args(args, 'std')
+    sensit_args = model_type_args(args, sensit_type)
+
+    divergent = []
+    divergent_patterns = set()
+
+    for stage in graph:
+
+        if not stage.runs_for(sensit_type):
+            continue
+
+        std_inputs = stage.input_list(std_args)
+
+        if sensit_type in stage.sensit_logic or stage.input_list(sensit_args) != std_inputs or \
+                any(pattern in divergent_patterns for s3_dir, pattern in std_inputs):
+            divergent.append(stage.name)
+            divergent_patterns.update(pattern for s3_dir, pattern in stage.output_list(std_args))
+
+    return divergent
+
+
+# Patterns of the tiles that the named stages of the model types read, by model type ({sensit_type: stage names})
+def stage_inputs(graph, args, stage_names_by_type):
+
+    patterns = set()
+    for sensit_type, stage_names in stage_names_by_type.items():
+        for stage in graph:
+            if stage.name in stage_names:
+                patterns.update(pattern for s3_dir, pattern in stage.input_list(model_type_args(args, sensit_type)))
+
+    return patterns
+
+
+# Warns about sensitivity analysis tiles on s3 for the outputs of shared stages (e.g., from an earlier run of the
+# sensitivity analysis by itself). Downloads use them instead of the standard model's tiles.
+def check_shared_outputs(graph, stage_names, args, divergent):
+
+    for stage in graph:
+
+        if stage.name not in stage_names or stage.name in divergent or not stage.runs_for(args['sensit_type']):
+            continue
+
+        for s3_dir, pattern in stage.output_list(args):
+            tile_count = len(tile_manifest.tiles(s3_dir, pattern))
+            if tile_count:
+                uu.print_log("  Warning: {0} has {1} {2} tiles. {3} will use them instead of the standard model's {4} tiles.".format(
+                    s3_dir, tile_count, pattern, args['sensit_type'], stage.name))
+
+
+# Deletes the sensitivity analysis's own tiles from the working folder once it's finished: its outputs and the inputs
+# it swaps in. Some stages use swapped inputs whenever they are in the folder (e.g., carbon pools and Mekong loss).
+def remove_sensit_tiles(graph, sensit_type):
+
+    swapped = set(pattern for stage in graph for s3_dir, pattern in stage.sensit_inputs.get(sensit_type, {}).values())
+
+    tiles_to_delete = [name for name in glob.glob('*.tif')
+                       if name.endswith('_{}.tif'.format(sensit_type)) or any(pattern in name for pattern in swapped)]
+
+    uu.print_log("Deleting {0} {1} tiles from the working folder".format(len(tiles_to_delete), sensit_type))
+    for tile_to_delete in tiles_to_delete:
+        os.remove(tile_to_delete)
+
+
+# Model types to run in a fan-out run: the standard model first, then the sensitivity analyses in the order given
+def model_types(sensit_types):
+
+    return ['std'] + [sensit_type for sensit_type in sensit_types if sensit_type != 'std']
+
+
+# Stages each model type runs in a fan-out run of the named stages, as {sensit_type: stage names}
+def stages_to_run(graph, stage_names, args, sensit_types):
+
+    stages = {}
+    for sensit_type in model_types(sensit_types):
+
+        if sensit_type == 'std':
+            stages[sensit_type] = [stage.name for stage in graph if stage.name in stage_names and stage.runs_for('std')]
+        else:
+            stages[sensit_type] = [name for name in divergent_stages(graph, args, sensit_type) if name in stage_names]
+
+    return stages
+
+
+# Runs the named stages of the graph for the standard model and then for each sensitivity analysis, sharing the
+# stages whose outputs are the same as the standard model's.
+# args has the model run's arguments, as for stage_graph.run(), with those of each model type from model_type_args().
+def run(graph, stage_names, args, sensit_types, resume=True):
+
+    sensit_types = model_types(sensit_types)
+    stages = stages_to_run(graph, stage_names, args, sensit_types)
+
+    uu.print_log(":::::Running {} in one model run".format(', '.join(sensit_types)))
+    for sensit_type in sensit_types[1:]:
+        shared = [stage.name for stage in graph if stage.name in stage_names and stage.runs_for(sensit_type)
+                  and stage.name not in stages[sensit_type]]
+        uu.print_log("  {0} runs {1} and shares {2} with the standard model".format(sensit_type, stages[sensit_type], shared))
+
+    for index, sensit_type in enumerate(sensit_types):
+
+        uu.print_log(":::::Model type {}".format(sensit_type), "\n")
+
+        sensit_args = model_type_args(args, sensit_type)
+
+        # The standard model's tiles that later model types read stay in the working folder
+        keep = stage_inputs(graph, args, dict((later, stages[later]) for later in sensit_types[index + 1:]))
+
+        stage_tiles = {}
+        if sensit_type != 'std':
+            check_shared_outputs(graph, stage_names, sensit_args, stages[sensit_type])
+            stage_tiles = dict((stage.name, []) for stage in graph if stage.name not in stages[sensit_type])
+
+        stage_graph.run(graph, stage_names, sensit_args, resume=resume, stage_tiles=stage_tiles, keep=keep)
+
+        if sensit_type != 'std':
+            remove_sensit_tiles(graph, sensit_type)
+
+
+# s3 folders written by a fan-out run of the named stages, for counting the tiles in them
+def output_dirs(graph, stage_names, args, sensit_types):
+
+    dirs = []
+    for sensit_type, names in sorted(stages_to_run(graph, stage_names, args, sensit_types).items()):
+        dirs.extend(stage_graph.output_dirs(graph, names, model_type_args(args, sensit_type)))
+
+    return dirs
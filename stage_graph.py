@@ -0,0 +1,413 @@
+'''
+Runs the stages of the full model as a graph instead of as a linear script.
+Each stage is declared with the s3 folders and file name patterns it reads and writes, and with the sensitivity
+analyses it runs for and the inputs that sensitivity analyses swap in (e.g., Brazil loss instead of Hansen loss).
+From these declarations:
+1. Each tile that a stage finishes is recorded in a SQLite file in cn.docker_tmp with a fingerprint of the stage's
+   inputs for that tile (the ETags of the input tiles on s3, from the tile manifest), the run's arguments and the
+   model code (the .py and .cpp files in cn.docker_app).
+   When the model is run again with the same arguments (e.g., after the machine stopped), stages whose tiles are all
+   recorded with the same fingerprint are skipped and the other stages only run on the tiles that aren't recorded.
+   If an input tile changes on s3 (e.g., because an upstream stage was run again, including in the folders with the
+   run date) or the code changes (e.g., a bug fix), the tile is run again.
+2. Within a stage, tile_scheduler records each tile as it finishes (with the output files it wrote). If the stage is
+   interrupted, the tiles that finished and whose outputs are still in the working folder aren't run again.
+3. Before each stage, tiles in the working folder that no remaining stage reads or writes are deleted (and cached
+   files from folders that no remaining stage reads are evicted from the tile cache),
+   instead of each stage listing the tiles to delete.
+'''
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import constants_and_names as cn
+import universal_util as uu
+import tile_cache
+import tile_manifest
+
+# The stage that is running, set by run() so that tile_scheduler can record and skip its tiles
+_active = None
+
+# Hash of the model code, computed once per process by code_version()
+_code_version = None
+
+
+# A model stage: the function that runs it and the tiles it reads and writes.
+# function(tile_id_list, args) runs the stage on the tiles, with the model run's arguments in args.
+# inputs and outputs are lists of (s3 folder, file name pattern), or functions of args that return such lists when
+# they depend on the model run (e.g., the carbon pool extent).
+# sensit_types is the sensitivity analyses the stage runs for (all, if None).
+# sensit_inputs is, for each sensitivity analysis, the (s3 folder, pattern) that replaces an input pattern.
+# sensit_logic is the sensitivity analyses whose calculations in the stage differ from the standard model's, other than
+# by swapped inputs (e.g., gain year count for maxgain), so that their outputs differ (see sensitivity_fanout.py).
+# uses_loss_years is whether the stage's calculations use the number of loss years (cn.loss_years), so that all of its
+# outputs change when a year of loss is added (see loss_year_update.py).
+class Stage(object):
+
+    def __init__(self, name, function, inputs, outputs, sensit_types=None, sensit_inputs=None, sensit_logic=None,
+                 uses_loss_years=False):
+
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.sensit_types = sensit_types
+        self.sensit_inputs = sensit_inputs if sensit_inputs is not None else {}
+        self.sensit_logic = sensit_logic if sensit_logic is not None else []
+        self.uses_loss_years = uses_loss_years
+
+    def runs_for(self, sensit_type):
+
+        return self.sensit_types is None or sensit_type in self.sensit_types
+
+    # Inputs of the stage for the model run, with sensitivity analysis inputs swapped in
+    def input_list(self, args):
+
+        inputs = self.inputs(args) if callable(self.inputs) else self.inputs
+        swaps = self.sensit_inputs.get(args['sensit_type'], {})
+
+        return [swaps.get(pattern, (s3_dir, pattern)) for s3_dir, pattern in inputs]
+
+    # Outputs of the stage for the model run, renamed for sensitivity analyses like uu.alter_dirs and uu.alter_patterns
+    def output_list(self, args):
+
+        outputs = self.outputs(args) if callable(self.outputs) else self.outputs
+        sensit_type = args['sensit_type']
+
+        if sensit_type == 'std':
+            return outputs
+
+        return [(s3_dir.replace('standard', sensit_type), '{0}_{1}'.format(pattern, sensit_type))
+                for s3_dir, pattern in outputs]
+
+
+# Opens the checkpoint database, creating its tables if they don't exist.
+# stage_tiles has the tiles each stage finished (tile_id 'all' if the stage was run on all tiles);
+# step_tiles has the tiles each tile_scheduler run within a stage finished, with the output files they wrote.
+def _connect():
+
+    if not os.path.exists(cn.docker_tmp):
+        os.makedirs(cn.docker_tmp, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.docker_tmp, cn.stage_checkpoint_db), timeout=120)
+    connection.execute('CREATE TABLE IF NOT EXISTS stage_tiles (run_id TEXT, stage TEXT, tile_id TEXT, '
+                       'fingerprint TEXT, completed_at REAL, PRIMARY KEY (run_id, stage, tile_id))')
+    connection.execute('CREATE TABLE IF NOT EXISTS step_tiles (run_id TEXT, step TEXT, tile_id TEXT, '
+                       'fingerprint TEXT, outputs TEXT, completed_at REAL, PRIMARY KEY (run_id, step, tile_id))')
+
+    return connection
+
+
+# Checkpoints are kept separately for each model type and run date
+def _run_id(args):
+
+    return '{0}_{1}'.format(args['sensit_type'], args['run_date'])
+
+
+# Hash of the model code: the .py and .cpp files in cn.docker_app. Any change to them (e.g., a bug fix) changes the
+# fingerprints of all stages, so nothing is skipped because it finished with older code.
+def code_version():
+
+    global _code_version
+
+    if _code_version is None:
+
+        digest = hashlib.sha1()
+        for root, dirs, files in sorted(os.walk(cn.docker_app)):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(files):
+                if name.endswith('.py') or name.endswith('.cpp'):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, cn.docker_app).encode('utf-8'))
+                    with open(path, 'rb') as code:
+                        digest.update(code.read())
+
+        _code_version = digest.hexdigest()
+
+    return _code_version
+
+
+# The folder with the run date that outputs in an s3 folder are written to, as uu.replace_output_dir_date makes it
+def _dated_dir(s3_dir, run_date):
+
+    return s3_dir.replace(s3_dir[-9:-1], run_date)
+
+
+# ETags of the input tiles of a stage on s3, by tile_id.
+# Inputs in standard model folders are also looked for in the sensitivity analysis folder, as uu.s3_file_download does.
+# With a run date, inputs that stages of the graph write are also looked for in the folders with the run date, where
+# those stages write them.
+def input_etags(stage, args, graph=()):
+
+    sensit_type = args['sensit_type']
+    etags = {}
+
+    produced = set()
+    if args.get('run_date'):
+        for graph_stage in graph:
+            produced.update(s3_dir for s3_dir, pattern in graph_stage.output_list(dict(args, sensit_type='std')))
+
+    for s3_dir, pattern in stage.input_list(args):
+
+        s3_dirs = [s3_dir]
+        if s3_dir in produced:
+            s3_dirs.append(_dated_dir(s3_dir, args['run_date']))
+        if sensit_type != 'std':
+            s3_dirs.extend(folder.replace('standard', sensit_type) for folder in list(s3_dirs) if 'standard' in folder)
+
+        for folder in s3_dirs:
+            for name, tile_id, size, etag, mtime in tile_manifest.tiles(folder, pattern):
+                etags.setdefault(tile_id, []).append('{0}:{1}'.format(name, etag))
+
+    return etags
+
+
+# Fingerprint of the inputs of a stage for a tile (or for all tiles, if tile_id is 'all') and of the run's arguments
+def fingerprint(stage, tile_id, args, etags):
+
+    # The tile list and log note don't change the outputs of a tile
+    arguments = dict((key, value) for key, value in args.items() if key not in ['tile_id_list', 'log_note'])
+
+    digest = hashlib.sha1(json.dumps([stage.name, arguments, code_version()], sort_keys=True, default=str).encode('utf-8'))
+
+    if tile_id == 'all':
+        tile_etags = sorted(etag for tile_etags in etags.values() for etag in tile_etags)
+    else:
+        tile_etags = sorted(etags.get(tile_id, []))
+
+    for etag in tile_etags:
+        digest.update(etag.encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+# Tiles of the tile list that the stage hasn't finished with the same inputs ('all' if the list is 'all' and the
+# stage hasn't finished all tiles)
+def pending_tiles(stage, args, etags):
+
+    tile_id_list = args['tile_id_list']
+    tile_ids = ['all'] if tile_id_list == 'all' else tile_id_list
+
+    connection = _connect()
+    finished = dict(connection.execute('SELECT tile_id, fingerprint FROM stage_tiles WHERE run_id = ? AND stage = ?',
+                                       (_run_id(args), stage.name)).fetchall())
+    connection.close()
+
+    pending = [tile_id for tile_id in tile_ids if finished.get(tile_id) != fingerprint(stage, tile_id, args, etags)]
+
+    if tile_id_list == 'all':
+        return 'all' if pending else []
+
+    return pending
+
+
+# Records that the stage finished the tiles
+def _stage_finished(stage, tile_ids, args, etags):
+
+    connection = _connect()
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO stage_tiles VALUES (?, ?, ?, ?, ?)',
+                               [(_run_id(args), stage.name, tile_id, fingerprint(stage, tile_id, args, etags),
+                                 time.time()) for tile_id in tile_ids])
+    connection.close()
+
+
+# Forgets the finished tiles and steps of the stages, so they are run again from the start
+def reset(stages, args):
+
+    connection = _connect()
+    with connection:
+        for stage in stages:
+            connection.execute('DELETE FROM stage_tiles WHERE run_id = ? AND stage = ?', (_run_id(args), stage.name))
+            connection.execute('DELETE FROM step_tiles WHERE run_id = ? AND substr(step, 1, length(?)) = ?',
+                               (_run_id(args), stage.name + ':', stage.name + ':'))
+    connection.close()
+
+
+# Tiles of a tile_scheduler run that already finished with the same inputs in an interrupted run of the current
+# stage and whose outputs are still in the working folder. Empty if no stage is running (e.g., an mp_ script run by itself).
+def finished_tiles(step, tile_id_list):
+
+    if _active is None:
+        return set()
+
+    stage, args, etags = _active
+
+    connection = _connect()
+    rows = connection.execute('SELECT tile_id, fingerprint, outputs FROM step_tiles WHERE run_id = ? AND step = ?',
+                              (_run_id(args), '{0}:{1}'.format(stage.name, step))).fetchall()
+    connection.close()
+
+    finished = set()
+    for tile_id, tile_fingerprint, outputs in rows:
+        if tile_id not in tile_id_list or tile_fingerprint != fingerprint(stage, _tile_id(tile_id), args, etags):
+            continue
+        if all(os.path.exists(name) and os.path.getsize(name) == size for name, size in json.loads(outputs)):
+            finished.add(tile_id)
+
+    return finished
+
+
+# Records that a tile_scheduler run in the current stage finished a tile, with the (name, size) of its output files
+def tile_finished(step, tile_id, outputs):
+
+    if _active is None:
+        return
+
+    stage, args, etags = _active
+
+    connection = _connect()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO step_tiles VALUES (?, ?, ?, ?, ?, ?)',
+                           (_run_id(args), '{0}:{1}'.format(stage.name, step), tile_id,
+                            fingerprint(stage, _tile_id(tile_id), args, etags), json.dumps(outputs),
+                            time.time()))
+    connection.close()
+
+
+# Tile id of a tile id or tile file name (some stages schedule tile file names)
+def _tile_id(tile):
+
+    match = re.search(tile_manifest.tile_id_regex, tile)
+
+    return match.group() if match else tile
+
+
+# Pattern of a tile name ({tile_id}_{pattern}.tif or {pattern}_{tile_id}.tif), or None if it isn't a tile name
+def _tile_pattern(name):
+
+    match = re.match(r'^{}_(.+)\.tif$'.format(tile_manifest.tile_id_regex), name)
+    if match:
+        return match.group(1)
+
+    match = re.match(r'^(.+)_{}\.tif$'.format(tile_manifest.tile_id_regex), name)
+    if match:
+        return match.group(1)
+
+    return None
+
+
+# The patterns and their sensitivity analysis versions
+def _with_sensit(patterns, sensit_type):
+
+    return set(patterns) | set('{0}_{1}'.format(pattern, sensit_type) for pattern in patterns)
+
+
+# Deletes tiles in the working folder whose pattern is a pattern of the graph but not one that the remaining stages
+# read or write or that is in keep. Patterns are matched exactly, including the sensitivity analysis versions of
+# input tiles ({pattern}_{sensit_type}, see uu.sensit_tile_rename). Other tiles are left alone.
+# Also evicts the unpinned files of the tile cache that aren't from folders the remaining stages read, since deleting
+# working tiles doesn't free the disk their cached copies use.
+def cleanup(graph, remaining, args, keep=()):
+
+    read_dirs = set()
+    for stage in remaining:
+        for s3_dir, pattern in stage.input_list(args):
+            read_dirs.update([s3_dir, s3_dir.replace('standard', args['sensit_type'])])
+
+    freed = tile_cache.evict(keep_dirs=read_dirs)
+    if freed:
+        uu.print_log(":::::Evicted {:.1f} GB of cached tiles that later stages don't read".format(freed / 1024 ** 3))
+
+    graph_patterns = set()
+    for stage in graph:
+        graph_patterns.update(pattern for s3_dir, pattern in stage.input_list(args) + stage.output_list(args))
+    graph_patterns = _with_sensit(graph_patterns, args['sensit_type'])
+
+    needed = set(keep)
+    for stage in remaining:
+        needed.update(pattern for s3_dir, pattern in stage.input_list(args) + stage.output_list(args))
+    needed = _with_sensit(needed, args['sensit_type'])
+
+    tiles_to_delete = []
+    for name in os.listdir('.'):
+        pattern = _tile_pattern(name)
+        if pattern in graph_patterns and pattern not in needed:
+            tiles_to_delete.append(name)
+
+    if not tiles_to_delete:
+        return
+
+    uu.print_log(":::::Freeing up disk space by deleting tiles that later stages don't use")
+    uu.print_log("  Deleting", len(tiles_to_delete), "tiles...")
+    for tile_to_delete in tiles_to_delete:
+        os.remove(tile_to_delete)
+    uu.print_log(":::::Deleted unneeded tiles")
+    uu.check_storage()
+
+
+# Runs the named stages of the graph in graph order, skipping the tiles and stages that are already finished.
+# args has the model run's arguments (sensit_type, tile_id_list, run_date, etc.), which are passed to each stage.
+# With resume False, the named stages are run again from the start.
+# stage_tiles optionally limits stages to other tile lists than the run's, by stage name (e.g., only the tiles with
+# new loss in an incremental update); stages with an empty list aren't run.
+# keep is patterns of tiles to keep in the working folder even if no remaining stage uses them (e.g., for later
+# model types in the same run).
+def run(graph, stage_names, args, resume=True, stage_tiles=None, keep=()):
+
+    global _active
+
+    stages = [stage for stage in graph if stage.name in stage_names]
+    if stage_tiles is None:
+        stage_tiles = {}
+
+    if not resume:
+        reset(stages, args)
+
+    for index, stage in enumerate(stages):
+
+        if not stage.runs_for(args['sensit_type']):
+            uu.print_log(":::::Skipping {0}; it isn't run for {1}".format(stage.name, args['sensit_type']))
+            continue
+
+        cleanup(graph, [stage for stage in stages[index:] if stage.runs_for(args['sensit_type'])], args, keep)
+
+        stage_args = args
+        if stage.name in stage_tiles:
+            if not stage_tiles[stage.name]:
+                uu.print_log(":::::No tiles to run {}. Skipping.".format(stage.name), "\n")
+                continue
+            stage_args = dict(args, tile_id_list=stage_tiles[stage.name])
+
+        etags = input_etags(stage, stage_args, graph)
+        tile_id_list = pending_tiles(stage, stage_args, etags)
+
+        if not tile_id_list:
+            uu.print_log(":::::{} already finished for these tiles with the same inputs. Skipping.".format(stage.name), "\n")
+            continue
+
+        if tile_id_list != stage_args['tile_id_list']:
+            uu.print_log(":::::Resuming {0} with the {1} tiles that aren't finished".format(stage.name, len(tile_id_list)))
+
+        uu.print_log(":::::Running {}".format(stage.name))
+        start = datetime.datetime.now()
+
+        _active = (stage, stage_args, etags)
+        try:
+            stage.function(tile_id_list, stage_args)
+        finally:
+            _active = None
+
+        # Outputs uploaded by the stage change the inputs of later stages, so they are listed again when needed
+        _stage_finished(stage, ['all'] if tile_id_list == 'all' else tile_id_list, stage_args, etags)
+
+        end = datetime.datetime.now()
+        elapsed_time = end - start
+        uu.check_storage()
+        uu.print_log(":::::Processing time for {}:".format(stage.name), elapsed_time, "\n", "\n")
+        uu.upload_log()
+
+
+# s3 folders written by the named stages for the model run, for counting the tiles in them
+def output_dirs(graph, stage_names, args):
+
+    dirs = []
+    for stage in graph:
+        if stage.name in stage_names and stage.runs_for(args['sensit_type']):
+            dirs.extend(s3_dir for s3_dir, pattern in stage.output_list(args))
+
+    return dirs
@@ -0,0 +1,290 @@
+'''
+Telemetry of model runs, kept across runs in a SQLite file in cn.docker_tmp (cn.telemetry_db).
+Before, the only record of what a tile cost was the processing time uu.end_of_fx_summary prints to the log, and peak
+memory was measured by hand and copied into comments. Now:
+1. tile_scheduler.run records every tile of every stage: wall and CPU seconds, peak memory, bytes read from and
+   written to disk and bytes of output files. These come from the rusage of the tile's process, so they include the
+   programs the tile ran (e.g., gdalwarp or the C++ gross emissions).
+2. command() runs external programs (gdalwarp, gdal_calc.py, the C++ gross emissions, etc.; uu.log_subprocess_output_full
+   calls it) and records the same for each program.
+3. uu.s3_copy records every s3 download and upload (which used to be aws cp programs): bytes and seconds.
+Records have the model run, the model stage (from stage_graph), the tile_scheduler step and the tile they belong to.
+report() summarizes a run. For each step: how long it took and how long its slowest tile took (tiles run in parallel,
+so the slowest tile is the step's critical path), CPU, disk I/O and the distribution of peak memory per tile, with the
+number of tiles of the 90th percentile peak that fit in this machine's memory. Then the slowest tiles of the run, and
+how many times each program and s3 transfer ran and how long they took. run_full_model prints the report at the end.
+The memory distributions are fed back into tile_scheduler: once a stage has cn.telemetry_min_tiles recorded tiles,
+tiles that haven't run in the stage before are estimated at cn.telemetry_new_tile_quantile of the recorded peaks
+(across all runs), instead of the largest peak of any tile.
+Running this script prints the report of the latest run, or of --run-id.
+'''
+
+import argparse
+import datetime
+import os
+import sqlite3
+import time
+from subprocess import Popen, PIPE, STDOUT, CalledProcessError
+import constants_and_names as cn
+import universal_util as uu
+import stage_graph
+
+GB = 1024 ** 3
+
+# Bytes in a block of ru_inblock and ru_oublock
+rusage_block_bytes = 512
+
+# The model run that records belong to. Set when the module is first imported (in the main process, before any tiles
+# are forked) so that all processes of a run share it. run_full_model names its runs with start_run().
+_run_id = '{0:%Y%m%d_%H%M%S}_{1}'.format(datetime.datetime.now(), os.getpid())
+
+# The tile_scheduler step and tile that the current (forked) process is running, if any
+_step = ''
+_tile_id = ''
+
+
+# Opens the telemetry database, creating its tables if they don't exist.
+# tiles has one row for each tile that tile_scheduler ran; commands has one row for each program or s3 transfer.
+def _connect():
+
+    if not os.path.exists(cn.docker_tmp):
+        os.makedirs(cn.docker_tmp, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.docker_tmp, cn.telemetry_db), timeout=120)
+    connection.execute('CREATE TABLE IF NOT EXISTS tiles (run_id TEXT, stage TEXT, step TEXT, tile_id TEXT, '
+                       'started REAL, wall_seconds REAL, cpu_seconds REAL, peak_bytes INTEGER, read_bytes INTEGER, '
+                       'written_bytes INTEGER, output_bytes INTEGER, ok INTEGER)')
+    connection.execute('CREATE TABLE IF NOT EXISTS commands (run_id TEXT, stage TEXT, step TEXT, tile_id TEXT, '
+                       'program TEXT, command TEXT, started REAL, wall_seconds REAL, cpu_seconds REAL, '
+                       'peak_bytes INTEGER, read_bytes INTEGER, written_bytes INTEGER, returncode INTEGER)')
+    connection.execute('CREATE INDEX IF NOT EXISTS tiles_run ON tiles (run_id)')
+    connection.execute('CREATE INDEX IF NOT EXISTS tiles_step ON tiles (step)')
+    connection.execute('CREATE INDEX IF NOT EXISTS commands_run ON commands (run_id)')
+
+    return connection
+
+
+# Names the model run that the following records belong to
+def start_run(run_id):
+
+    global _run_id
+
+    _run_id = run_id
+
+
+# Sets the tile_scheduler step and tile that this process runs, so that its programs and transfers are recorded with them
+def set_tile(step, tile_id):
+
+    global _step, _tile_id
+
+    _step = step
+    _tile_id = tile_id
+
+
+# The model stage that is running in stage_graph, if any
+def _stage():
+
+    if stage_graph._active is None:
+        return ''
+
+    return stage_graph._active[0].name
+
+
+# Wall and CPU seconds, peak memory and bytes read and written from a process's rusage.
+# The rusage of a process that has been waited for includes the processes it waited for.
+def _usage(rusage):
+
+    return (rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss * 1024,
+            rusage.ru_inblock * rusage_block_bytes, rusage.ru_oublock * rusage_block_bytes)
+
+
+# Writes a row to a table. Telemetry that can't be written is logged and skipped; it never stops the model.
+def _insert(table, row):
+
+    try:
+        connection = _connect()
+        with connection:
+            connection.execute('INSERT INTO {0} VALUES ({1})'.format(table, ', '.join('?' * len(row))), row)
+        connection.close()
+    except:
+        uu.print_log("Could not record telemetry in {}".format(table))
+
+
+# Records a tile that tile_scheduler ran, from the rusage of its process
+def record_tile(step, tile_id, started, wall_seconds, rusage, output_bytes, ok):
+
+    cpu_seconds, peak_bytes, read_bytes, written_bytes = _usage(rusage)
+    _insert('tiles', (_run_id, _stage(), step, tile_id, started, wall_seconds, cpu_seconds, peak_bytes, read_bytes,
+                      written_bytes, output_bytes, int(ok)))
+
+
+# Records an s3 download or upload with the (files, bytes, seconds) result of s3_transfer
+def record_transfer(source, dest, result):
+
+    program = 's3_download' if source.startswith('s3://') else 's3_upload'
+    files, total_bytes, seconds = result[:3]
+    read_bytes, written_bytes = (0, total_bytes) if program == 's3_download' else (total_bytes, 0)
+    _insert('commands', (_run_id, _stage(), _step, _tile_id, program, '{0} {1}'.format(source, dest),
+                         time.time() - seconds, seconds, None, None, read_bytes, written_bytes, 0))
+
+
+# Runs an external program, logs its output and records its wall and CPU seconds, peak memory and disk I/O.
+# cmd is a list of arguments, or a string with shell=True (e.g., for wildcards).
+# Returns the program's return code; with check=True, a return code other than 0 raises CalledProcessError.
+def command(cmd, shell=False, check=False):
+
+    started = time.time()
+    process = Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=shell)
+    with process.stdout:
+        uu.log_subprocess_output(process.stdout)
+
+    # Waits with wait4 instead of process.wait() to get the program's rusage
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    wall_seconds = time.time() - started
+
+    text = cmd if shell else ' '.join(str(arg) for arg in cmd)
+    program = os.path.basename(text.split()[0]) if text.split() else ''
+    cpu_seconds, peak_bytes, read_bytes, written_bytes = _usage(rusage)
+    _insert('commands', (_run_id, _stage(), _step, _tile_id, program, text, started, wall_seconds, cpu_seconds,
+                         peak_bytes, read_bytes, written_bytes, process.returncode))
+
+    if check and process.returncode != 0:
+        raise CalledProcessError(process.returncode, cmd)
+
+    return process.returncode
+
+
+# Value at a quantile (0-1) of a list of numbers, by the nearest rank
+def quantile(values, fraction):
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+# Peak memory per tile at a quantile of all tiles recorded for a tile_scheduler step (across runs),
+# or None if fewer than cn.telemetry_min_tiles tiles have been recorded
+def peak_quantile(step, fraction):
+
+    try:
+        connection = _connect()
+        peaks = [row[0] for row in connection.execute('SELECT peak_bytes FROM tiles WHERE step = ? AND ok = 1', (step,))]
+        connection.close()
+    except:
+        return None
+
+    if len(peaks) < cn.telemetry_min_tiles:
+        return None
+
+    return quantile(peaks, fraction)
+
+
+# The run with the latest record
+def latest_run():
+
+    connection = _connect()
+    row = connection.execute('SELECT run_id FROM (SELECT run_id, started FROM tiles UNION ALL '
+                             'SELECT run_id, started FROM commands) ORDER BY started DESC LIMIT 1').fetchone()
+    connection.close()
+
+    return row[0] if row else None
+
+
+# Logs a summary of a run (the current run if run_id isn't given): per step critical path, CPU, I/O and memory per tile;
+# the slowest tiles; and the programs and s3 transfers
+def report(run_id=None):
+
+    if run_id is None:
+        run_id = _run_id
+
+    connection = _connect()
+    tiles = connection.execute('SELECT stage, step, tile_id, started, wall_seconds, cpu_seconds, peak_bytes, read_bytes, '
+                               'written_bytes, output_bytes, ok FROM tiles WHERE run_id = ? ORDER BY started',
+                               (run_id,)).fetchall()
+    commands = connection.execute('SELECT program, wall_seconds, cpu_seconds, peak_bytes, read_bytes, written_bytes, '
+                                  'returncode FROM commands WHERE run_id = ?', (run_id,)).fetchall()
+    connection.close()
+
+    if not tiles and not commands:
+        uu.print_log("No telemetry recorded for run {}".format(run_id))
+        return
+
+    memory_budget = _memory_budget()
+
+    uu.print_log(":::::Performance report for run {}".format(run_id))
+
+    # Steps in the order they started
+    steps = []
+    for tile in tiles:
+        if (tile[0], tile[1]) not in steps:
+            steps.append((tile[0], tile[1]))
+
+    uu.print_log("{0:<40}{1:>7}{2:>7}{3:>10}{4:>10}{5:>8}{6:>10}{7:>10}{8:>10}{9:>9}{10:>9}{11:>9}{12:>8}".format(
+        'Step', 'Tiles', 'Failed', 'Elapsed s', 'Slowest s', 'CPU h', 'Read GB', 'Write GB', 'Output GB',
+        'p50 GB', 'p90 GB', 'Max GB', 'Fit'))
+
+    elapsed_total = 0
+    slowest_total = 0
+    for stage, step in steps:
+
+        step_tiles = [tile for tile in tiles if tile[0] == stage and tile[1] == step]
+        elapsed = max(tile[3] + tile[4] for tile in step_tiles) - min(tile[3] for tile in step_tiles)
+        slowest = max(tile[4] for tile in step_tiles)
+        peaks = [tile[6] for tile in step_tiles if tile[10]] or [0]
+        elapsed_total += elapsed
+        slowest_total += slowest
+
+        uu.print_log("{0:<40}{1:>7}{2:>7}{3:>10.0f}{4:>10.0f}{5:>8.1f}{6:>10.1f}{7:>10.1f}{8:>10.1f}{9:>9.1f}{10:>9.1f}{11:>9.1f}{12:>8}".format(
+            step if not stage or stage in step else '{0}: {1}'.format(stage, step), len(step_tiles),
+            sum(1 for tile in step_tiles if not tile[10]), elapsed, slowest,
+            sum(tile[5] for tile in step_tiles) / 3600, sum(tile[7] for tile in step_tiles) / GB,
+            sum(tile[8] for tile in step_tiles) / GB, sum(tile[9] for tile in step_tiles) / GB,
+            quantile(peaks, 0.5) / GB, quantile(peaks, 0.9) / GB, max(peaks) / GB,
+            int(memory_budget // quantile(peaks, 0.9)) if quantile(peaks, 0.9) else ''))
+
+    if steps:
+        uu.print_log("Steps took {0:.1f} h; their slowest tiles alone took {1:.1f} h (the critical path)".format(
+            elapsed_total / 3600, slowest_total / 3600))
+        uu.print_log("Fit: tiles at the 90th percentile peak memory that fit in this machine's memory budget "
+                     "({:.0f} GB)".format(memory_budget / GB))
+
+    # Slowest tiles of the run
+    if tiles:
+        uu.print_log("Slowest tiles:")
+        for stage, step, tile_id, started, wall_seconds, cpu_seconds, peak_bytes, read_bytes, written_bytes, output_bytes, ok \
+                in sorted(tiles, key=lambda tile: tile[4], reverse=True)[:cn.telemetry_slowest_tiles]:
+            uu.print_log("  {0} {1}: {2:.0f} s, {3:.0f} CPU s, peak memory {4:.1f} GB{5}".format(
+                step, tile_id, wall_seconds, cpu_seconds, peak_bytes / GB, '' if ok else ' (failed)'))
+
+    # Programs and s3 transfers
+    if commands:
+        uu.print_log("{0:<30}{1:>8}{2:>8}{3:>10}{4:>10}{5:>10}{6:>10}{7:>10}".format(
+            'Program', 'Runs', 'Failed', 'Total s', 'Max s', 'Max GB', 'Read GB', 'Write GB'))
+        for program in sorted(set(row[0] for row in commands)):
+            rows = [row for row in commands if row[0] == program]
+            uu.print_log("{0:<30}{1:>8}{2:>8}{3:>10.0f}{4:>10.0f}{5:>10.1f}{6:>10.1f}{7:>10.1f}".format(
+                program, len(rows), sum(1 for row in rows if row[6]), sum(row[1] for row in rows),
+                max(row[1] for row in rows), max(row[3] or 0 for row in rows) / GB,
+                sum(row[4] or 0 for row in rows) / GB, sum(row[5] or 0 for row in rows) / GB))
+
+
+# Memory that tile_scheduler lets tiles use on this machine when nothing else is running
+def _memory_budget():
+
+    with open('/proc/meminfo') as meminfo:
+        for line in meminfo:
+            if line.startswith('MemTotal:'):
+                return int(line.split()[1]) * 1024 * cn.tile_scheduler_memory_fraction
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Print the performance report of a model run')
+    parser.add_argument('--run-id', '-r', default=None,
+                        help='Run to report on (the latest run if not given)')
+    args = parser.parse_args()
+
+    report(args.run_id if args.run_id else latest_run())
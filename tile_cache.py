@@ -0,0 +1,260 @@
+'''
+Local cache of downloaded s3 objects, shared by all model stages and by sensitivity analysis runs on the same machine.
+Cached files are identified by their s3 key and ETag, so a changed object on s3 is downloaded again, and stored
+read-only under cn.tile_cache_dir. They are put in the working folder as reflinks (copy-on-write clones) where the
+file system supports them, otherwise as copies. Never as hard links: a stage that writes to a working tile in place
+would change the cached file too (read-only modes don't stop root). Deleting a tile from the working folder
+(as run_full_model does between stages) doesn't delete it from the cache, so later stages and runs get it without
+another download.
+The cache is kept under its budget by deleting the least recently used files, except files in folders that are
+pinned because later stages still need them. The budget is cn.tile_cache_max_bytes, but no more than the cache's files
+plus the free disk, minus the disk that tile_scheduler keeps free. Files that aren't pinned are also evicted when a
+stage's cleanup runs (if no remaining stage reads their folder) and when tile_scheduler needs their disk for tiles.
+'''
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import constants_and_names as cn
+import s3_transfer
+
+# ioctl request for cloning a file's extents (reflink) on Linux (btrfs, xfs, etc.)
+FICLONE = 0x40049409
+
+
+# Opens the cache index, creating the cache folder and tables if they don't exist
+def _connect():
+
+    if not os.path.exists(os.path.join(cn.tile_cache_dir, 'objects')):
+        os.makedirs(os.path.join(cn.tile_cache_dir, 'objects'), exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.tile_cache_dir, 'tile_cache.sqlite'), timeout=120)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS entries (s3_path TEXT, etag TEXT, path TEXT, size INTEGER, '
+                       'last_used REAL, PRIMARY KEY (s3_path, etag))')
+    connection.execute('CREATE TABLE IF NOT EXISTS pins (s3_dir TEXT PRIMARY KEY)')
+
+    return connection
+
+
+# Where the cached copy of an object version is stored
+def _cache_path(s3_path, etag):
+
+    digest = hashlib.sha1('{0}:{1}'.format(s3_path, etag).encode('utf-8')).hexdigest()
+
+    return os.path.join(cn.tile_cache_dir, 'objects', digest[:2], '{0}_{1}'.format(digest, os.path.basename(s3_path)))
+
+
+# Puts a cached file at dest: reflink if possible, otherwise copy
+def _materialize(cache_path, dest):
+
+    dest_dir = os.path.dirname(dest)
+    if dest_dir and not os.path.exists(dest_dir):
+        os.makedirs(dest_dir, exist_ok=True)
+
+    # Named for the process, so processes putting the same file in place don't write to each other's copy
+    tmp = '{0}.{1}.cache_tmp'.format(dest, os.getpid())
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    with open(cache_path, 'rb') as src:
+        try:
+            with open(tmp, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY]:
+                raise
+            with open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 16 * 1024 * 1024)
+
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, dest)
+
+
+# Marks s3 folders whose files must stay in the cache because later stages need them
+def pin(s3_dirs):
+
+    connection = _connect()
+    with connection:
+        connection.executemany('INSERT OR IGNORE INTO pins VALUES (?)', [(s3_dir,) for s3_dir in s3_dirs])
+    connection.close()
+
+
+# Lets files in the s3 folders be evicted again. With no folders, removes all pins.
+def unpin(s3_dirs=None):
+
+    connection = _connect()
+    with connection:
+        if s3_dirs is None:
+            connection.execute('DELETE FROM pins')
+        else:
+            connection.executemany('DELETE FROM pins WHERE s3_dir = ?', [(s3_dir,) for s3_dir in s3_dirs])
+    connection.close()
+
+
+# Bytes the cache can use: cn.tile_cache_max_bytes, but no more than the bytes it uses plus the free disk, minus the
+# disk that tile_scheduler keeps free for tiles
+def _budget(used):
+
+    free = shutil.disk_usage(cn.tile_cache_dir).free - cn.tile_scheduler_disk_reserve_gb * 1024 ** 3
+
+    return min(cn.tile_cache_max_bytes, used + max(free, 0))
+
+
+# Deletes least recently used, unpinned files, oldest first, until bytes_to_free bytes are freed (all of them if None).
+# Files in keep (the ones about to be put in the working folder) and in the folders of keep_dirs are never deleted.
+# Returns the bytes freed.
+def _evict(connection, bytes_to_free, keep=(), keep_dirs=()):
+
+    protected_dirs = [row[0] for row in connection.execute('SELECT s3_dir FROM pins')] + list(keep_dirs)
+
+    freed = 0
+    for s3_path, etag, path, size in connection.execute(
+            'SELECT s3_path, etag, path, size FROM entries ORDER BY last_used').fetchall():
+
+        if bytes_to_free is not None and freed >= bytes_to_free:
+            break
+
+        if (s3_path, etag) in keep or any(s3_path.startswith(s3_dir) for s3_dir in protected_dirs):
+            continue
+
+        if os.path.exists(path):
+            os.remove(path)
+        with connection:
+            connection.execute('DELETE FROM entries WHERE s3_path = ? AND etag = ?', (s3_path, etag))
+        freed += size
+
+    return freed
+
+
+# Deletes least recently used, unpinned files until new_bytes more bytes fit in the cache budget.
+# Files in keep (the ones about to be put in the working folder) are never deleted.
+def _make_room(connection, new_bytes, keep):
+
+    used = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+    budget = _budget(used)
+    if used + new_bytes <= budget:
+        return
+
+    _evict(connection, used + new_bytes - budget, keep=keep)
+
+
+# Whether the cache is on and on the same disk as the folder, so evicting from it frees disk for the folder
+def _shares_disk(folder):
+
+    return cn.tile_cache_max_bytes > 0 and os.path.exists(cn.tile_cache_dir) and \
+           os.stat(cn.tile_cache_dir).st_dev == os.stat(folder).st_dev
+
+
+# Bytes of unpinned cached files that evict() could free on the disk of the folder
+def evictable_bytes(folder='.'):
+
+    if not _shares_disk(folder):
+        return 0
+
+    connection = _connect()
+    pinned_dirs = [row[0] for row in connection.execute('SELECT s3_dir FROM pins')]
+    rows = connection.execute('SELECT s3_path, size FROM entries').fetchall()
+    connection.close()
+
+    return sum(size for s3_path, size in rows if not any(s3_path.startswith(s3_dir) for s3_dir in pinned_dirs))
+
+
+# Deletes unpinned cached files, least recently used first, until bytes_to_free bytes are freed (all of them if None).
+# Files from the s3 folders in keep_dirs are kept (e.g., folders that later stages read). Returns the bytes freed.
+def evict(bytes_to_free=None, keep_dirs=()):
+
+    if cn.tile_cache_max_bytes <= 0 or not os.path.exists(cn.tile_cache_dir):
+        return 0
+
+    connection = _connect()
+    freed = _evict(connection, bytes_to_free, keep_dirs=keep_dirs)
+    connection.close()
+
+    return freed
+
+
+# Downloads (s3 path, size, etag) objects into the cache and adds them to the index. Returns the bytes downloaded.
+def _download(connection, to_download):
+
+    downloads = []
+    for s3_path, size, etag in to_download:
+        bucket, key = s3_transfer.split_s3_path(s3_path)
+        downloads.append({'bucket': bucket, 'key': key, 'size': size, 'etag': etag,
+                          'local_path': _cache_path(s3_path, etag)})
+    file_count, byte_count, seconds = s3_transfer.download_files(downloads)
+
+    with connection:
+        for obj in downloads:
+            os.chmod(obj['local_path'], 0o444)
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                               ('s3://{0}/{1}'.format(obj['bucket'], obj['key']), obj['etag'], obj['local_path'],
+                                obj['size'], time.time()))
+
+    return byte_count
+
+
+# Puts the given s3 objects in the working folder, downloading only the ones that aren't already cached.
+# objects is a list of (s3 path, local path, size, etag).
+# Returns the number of files, bytes downloaded, seconds and number of files that were already cached.
+def fetch(objects):
+
+    start = time.time()
+    connection = _connect()
+
+    to_download = []
+    cached_count = 0
+    for s3_path, local_path, size, etag in objects:
+        etag = etag.strip('"')
+        row = connection.execute('SELECT path FROM entries WHERE s3_path = ? AND etag = ?', (s3_path, etag)).fetchone()
+        if row is not None and os.path.exists(row[0]):
+            cached_count += 1
+        else:
+            to_download.append((s3_path, size, etag))
+
+    _make_room(connection, sum(size for s3_path, size, etag in to_download), set((obj[0], obj[3].strip('"')) for obj in objects))
+
+    byte_count = _download(connection, to_download)
+
+    # Copies and downloads are done outside of any transaction, so other processes can use the index meanwhile.
+    # The files' last use is recorded afterwards in one short transaction.
+    used = []
+    for s3_path, local_path, size, etag in objects:
+        etag = etag.strip('"')
+        path = _cache_path(s3_path, etag)
+        # Evicted by another process (e.g., tile_scheduler making room for tiles) since it was found in the cache
+        if not os.path.exists(path):
+            byte_count += _download(connection, [(s3_path, size, etag)])
+        _materialize(path, local_path)
+        used.append((time.time(), s3_path, etag))
+
+    with connection:
+        connection.executemany('UPDATE entries SET last_used = ? WHERE s3_path = ? AND etag = ?', used)
+
+    connection.close()
+
+    return len(objects), byte_count, time.time() - start, cached_count
+
+
+# Cached equivalent of s3_transfer.copy for downloads (s3 to the local machine)
+def copy(source, dest, recursive=False, exclude=None, include=None):
+
+    if recursive:
+        objects = []
+        for obj in s3_transfer.list_objects(source):
+            if obj['relative'] and s3_transfer.included(obj['relative'], exclude, include):
+                objects.append(('s3://{0}/{1}'.format(obj['bucket'], obj['key']),
+                                os.path.join(dest, obj['relative']), obj['size'], obj['etag']))
+        return fetch(objects)
+
+    if os.path.isdir(dest) or dest.endswith('/'):
+        dest = os.path.join(dest, os.path.basename(source))
+
+    # From s3 rather than the tile manifest, which can be older than the object
+    info = s3_transfer.head(source)
+
+    return fetch([(source, dest, info['size'], info['etag'])])
@@ -0,0 +1,158 @@
+'''
+Internal layout of the tiles the model writes, and the windows the model reads and calculates them in.
+Tiles used to be written as 40000x1 strips, so iterating over block_windows() gave 40000 one-row windows per tile,
+each with its own Python and decompression overhead, and there were no 2-D neighborhoods without reading many strips.
+Now every GeoTIFF the model writes is internally tiled in square blocks of cn.tile_block_size pixels:
+Writers get the layout with their compression from raster_profile.py, which adds profile() and gdal_options().
+Processing uses super-windows of cn.tile_window_rows x cn.tile_window_cols pixels from windows(), which don't depend
+on the blocks on disk, so the same code reads tiled tiles and striped tiles (e.g., inputs from outside the model).
+For striped tiles, windows span the width of the tile so that each strip is decompressed once.
+With the default sizes, a super-window is a whole number of blocks, so each block is also decompressed once.
+Setting cn.tile_block_size to None writes strips, as before.
+Running this script writes synthetic tiles with different block shapes and prints the write and read throughput of
+each block shape with different window shapes.
+'''
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+import constants_and_names as cn
+import universal_util as uu
+
+
+# Creation arguments for rasterio writers for the tile layout
+def profile(block_size=None):
+
+    if block_size is None:
+        block_size = cn.tile_block_size
+
+    if not block_size:
+        return {'tiled': False}
+
+    return {'tiled': True, 'blockxsize': block_size, 'blockysize': block_size}
+
+
+# GDAL creation options (-co) for the tile layout, e.g., for gdal.Warp(creationOptions=...)
+def creation_options(block_size=None):
+
+    if block_size is None:
+        block_size = cn.tile_block_size
+
+    if not block_size:
+        return []
+
+    return ['TILED=YES', 'BLOCKXSIZE={}'.format(block_size), 'BLOCKYSIZE={}'.format(block_size)]
+
+
+# GDAL command line creation options for the tile layout.
+# Most GDAL programs take -co; gdal_calc.py takes --co.
+def gdal_options(flag='-co', block_size=None):
+
+    options = []
+    for option in creation_options(block_size):
+        options.extend([flag, option])
+
+    return options
+
+
+# Super-windows covering a dataset, as (row, col) index and window pairs like block_windows() gives.
+# Windows are rows x cols pixels. If cols isn't given and the dataset is written in strips, windows span the width
+# of the tile. Operations on 2-D neighborhoods (e.g., filling with the mode of a window) give both rows and cols.
+def windows(src, rows=None, cols=None):
+
+    if rows is None:
+        rows = cn.tile_window_rows
+    if cols is None:
+        block_shapes = getattr(src, 'block_shapes', None)
+        if block_shapes and block_shapes[0][1] >= src.width:
+            cols = src.width
+        else:
+            cols = cn.tile_window_cols
+
+    for i, row in enumerate(range(0, src.height, rows)):
+        for j, col in enumerate(range(0, src.width, cols)):
+            yield (i, j), Window(col, row, min(cols, src.width - col), min(rows, src.height - row))
+
+
+# Synthetic tile that compresses about like a model output: smooth values in patches, 0 outside them
+def synthetic_tile(size, dtype, seed=1):
+
+    rng = np.random.RandomState(seed)
+
+    coarse = rng.random_sample((size // 100 + 2, size // 100 + 2))
+    rows = np.arange(size) // 100
+    values = coarse[rows][:, rows] * 100 + rng.random_sample((size, size)) * 5
+    values[coarse[rows][:, rows] < 0.3] = 0
+
+    return values.astype(dtype)
+
+
+# Writes a synthetic tile with each block shape and reads it back with each window shape.
+# block_sizes are square block sizes (None is strips); window_shapes are (rows, cols) of the super-windows
+# ('blocks' reads with block_windows()). Returns (block size, window shape, write seconds, read seconds, MB on disk).
+def benchmark(size=8000, dtype='float32', block_sizes=None, window_shapes=None):
+
+    if block_sizes is None:
+        block_sizes = [None, 256, 512, 1024]
+    if window_shapes is None:
+        window_shapes = ['blocks', (cn.tile_window_rows, cn.tile_window_cols), (cn.tile_window_rows, size)]
+
+    data = synthetic_tile(size, dtype)
+    megabytes = data.nbytes / 1024 ** 2
+    folder = tempfile.mkdtemp()
+    results = []
+
+    try:
+        for block_size in block_sizes:
+
+            path = os.path.join(folder, 'benchmark_{}.tif'.format(block_size))
+            kwargs = dict(driver='GTiff', width=size, height=size, count=1, dtype=dtype, crs='EPSG:4326',
+                          transform=from_origin(0, 0, cn.Hansen_res, cn.Hansen_res), compress='lzw', nodata=0,
+                          **profile(block_size))
+
+            # Writes the tile a window at a time, the way the model does
+            start = time.time()
+            with rasterio.open(path, 'w', **kwargs) as dst:
+                for idx, window in windows(dst):
+                    dst.write_band(1, data[window.toslices()], window=window)
+            write_seconds = time.time() - start
+            disk_megabytes = os.path.getsize(path) / 1024 ** 2
+
+            for window_shape in window_shapes:
+                start = time.time()
+                with rasterio.open(path) as src:
+                    if window_shape == 'blocks':
+                        window_list = src.block_windows(1)
+                    else:
+                        window_list = windows(src, *window_shape)
+                    for idx, window in window_list:
+                        src.read(1, window=window)
+                read_seconds = time.time() - start
+
+                results.append((block_size, window_shape, write_seconds, read_seconds, disk_megabytes))
+                uu.print_log("Blocks {0}, windows {1}: write {2:.0f} MB/s, read {3:.0f} MB/s, {4:.1f} MB on disk".format(
+                    block_size if block_size else 'strips', window_shape, megabytes / write_seconds,
+                    megabytes / read_seconds, disk_megabytes))
+    finally:
+        shutil.rmtree(folder)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark tile write and read throughput for different block and window shapes on synthetic tiles')
+    parser.add_argument('--size', '-s', type=int, default=8000,
+                        help='Width and height of the synthetic tile in pixels')
+    parser.add_argument('--dtype', '-d', default='float32',
+                        help='Data type of the synthetic tile, e.g., float32 or uint8')
+    args = parser.parse_args()
+
+    benchmark(args.size, args.dtype)
@@ -0,0 +1,179 @@
+'''
+Local index of the tiles in the model's s3 folders, used instead of parsing `aws s3 ls` output.
+Each s3 folder is listed (with paginated boto3 calls) the first time it is needed and the name, tile_id, size,
+ETag and modification time of every object directly in it are saved in a SQLite database in cn.docker_tmp.
+Later questions about that folder (which tiles exist, how many tiles match a pattern, which tiles are in both folders)
+are answered from the database without going back to s3, including by other scripts and pool workers on the same machine.
+A folder is listed again after cn.tile_manifest_max_age seconds or after the model uploads to it (see invalidate()).
+'''
+
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import constants_and_names as cn
+import s3_transfer
+
+# Same tile_id pattern as uu.get_tile_id (e.g., 00N_110E)
+tile_id_regex = "[0-9]{2}[A-Z][_][0-9]{3}[A-Z]"
+
+
+# Opens the manifest database, creating its tables if they don't exist
+def _connect():
+
+    if not os.path.exists(cn.docker_tmp):
+        os.makedirs(cn.docker_tmp, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.docker_tmp, cn.tile_manifest_db), timeout=120)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS listings (s3_dir TEXT PRIMARY KEY, listed_at REAL)')
+    connection.execute('CREATE TABLE IF NOT EXISTS tiles (s3_dir TEXT, name TEXT, tile_id TEXT, size INTEGER, '
+                       'etag TEXT, mtime REAL, PRIMARY KEY (s3_dir, name))')
+    connection.execute('CREATE INDEX IF NOT EXISTS tiles_tile_id ON tiles (tile_id)')
+
+    return connection
+
+
+# Folders are stored with a trailing slash so that s3://a/b and s3://a/b/ are the same folder
+def _normalize(s3_dir):
+
+    if not s3_dir.endswith('/'):
+        s3_dir = s3_dir + '/'
+
+    return s3_dir
+
+
+# Lists an s3 folder and returns rows for the objects directly in it (not in subfolders)
+def _list(s3_dir):
+
+    rows = []
+    for obj in s3_transfer.list_objects(s3_dir):
+        name = obj['relative']
+        if not name or '/' in name:
+            continue
+        match = re.search(tile_id_regex, name)
+        tile_id = match.group() if match else None
+        rows.append((s3_dir, name, tile_id, obj['size'], obj['etag'].strip('"'), obj['mtime']))
+
+    return rows
+
+
+# Replaces the saved listing of each folder with the given rows
+def _save(connection, listings):
+
+    with connection:
+        for s3_dir, rows in listings.items():
+            connection.execute('DELETE FROM tiles WHERE s3_dir = ?', (s3_dir,))
+            connection.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?, ?, ?)', rows)
+            connection.execute('INSERT OR REPLACE INTO listings VALUES (?, ?)', (s3_dir, time.time()))
+
+
+# Lists the given s3 folders again, several at a time, and saves them in the manifest
+def refresh(s3_dirs):
+
+    s3_dirs = sorted(set(_normalize(s3_dir) for s3_dir in s3_dirs))
+
+    with ThreadPoolExecutor(max_workers=cn.tile_manifest_threads) as executor:
+        listings = dict(zip(s3_dirs, executor.map(_list, s3_dirs)))
+
+    connection = _connect()
+    _save(connection, listings)
+    connection.close()
+
+
+# Lists the folders that aren't in the manifest yet (or whose listing is too old)
+def _ensure(connection, s3_dirs):
+
+    cutoff = time.time() - cn.tile_manifest_max_age
+    missing = []
+
+    for s3_dir in s3_dirs:
+        row = connection.execute('SELECT listed_at FROM listings WHERE s3_dir = ?', (s3_dir,)).fetchone()
+        if row is None or row[0] < cutoff:
+            missing.append(s3_dir)
+
+    if missing:
+        refresh(missing)
+
+
+# All s3 folders named in constants_and_names
+def model_dirs():
+
+    return sorted(set(_normalize(value) for name, value in vars(cn).items()
+                      if name.endswith('_dir') and isinstance(value, str) and value.startswith('s3://')))
+
+
+# Whether a tile file name matches a pattern, following the model's file naming:
+# gain, tcd, pixel area and loss tiles are named pattern_tileid.tif; all other tiles are tileid_pattern.tif
+def _matches(name, pattern):
+
+    if not name.endswith('.tif'):
+        return False
+
+    if pattern is None:
+        return True
+
+    if pattern in [cn.pattern_gain, cn.pattern_tcd, cn.pattern_pixel_area, cn.pattern_loss, cn.previous_pattern_loss]:
+        return name.startswith(pattern)
+
+    return name.endswith('{}.tif'.format(pattern))
+
+
+# Returns the (name, tile_id, size, etag, mtime) of each tif in an s3 folder, optionally only those matching a pattern
+def tiles(s3_dir, pattern=None):
+
+    s3_dir = _normalize(s3_dir)
+
+    connection = _connect()
+    _ensure(connection, [s3_dir])
+    rows = connection.execute('SELECT name, tile_id, size, etag, mtime FROM tiles WHERE s3_dir = ? ORDER BY name',
+                              (s3_dir,)).fetchall()
+    connection.close()
+
+    return [row for row in rows if row[1] is not None and _matches(row[0], pattern)]
+
+
+# Returns the tile_ids of the tifs in an s3 folder (in s3 order), optionally only those matching a pattern
+def tile_ids(s3_dir, pattern=None):
+
+    return [row[1] for row in tiles(s3_dir, pattern)]
+
+
+# Number of tifs in an s3 folder, optionally only those matching a pattern
+def count(s3_dir, pattern=None):
+
+    return len(tiles(s3_dir, pattern))
+
+
+# Sorted tile_ids found in any of the s3 folders
+def union(s3_dirs):
+
+    tile_id_set = set()
+    for s3_dir in s3_dirs:
+        tile_id_set.update(tile_ids(s3_dir))
+
+    return sorted(tile_id_set)
+
+
+# Sorted tile_ids found in all of the s3 folders
+def intersection(s3_dirs):
+
+    tile_id_sets = [set(tile_ids(s3_dir)) for s3_dir in s3_dirs]
+
+    return sorted(set.intersection(*tile_id_sets)) if tile_id_sets else []
+
+
+# Forgets the listing of the folder an upload went to (and of any folders under it), so it is listed again next time
+def invalidate(s3_path):
+
+    if s3_path.endswith('/'):
+        s3_dir = s3_path
+    else:
+        s3_dir = s3_path.rsplit('/', 1)[0] + '/'
+
+    connection = _connect()
+    with connection:
+        connection.execute('DELETE FROM tiles WHERE substr(s3_dir, 1, length(?)) = ?', (s3_dir, s3_dir))
+        connection.execute('DELETE FROM listings WHERE substr(s3_dir, 1, length(?)) = ?', (s3_dir, s3_dir))
+    connection.close()
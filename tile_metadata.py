@@ -0,0 +1,378 @@
+'''
+Metadata tags of the tiles the model writes, keyed by output pattern.
+Tags used to be added after the tiles were written: with gdal_edit.py once per tile (for gross emissions, in a separate
+pool of processes after the emissions were calculated), or by copying a tile and rewriting it window by window
+only to attach tags (peat mask).
+Now the tags of every output are in registry and writers add them when they create the output:
+rasterio writers call update_tags() right after opening the output, GDAL command line tools add gdal_options()
+(gdal_translate takes -mo; gdalwarp, gdal_calc.py and gdal_rasterize don't in GDAL 3.0, so their tagged outputs are
+written through gdal_translate), and the C++ gross emissions scripts take metadata_list() as KEY=VALUE arguments.
+Every output also gets the universal tags (model version, date created, model type, etc.).
+Tag values can use {sensit_type} and {loss_years}, and can be dictionaries of values by model type ('std' is the default).
+'''
+
+import constants_and_names as cn
+import universal_util as uu
+
+
+# Tags that are the same for several outputs
+removal_forest_types_source = 'Mangroves: IPCC wetlands supplement Table 4.4. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9'
+US_extent = 'Continental USA. Applies to pixels for which an FIA region, FIA forest group, and Pan et al. forest age category are available or interpolated.'
+IPCC_defaults_source = 'IPCC Guidelines 2019 refinement, forest section, Table 4.9'
+mangrove_source = 'IPCC Guidelines, 2013 Coastal Wetlands Supplement, Table 4.4'
+mangrove_extent = 'Simard et al. 2018, based on Giri et al. 2011 (Global Ecol. Biogeogr.) mangrove extent'
+carbon_extent_2000 = 'aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis) and mangrove AGB. Mangrove AGB has precedence.'
+carbon_extent_loss = 'tree cover loss pixels within model extent'
+full_extent = 'Full model extent: ((TCD2000>0 AND WHRC AGB2000>0) OR Hansen gain=1 OR mangrove AGB2000>0) NOT IN pre-2000 plantations'
+forest_extent = 'Forest extent: ((TCD2000>30 AND WHRC AGB2000>0) OR Hansen gain=1 OR mangrove AGB2000>0) NOT IN pre-2000 plantations'
+net_flux_scale = 'Negative values are net sinks. Positive values are net sources.'
+
+gross_emissions = {
+    'units': 'Mg CO2e/ha over model duration (2001-20{loss_years})',
+    'source': 'many data sources',
+    'extent': 'Tree cover loss pixels within model extent (and tree cover loss driver, if applicable)'
+}
+
+registry = {
+
+    # Removals
+    cn.pattern_annual_gain_AGC_BGC_natrl_forest_US: {
+        'units': 'megagrams aboveground+belowground carbon/ha/yr',
+        'source': 'US Forest Service FIA database, queried by Rich Birdsey, and consolidated by Nancy Harris',
+        'extent': US_extent
+    },
+    cn.pattern_stdev_annual_gain_AGC_BGC_natrl_forest_US: {
+        'units': 'standard deviation of removal factor, in megagrams aboveground+belowground carbon/ha/yr',
+        'source': 'US Forest Service FIA database, queried by Rich Birdsey, and reorganized by Nancy Harris',
+        'extent': US_extent
+    },
+    cn.pattern_annual_gain_AGC_BGC_planted_forest_unmasked: {
+        'units': 'megagrams aboveground+belowground carbon/ha/yr',
+        'source': 'Spatial Database of Planted Forests',
+        'extent': 'Planted forest extent, not masked by mangroves or non-mangrove natural forests'
+    },
+    cn.pattern_planted_forest_type_unmasked: {
+        'key': '1: oil palm. 2: wood fiber/timber. 3: other.',
+        'source': 'Spatial Database of Planted Forests',
+        'extent': 'Planted forest extent, not masked by mangroves or non-mangrove natural forests'
+    },
+    cn.pattern_stdev_annual_gain_AGC_BGC_planted_forest_unmasked: {
+        'units': 'standard deviation of removal factor, in megagrams aboveground+belowground carbon/ha/yr',
+        'source': 'Spatial Database of Planted Forests',
+        'extent': 'Planted forest extent, not masked by mangroves or non-mangrove natural forests'
+    },
+    cn.pattern_annual_gain_AGB_mangrove: {
+        'units': 'megagrams aboveground biomass (AGB or dry matter)/ha/yr',
+        'source': mangrove_source,
+        'extent': mangrove_extent
+    },
+    cn.pattern_annual_gain_BGB_mangrove: {
+        'units': 'megagrams belowground biomass (BGB or dry matter)/ha/yr',
+        'source': mangrove_source,
+        'extent': mangrove_extent
+    },
+    cn.pattern_stdev_annual_gain_AGB_mangrove: {
+        'units': 'standard deviation, in terms of megagrams aboveground biomass (AGB or dry matter)/ha/yr',
+        'source': mangrove_source,
+        'extent': mangrove_extent
+    },
+    cn.pattern_age_cat_IPCC: {
+        'key': '1: young (<20 year) secondary forest; 2: old (>20 year) secondary forest; 3: primary forest or IFL',
+        'source': 'Decision tree that uses Hansen gain and loss, IFL/primary forest extent, and aboveground biomass to assign an age category',
+        'extent': 'Full model extent, even though these age categories will not be used over the full model extent. They apply to just the rates from IPCC defaults.'
+    },
+    cn.pattern_annual_gain_AGB_IPCC_defaults: {
+        'units': 'megagrams aboveground biomass (AGB or dry matter)/ha/yr',
+        'source': IPCC_defaults_source,
+        'extent': 'Full model extent, even though these rates will not be used over the full model extent'
+    },
+    cn.pattern_annual_gain_BGB_IPCC_defaults: {
+        'units': 'megagrams belowground biomass (AGB or dry matter)/ha/yr',
+        'source': IPCC_defaults_source,
+        'extent': 'Full model extent, even though these rates will not be used over the full model extent'
+    },
+    cn.pattern_stdev_annual_gain_AGB_IPCC_defaults: {
+        'units': 'standard deviation, in terms of megagrams aboveground biomass (AGB or dry matter)/ha/yr',
+        'source': IPCC_defaults_source,
+        'extent': 'Full model extent, even though these standard deviations will not be used over the full model extent'
+    },
+    cn.pattern_removal_forest_type: {
+        'key': '6: mangroves. 5: European-specific rates. 4: planted forests. 3: US-specific rates. 2: young (<20 year) secondary forests. 1: old (>20 year) secondary forests and primary forests. Priority goes to the highest number.',
+        'source': 'Mangroves: IPCC wetlands supplement. Europe: Liz Goldman. Planted forests: Spatial Database of Planted Forests. USA: US FIA, via Rich Birdsey. Young natural forests: Cook-Patton et al. 2020. Old natural forests: IPCC Forests table 4.9',
+        'extent': 'Full model extent'
+    },
+    cn.pattern_annual_gain_AGC_all_types: {
+        'units': 'megagrams aboveground carbon/ha/yr',
+        'source': removal_forest_types_source,
+        'extent': 'Full model extent'
+    },
+    cn.pattern_annual_gain_BGC_all_types: {
+        'units': 'megagrams belowground carbon/ha/yr',
+        'source': removal_forest_types_source,
+        'extent': 'Full model extent'
+    },
+    cn.pattern_annual_gain_AGC_BGC_all_types: {
+        'units': 'megagrams aboveground + belowground carbon/ha/yr',
+        'source': removal_forest_types_source,
+        'extent': 'Full model extent'
+    },
+    cn.pattern_stdev_annual_gain_AGC_all_types: {
+        'units': 'standard deviation for removal factor, in terms of megagrams aboveground carbon/ha/yr',
+        'source': removal_forest_types_source,
+        'extent': 'Full model extent'
+    },
+    cn.pattern_gain_year_count: {
+        'units': 'years',
+        'min_possible_value': '0',
+        'max_possible_value': '{loss_years}',
+        'source': 'Gain years are assigned based on the combination of Hansen loss and gain in each pixel. There are four combinations: neither loss nor gain, loss only, gain only, loss and gain.',
+        'extent': 'Full model extent'
+    },
+    cn.pattern_cumul_gain_AGCO2_all_types: {
+        'units': 'megagrams aboveground CO2/ha over entire model period',
+        'source': 'annual removal factors and gain year count',
+        'extent': 'Full model extent'
+    },
+    cn.pattern_cumul_gain_BGCO2_all_types: {
+        'units': 'megagrams belowground CO2/ha over entire model period',
+        'source': 'annual removal factors and gain year count',
+        'extent': 'Full model extent'
+    },
+    cn.pattern_cumul_gain_AGCO2_BGCO2_all_types: {
+        'units': 'megagrams aboveground+belowground CO2/ha over entire model period',
+        'source': 'annual removal factors and gain year count',
+        'extent': 'Full model extent'
+    },
+
+    # Model extent and inputs to emissions
+    cn.pattern_model_extent: {
+        'units': 'unitless. 1 = in model extent. 0 = not in model extent',
+        'source': {
+            'std': 'Pixels with ((Hansen 2000 tree cover AND WHRC AGB2000) OR Hansen gain OR mangrove biomass 2000) NOT pre-2000 plantations',
+            'biomass_swap': 'Pixels with ((Hansen 2000 tree cover AND NASA JPL AGB2000) OR Hansen gain OR mangrove biomass 2000) NOT pre-2000 plantations'
+        },
+        'extent': 'Full model extent. This defines which pixels are included in the model.'
+    },
+    cn.pattern_peat_mask: {
+        'key': '1 = peat. 0 = not peat.',
+        'source': 'Jukka for IDN and MYS; CIFOR for rest of tropics; SoilGrids250 (May 2020) most likely histosol for outside tropics',
+        'extent': 'Full extent of input datasets'
+    },
+    cn.pattern_burn_year: {
+        'units': 'year (2001, 2002, 2003...)',
+        'source': 'MODIS collection 6 burned area',
+        'extent': 'global'
+    },
+
+    # Carbon pools
+    cn.pattern_AGC_2000: {
+        'units': 'megagrams aboveground carbon (AGC)/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018)',
+        'extent': carbon_extent_2000
+    },
+    cn.pattern_BGC_2000: {
+        'units': 'megagrams belowground carbon (BGC)/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:BGC for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_2000
+    },
+    cn.pattern_deadwood_2000: {
+        'units': 'megagrams deadwood carbon/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:deadwood carbon for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_2000
+    },
+    cn.pattern_litter_2000: {
+        'units': 'megagrams litter carbon/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). AGC:litter carbon for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_2000
+    },
+    cn.pattern_total_C_2000: {
+        'units': 'megagrams total (all emitted_pools) carbon/ha',
+        'source': 'AGC, BGC, deadwood carbon, litter carbon, and soil carbon',
+        'extent': 'aboveground biomass in 2000 (WHRC if standard model, JPL if biomass_swap sensitivity analysis), mangrove AGB, and soil carbon. Mangrove AGB has precedence.'
+    },
+    cn.pattern_AGC_emis_year: {
+        'units': 'megagrams aboveground carbon (AGC)/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year.',
+        'extent': carbon_extent_loss
+    },
+    cn.pattern_BGC_emis_year: {
+        'units': 'megagrams belowground carbon (BGC)/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:BGC for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_loss
+    },
+    cn.pattern_deadwood_emis_year_2000: {
+        'units': 'megagrams deadwood carbon/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:litter carbon for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_loss
+    },
+    cn.pattern_litter_emis_year_2000: {
+        'units': 'megagrams litter carbon/ha',
+        'source': 'WHRC (if standard model) or JPL (if biomass_swap sensitivity analysis) and mangrove AGB (Simard et al. 2018). Gross removals added to AGC2000 to get AGC in loss year. AGC:litter carbon for mangrove and non-mangrove forests applied.',
+        'extent': carbon_extent_loss
+    },
+    cn.pattern_soil_C_emis_year_2000: {
+        'units': 'megagrams soil carbon/ha',
+        'source': 'ISRIC SoilGrids250 (May 2020 update) soil organic carbon stock data. 0-30 cm data.',
+        'extent': 'tree cover loss pixels'
+    },
+    cn.pattern_total_C_emis_year: {
+        'units': 'megagrams total (all emitted_pools) carbon/ha',
+        'source': 'AGC, BGC, deadwood carbon, litter carbon, and soil carbon',
+        'extent': carbon_extent_loss
+    },
+
+    # Gross emissions (below), net flux and supplementary outputs
+    cn.pattern_net_flux: {
+        'units': 'Mg CO2e/ha over model duration (2001-20{loss_years})',
+        'source': 'Gross emissions - gross removals',
+        'extent': 'Model extent',
+        'scale': net_flux_scale
+    },
+    cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_full_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': full_extent
+    },
+    cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_forest_extent: {
+        'units': 'Mg CO2e/hectare over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': forest_extent
+    },
+    cn.pattern_cumul_gain_AGCO2_BGCO2_all_types_per_pixel_forest_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare forest model extent tile',
+        'extent': forest_extent
+    },
+    cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_full_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': full_extent
+    },
+    cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_forest_extent: {
+        'units': 'Mg CO2e/hectare over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': forest_extent
+    },
+    cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil_per_pixel_forest_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare forest model extent tile',
+        'extent': forest_extent
+    },
+    cn.pattern_net_flux_per_pixel_full_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': full_extent,
+        'scale': net_flux_scale
+    },
+    cn.pattern_net_flux_forest_extent: {
+        'units': 'Mg CO2e/hectare over model duration (2001-20{loss_years})',
+        'source': 'per hectare full model extent tile',
+        'extent': forest_extent,
+        'scale': net_flux_scale
+    },
+    cn.pattern_net_flux_per_pixel_forest_extent: {
+        'units': 'Mg CO2e/pixel over model duration (2001-20{loss_years})',
+        'source': 'per hectare forest model extent tile',
+        'extent': forest_extent,
+        'scale': net_flux_scale
+    },
+
+    # Aggregated (0.04x0.04 degree) outputs. Aggregated annual removal factors have their own units
+    # (see mp_aggregate_results_to_4_km.py).
+    cn.pattern_aggreg: {
+        'units': 'Mg CO2e/yr/pixel, where pixels are 0.04x0.04 degrees',
+        'source': 'per hectare version of the same model output, aggregated from 0.00025x0.00025 degree pixels',
+        'extent': 'Global'
+    },
+    cn.pattern_aggreg_sensit_sign_change: {
+        'key': '1=stays net source. 2=stays net sink. 3=changes from net source to net sink. 4=changes from net sink to net source.',
+        'source': 'Comparison of net flux at 0.04x0.04 degrees from standard model to net flux from {sensit_type} sensitivity analysis',
+        'extent': 'Global'
+    }
+}
+
+# All gross emissions outputs (per driver, per gas, and decision tree nodes) have the same tags
+for pattern in [cn.pattern_gross_emis_commod_biomass_soil,
+                cn.pattern_gross_emis_shifting_ag_biomass_soil,
+                cn.pattern_gross_emis_forestry_biomass_soil,
+                cn.pattern_gross_emis_wildfire_biomass_soil,
+                cn.pattern_gross_emis_urban_biomass_soil,
+                cn.pattern_gross_emis_no_driver_biomass_soil,
+                cn.pattern_gross_emis_all_gases_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_co2_only_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_non_co2_all_drivers_biomass_soil,
+                cn.pattern_gross_emis_nodes_biomass_soil]:
+    registry[pattern] = gross_emissions
+    registry[pattern.replace('biomass_soil', 'soil_only')] = gross_emissions
+
+
+# Tags that every output gets
+def universal_tags(sensit_type):
+
+    if sensit_type == 'std':
+        sensit_type = 'standard model'
+
+    return {
+        'model_version': cn.version,
+        'date_created': uu.date_today,
+        'model_type': sensit_type,
+        'originator': 'Global Forest Watch at the World Resources Institute',
+        'citation': 'Harris et al. 2021 Nature Climate Change https://www.nature.com/articles/s41558-020-00976-6',
+        'model_year_range': '2001 through 20{}'.format(cn.loss_years)
+    }
+
+
+# Registry entry of an output pattern.
+# Patterns of sensitivity analyses and aggregated outputs contain the pattern of the standard output, so patterns that
+# aren't registered use the entry of the longest registered pattern in them.
+def entry(pattern):
+
+    if pattern in registry:
+        return registry[pattern]
+
+    matches = [registered for registered in registry if registered in pattern]
+
+    if not matches:
+        uu.exception_log("No metadata tags registered for output pattern", pattern)
+
+    return registry[max(matches, key=len)]
+
+
+# All tags of an output: the universal tags and the tags of its pattern.
+# extra tags are for tags that depend on the run (e.g., tree cover density threshold) and replace registered tags.
+def tags(pattern, sensit_type, **extra):
+
+    output_tags = universal_tags(sensit_type)
+
+    for tag, value in entry(pattern).items():
+        if isinstance(value, dict):
+            value = value.get(sensit_type, value['std'])
+        output_tags[tag] = value.format(sensit_type=sensit_type, loss_years=cn.loss_years)
+
+    output_tags.update(extra)
+
+    return output_tags
+
+
+# Adds the tags of an output to a rasterio dataset that was just opened for writing
+def update_tags(dst, pattern, sensit_type, **extra):
+
+    dst.update_tags(**tags(pattern, sensit_type, **extra))
+
+    return dst
+
+
+# Tags of an output as KEY=VALUE strings, e.g., for the C++ gross emissions scripts
+def metadata_list(pattern, sensit_type, **extra):
+
+    return ['{0}={1}'.format(tag, value) for tag, value in tags(pattern, sensit_type, **extra).items()]
+
+
+# GDAL command line metadata options (gdal_translate -mo) for an output
+def gdal_options(pattern, sensit_type, flag='-mo', **extra):
+
+    options = []
+    for metadata in metadata_list(pattern, sensit_type, **extra):
+        options.extend([flag, metadata])
+
+    return options
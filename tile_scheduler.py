@@ -0,0 +1,240 @@
+'''
+Runs a per-tile function on many tiles at once, starting a tile only when it fits in the machine's memory and disk.
+This replaces hand-tuned processor counts like `if cn.count == 96: processes = 19`.
+Each tile runs in its own forked process. Before a tile starts, its peak memory and the disk space it will write are
+estimated from earlier runs of the same stage on that tile (recorded in a SQLite file in cn.docker_tmp). If a tile
+hasn't been run before, the largest peak recorded for any tile in the stage is used, or, once telemetry.py has recorded
+enough tiles of the stage, cn.telemetry_new_tile_quantile of their peaks. If the stage has no records,
+the per-tile cost given by the stage driver is used.
+A tile starts only while the estimates for all running tiles plus this tile stay within the memory budget
+(cn.tile_scheduler_memory_fraction of the memory available when the stage starts) and within the free disk space
+(minus cn.tile_scheduler_disk_reserve_gb). Unpinned files of the tile cache on the same disk count as free: they are
+evicted when a starting tile needs their space. Tiles with the highest estimates start first, so the
+largest tiles don't end up running alone at the end of the stage.
+The peak memory (including subprocesses, like gdal commands) and the output size of each tile are recorded for later runs,
+and the time, CPU, memory and disk I/O of each tile are recorded in telemetry.py for the report at the end of the run.
+When the stage runs within run_full_model's stage graph, finished tiles are also recorded there, so the tiles aren't
+run again if the model is interrupted and run again.
+'''
+
+import os
+import re
+import shutil
+import signal
+import sqlite3
+import time
+import traceback
+import constants_and_names as cn
+import universal_util as uu
+import tile_manifest
+import stage_graph
+import telemetry
+import tile_cache
+
+GB = 1024 ** 3
+
+
+# Opens the database of recorded tile costs, creating its table if it doesn't exist
+def _connect():
+
+    if not os.path.exists(cn.docker_tmp):
+        os.makedirs(cn.docker_tmp, exist_ok=True)
+
+    connection = sqlite3.connect(os.path.join(cn.docker_tmp, cn.tile_scheduler_db), timeout=120)
+    connection.execute('CREATE TABLE IF NOT EXISTS tile_costs (stage TEXT, tile_id TEXT, peak_bytes INTEGER, '
+                       'disk_bytes INTEGER, seconds REAL, recorded_at REAL, PRIMARY KEY (stage, tile_id))')
+
+    return connection
+
+
+# Memory available to new processes, from /proc/meminfo (Linux)
+def available_memory():
+
+    with open('/proc/meminfo') as meminfo:
+        for line in meminfo:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+
+
+# Estimated (peak memory, disk) in bytes for each tile, from recorded runs of the stage or the declared per-tile costs
+def estimates(stage, tile_id_list, memory_gb, disk_gb):
+
+    connection = _connect()
+    recorded = dict((row[0], (row[1], row[2])) for row in connection.execute(
+        'SELECT tile_id, peak_bytes, disk_bytes FROM tile_costs WHERE stage = ?', (stage,)))
+    connection.close()
+
+    if recorded:
+        default = (max(cost[0] for cost in recorded.values()), max(cost[1] for cost in recorded.values()))
+    else:
+        default = (int(memory_gb * GB), int(disk_gb * GB))
+
+    # Peak memory of new tiles from the distribution of the stage's recorded peaks, rather than the largest peak
+    quantile_peak = telemetry.peak_quantile(stage, cn.telemetry_new_tile_quantile)
+    if quantile_peak is not None:
+        default = (quantile_peak, default[1])
+
+    tile_estimates = {}
+    for tile_id in tile_id_list:
+        peak_bytes, disk_bytes = recorded.get(tile_id, default)
+        tile_estimates[tile_id] = (int(peak_bytes * cn.tile_scheduler_memory_margin), disk_bytes)
+
+    return tile_estimates
+
+
+# Saves the measured cost of a tile so later runs of the stage can use it
+def _record(stage, tile_id, peak_bytes, disk_bytes, seconds):
+
+    connection = _connect()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO tile_costs VALUES (?, ?, ?, ?, ?, ?)',
+                           (stage, tile_id, peak_bytes, disk_bytes, seconds, time.time()))
+    connection.close()
+
+
+# Files in the working folder written for a tile since the tile started, with their sizes in bytes.
+# Some stages are given tile file names instead of tile ids (e.g., aggregation); their outputs are found by the tile id.
+def _output_files(tile_id, since):
+
+    match = re.search(tile_manifest.tile_id_regex, tile_id)
+    if match:
+        tile_id = match.group()
+
+    files = []
+    for entry in os.scandir('.'):
+        try:
+            if tile_id in entry.name and entry.is_file() and entry.stat().st_mtime >= since:
+                files.append((entry.name, entry.stat().st_size))
+        except FileNotFoundError:
+            pass
+
+    return files
+
+
+# Runs the function on a single tile in a forked process and returns the process id
+def _launch(function, tile_id, stage):
+
+    pid = os.fork()
+
+    if pid == 0:
+        code = 0
+        telemetry.set_tile(stage, tile_id)
+        try:
+            function(tile_id)
+        except BaseException:
+            uu.print_log("Tile {0} failed:\n{1}".format(tile_id, traceback.format_exc()))
+            code = 1
+        # Skips the parent's atexit handlers (e.g., the log shipper), which must only run in the main process
+        os._exit(code)
+
+    return pid
+
+
+# Runs function(tile_id) for every tile in tile_id_list, with as many tiles at once as memory and disk allow.
+# stage names the recorded costs (e.g., 'gross_emissions_std'). memory_gb and disk_gb are the per-tile peak memory and
+# disk used before the stage has recorded costs. max_processes limits the number of tiles at once (default: cn.count).
+def run(function, tile_id_list, stage, memory_gb, disk_gb=None, max_processes=None):
+
+    if disk_gb is None:
+        disk_gb = cn.tile_scheduler_default_disk_gb
+    if max_processes is None:
+        max_processes = cn.count
+
+    # Tiles that already finished in an interrupted run of the model stage aren't run again (see stage_graph.py)
+    finished = stage_graph.finished_tiles(stage, tile_id_list)
+    if finished:
+        uu.print_log("{0} of {1} tiles already finished for {2}. Skipping them.".format(len(finished), len(tile_id_list), stage))
+        tile_id_list = [tile_id for tile_id in tile_id_list if tile_id not in finished]
+
+    tile_estimates = estimates(stage, tile_id_list, memory_gb, disk_gb)
+    memory_budget = int(available_memory() * cn.tile_scheduler_memory_fraction)
+
+    # Largest estimated tiles first
+    pending = sorted(tile_id_list, key=lambda tile_id: tile_estimates[tile_id], reverse=True)
+
+    uu.print_log("Scheduling {0} tiles for {1}: memory budget {2:.0f} GB, at most {3} tiles at once".format(
+        len(pending), stage, memory_budget / GB, max_processes))
+
+    running = {}
+    retried = set()
+    failed = []
+    peak_running = 0
+
+    while pending or running:
+
+        # Starts as many pending tiles as fit. If the largest doesn't fit, smaller ones may.
+        # With nothing running, a tile starts even if it doesn't fit, so a tile larger than the budget still runs alone.
+        if not failed:
+            memory_used = sum(task[1] for task in running.values())
+            disk_reserved = sum(task[2] for task in running.values())
+            disk_free = shutil.disk_usage('.').free - cn.tile_scheduler_disk_reserve_gb * GB
+            disk_evictable = tile_cache.evictable_bytes('.')
+
+            for tile_id in list(pending):
+
+                if len(running) >= max_processes:
+                    break
+
+                peak_bytes, disk_bytes = tile_estimates[tile_id]
+
+                if running and (memory_used + peak_bytes > memory_budget or
+                                disk_reserved + disk_bytes > disk_free + disk_evictable):
+                    continue
+
+                # Makes room for the tile by evicting cached files
+                if disk_reserved + disk_bytes > disk_free and disk_evictable:
+                    freed = tile_cache.evict(disk_reserved + disk_bytes - disk_free)
+                    disk_free += freed
+                    disk_evictable -= freed
+
+                if not running and disk_bytes > disk_free:
+                    uu.print_log("Starting {0} with {1:.1f} GB free disk; it may need {2:.1f} GB".format(
+                        tile_id, disk_free / GB, disk_bytes / GB))
+
+                pending.remove(tile_id)
+                running[_launch(function, tile_id, stage)] = (tile_id, peak_bytes, disk_bytes, time.time())
+                memory_used += peak_bytes
+                disk_reserved += disk_bytes
+
+            peak_running = max(peak_running, len(running))
+
+        if not running:
+            break
+
+        pid, status, rusage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+
+        tile_id, peak_bytes, disk_bytes, started = running.pop(pid)
+        measured_peak = rusage.ru_maxrss * 1024
+        seconds = time.time() - started
+
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            outputs = _output_files(tile_id, started)
+            measured_disk = sum(size for name, size in outputs)
+            _record(stage, tile_id, measured_peak, measured_disk, seconds)
+            telemetry.record_tile(stage, tile_id, started, seconds, rusage, measured_disk, True)
+            stage_graph.tile_finished(stage, tile_id, outputs)
+            uu.print_log("{0} finished in {1:.0f} s: peak memory {2:.1f} GB (estimated {3:.1f} GB), output {4:.1f} GB".format(
+                tile_id, seconds, measured_peak / GB, peak_bytes / GB, measured_disk / GB))
+
+        # Killed by the kernel (most likely out of memory). Runs it again by itself once.
+        elif os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL and tile_id not in retried:
+            retried.add(tile_id)
+            tile_estimates[tile_id] = (memory_budget, disk_bytes)
+            pending.insert(0, tile_id)
+            uu.print_log("{0} was killed after reaching {1:.1f} GB of memory. Running it again by itself.".format(
+                tile_id, measured_peak / GB))
+
+        else:
+            failed.append(tile_id)
+
+        if not (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0):
+            telemetry.record_tile(stage, tile_id, started, seconds, rusage, 0, False)
+
+    if failed:
+        uu.exception_log("{0} failed for tiles: {1}".format(stage, failed))
+
+    uu.print_log("{0}: up to {1} tiles ran at once".format(stage, peak_running))
@@ -1,4 +1,4 @@
-from subprocess import Popen, PIPE, STDOUT, check_call
+from subprocess import Popen, PIPE, STDOUT
 import glob
 import boto3
 import botocore
@@ -16,6 +16,13 @@ from shutil import copy
 import re
 import pandas as pd
 from osgeo import gdal
+import log_shipper
+import s3_transfer
+import tile_manifest
+import tile_cache
+import missing_tile
+import raster_profile
+import telemetry
 
 # Prints the date as YYYYmmdd_hhmmss
 d = datetime.datetime.today()
@@ -23,11 +30,14 @@ date_today = d.strftime('%Y_%m_%d')
 date_time_today = d.strftime('%Y%m%d_%h%m%s') # for Linux
 # date_time_today = d.strftime('%Y%m%d_%H%M%S') # for Windows
 
-# Uploads the output log to the designated s3 folder
+# Uploads the output log to the designated s3 folder.
+# Lines are normally shipped in batches by log_shipper (on a time or size threshold), so this is only needed
+# when the log on s3 must be current right away, e.g., at the end of a model stage or before an exception.
+# Pool workers can't ship the log; their lines are shipped by the main process.
 def upload_log():
 
-    cmd = ['aws', 's3', 'cp', os.path.join(cn.docker_app, cn.model_log), cn.model_log_dir, '--quiet']
-    check_call(cmd)
+    log_shipper.drain()
+    log_shipper.ship(force=True)
 
 
 # Creates the log with a starting line
@@ -35,8 +45,8 @@ def initiate_log(tile_id_list=None, sensit_type=None, run_date=None, stage_input
                  emitted_pools=None, thresh=None, std_net_flux=None,
                  include_mangroves=None, include_us=None, log_note=None):
 
-    logging.basicConfig(filename=os.path.join(cn.docker_app, cn.model_log), format='%(levelname)s @ %(asctime)s: %(message)s',
-                        datefmt='%Y/%m/%d %I:%M:%S %p', level=logging.INFO)
+    # All processes log through a pipe to one local log, which is copied to s3 in batches
+    log_shipper.start(os.path.join(cn.docker_app, cn.model_log), cn.model_log_dir)
     logging.info("Log notes: {}".format(log_note))
     logging.info("Model version: {}".format(cn.version))
     logging.info("This is the start of the log for this model run. Below are the command line arguments for this run.")
@@ -86,9 +96,6 @@ def print_log(*args):
     # Prints to console
     print("LOG: " + full_statement)
 
-    # Every time a line is added to the log, it is copied to s3
-    upload_log()
-
 
 # Logs fatal errors to the log txt, uploads to s3, and then terminates the program with an exception in the console
 def exception_log(*args):
@@ -128,41 +135,54 @@ def log_subprocess_output(pipe):
         # logging.info("\n")
         # print("\n")
 
-    # After the subprocess finishes, the log is uploaded to s3
-    upload_log()
-
 
 def log_subprocess_output_simple(cmd):
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
+
+    return log_subprocess_output_full(cmd)
 
 
-def log_subprocess_output_full(cmd):
-    # Solution for adding subprocess output to log is from https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    pipe = process.stdout
-    with pipe:
+# Runs an external program (e.g., gdalwarp) and adds its output to the log. cmd is a list of arguments, or a string
+# with shell=True (e.g., for wildcards). The program's time, memory and disk I/O are recorded by telemetry.py.
+# Returns the program's return code; with check=True, a failed program raises CalledProcessError.
+def log_subprocess_output_full(cmd, shell=False, check=False):
 
-        # Reads all the output into a string
-        for full_out in iter(pipe.readline, b''):  # b'\n'-separated lines
+    return telemetry.command(cmd, shell=shell, check=check)
 
-            # Separates the string into an array, where each entry is one line of output
-            line_array = full_out.splitlines()
 
-            # For reasons I don't know, the array is backwards, so this prints it out in reverse (i.e. correct) order
-            for line in reversed(line_array):
-                logging.info(line.decode(
-                    "utf-8"))  # https://stackoverflow.com/questions/37016946/remove-b-character-do-in-front-of-a-string-literal-in-python-3, answer by krock
-                print(line.decode(
-                    "utf-8"))  # https://stackoverflow.com/questions/37016946/remove-b-character-do-in-front-of-a-string-literal-in-python-3, answer by krock
+# Prints how many files and bytes an s3 transfer moved and how fast
+def print_transfer_summary(action, result):
 
-            # logging.info("\n")
-            # print("\n")
+    file_count, byte_count, seconds = result[:3]
+    megabytes = byte_count / 1024.0 / 1024.0
 
-        # After the subprocess finishes, the log is uploaded to s3
-        upload_log()
+    print_log("  {0} {1} files ({2:.1f} MB) in {3:.1f} s ({4:.1f} MB/s)".format(
+        action, file_count, megabytes, seconds, megabytes / max(seconds, 0.001)))
+
+
+# Copies files between s3 and the spot machine in-process (see s3_transfer.py).
+# Works like `aws s3 cp`, including --recursive and the --exclude and --include filters.
+# Downloads go through the local tile cache (see tile_cache.py), so files already downloaded by an earlier stage
+# or model run are cloned or copied into dest instead of downloaded again.
+def s3_copy(source, dest, recursive=False, exclude=None, include=None):
+
+    if source.startswith('s3://') and cn.tile_cache_max_bytes > 0:
+        result = tile_cache.copy(source, dest, recursive=recursive, exclude=exclude, include=include)
+    else:
+        result = s3_transfer.copy(source, dest, recursive=recursive, exclude=exclude, include=include)
+
+    telemetry.record_transfer(source, dest, result)
+
+    if source.startswith('s3://'):
+        print_transfer_summary("Downloaded", result)
+        if len(result) > 3:
+            print_log("  {} of these files were already in the local tile cache".format(result[3]))
+    else:
+        print_transfer_summary("Uploaded", result)
+
+        # The s3 folder has changed, so its listing in the tile manifest is out of date
+        tile_manifest.invalidate(dest)
+
+    return result
 
 
 # Checks the OS for how much storage is available in the system, what's being used, and what percent is being used
@@ -210,7 +230,8 @@ def get_tile_dir(tile):
     return tile_dir
 
 
-# Lists the tiles in a folder in s3
+# Lists the tiles in a folder in s3.
+# The listing comes from the local tile manifest, which only goes to s3 the first time a folder is needed.
 def tile_list_s3(source, sensit_type='std'):
 
     # Changes the directory to list tiles in if the model run is the biomass_swap or US_removals sensitivity analyses
@@ -224,61 +245,16 @@ def tile_list_s3(source, sensit_type='std'):
 
     print_log("Creating list of tiles in", new_source)
 
-    ## For an s3 folder in a bucket using AWSCLI
-    # Captures the list of the files in the folder
-    out = Popen(['aws', 's3', 'ls', new_source], stdout=PIPE, stderr=STDOUT)
-    stdout, stderr = out.communicate()
-
-    # Writes the output string to a text file for easier interpretation
-    biomass_tiles = open(os.path.join(cn.docker_tmp, 'tiles.txt'), "wb")
-    biomass_tiles.write(stdout)
-    biomass_tiles.close()
-
-    file_list = []
-
-    # Iterates through the text file to get the names of the tiles and appends them to list
-    with open(os.path.join(cn.docker_tmp, 'tiles.txt'), 'r') as tile:
-        for line in tile:
-            num = len(line.strip('\n').split(" "))
-            tile_name = line.strip('\n').split(" ")[num - 1]
-
-            # Only tifs will be in the tile list
-            if '.tif' in tile_name:
-
-                tile_id = get_tile_id(tile_name)
-                file_list.append(tile_id)
+    file_list = tile_manifest.tile_ids(new_source)
 
     if len(file_list) > 0:
 
         return file_list
 
     # In case the change of directories to look for sensitivity versions yields an empty folder.
-    # This could be done better by using boto3 to check the potential s3 folders for files upfront but I couldn't figure
-    # out how to do that.
     print_log("Creating list of tiles in", source)
 
-    ## For an s3 folder in a bucket using AWSCLI
-    # Captures the list of the files in the folder
-    out = Popen(['aws', 's3', 'ls', source], stdout=PIPE, stderr=STDOUT)
-    stdout, stderr = out.communicate()
-
-    # Writes the output string to a text file for easier interpretation
-    biomass_tiles = open(os.path.join(cn.docker_tmp, 'tiles.txt'), "wb")
-    biomass_tiles.write(stdout)
-    biomass_tiles.close()
-
-    file_list = []
-
-    # Iterates through the text file to get the names of the tiles and appends them to list
-    with open(os.path.join(cn.docker_tmp, 'tiles.txt'), 'r') as tile:
-        for line in tile:
-            num = len(line.strip('\n').split(" "))
-            tile_name = line.strip('\n').split(" ")[num - 1]
-
-            # Only tifs will be in the tile list
-            if '.tif' in tile_name:
-                tile_id = get_tile_id(tile_name)
-                file_list.append(tile_id)
+    file_list = tile_manifest.tile_ids(source)
 
     return file_list
 
@@ -339,113 +315,21 @@ def create_combined_tile_list(set1, set2, set3=None, sensit_type='std'):
         set1 = set1.replace('standard', sensit_type)
         set2 = set2.replace('standard', sensit_type)
 
+    # Falls back to the standard model folder for a set that doesn't have a sensitivity analysis version
+    combined_sets = []
+    for tile_set in [set1, set2]:
 
-    out = Popen(['aws', 's3', 'ls', set1], stdout=PIPE, stderr=STDOUT)
-    stdout, stderr = out.communicate()
-    # Writes the output string to a text file for easier interpretation
-    set1_tiles = open("set1.txt", "wb")
-    set1_tiles.write(stdout)
-    set1_tiles.close()
-
-    out = Popen(['aws', 's3', 'ls', set2], stdout=PIPE, stderr=STDOUT)
-    stdout2, stderr2 = out.communicate()
-    # Writes the output string to a text file for easier interpretation
-    set2_tiles = open("set2.txt", "wb")
-    set2_tiles.write(stdout2)
-    set2_tiles.close()
-
-    # Empty lists for filling with biomass tile ids
-    file_list_set1 = []
-    file_list_set2 = []
-
-    # Iterates through the first text file to get the names of the tiles and appends them to list
-    with open("set1.txt", 'r') as tile:
-
-        for line in tile:
-            num = len(line.strip('\n').split(" "))
-            tile_name = line.strip('\n').split(" ")[num - 1]
-
-            # Only tifs will be in the tile list
-            if '.tif' in tile_name:
-
-                tile_id = get_tile_id(tile_name)
-                file_list_set1.append(tile_id)
-
-    # Iterates through the second text file to get the names of the tiles and appends them to list
-    with open("set2.txt", 'r') as tile:
-
-        for line in tile:
-            num = len(line.strip('\n').split(" "))
-            tile_name = line.strip('\n').split(" ")[num - 1]
-
-            # Only tifs will be in the tile list
-            if '.tif' in tile_name:
-
-                tile_id = get_tile_id(tile_name)
-                file_list_set2.append(tile_id)
-
-    if len(file_list_set1) > 1:
-        print_log("There are {} tiles in {}. Using this tile set.".format(len(file_list_set1), set1))
-    else:
-        print_log("There are 0 tiles in {}. Looking for alternative tile set...".format(set1))
-        set1 = set1.replace(sensit_type, 'standard')
-        print_log("  Looking for alternative tile set in {}".format(set1))
-
-        out = Popen(['aws', 's3', 'ls', set1], stdout=PIPE, stderr=STDOUT)
-        stdout, stderr = out.communicate()
-        # Writes the output string to a text file for easier interpretation
-        set1_tiles = open("set1.txt", "wb")
-        set1_tiles.write(stdout)
-        set1_tiles.close()
-
-        # Empty lists for filling with biomass tile ids
-        file_list_set1 = []
-
-        # Iterates through the first text file to get the names of the tiles and appends them to list
-        with open("set1.txt", 'r') as tile:
-
-            for line in tile:
-                num = len(line.strip('\n').split(" "))
-                tile_name = line.strip('\n').split(" ")[num - 1]
-
-                # Only tifs will be in the tile list
-                if '.tif' in tile_name:
-                    tile_id = get_tile_id(tile_name)
-                    file_list_set1.append(tile_id)
-
-        print_log("There are {} tiles in {}. Using this tile set.".format(len(file_list_set1), set1))
-
-    if len(file_list_set2) > 1:
-        print_log("There are {} tiles in {}. Using this tile set.".format(len(file_list_set2), set2))
-    else:
-        print_log("There are 0 tiles in {}. Looking for alternative tile set.".format(set2))
-        set2 = set2.replace(sensit_type, 'standard')
-        print_log("  Looking for alternative tile set in {}".format(set2))
-
-        out = Popen(['aws', 's3', 'ls', set2], stdout=PIPE, stderr=STDOUT)
-        stdout2, stderr2 = out.communicate()
-        # Writes the output string to a text file for easier interpretation
-        set2_tiles = open("set2.txt", "wb")
-        set2_tiles.write(stdout2)
-        set2_tiles.close()
-
-        file_list_set2 = []
-
-        # Iterates through the second text file to get the names of the tiles and appends them to list
-        with open("set2.txt", 'r') as tile:
-
-            for line in tile:
-                num = len(line.strip('\n').split(" "))
-                tile_name = line.strip('\n').split(" ")[num - 1]
-
-                # Only tifs will be in the tile list
-                if '.tif' in tile_name:
-                    tile_id = get_tile_id(tile_name)
-                    file_list_set2.append(tile_id)
+        if tile_manifest.count(tile_set) > 1:
+            print_log("There are {} tiles in {}. Using this tile set.".format(tile_manifest.count(tile_set), tile_set))
+        else:
+            print_log("There are 0 tiles in {}. Looking for alternative tile set...".format(tile_set))
+            tile_set = tile_set.replace(sensit_type, 'standard')
+            print_log("  Looking for alternative tile set in {}".format(tile_set))
+            print_log("There are {} tiles in {}. Using this tile set.".format(tile_manifest.count(tile_set), tile_set))
 
-        print_log("There are {} tiles in {}. Using this tile set.".format(len(file_list_set2), set2))
+        combined_sets.append(tile_set)
 
-    # If there's a third folder supplied, iterates through that
+    # If there's a third folder supplied, its tiles are added to the first two sets of tiles
     if set3 != None:
 
         print_log("Third set of tiles input. Adding to first two sets of tiles...")
@@ -455,51 +339,12 @@ def create_combined_tile_list(set1, set2, set3=None, sensit_type='std'):
         else:
             set3 = set3.replace('standard', sensit_type)
 
-        out = Popen(['aws', 's3', 'ls', set3], stdout=PIPE, stderr=STDOUT)
-        stdout3, stderr3 = out.communicate()
-        # Writes the output string to a text file for easier interpretation
-        set3_tiles = open("set3.txt", "wb")
-        set3_tiles.write(stdout3)
-        set3_tiles.close()
-
-        file_list_set3 = []
+        print_log("There are {} tiles in {}".format(tile_manifest.count(set3), set3))
 
-        # Iterates through the text file to get the names of the tiles and appends them to list
-        with open("set3.txt", 'r') as tile:
+        combined_sets.append(set3)
 
-            for line in tile:
-                num = len(line.strip('\n').split(" "))
-                tile_name = line.strip('\n').split(" ")[num - 1]
-
-                # Only tifs will be in the tile list
-                if '.tif' in tile_name:
-                    tile_id = get_tile_id(tile_name)
-                    file_list_set3.append(tile_id)
-
-        print_log("There are {} tiles in {}".format(len(file_list_set3), set3))
-
-    # Combines both tile lists
-    all_tiles = file_list_set1 + file_list_set2
-
-    # If a third directory is supplied, the tiles from that list are added to the list from the first two
-    if set3 != None:
-
-        all_tiles = all_tiles + file_list_set3
-
-    # Tile list with tiles found in multiple lists removed, so now duplicates are gone
-    unique_tiles = list(set(all_tiles))
-
-    # Converts the set to a pandas dataframe to put the tiles in the correct order
-    df = pd.DataFrame(unique_tiles, columns=['tile_id'])
-    df = df.sort_values(by=['tile_id'])
-
-    # Converts the pandas dataframe to a Python list
-    unique_tiles_ordered_list = df.tile_id.tolist()
-
-    # Removes the text files with the lists of tiles
-    set_txt = glob.glob("set*.txt")
-    for i in set_txt:
-        os.remove(i)
+    # Tiles found in any of the sets, without duplicates and in order
+    unique_tiles_ordered_list = tile_manifest.union(combined_sets)
 
     return unique_tiles_ordered_list
 
@@ -507,45 +352,8 @@ def create_combined_tile_list(set1, set2, set3=None, sensit_type='std'):
 # Counts the number of tiles in a folder in s3
 def count_tiles_s3(source, pattern=None):
 
-    ## For an s3 folder in a bucket using AWSCLI
-    # Captures the list of the files in the folder
-    out = Popen(['aws', 's3', 'ls', source], stdout=PIPE, stderr=STDOUT)
-    stdout, stderr = out.communicate()
-
-    # Writes the output string to a text file for easier interpretation
-    tile_list_name = "tiles.txt"
-    tile_file = open(os.path.join(cn.docker_tmp, tile_list_name), "wb")
-    tile_file.write(stdout)
-    tile_file.close()
-
-    file_list = []
-
-    # Iterates through the text file to get the names of the tiles and appends them to list
-    with open(os.path.join(cn.docker_tmp, tile_list_name), 'r') as tile:
-        for line in tile:
-            num = len(line.strip('\n').split(" "))
-            tile_name = line.strip('\n').split(" ")[num - 1]
-
-            # For gain, tcd, and pixel area tiles, which have the tile_id after the the pattern
-            if pattern in [cn.pattern_gain, cn.pattern_tcd, cn.pattern_pixel_area, cn.pattern_loss]:
-                if tile_name.endswith('.tif'):
-                    tile_id = get_tile_id(tile_name)
-                    file_list.append(tile_id)
-
-            # If the counted tiles have to have a specific pattern
-            elif pattern != None:
-                if tile_name.endswith('{}.tif'.format(pattern)):
-                    tile_id = get_tile_id(tile_name)
-                    file_list.append(tile_id)
-
-            # If the counted tiles just have to be tifs
-            else:
-                if tile_name.endswith('.tif'):
-                    tile_id = get_tile_id(tile_name)
-                    file_list.append(tile_id)
-
     # Count of tiles (ends in *tif)
-    return len(file_list)
+    return tile_manifest.count(source, pattern)
 
 
 
@@ -651,9 +459,7 @@ def s3_folder_download(source, dest, sensit_type, pattern = None):
 
             print_log("Source directory used:", source_final)
 
-            cmd = ['aws', 's3', 'cp', source_final, dest, '--recursive', '--exclude', '*tiled/*',
-                   '--exclude', '*geojason', '--exclude', '*vrt', '--exclude', '*csv', '--no-progress']
-            log_subprocess_output_full(cmd)
+            s3_copy(source_final, dest, recursive=True, exclude=['*tiled/*', '*geojason', '*vrt', '*csv'])
 
             print_log('\n')
 
@@ -665,9 +471,7 @@ def s3_folder_download(source, dest, sensit_type, pattern = None):
 
             print_log("Source directory used:", source)
 
-            cmd = ['aws', 's3', 'cp', source, dest, '--recursive', '--exclude', '*tiled/*',
-                   '--exclude', '*geojason', '--exclude', '*vrt', '--exclude', '*csv', '--no-progress']
-            log_subprocess_output_full(cmd)
+            s3_copy(source, dest, recursive=True, exclude=['*tiled/*', '*geojason', '*vrt', '*csv'])
 
             print_log('\n')
 
@@ -685,12 +489,7 @@ def s3_folder_download(source, dest, sensit_type, pattern = None):
 
         print_log("Tiles with pattern", pattern, "are not on spot machine. Downloading...")
 
-        cmd = ['aws', 's3', 'cp', source, dest, '--recursive', '--exclude', '*tiled/*',
-               '--exclude', '*geojason', '--exclude', '*vrt', '--exclude', '*csv', '--no-progress']
-
-        # cmd = ['aws', 's3', 'cp', source, dest, '--recursive',
-        #        '--exclude', '*', '--include', '{}'.format(pattern), '--no-progress']
-        log_subprocess_output_full(cmd)
+        s3_copy(source, dest, recursive=True, exclude=['*tiled/*', '*geojason', '*vrt', '*csv'])
 
         print_log('\n')
 
@@ -701,8 +500,6 @@ def s3_folder_download(source, dest, sensit_type, pattern = None):
 # sensit_type = whether the model is standard or a sensitivity analysis model run
 def s3_file_download(source, dest, sensit_type):
 
-    s3 = boto3.resource('s3')
-
     # Retrieves the s3 directory and name of the tile from the full path name
     dir = get_tile_dir(source)
     file_name = get_tile_name(source)
@@ -732,10 +529,8 @@ def s3_file_download(source, dest, sensit_type):
 
         # If not already downloaded, first tries to download the sensitivity analysis version
         try:
-            # Based on https://www.thetopsites.net/article/50187246.shtml#:~:text=Fastest%20way%20to%20find%20out,does%20not%20exist%22%20if%20s3.
-            s3.Object('gfw2-data', '{0}/{1}'.format(dir_sens[15:], file_name_sens)).load()
-            cmd = ['aws', 's3', 'cp', '{0}/{1}'.format(dir_sens, file_name_sens), dest, '--only-show-errors']
-            log_subprocess_output_full(cmd)
+            # Raises a 404 ClientError if the tile doesn't exist on s3
+            s3_copy('{0}/{1}'.format(dir_sens, file_name_sens), dest)
             print_log("  Option 2 success: Sensitivity analysis tile {0}/{1} found on s3 and downloaded".format(dir_sens, file_name_sens))
             print_log("")
             return
@@ -759,10 +554,8 @@ def s3_file_download(source, dest, sensit_type):
         # If not already downloaded, final optionis to try to download the standard version of the tile.
         # If this doesn't work, the script throws a fatal error because no variant of this tile was found.
         try:
-            # Based on https://www.thetopsites.net/article/50187246.shtml#:~:text=Fastest%20way%20to%20find%20out,does%20not%20exist%22%20if%20s3.
-            s3.Object('gfw2-data', '{0}'.format(source[15:])).load()
-            cmd = ['aws', 's3', 'cp', source, dest, '--only-show-errors']
-            log_subprocess_output_full(cmd)
+            # Raises a 404 ClientError if the tile doesn't exist on s3
+            s3_copy(source, dest)
             print_log("  Option 4 success: Standard tile {} found on s3 and downloaded".format(source))
             print_log("")
             return
@@ -786,10 +579,8 @@ def s3_file_download(source, dest, sensit_type):
         source = os.path.join(dir, file_name)
 
         try:
-            # Based on https://www.thetopsites.net/article/50187246.shtml#:~:text=Fastest%20way%20to%20find%20out,does%20not%20exist%22%20if%20s3.
-            s3.Object('gfw2-data', '{0}'.format(source[15:])).load()
-            cmd = ['aws', 's3', 'cp', source, dest, '--only-show-errors']
-            log_subprocess_output_full(cmd)
+            # Raises a 404 ClientError if the tile doesn't exist on s3
+            s3_copy(source, dest)
             print_log("  Option 2 success: Tile {} found on s3 and downloaded".format(source))
             print_log("")
             return
@@ -802,12 +593,14 @@ def s3_file_download(source, dest, sensit_type):
 # Uploads all tiles of a pattern to specified location
 def upload_final_set(upload_dir, pattern):
 
+    # Published outputs are uploaded as Cloud-Optimized GeoTIFFs with overviews
+    if raster_profile.published(pattern):
+        raster_profile.publish(pattern)
+
     print_log("Uploading tiles with pattern {0} to {1}".format(pattern, upload_dir))
 
-    cmd = ['aws', 's3', 'cp', cn.docker_base_dir, upload_dir, '--exclude', '*', '--include', '*{}*tif'.format(pattern),
-           '--recursive', '--no-progress']
     try:
-        log_subprocess_output_full(cmd)
+        s3_copy(cn.docker_base_dir, upload_dir, recursive=True, exclude=['*'], include=['*{}*tif'.format(pattern)])
         print_log("  Upload of tiles with {} pattern complete!".format(pattern))
     except:
         print_log("Error uploading output tile(s)")
@@ -819,10 +612,8 @@ def upload_final(upload_dir, tile_id, pattern):
     file = '{}_{}.tif'.format(tile_id, pattern)
 
     print_log("Uploading {}".format(file))
-    cmd = ['aws', 's3', 'cp', file, upload_dir, '--no-progress']
-
     try:
-        log_subprocess_output_full(cmd)
+        s3_copy(file, upload_dir)
     except:
         print_log("Error uploading output tile")
 
@@ -934,36 +725,30 @@ def mp_warp_to_Hansen(tile_id, source_raster, out_pattern, dt):
 
     out_tile = '{0}_{1}.tif'.format(tile_id, out_pattern)
 
-    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', '-co', 'COMPRESS=LZW', '-tr', str(cn.Hansen_res), str(cn.Hansen_res), '-tap', '-te',
+    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', *raster_profile.gdal_options('archive', dt), '-tr', str(cn.Hansen_res), str(cn.Hansen_res), '-tap', '-te',
             str(xmin), str(ymin), str(xmax), str(ymax), '-dstnodata', '0', '-ot', dt, '-overwrite', source_raster, out_tile]
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
+    log_subprocess_output_full(cmd)
 
     end_of_fx_summary(start, tile_id, out_pattern)
 
 
 def warp_to_Hansen(in_file, out_file, xmin, ymin, xmax, ymax, dt):
 
-    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', '-co', 'COMPRESS=LZW', '-tr', str(cn.Hansen_res), str(cn.Hansen_res), '-tap', '-te',
+    cmd = ['gdalwarp', '-t_srs', 'EPSG:4326', *raster_profile.gdal_options('archive', dt), '-tr', str(cn.Hansen_res), str(cn.Hansen_res), '-tap', '-te',
             str(xmin), str(ymin), str(xmax), str(ymax), '-dstnodata', '0', '-ot', dt, '-overwrite', in_file, out_file]
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
+    log_subprocess_output_full(cmd)
 
 
 # Rasterizes the shapefile within the bounding coordinates of a tile
 def rasterize(in_shape, out_tif, xmin, ymin, xmax, ymax, blocksizex, blocksizey, tr=None, ot=None, name_field=None, anodata=None):
-    cmd = ['gdal_rasterize', '-co', 'COMPRESS=LZW',
+    cmd = ['gdal_rasterize', *raster_profile.gdal_options('scratch', ot, block_size=False),
 
            # Input raster is ingested as 1024x1024 pixel tiles (rather than the default of 1 pixel wide strips
            '-co', 'TILED=YES', '-co', 'BLOCKXSIZE={}'.format(blocksizex), '-co', 'BLOCKYSIZE={}'.format(blocksizey),
            '-te', str(xmin), str(ymin), str(xmax), str(ymax),
            '-tr', tr, tr, '-ot', ot, '-a', name_field, '-a_nodata',
            anodata, in_shape, out_tif]
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
+    log_subprocess_output_full(cmd)
 
     return out_tif
 
@@ -978,21 +763,19 @@ def mp_rasterize(tile_id, in_shape, out_pattern, blocksizex, blocksizey, tr, ot,
 
     out_tile = '{0}_{1}.tif'.format(tile_id, out_pattern)
 
-    cmd = ['gdal_rasterize', '-co', 'COMPRESS=LZW',
+    cmd = ['gdal_rasterize', *raster_profile.gdal_options('scratch', ot, block_size=False),
            '-co', 'TILED=YES', '-co', 'BLOCKXSIZE={}'.format(blocksizex), '-co', 'BLOCKYSIZE={}'.format(blocksizey),
            '-te', str(xmin), str(ymin), str(xmax), str(ymax),
            '-tr', tr, tr, '-ot', ot, '-a', name_field, '-a_nodata',
            anodata, in_shape, out_tile]
-    process = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-    with process.stdout:
-        log_subprocess_output(process.stdout)
+    log_subprocess_output_full(cmd)
 
     end_of_fx_summary(start, tile_id, out_pattern)
 
 
-# Creates a tile of all 0s for any tile passed to it.
-# Uses the Hansen loss tile for information about the tile.
-# Based on https://gis.stackexchange.com/questions/220753/how-do-i-create-blank-geotiff-with-same-spatial-properties-as-existing-geotiff
+# Creates a tile of all 0s for any tile passed to it, for programs that need every input file to exist.
+# The tile is a sparse GeoTIFF with the extent and resolution of the tile but no pixel blocks, so it takes a few kB
+# and doesn't need a template tile. Python readers should use missing_tile.open_tile instead, which needs no file.
 def make_blank_tile(tile_id, pattern, folder, sensit_type):
 
     # Creates tile names for standard and sensitivity analyses.
@@ -1015,39 +798,18 @@ def make_blank_tile(tile_id, pattern, folder, sensit_type):
     else:
         print_log('{} does not exist. Creating a blank tile.'.format(file_name))
 
+        # Uses the sensitivity analysis name if the other tiles of the pattern on the spot machine have it
+        tile_list = tile_list_spot_machine(folder, pattern)
+        if len(tile_list) > 0 and get_tile_type(tile_list[0]) != pattern:
+            file_name = file_name_sens
+
         with open(os.path.join(cn.docker_tmp, cn.blank_tile_txt), 'a') as f:
-            f.write('{0}_{1}.tif'.format(tile_id, pattern))
+            f.write(file_name)
             f.write("\n")
             f.close()
 
-        # Preferentially uses Hansen loss tile as the template for creating a blank plantation tile
-        # (tile extent, resolution, pixel alignment, compression, etc.).
-        # If the tile is already on the spot machine, it uses the downloaded tile.
-        if os.path.exists(os.path.join(folder, '{0}_{1}.tif'.format(cn.pattern_loss, tile_id))):
-            print_log("Hansen loss tile exists for {}. Using that as template for blank tile.".format(tile_id))
-            cmd = ['gdal_merge.py', '-createonly', '-init', '0', '-co', 'COMPRESS=LZW', '-ot', 'Byte',
-                   '-o', '{0}/{1}_{2}.tif'.format(folder, tile_id, pattern),
-                   '{0}/{1}_{2}.tif'.format(folder, cn.pattern_loss, tile_id)]
-            check_call(cmd)
-
-        # If the Hansen loss tile isn't already on the spot machine
-        else:
-
-            s3_file_download('{0}{1}_{2}.tif'.format(cn.pixel_area_dir, cn.pattern_pixel_area, tile_id),
-                             os.path.join(folder, '{0}_{1}.tif'.format(tile_id, 'empty_tile_template')), 'std')
-            print_log("Downloaded pixel area tile for", tile_id, "to create a blank tile")
-
-            # Determines what pattern to use (standard or sensitivity) based on the first tile in the list
-            tile_list= tile_list_spot_machine(folder, pattern)
-            full_pattern = get_tile_type(tile_list[0])
-
-            # Uses either the Hansen loss tile or pixel area tile as a template tile,
-            # with the output name corresponding to the model type
-            cmd = ['gdal_merge.py', '-createonly', '-init', '0', '-co', 'COMPRESS=LZW', '-ot', 'Byte',
-                   '-o', '{0}/{1}_{2}.tif'.format(folder, tile_id, full_pattern),
-                   '{0}/{1}_{2}.tif'.format(folder, tile_id, 'empty_tile_template')]
-            check_call(cmd)
-            print_log("Created raster of all 0s for", file_name)
+        missing_tile.write_blank_tile(file_name, tile_id)
+        print_log("Created raster of all 0s for", file_name)
 
 
 # Creates a txt that will have blank dummy tiles listed in it for certain scripts that need those
@@ -1112,15 +874,15 @@ def mask_pre_2000_plantation(pre_2000_plant, tile_to_mask, out_name, tile_id):
         # Only the pre-2000 plantation raster needed to be converted to a vrt; the loss raster did not.
         cmd = ['gdal_translate', '-of', 'VRT', pre_2000_plant,
                '{0}_{1}.vrt'.format(tile_id, cn.pattern_plant_pre_2000), '-a_nodata', 'none']
-        check_call(cmd)
+        log_subprocess_output_full(cmd, check=True)
 
         # Removes the pre-2000 plantation pixels from the loss tile
         pre_2000_vrt = '{0}_{1}.vrt'.format(tile_id, cn.pattern_plant_pre_2000)
         calc = '--calc=A*(B==0)'
         loss_outfilearg = '--outfile={}'.format(out_name)
         cmd = ['gdal_calc.py', '-A', tile_to_mask, '-B', pre_2000_vrt,
-               calc, loss_outfilearg, '--NoDataValue=0', '--overwrite', '--co', 'COMPRESS=LZW', '--quiet']
-        check_call(cmd)
+               calc, loss_outfilearg, '--NoDataValue=0', '--overwrite', *raster_profile.gdal_options(flag='--co'), '--quiet']
+        log_subprocess_output_full(cmd, check=True)
 
     # Basically, does nothing if there is no pre-2000 plantation and the output name is the same as the
     # input name
@@ -1211,7 +973,7 @@ def analysis_stages(stage_list, stage_input, run_through, sensit_type,
         stage_output.insert(0, 'annual_removals_mangrove')
 
     # Step create_supplementary_outputs only run for standard model
-    if sensit_type != 'std':
+    if sensit_type != 'std' and 'create_supplementary_outputs' in stage_output:
         stage_output.remove('create_supplementary_outputs')
 
     return stage_output
@@ -1244,63 +1006,3 @@ def replace_output_dir_date(output_dir_list, run_date):
     print_log(output_dir_list)
     print_log("")
     return output_dir_list
-
-# Adds various metadata tags to the raster
-def add_rasterio_tags(output_dst, sensit_type):
-
-    # based on https://rasterio.readthedocs.io/en/latest/topics/tags.html
-
-    if sensit_type == 'std':
-        sensit_type = 'standard model'
-
-    output_dst.update_tags(
-        model_version=cn.version)
-    output_dst.update_tags(
-        date_created=date_today)
-    output_dst.update_tags(
-        model_type=sensit_type)
-    output_dst.update_tags(
-        originator='Global Forest Watch at the World Resources Institute')
-    output_dst.update_tags(
-        citation='Harris et al. 2021 Nature Climate Change https://www.nature.com/articles/s41558-020-00976-6')
-    output_dst.update_tags(
-        model_year_range='2001 through 20{}'.format(cn.loss_years)
-    )
-
-    return output_dst
-
-
-def add_universal_metadata_tags(output_raster, sensit_type):
-
-    print_log("Adding universal metadata tags to", output_raster)
-
-    cmd = ['gdal_edit.py', '-mo', 'model_version={}'.format(cn.version),
-           '-mo', 'date_created={}'.format(date_today),
-           '-mo', 'model_type={}'.format(sensit_type),
-           '-mo', 'originator=Global Forest Watch at the World Resources Institute',
-           '-mo', 'model_year_range=2001 through 20{}'.format(cn.loss_years),
-           output_raster]
-    log_subprocess_output_full(cmd)
-
-# Adds metadata tags to raster.
-# Certain tags are included for all rasters, while other tags can be customized for each input set.
-def add_metadata_tags(tile_id, output_pattern, sensit_type, metadata_list):
-
-    output_raster = '{0}_{1}.tif'.format(tile_id, output_pattern)
-
-    print_log("Adding metadata tags to", output_raster)
-
-    # Universal metadata tags
-    cmd = ['gdal_edit.py', '-mo', 'model_version={}'.format(cn.version),
-           '-mo', 'date_created={}'.format(date_today),
-           '-mo', 'model_type={}'.format(sensit_type),
-           '-mo', 'originator=Global Forest Watch at the World Resources Institute',
-           '-mo', 'model_year_range=2001 through 20{}'.format(cn.loss_years)]
-
-    # Metadata tags specifically for this dataset
-    for metadata in metadata_list:
-        cmd += ['-mo', metadata]
-
-    cmd += [output_raster]
-
-    log_subprocess_output_full(cmd)
\ No newline at end of file
@@ -0,0 +1,210 @@
+'''
+Runs a per-tile calculation as a pipeline, so that reading (decompressing) the inputs, calculating and writing
+(compressing) the outputs of a tile overlap instead of taking turns.
+A stage's calculation is a kernel: a function of the input windows of one window of the tile that returns the output
+windows, kernel(windows, window) -> {output name: array}. windows has the input arrays by input name and window is the
+rasterio Window they cover (e.g., for pixel areas). Kernels don't read or write files, so the same kernel can be run
+serially or in the pipeline.
+Each input is read by its own reader thread and each output is written by its own writer thread, and windows are
+calculated on cn.window_pipeline_threads threads. GDAL (de)compression and most numpy operations release the GIL,
+so these run at the same time.
+Windows are the super-windows of the tile layout (tile_layout.windows()).
+Inputs are read directly into a fixed set of cn.window_pipeline_windows buffers that every thread shares
+(no copies between stages) and that are reused once a window is written. A window can only be read when a buffer
+is free, so reading can't get more than that many windows ahead of writing.
+Outputs are written in window order.
+'''
+
+import queue
+import threading
+import numpy as np
+import constants_and_names as cn
+import tile_layout
+
+# How often (seconds) blocked threads check whether another thread failed
+_poll_seconds = 1
+
+
+# Raised in a thread of the pipeline when another thread failed, so that it stops
+class _Stopped(Exception):
+    pass
+
+
+# Gets from a queue, unless the pipeline is stopping
+def _get(items, stop):
+
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            return items.get(timeout=_poll_seconds)
+        except queue.Empty:
+            pass
+
+
+# Puts in a bounded queue, unless the pipeline is stopping
+def _put(items, item, stop):
+
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            return items.put(item, timeout=_poll_seconds)
+        except queue.Full:
+            pass
+
+
+# The start of a buffer as an array with the shape of a window (contiguous, so rasterio can read into it)
+def buffer_view(buffer, window):
+
+    height, width = int(window.height), int(window.width)
+
+    return buffer[:height * width].reshape(height, width)
+
+
+# Runs the kernel over every window of the tile.
+# srcs has the open input datasets by input name (rasterio datasets or missing_tile.MissingTile) and dsts the open
+# output datasets by output name. Both are opened (and tagged) and closed by the caller.
+# Windows are tile_layout.windows() of the outputs. Output windows are converted to the data type of their output dataset.
+def run(kernel, srcs, dsts, threads=None, buffers=None):
+
+    if threads is None:
+        threads = cn.window_pipeline_threads
+    if buffers is None:
+        buffers = cn.window_pipeline_windows
+
+    if not srcs and not dsts:
+        raise ValueError("The kernel has no inputs or outputs to take the tile's windows from")
+
+    # Windows cover the outputs (inputs that don't exist are read as 0s with the extent of a whole tile)
+    tile = list(dsts.values())[0] if dsts else list(srcs.values())[0]
+    windows = [window for idx, window in tile_layout.windows(tile)]
+    pixels = max(int(window.height) * int(window.width) for window in windows)
+
+    # Input buffers, reused for all windows. Windows given to the kernel are views of these.
+    buffer_list = [dict((name, np.empty(pixels, dtype=src.dtypes[0])) for name, src in srcs.items())
+                   for i in range(buffers)]
+    free_buffers = queue.Queue()
+    for buffer in range(buffers):
+        free_buffers.put(buffer)
+
+    # (window index, buffer) to read, by input, and windows that were read, by input
+    to_read = dict((name, queue.Queue()) for name in srcs)
+    was_read = dict((name, queue.Queue()) for name in srcs)
+    read_lock = threading.Lock()
+
+    # Windows ready to calculate. Kernels without inputs get them straight from feed().
+    ready = list(was_read.values()) if srcs else [queue.Queue()]
+
+    # Calculated windows, in the order they finish, and windows to write, by output
+    calculated = queue.Queue()
+    to_write = dict((name, queue.Queue(maxsize=buffers)) for name in dsts)
+
+    # Outputs still to be written for each buffer in use. A buffer is freed when all outputs of its window are written,
+    # since output windows can be views of the input windows.
+    unwritten = {}
+    unwritten_lock = threading.Lock()
+
+    stop = threading.Event()
+    errors = []
+
+    # Runs a thread's loop, stopping the other threads if it fails
+    def thread(target, *args):
+
+        def loop():
+            try:
+                target(*args)
+            except _Stopped:
+                pass
+            except BaseException as exception:
+                errors.append(exception)
+                stop.set()
+
+        started = threading.Thread(target=loop, daemon=True)
+        started.start()
+        return started
+
+    # Gives each window a free buffer and hands it to the readers
+    def feed():
+        for index in range(len(windows)):
+            buffer = _get(free_buffers, stop)
+            with unwritten_lock:
+                unwritten[buffer] = len(dsts)
+            for name in srcs:
+                to_read[name].put((index, buffer))
+            if not srcs:
+                ready[0].put((index, buffer))
+        for name in srcs:
+            to_read[name].put(None)
+        if not srcs:
+            ready[0].put(None)
+
+    # Reads one input, window by window, into the window's buffer
+    def read(name):
+        src = srcs[name]
+        while True:
+            item = _get(to_read[name], stop)
+            if item is None:
+                was_read[name].put(None)
+                return
+            index, buffer = item
+            window = windows[index]
+            src.read(1, window=window, out=buffer_view(buffer_list[buffer][name], window))
+            was_read[name].put(item)
+
+    # Calculates windows once all their inputs are read
+    def calculate():
+        while True:
+            with read_lock:
+                items = [_get(ready_queue, stop) for ready_queue in ready]
+                if items[0] is None:
+                    # Lets the other calculating threads see that all windows are read
+                    for ready_queue in ready:
+                        ready_queue.put(None)
+                    return
+            index, buffer = items[0]
+            window = windows[index]
+            window_arrays = dict((name, buffer_view(buffer_list[buffer][name], window)) for name in srcs)
+            calculated.put((index, buffer, kernel(window_arrays, window)))
+
+    # Writes one output, window by window, and frees buffers whose outputs are all written
+    def write(name):
+        dst = dsts[name]
+        while True:
+            item = _get(to_write[name], stop)
+            if item is None:
+                return
+            index, buffer, array = item
+            dst.write_band(1, array.astype(dst.dtypes[0], copy=False), window=windows[index])
+            with unwritten_lock:
+                unwritten[buffer] -= 1
+                if unwritten[buffer] == 0:
+                    free_buffers.put(buffer)
+
+    started = [thread(feed)]
+    started += [thread(read, name) for name in srcs]
+    started += [thread(calculate) for i in range(threads)]
+    writers = [thread(write, name) for name in dsts]
+
+    # Hands calculated windows to the writers in window order
+    finished = {}
+    try:
+        for index in range(len(windows)):
+            while index not in finished:
+                finished_index, buffer, outputs = _get(calculated, stop)
+                finished[finished_index] = (buffer, outputs)
+            buffer, outputs = finished.pop(index)
+            if not dsts:
+                free_buffers.put(buffer)
+            for name in dsts:
+                _put(to_write[name], (index, buffer, outputs[name]), stop)
+        for name in dsts:
+            _put(to_write[name], None, stop)
+    except _Stopped:
+        pass
+
+    for started_thread in started + writers:
+        started_thread.join()
+
+    if errors:
+        raise errors[0]